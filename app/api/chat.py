@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import StreamingResponse
+import asyncio
 import logging
 import time
 import uuid
@@ -18,6 +19,8 @@ from ..services.chat_service import get_chatbot_service, initialize_chatbot_serv
 from app.services.chatbot.rag.chat_engine import LangChainChatEngine
 from app.services.chatbot.title_generation.title_generator import ConversationTitleGenerator
 from app.core.database import get_db
+from app.core.dependencies import get_current_admin_user
+from app.schemas.user_schemas import UserResponse
 from app.db.conversations import get_conversations, get_messages
 # JWT middleware not implemented yet
 from ..services.chatbot.rag.conversation_summarizer import ConversationSummarizer
@@ -948,6 +951,33 @@ async def delete_document(document_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/documents/{document_id}/related")
+async def get_related_documents(document_id: str, user_id: Optional[str] = None, limit: int = 5):
+    """
+    Get the documents most similar to a document
+
+    Documents are compared by their document vector (the centroid of
+    their chunk embeddings), among the requesting user's documents only.
+    """
+    try:
+        if not user_id:
+            raise HTTPException(status_code=400, detail="user_id is required")
+        service = get_chatbot_service()
+
+        related = service.get_related_documents(document_id, user_id, k=limit)
+
+        return {
+            "document_id": document_id,
+            "related": related,
+            "total": len(related)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting related documents: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/system/stats", response_model=SystemStatsResponse)
 async def get_system_stats():
     """
@@ -969,6 +999,51 @@ async def get_system_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/vector-store/report")
+async def get_vector_store_report(current_user: UserResponse = Depends(get_current_admin_user)):
+    """
+    Report the integrity of the vector store (admins only)
+
+    This endpoint reports chunks per user, disk usage, chunks of documents
+    that no longer exist in Postgres, duplicated chunks, and drift between
+    the document_embeddings table and the stored vectors.
+    """
+    try:
+        service = get_chatbot_service()
+
+        # Scans every chunk; keep the event loop free meanwhile
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, service.get_vector_store_report)
+
+    except Exception as e:
+        logger.error(f"Error getting vector store report: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/vector-store/maintenance")
+async def run_vector_store_maintenance(dry_run: bool = True,
+                                       current_user: UserResponse = Depends(get_current_admin_user)):
+    """
+    Remove orphaned and duplicated chunks from the vector store (admins only)
+
+    Runs as a dry run unless dry_run=false. Refuses when most chunks look
+    orphaned (usually the wrong database); overriding that guard, like HNSW
+    compaction, is only available from the vector_maintenance command.
+    """
+    try:
+        service = get_chatbot_service()
+
+        loop = asyncio.get_event_loop()
+        logger.info(f"Vector store maintenance (dry_run={dry_run}) requested by {current_user.id}")
+        return await loop.run_in_executor(None, service.run_vector_maintenance, dry_run)
+
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error running vector store maintenance: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/engine/create")
 async def create_chat_engine(config: ChatEngineConfig):
     """
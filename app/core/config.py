@@ -1,6 +1,6 @@
 import os
 import json
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -60,12 +60,70 @@ class Settings(BaseSettings):
 	# Vector Database Settings
 	VECTOR_DB_PATH: str = Field("./data/chroma_db", description="ChromaDB storage path")
 	COLLECTION_NAME: str = Field("documents", description="ChromaDB collection name")
+	EMBEDDING_MODEL: str = Field("all-MiniLM-L6-v2", description="Embedding model until a model migration switches the collection")
+	CHROMA_CLIENT_MODE: Literal["persistent", "http"] = Field("persistent", description="Open the Chroma directory in-process, or talk to a Chroma server")
+	CHROMA_SERVER_URL: str = Field("http://localhost:8001", description="Chroma server of the http client mode")
+	CHROMA_HTTP_POOL_SIZE: int = Field(16, gt=0, description="Connections kept per Chroma HTTP client")
+	CHROMA_HTTP_RETRIES: int = Field(3, ge=0, description="Retries of a failed Chroma HTTP request")
+	CHROMA_HTTP_BACKOFF: float = Field(0.2, ge=0, description="First retry delay of a Chroma HTTP request, in seconds (doubles per retry)")
+
+	# Vector Index Settings (apply to collections created afterwards; unset uses Chroma's defaults)
+	HNSW_SPACE: Optional[Literal["l2", "cosine", "ip"]] = Field(None, description="HNSW distance space")
+	HNSW_M: Optional[int] = Field(None, gt=0, description="HNSW graph links per vector")
+	HNSW_CONSTRUCTION_EF: Optional[int] = Field(None, gt=0, description="HNSW candidate list size while building")
+	HNSW_SEARCH_EF: Optional[int] = Field(None, gt=0, description="HNSW candidate list size while querying")
+
+	# Vector Search Settings
+	VECTOR_SHARDING: Literal["none", "user", "hash"] = Field("none", description="Chunk collection per user, per hash bucket of users, or one for all")
+	VECTOR_SHARD_BUCKETS: int = Field(64, gt=0, description="Number of buckets of hash sharding")
+	VECTOR_QUANTIZATION: Literal["none", "int8", "binary"] = Field("none", description="Quantized first-pass search before exact rescoring")
+	VECTOR_RESCORE_FACTOR: int = Field(10, gt=0, description="Quantized candidates rescored per result")
+	VECTOR_QUANTIZED_SYNC_SECONDS: float = Field(30.0, ge=0, description="Minimum seconds between syncs of the quantized index")
+	COARSE_TO_FINE_DOCUMENTS: int = Field(0, ge=0, description="Documents shortlisted per query before chunk search (0 disables it)")
+	HYBRID_BATCH_WORKERS: int = Field(4, gt=0, description="Threads scoring the queries of a hybrid batch search")
+
+	# Vector Cache Settings
+	QUERY_EMBEDDING_CACHE_SIZE: int = Field(2048, ge=0, description="Query embeddings kept in memory")
+	CHUNK_EMBEDDING_CACHE_MAX_ENTRIES: int = Field(500000, gt=0, description="Chunk embeddings kept in the on-disk cache")
+	SELECTION_CACHE_MAX_VECTORS: int = Field(200000, ge=0, description="Chunk vectors of Knowledge Base selections kept in memory")
+	SELECTION_CACHE_MAX_SELECTION_VECTORS: int = Field(20000, ge=0, description="Largest selection searched from memory; larger ones go to Chroma")
+	SELECTION_CACHE_TTL_SECONDS: float = Field(300.0, gt=0, description="Age in seconds after which a cached selection is reloaded")
+
+	# BM25 Index Settings (hybrid search)
+	BM25_SCORING_MODE: Literal["postings", "sparse"] = Field("postings", description="BM25 scoring with postings lists or a sparse matrix")
+	BM25_SPARSE_REBUILD_RATIO: float = Field(0.05, ge=0, description="Share of chunks added or deleted since the last build that rebuilds the sparse BM25 matrix")
+	BM25_BOOTSTRAP_PAGE_SIZE: int = Field(1000, gt=0, description="Chunks read per page when building the BM25 index")
+	BM25_COMPACTION_INTERVAL: float = Field(300.0, gt=0, description="Seconds between BM25 compactions")
+	BM25_SNAPSHOT_INTERVAL: float = Field(300.0, gt=0, description="Seconds between BM25 segment snapshots")
+	BM25_CHANGE_FEED_INTERVAL: float = Field(2.0, gt=0, description="Seconds between polls of the chunk change log")
+	CHANGE_LOG_CONSUMER_TTL: float = Field(3600.0, gt=0, description="Seconds after its last report that a change log reader stops holding back truncation")
+
+	# Vector Maintenance Settings
+	VECTOR_MAINTENANCE_PAGE_SIZE: int = Field(1000, gt=0, description="Chunks read per page by maintenance jobs")
+	VECTOR_COMPACT_MIN_DELETED: float = Field(0.2, ge=0, le=1, description="Share of deleted vectors in an HNSW index above which compaction rebuilds it")
+	VECTOR_SWEEP_MAX_ORPHAN_RATIO: float = Field(0.5, ge=0, le=1, description="Largest share of the chunks a sweep removes without force")
+	SNAPSHOT_PAGE_SIZE: int = Field(1000, gt=0, description="Chunks written per page of a vector snapshot")
+	SNAPSHOT_CATCH_UP_MARGIN: float = Field(600.0, ge=0, description="Documents changed this many seconds before a snapshot are re-embedded after its import")
 
 	# Document Processing Settings
 	CHUNK_SIZE: int = Field(1000, description="Document chunk size")
 	CHUNK_OVERLAP: int = Field(200, description="Document chunk overlap")
 	MAX_HISTORY_LENGTH: int = Field(10, description="Maximum conversation history length")
 
+	# Embedding Batching Settings (chunks of concurrent uploads are encoded together)
+	EMBEDDING_BATCH_SIZE: int = Field(64, description="Number of chunks encoded per batch")
+	EMBEDDING_BATCH_WAIT_MS: float = Field(20.0, description="Longest wait for an embedding batch to fill, in milliseconds")
+
+	# Embedding Backend Settings
+	EMBEDDING_BACKEND: Literal["torch", "onnx", "onnx-int8"] = Field("torch", description="Embedding model runtime")
+	EMBEDDING_ONNX_QUANTIZATION: Literal["avx2", "avx512", "avx512_vnni", "arm64"] = Field("avx2", description="CPU target of the int8 ONNX model")
+	EMBEDDING_ONNX_EXPORT_DIR: str = Field(
+		os.path.join(os.path.expanduser("~"), ".cache", "document-analyzer", "onnx"),
+		description="Local exports of models without a published int8 ONNX file"
+	)
+	EMBEDDING_BULK_SLICE_SIZE: int = Field(32, gt=0, description="Texts encoded per slice of a bulk embedding call")
+	EMBEDDING_SERVER_SOCKET: Optional[str] = Field(None, description="Unix socket of a shared embedding server (unset loads models in-process)")
+
 	# Conversation Summarization Settings (from your chatbot)
 	ENABLE_CONVERSATION_SUMMARIZATION: bool = Field(True, description="Enable conversation summarization")
 	SUMMARIZATION_THRESHOLD: int = Field(16, description="Message pairs threshold for summarization")
@@ -102,6 +160,7 @@ class Settings(BaseSettings):
 	SECRET_KEY: str = Field("your-secret-key-change-in-production", description="Secret key for JWT")
 	ALGORITHM: str = Field("HS256", description="JWT algorithm")
 	ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(30, description="JWT token expiry minutes")
+	ADMIN_EMAILS: str = Field("", description="Comma-separated emails of users allowed to call admin endpoints")
 
 	# CORS Settings
 	CORS_ORIGINS: List[str] = Field(
@@ -144,6 +203,23 @@ class Settings(BaseSettings):
 				return [origin.strip() for origin in v.split(',')]  # comma-separated
 		return v
 
+	@field_validator(
+		'CHROMA_CLIENT_MODE', 'HNSW_SPACE', 'VECTOR_SHARDING', 'VECTOR_QUANTIZATION', 'BM25_SCORING_MODE',
+		'EMBEDDING_BACKEND', 'EMBEDDING_ONNX_QUANTIZATION', mode='before'
+	)
+	@classmethod
+	def parse_mode(cls, v):
+		if isinstance(v, str):
+			return v.strip().lower() or None  # empty means unset
+		return v
+
+	@field_validator('HNSW_M', 'HNSW_CONSTRUCTION_EF', 'HNSW_SEARCH_EF', 'EMBEDDING_SERVER_SOCKET', mode='before')
+	@classmethod
+	def parse_optional(cls, v):
+		if isinstance(v, str) and not v.strip():
+			return None  # empty means unset
+		return v
+
 	@field_validator('DEBUG', mode='before')
 	@classmethod
 	def parse_debug(cls, v):
@@ -4,6 +4,7 @@ from typing import Optional
 from uuid import UUID
 import hashlib
 
+from .config import settings
 from .security import verify_token
 from .user_cache import user_cache
 from ..db.crud import get_user_crud
@@ -59,3 +60,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_current_active_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
     """Get current active user"""
     return current_user
+
+async def get_current_admin_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
+    """Get current user if their email is listed in ADMIN_EMAILS"""
+    admins = {email.strip().lower() for email in settings.ADMIN_EMAILS.split(",") if email.strip()}
+    if current_user.email.lower() not in admins:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
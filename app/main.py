@@ -141,6 +141,13 @@ async def startup_event():
         except Exception as e:
             logger.warning(f"Failed to start title listener: {e}")
 
+        # Catch up on documents changed since an imported vector snapshot
+        try:
+            from .services.document_embedding_service import document_embedding_service
+            document_embedding_service.start_snapshot_catch_up()
+        except Exception as e:
+            logger.warning(f"Failed to start snapshot catch-up: {e}")
+
     except Exception as e:
         logger.warning(f"Startup DB init warning: {e}")
         # Don't crash the server if DB init fails
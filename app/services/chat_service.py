@@ -1,19 +1,29 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 from datetime import datetime
 import uuid
 import os
+import threading
+import time
 
+from ..core.config import settings
 from .chatbot.vector_db.langchain_chroma import LangChainChromaStore
 from .chatbot.vector_db.chunking import DocumentChunker
 from .chatbot.vector_db.indexing import LangChainDocumentIndexer
+from .chatbot.vector_db.change_log import ChunkChangeLog
+from .chatbot.vector_db.chunk_embedding_cache import ChunkEmbeddingCache
 from .chatbot.vector_db.embeddings import EmbeddingGenerator
+from .chatbot.vector_db.model_registry import model_registry
+from .chatbot.vector_db.model_migration import CollectionAliases, ShadowWriter
+from .chatbot.vector_db.query_embedding_cache import query_embedding_cache
+from .chatbot.vector_db.vector_maintenance import VectorStoreMaintenance
 from .chatbot.llm.llm_factory import LLMFactory
 from .chatbot.chains.universal_citation_chain import UniversalCitationChain
 from .chatbot.rag.chat_engine import LangChainChatEngine
 from .chatbot.rag.conversation_manager import ConversationManager
 from .chatbot.search.bm25_retriever import BM25Retriever
-from .chatbot.search.hybrid_retriever import HybridRetriever
+from .chatbot.search.hybrid_retriever import HybridRetriever, HybridSearchRetriever
+from .chatbot.search.bm25_change_feed import BM25ChangeFeed, APPLIED_TS_KEY, snapshot_lock
 from ..core.langfuse_config import get_langfuse_callbacks
 
 
@@ -50,12 +60,22 @@ class ChatbotService:
         self._vectorstore = None
         self._chunker = None
         self._indexer = None
+        self._augmentation_llm = None
+        self._change_log = None
+        self._shadow_writer = None
+        # The collection name is an alias, switched by embedding model migrations
+        self._aliases = CollectionAliases.for_directory(config['vector_db_path'])
+        self._active = None
+        self._switch_lock = threading.Lock()
+        self._document_vectors_thread = None
         self._embedding_generator = None
         self._conversation_manager = None
         self._chat_engines = {}  # Cache chat engines per user/session
         
         # BM25 hybrid search components (optional, based on .env flag)
         self._bm25_retriever = None
+        self._bm25_bootstrap_thread = None
+        self._bm25_change_feed = None
         self._hybrid_retriever = None
         self._use_hybrid_search = self._get_hybrid_search_flag()
 
@@ -84,12 +104,6 @@ class ChatbotService:
         try:
             self.logger.info("Initializing ChatbotService...")
 
-            self._vectorstore = LangChainChromaStore(
-                persist_directory=self.config['vector_db_path'],
-                collection_name=self.config.get('collection_name', 'documents'),
-                embedding_model=self.config.get('embedding_model', 'all-MiniLM-L6-v2')
-            )
-
             self._chunker = DocumentChunker(
                 chunk_size=self.config.get('chunk_size', 1000),
                 chunk_overlap=self.config.get('chunk_overlap', 200)
@@ -105,12 +119,17 @@ class ChatbotService:
                 )
             except Exception as e:
                 self.logger.warning(f"Failed to initialize augmentation LLM: {e}")
+            self._augmentation_llm = augmentation_llm
 
-            self._indexer = LangChainDocumentIndexer(
-                vectorstore=self._vectorstore,
-                chunker=self._chunker,
-                llm=augmentation_llm
-            )
+            # Chunk add/delete events for indexes that follow the vector store (BM25);
+            # nothing consumes the log without hybrid search, so it is not written then
+            if self._use_hybrid_search:
+                self._change_log = ChunkChangeLog.for_directory(self.config['vector_db_path'])
+
+            self._open_vectorstore(self._aliases.resolve(
+                self.config.get('collection_name', 'documents'),
+                self.config.get('embedding_model', 'all-MiniLM-L6-v2')
+            ))
 
             self._embedding_generator = EmbeddingGenerator(
                 model_name=self.config.get('embedding_model', 'all-MiniLM-L6-v2')
@@ -134,6 +153,73 @@ class ChatbotService:
             self.logger.error(f"Failed to initialize ChatbotService: {str(e)}")
             raise
 
+    def _open_vectorstore(self, active: Tuple[str, str]) -> None:
+        """
+        Open the vector store and indexer on the collection the alias points to.
+
+        Args:
+            active: (collection name, embedding model) from the collection aliases
+        """
+        collection_name, embedding_model = active
+        self._vectorstore = LangChainChromaStore(
+            persist_directory=self.config['vector_db_path'],
+            collection_name=collection_name,
+            embedding_model=embedding_model
+        )
+        self._indexer = LangChainDocumentIndexer(
+            vectorstore=self._vectorstore,
+            chunker=self._chunker,
+            llm=self._augmentation_llm,
+            change_log=self._change_log,
+            embedding_cache=ChunkEmbeddingCache.for_directory(
+                self.config['vector_db_path'],
+                model_registry.model_id(embedding_model)
+            ),
+            document_vectors=self._vectorstore.document_vectors
+        )
+        # Documents indexed during an embedding model migration are written to both collections
+        self._shadow_writer = ShadowWriter(
+            self._vectorstore, self.config.get('collection_name', 'documents'), self._aliases
+        )
+        self._active = active
+
+        # Vectors of documents indexed before document vectors existed
+        self._start_document_vectors_backfill()
+
+    def _refresh_active_collection(self) -> None:
+        """
+        Follow a switch of the collection alias made by an embedding model migration.
+
+        The new store replaces the old one in the indexer, the hybrid
+        retriever and the BM25 chunk loader; chunk IDs and texts are the same
+        in both collections, so the BM25 index stays valid. Cached chat
+        engines hold retrievers on the old store and are dropped.
+        """
+        try:
+            active = self._aliases.resolve(
+                self.config.get('collection_name', 'documents'),
+                self.config.get('embedding_model', 'all-MiniLM-L6-v2')
+            )
+        except Exception as e:
+            self.logger.error(f"Could not read collection aliases: {e}")
+            return
+        if active == self._active:
+            return
+
+        with self._switch_lock:
+            if active == self._active:
+                return
+            self.logger.info(f"Collection switched to {active[0]} ({active[1]})")
+            old_vectorstore, old_shadow_writer = self._vectorstore, self._shadow_writer
+            self._open_vectorstore(active)
+            if self._hybrid_retriever:
+                self._hybrid_retriever.vectorstore = self._vectorstore
+            if self._bm25_retriever:
+                self._bm25_retriever.document_loader = self._vectorstore.get_documents_by_ids
+            self._chat_engines.clear()
+            old_shadow_writer.cleanup()
+            old_vectorstore.cleanup()
+
     def get_or_create_chat_engine(self, llm_config: Dict[str, Any],
                                   user_id: Optional[str] = None,
                                   memory_type: str = "window") -> LangChainChatEngine:
@@ -204,7 +290,9 @@ class ChatbotService:
             List of chunk IDs that were indexed
         """
         self._ensure_initialized()
-        return self._indexer.index_document(document_data)
+        chunk_ids = self._indexer.index_document(document_data)
+        self._shadow_writer.mirror_document(document_data['id'], chunk_ids, document_data.get('user_id'))
+        return chunk_ids
 
     def delete_document(self, document_id: str) -> None:
         """
@@ -216,23 +304,25 @@ class ChatbotService:
         self._ensure_initialized()
 
         try:
-            # Search for all chunks belonging to this document
-            filter_criteria = {"document_id": document_id}
-            documents = self._vectorstore.similarity_search(
-                query="",
-                k=1000,  # Large number to get all chunks
-                filter=filter_criteria
-            )
+            # Delete all chunks belonging to this document by metadata
+            deleted = self._vectorstore.delete_where({"document_id": document_id})
 
-            if documents:
-                # Extract chunk IDs and delete them
-                chunk_ids = [doc.metadata.get('chunk_id') for doc in documents if doc.metadata.get('chunk_id')]
-                if chunk_ids:
-                    self._vectorstore.delete_documents(chunk_ids)
-                    self.logger.info(f"Deleted document {document_id} with {len(chunk_ids)} chunks")
+            if deleted:
+                self.logger.info(f"Deleted document {document_id} with {deleted} chunks")
             else:
                 self.logger.warning(f"No chunks found for document {document_id}")
 
+            self._vectorstore.document_vectors.delete(document_id)
+            self._shadow_writer.delete_document(document_id)
+
+            # Record the delete for indexes following the change log
+            if self._change_log:
+                self._change_log.record_deleted(document_id=document_id)
+
+            # Tombstone the document's chunks in this process's keyword index right away
+            if self._bm25_retriever:
+                self._bm25_retriever.delete_document(document_id)
+
         except Exception as e:
             self.logger.error(f"Failed to delete document {document_id}: {str(e)}")
             raise
@@ -278,6 +368,60 @@ class ChatbotService:
             self.logger.error(f"Failed to search documents: {str(e)}")
             raise
 
+    def get_related_documents(self, document_id: str, user_id: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Find the user's documents most similar to one of their documents, by document vector.
+
+        Args:
+            document_id: Document to find related documents for
+            user_id: Owner of the document; results are restricted to their documents
+            k: Number of related documents to return
+
+        Returns:
+            List of related documents with metadata and distance, closest first
+        """
+        self._ensure_initialized()
+
+        try:
+            return self._vectorstore.document_vectors.related(document_id, user_id, k=k)
+        except Exception as e:
+            self.logger.error(f"Failed to find documents related to {document_id}: {str(e)}")
+            raise
+
+    def get_vector_store_report(self) -> Dict[str, Any]:
+        """
+        Report the integrity of the active collection against Postgres.
+
+        Returns:
+            Chunks per user, disk usage, orphaned and duplicated chunks, and
+            drift between document_embeddings and the stored vectors
+        """
+        self._ensure_initialized()
+        return VectorStoreMaintenance(self._vectorstore, change_log=self._change_log).report()
+
+    def run_vector_maintenance(self, dry_run: bool = True) -> Dict[str, Any]:
+        """
+        Remove chunks and document vectors of documents that are not in Postgres, and duplicate chunks.
+
+        Refuses when most chunks look orphaned; overriding that takes the
+        vector_maintenance command (sweep --force).
+
+        Args:
+            dry_run: Only count what would be removed
+
+        Returns:
+            Counts and samples of the orphans and duplicates, and the number of removed chunks
+        """
+        self._ensure_initialized()
+
+        try:
+            # Removed chunks reach the BM25 index of every process through the change log
+            maintenance = VectorStoreMaintenance(self._vectorstore, change_log=self._change_log)
+            return maintenance.sweep(dry_run=dry_run)
+        except Exception as e:
+            self.logger.error(f"Vector store maintenance failed: {str(e)}")
+            raise
+
     def get_conversation_history(self, conversation_id: str) -> str:
         """
         Retrieve conversation history for a given conversation ID.
@@ -320,13 +464,37 @@ class ChatbotService:
             # Get vector database stats
             vectorstore_stats = {
                 "collection_name": self.config.get('collection_name', 'documents'),
-                "persist_directory": self.config['vector_db_path']
+                "active_collection": self._active[0] if self._active else None,
+                "embedding_model": self._active[1] if self._active else None,
+                "migration": self._aliases.get(self.config.get('collection_name', 'documents')),
+                "persist_directory": self.config['vector_db_path'],
+                "quantization": self._vectorstore.get_quantization_stats() if self._vectorstore else None,
+                "sharding": self._vectorstore.get_shard_stats() if self._vectorstore else None,
+                "hnsw": self._vectorstore.get_index_params() if self._vectorstore else None,
+                "document_vectors": self._vectorstore.document_vectors.count() if self._vectorstore else None,
+                "coarse_documents": self._vectorstore.coarse_documents if self._vectorstore else None
             }
 
+            # BM25 index stats, including bootstrap progress
+            bm25_stats = None
+            if self._bm25_retriever:
+                bm25_stats = {
+                    **self._bm25_retriever.get_stats(),
+                    "build": self._bm25_retriever.get_build_status(),
+                    "change_feed": self._bm25_change_feed.get_stats() if self._bm25_change_feed else None,
+                    "latency": self._hybrid_retriever.get_latency_stats() if self._hybrid_retriever else None
+                }
+
             return {
                 "initialized": self._initialized,
                 "active_chat_engines": len(self._chat_engines),
                 "vectorstore": vectorstore_stats,
+                "hybrid_search": self._use_hybrid_search,
+                "bm25": bm25_stats,
+                "models": model_registry.memory_report(),
+                "query_embedding_cache": query_embedding_cache.get_stats(),
+                "selection_vector_cache": self._vectorstore.selection_cache.get_stats() if self._vectorstore else None,
+                "chunk_embedding_cache": self._indexer.embedding_cache.get_stats() if self._indexer else None,
                 "config": {
                     "chunk_size": self.config.get('chunk_size', 1000),
                     "chunk_overlap": self.config.get('chunk_overlap', 200),
@@ -367,9 +535,20 @@ class ChatbotService:
             # Clear chat engine cache
             self._chat_engines.clear()
 
-            # Clean up vector store
+            # Stop BM25 change feed (writing a final snapshot), bootstrap and compaction
+            if self._bm25_change_feed:
+                self._bm25_change_feed.stop()
+            if self._bm25_retriever:
+                self._bm25_retriever.cancel_build()
+                self._bm25_retriever.stop_background_compaction()
+
+            # Clean up vector store and release the shared embedding model
+            if self._shadow_writer:
+                self._shadow_writer.cleanup()
             if self._vectorstore:
                 self._vectorstore.cleanup()
+            if self._embedding_generator:
+                self._embedding_generator.release()
 
             self._initialized = False
             self.logger.info("ChatbotService cleanup completed")
@@ -381,6 +560,7 @@ class ChatbotService:
         """Ensure the service is initialized before use."""
         if not self._initialized:
             raise RuntimeError("ChatbotService not initialized. Call initialize() first.")
+        self._refresh_active_collection()
 
     def _create_llm(self, llm_config: Dict[str, Any]):
         """Create LLM instance based on configuration."""
@@ -423,55 +603,162 @@ class ChatbotService:
     def _initialize_bm25(self) -> None:
         """
         Initialize BM25 retriever from existing ChromaDB documents.
+        
+        A cached segment is memory-mapped immediately. Otherwise the index is
+        built in a background thread so startup and the first chat requests
+        are not blocked; the hybrid retriever serves semantic-only results
+        until the index reports ready.
         """
         try:
             # Check for cached BM25 index
-            cache_path = os.path.join(self.config['vector_db_path'], 'bm25_index.pkl')
+            cache_path = self._get_bm25_cache_path()
+            
+            scoring_mode = settings.BM25_SCORING_MODE
             
             if os.path.exists(cache_path):
-                self.logger.info(f"Loading BM25 index from cache: {cache_path}")
-                self._bm25_retriever = BM25Retriever.load(cache_path)
-            else:
-                self.logger.info("Building BM25 index from ChromaDB...")
-                self._bm25_retriever = BM25Retriever()
-                
-                # Get all documents from ChromaDB
-                try:
-                    # Perform a dummy search to get documents
-                    all_docs = self._vectorstore.similarity_search("", k=10000)
-                    
-                    if all_docs:
-                        self._bm25_retriever.build_index(all_docs)
-                        # Save to cache
-                        self._bm25_retriever.save(cache_path)
-                    else:
-                        self.logger.warning("No documents found in ChromaDB for BM25 indexing")
-                except Exception as e:
-                    self.logger.warning(f"Could not retrieve documents for BM25: {e}")
+                # Memory-mapped segment; chunk text is resolved from Chroma by chunk_id
+                self.logger.info(f"Loading BM25 segment from cache: {cache_path}")
+                # Registered with the change log before another worker can truncate past the segment
+                with snapshot_lock(cache_path):
+                    self._bm25_retriever = BM25Retriever.load_segment(
+                        cache_path,
+                        document_loader=self._vectorstore.get_documents_by_ids,
+                        scoring_mode=scoring_mode
+                    )
+                    if self._bm25_retriever.is_built():
+                        # Catch up on changes made since the segment was written
+                        self._start_bm25_change_feed(self._bm25_retriever.get_segment_meta().get(APPLIED_TS_KEY, 0))
             
-            # Create hybrid retriever
-            if self._bm25_retriever and self._bm25_retriever.is_built():
-                self._hybrid_retriever = HybridRetriever(
-                    vectorstore=self._vectorstore,
-                    bm25_retriever=self._bm25_retriever
+            if not self._bm25_retriever or not self._bm25_retriever.is_built():
+                self.logger.info("Building BM25 index from ChromaDB in the background...")
+                self._bm25_retriever = BM25Retriever(scoring_mode=scoring_mode)
+                self._bm25_retriever.document_loader = self._vectorstore.get_documents_by_ids
+                self._bm25_bootstrap_thread = threading.Thread(
+                    target=self._bootstrap_bm25,
+                    args=(cache_path,),
+                    name="bm25-bootstrap",
+                    daemon=True
                 )
-                self.logger.info("Hybrid retriever initialized successfully")
-            else:
-                self.logger.warning("BM25 index not built, hybrid search will fall back to semantic only")
+                self._bm25_bootstrap_thread.start()
+            
+            # Purge deleted chunks from the keyword index in the background
+            self._bm25_retriever.start_background_compaction(
+                interval_seconds=settings.BM25_COMPACTION_INTERVAL
+            )
+            
+            # Create hybrid retriever; it uses BM25 once the index is ready
+            self._hybrid_retriever = HybridRetriever(
+                vectorstore=self._vectorstore,
+                bm25_retriever=self._bm25_retriever
+            )
+            self.logger.info(
+                f"Hybrid retriever initialized (BM25 index {self._bm25_retriever.get_build_status()['state']})"
+            )
                 
         except Exception as e:
             self.logger.error(f"Failed to initialize BM25: {e}")
             self.logger.warning("Falling back to semantic search only")
     
+    def _bootstrap_bm25(self, cache_path: str) -> None:
+        """
+        Build the BM25 index by paging through the Chroma collection.
+        
+        Runs in a background thread. Pages are read with collection.get(),
+        so no query embedding is computed and the corpus is not capped.
+        
+        Args:
+            cache_path: Where to write the segment once the build completes
+        """
+        page_size = settings.BM25_BOOTSTRAP_PAGE_SIZE
+        # Changes logged from here on may be missing from the pages read; the feed replays them
+        started_ts = time.time_ns()
+        consumer_id = uuid.uuid4().hex
+        try:
+            # Other workers keep these changes in the log until the feed has applied them
+            self._change_log.record_applied(consumer_id, started_ts)
+            self._bm25_retriever.build_index_paged(
+                lambda offset, limit: self._vectorstore.get_documents(limit=limit, offset=offset),
+                page_size=page_size,
+                total=self._vectorstore.count()
+            )
+            
+            state = self._bm25_retriever.get_build_status()['state']
+            if self._bm25_retriever.is_built():
+                # Save to cache and switch to the memory-mapped segment, dropping the in-memory text
+                with snapshot_lock(cache_path):
+                    self._bm25_retriever.save_segment(cache_path, meta={APPLIED_TS_KEY: started_ts}, reopen=True)
+            elif state == 'ready':
+                self.logger.warning("No documents found in ChromaDB for BM25 indexing")
+            
+            if state == 'ready':
+                self._start_bm25_change_feed(started_ts, consumer_id)
+                return
+        except Exception as e:
+            self.logger.error(f"Could not build BM25 index from ChromaDB: {e}")
+        # Cancelled or failed: do not hold back truncation of the log
+        self._change_log.remove_consumer(consumer_id)
+    
+    def _start_bm25_change_feed(self, applied_ts: int, consumer_id: Optional[str] = None) -> None:
+        """
+        Start applying logged chunk changes to the BM25 index.
+        
+        Args:
+            applied_ts: Timestamp of the last change already in the index
+            consumer_id: ID already reported to the change log at applied_ts (None for a new one)
+        """
+        self._bm25_change_feed = BM25ChangeFeed(
+            retriever=self._bm25_retriever,
+            change_log=self._change_log,
+            snapshot_path=self._get_bm25_cache_path(),
+            applied_ts=applied_ts,
+            snapshot_interval=settings.BM25_SNAPSHOT_INTERVAL,
+            consumer_id=consumer_id
+        )
+        self._bm25_change_feed.start(poll_interval=settings.BM25_CHANGE_FEED_INTERVAL)
+    
+    def _start_document_vectors_backfill(self) -> None:
+        """
+        Compute document vectors in a background thread if none exist yet.
+
+        Chunk stores filled before document vectors were introduced would
+        otherwise have no related documents and no coarse-to-fine search.
+        """
+        try:
+            if self._vectorstore.document_vectors.count() or not self._vectorstore.count():
+                return
+            self._document_vectors_thread = threading.Thread(
+                target=self._backfill_document_vectors,
+                daemon=True,
+                name="document-vectors-backfill"
+            )
+            self._document_vectors_thread.start()
+        except Exception as e:
+            self.logger.error(f"Failed to start document vector backfill: {e}")
+
+    def _backfill_document_vectors(self) -> None:
+        """Compute the vectors of all stored documents (runs in a background thread)."""
+        try:
+            self._vectorstore.document_vectors.backfill()
+        except Exception as e:
+            self.logger.error(f"Could not backfill document vectors: {e}")
+
+    def _get_bm25_cache_path(self) -> str:
+        """Get the path of the cached BM25 index inside the vector DB directory."""
+        return os.path.join(self.config['vector_db_path'], 'bm25_index.seg')
+    
     def _create_retriever(self, user_id: Optional[str] = None):
         """Create retriever with user filtering.
 
         Apply a metadata filter {"user_id": user_id} for all valid user IDs to ensure
         proper document isolation between users.
         
-        NOTE: This returns a standard LangChain retriever. Hybrid search is handled
-        in the EnhancedSearchEngine which has access to both retrievers.
+        With hybrid search enabled this is the hybrid retriever bound to the user,
+        which restricts the BM25 leg to the same user partition; otherwise a
+        standard LangChain retriever over the vector store.
         """
+        if self._use_hybrid_search and self._hybrid_retriever:
+            return HybridSearchRetriever(hybrid=self._hybrid_retriever, user_id=user_id or None, k=4)
+        
         search_kwargs: Dict[str, Any] = {"k": 4}
 
         # Always apply user filtering if user_id is provided
@@ -249,7 +249,7 @@ Answer:""",
         all_callbacks = callbacks or []
         
         # Retrieve documents
-        relevant_docs = self.retriever.get_relevant_documents(question)
+        relevant_docs = await self.retriever.ainvoke(question)
         print(f"DEBUG: Retrieved {len(relevant_docs)} documents for universal citation")
         
         if not relevant_docs:
@@ -426,7 +426,7 @@ Answer:""",
         all_callbacks = callbacks or []
         
         # Retrieve documents
-        relevant_docs = self.retriever.get_relevant_documents(question)
+        relevant_docs = await self.retriever.ainvoke(question)
         
         # Create QA chain
         self.qa_chain = load_qa_chain(self.llm, chain_type="stuff", prompt=self.fallback_prompt, memory=self.memory)
@@ -462,7 +462,7 @@ Answer:""",
         all_callbacks = callbacks or []
         
         # Retrieve documents
-        relevant_docs = self.retriever.get_relevant_documents(question)
+        relevant_docs = await self.retriever.ainvoke(question)
         
         # Create streaming QA chain with clean markdown prompt
         streaming_chain = load_qa_chain(self.llm, chain_type="stuff", prompt=self.streaming_prompt, memory=self.memory)
@@ -230,7 +230,7 @@ Provide a comprehensive answer based on the documents. Do not include JSON forma
                 docs_to_use = enhanced_docs
             else:
                 # Get documents from retriever
-                docs_to_use = self.chain.retriever.get_relevant_documents(query)
+                docs_to_use = await self.chain.retriever.ainvoke(query)
             
             # Start streaming task
             task = asyncio.create_task(
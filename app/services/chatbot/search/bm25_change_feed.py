@@ -0,0 +1,256 @@
+"""
+Change feed from the chunk change log into the BM25 index
+
+The embedding pipeline and document delete paths append chunk add/delete
+events to a ChunkChangeLog. BM25ChangeFeed tails that log from a daemon
+thread and applies the events to a BM25Retriever incrementally, so keyword
+search sees new uploads within a poll interval. Periodically the index is
+snapshotted to its segment file, together with the timestamp of the last
+applied event, and the applied prefix of the log is truncated.
+
+Every worker process of a node runs its own feed on the shared log. Each
+feed reports its applied position to the log as a consumer, so truncation
+stops at the slowest live worker. Segment writes (and the truncation that
+follows) are serialized with snapshot_lock(), so a worker always reopens
+the segment it wrote itself.
+"""
+
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from langchain.schema import Document
+from ..vector_db.change_log import ChunkChangeLog, OP_ADD, OP_DELETE, OP_DELETE_DOCUMENT, DEFAULT_CONSUMER_TTL
+from .bm25_retriever import BM25Retriever
+import logging
+import threading
+import time
+import uuid
+
+# File locking across processes is only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Segment header key holding the timestamp of the last applied change log event
+APPLIED_TS_KEY = "change_log_ts"
+
+
+@contextmanager
+def snapshot_lock(snapshot_path: str):
+    """
+    Hold the cross-process lock of a segment file while it is read or written.
+
+    Args:
+        snapshot_path: Path of the segment file
+    """
+    with open(f"{snapshot_path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class BM25ChangeFeed:
+    """
+    Tails a chunk change log and applies it to a BM25 index.
+    
+    Events are applied in log order. Adds upsert by chunk_id and deletes are
+    idempotent, so re-applying events that are already reflected in the
+    index (e.g. after a bootstrap from the vector store) is harmless.
+    """
+    
+    def __init__(
+        self,
+        retriever: BM25Retriever,
+        change_log: ChunkChangeLog,
+        snapshot_path: Optional[str] = None,
+        applied_ts: int = 0,
+        snapshot_interval: float = 300.0,
+        consumer_id: Optional[str] = None,
+        consumer_ttl: float = DEFAULT_CONSUMER_TTL
+    ):
+        """
+        Initialize the change feed.
+        
+        Args:
+            retriever: BM25 index to keep up to date
+            change_log: Change log to tail
+            snapshot_path: Segment file to snapshot the index to (None disables snapshots)
+            applied_ts: Timestamp of the last event already in the index
+            snapshot_interval: Minimum seconds between snapshots
+            consumer_id: ID the feed reports its position to the log with
+                (default: a new one; pass the ID reported before a bootstrap)
+            consumer_ttl: Seconds after its last report that the log considers the feed gone
+        """
+        self.retriever = retriever
+        self.change_log = change_log
+        self.snapshot_path = snapshot_path
+        self.applied_ts = applied_ts
+        self.snapshot_interval = snapshot_interval
+        self.consumer_id = consumer_id or uuid.uuid4().hex
+        self.consumer_ttl = consumer_ttl
+        
+        self._offset = 0
+        self._file_id = None
+        self._pending_snapshot = 0
+        self._last_snapshot = time.time()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats = {"events_applied": 0, "snapshots": 0, "last_applied_at": None}
+        
+        # Other workers keep the log from applied_ts on for this feed
+        self.change_log.record_applied(self.consumer_id, applied_ts)
+        self._last_report = time.time()
+    
+    def poll(self) -> int:
+        """
+        Apply every complete event appended since the last poll.
+        
+        Returns:
+            Number of events applied
+        """
+        with self._lock:
+            # A rewritten (truncated) log starts over; applied events are skipped by ts
+            file_id = self.change_log.file_id()
+            if file_id != self._file_id:
+                self._file_id = file_id
+                self._offset = 0
+            
+            events, offset = self.change_log.read(self._offset)
+            events = [event for event in events if event.get("ts", 0) > self.applied_ts]
+            if events:
+                # Only advance past events once they are applied, so a failure retries them
+                self._apply(events)
+                self.applied_ts = events[-1]["ts"]
+                self._pending_snapshot += len(events)
+                self._stats["events_applied"] += len(events)
+                self._stats["last_applied_at"] = time.time()
+            self._offset = offset
+            
+            # Report progress, and stay alive for truncation while idle
+            if events or time.time() - self._last_report >= self.consumer_ttl / 2:
+                self.change_log.record_applied(self.consumer_id, self.applied_ts)
+                self._last_report = time.time()
+            if not events:
+                return 0
+        
+        logger.debug(f"BM25 change feed applied {len(events)} events")
+        return len(events)
+    
+    def _apply(self, events: List[Dict[str, Any]]) -> None:
+        """
+        Apply events to the index, batching consecutive adds.
+        
+        Args:
+            events: Change log events in log order
+        """
+        added: List[Document] = []
+        for event in events:
+            op = event.get("op")
+            if op == OP_ADD:
+                added.append(Document(
+                    page_content=event.get("text", ""),
+                    metadata={**(event.get("metadata") or {}), "chunk_id": event["chunk_id"]}
+                ))
+                continue
+            
+            # Keep log order: flush pending adds before a delete
+            if added:
+                self.retriever.add_documents(added)
+                added = []
+            if op == OP_DELETE:
+                self.retriever.delete_chunks([event["chunk_id"]])
+            elif op == OP_DELETE_DOCUMENT:
+                self.retriever.delete_document(event["document_id"])
+            else:
+                logger.warning(f"Ignoring unknown change log operation: {op}")
+        
+        if added:
+            self.retriever.add_documents(added)
+    
+    def snapshot(self) -> bool:
+        """
+        Write the index to its segment file and truncate the applied log prefix.
+        
+        Returns:
+            True if a snapshot was written
+        """
+        if not self.snapshot_path or not self.retriever.is_built():
+            return False
+        
+        # Other workers write the same file; nobody replaces it between our write and reopen
+        with snapshot_lock(self.snapshot_path):
+            with self._lock:
+                applied_ts = self.applied_ts
+                self.retriever.save_segment(
+                    self.snapshot_path,
+                    meta={**self.retriever.get_segment_meta(), APPLIED_TS_KEY: applied_ts},
+                    reopen=True
+                )
+                self._pending_snapshot = 0
+                self._last_snapshot = time.time()
+                self._stats["snapshots"] += 1
+            
+            # Under the lock, so the file on disk always covers the dropped events
+            self.change_log.truncate_applied(applied_ts, ttl=self.consumer_ttl)
+        logger.info(f"✅ BM25 change feed snapshot written to {self.snapshot_path}")
+        return True
+    
+    def start(self, poll_interval: float = 2.0) -> None:
+        """
+        Tail the change log from a daemon thread.
+        
+        Args:
+            poll_interval: Seconds between polls of the log
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        
+        def feed_loop():
+            while not self._stop.wait(poll_interval):
+                try:
+                    self.poll()
+                    if self._pending_snapshot and time.time() - self._last_snapshot >= self.snapshot_interval:
+                        self.snapshot()
+                except Exception as e:
+                    logger.error(f"BM25 change feed failed: {e}")
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=feed_loop, name="bm25-change-feed", daemon=True)
+        self._thread.start()
+        logger.info(f"BM25 change feed started on {self.change_log.path} (every {poll_interval}s)")
+    
+    def stop(self) -> None:
+        """Stop tailing, write a final snapshot if events are pending and leave the log's consumers."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._pending_snapshot:
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"Final BM25 snapshot failed: {e}")
+        try:
+            self.change_log.remove_consumer(self.consumer_id)
+        except Exception as e:
+            logger.error(f"Could not unregister BM25 change feed from the change log: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get change feed statistics.
+        
+        Returns:
+            Dictionary with applied event counts, snapshot count and pending events
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["applied_ts"] = self.applied_ts
+            stats["pending_snapshot_events"] = self._pending_snapshot
+        return stats
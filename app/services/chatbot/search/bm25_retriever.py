@@ -6,15 +6,46 @@ BM25 is a statistical ranking function that scores documents based on term frequ
 and inverse document frequency, making it excellent for exact keyword matches.
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Union
+from bisect import bisect_left
+from collections import Counter
 from langchain.schema import Document
+import heapq
 import logging
+import math
 import pickle
-import os
+import threading
+import time
 from pathlib import Path
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Segment files and sparse-matrix scoring need NumPy (and SciPy for sparse)
+try:
+    import numpy as np
+    from .bm25_segment import BM25Segment, write_segment, STRING_COLUMNS
+    SEGMENTS_AVAILABLE = True
+except ImportError:
+    np = None
+    BM25Segment = None
+    write_segment = None
+    STRING_COLUMNS = ("chunk_id", "document_id", "user_id")
+    SEGMENTS_AVAILABLE = False
+
+try:
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    sparse = None
+    SCIPY_AVAILABLE = False
+
+SCORING_MODES = ("postings", "sparse")
+
+# Sparse mode rebuilds its weight matrix once adds/deletes since the last
+# build exceed this share of the index (see _search_sparse)
+DEFAULT_SPARSE_REBUILD_RATIO = settings.BM25_SPARSE_REBUILD_RATIO
+
 
 class BM25Retriever:
     """
@@ -22,28 +53,84 @@ class BM25Retriever:
     
     This retriever uses the BM25 algorithm to rank documents based on
     keyword relevance, complementing semantic search with exact term matching.
+    
+    Scoring is driven by an inverted index (term -> postings of (doc_idx, tf)),
+    so a query only touches documents that contain at least one query term.
+    In "sparse" scoring mode the per-term BM25 weights are precomputed into a
+    CSR matrix and queries are scored with sparse matrix products instead.
+    
+    The index is updated incrementally: adds only touch the new tokens,
+    deletes leave tombstones that are skipped at query time, and IDF/avgdl
+    are derived lazily from maintained counters. compact() (or the
+    background compaction thread) purges tombstoned documents.
+    
+    An index loaded with load_segment() is backed by a memory-mapped segment
+    file (see bm25_segment) holding documents 0..base-1; documents added
+    afterwards live in memory as a delta with indices base.. . Segment
+    documents carry no text and are resolved by chunk_id (and owner, so a
+    sharded vector store reads only the owners' shards) through
+    document_loader when results are returned.
     """
     
-    def __init__(self, k1: float = 1.5, b: float = 0.75):
+    def __init__(self, k1: float = 1.5, b: float = 0.75, scoring_mode: str = "postings"):
         """
         Initialize BM25 retriever.
         
         Args:
             k1: Term frequency saturation parameter (default: 1.5)
             b: Length normalization parameter (default: 0.75)
+            scoring_mode: "postings" (inverted index) or "sparse" (CSR matrix)
         """
         self.k1 = k1
         self.b = b
+        self.scoring_mode = "postings"
+        self.set_scoring_mode(scoring_mode)
         self.corpus = []
         self.tokenized_corpus = []
         self.doc_metadata = []
         self.doc_lengths = []
-        self.avgdl = 0
         self.doc_freqs = {}
-        self.idf = {}
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
         self.N = 0
+        self._total_length = 0
         self._is_built = False
         
+        # Chunk identity and tombstones (doc_idx of deleted documents)
+        self.chunk_ids: List[Optional[str]] = []
+        self._chunk_index: Dict[str, int] = {}
+        self._document_index: Dict[str, List[int]] = {}
+        self._user_index: Dict[str, List[int]] = {}
+        self._deleted: set = set()
+        
+        # Sparse scoring state: term -> row, term-major CSR matrix of shape (vocab, N),
+        # the documents it covers and the adds/deletes since it was built
+        self.term_index: Dict[str, int] = {}
+        self._weights = None
+        self._weights_docs = 0
+        self._weights_changes = 0
+        self.sparse_rebuild_ratio = DEFAULT_SPARSE_REBUILD_RATIO
+        
+        # Memory-mapped base segment; in-memory lists above hold the delta
+        self._segment = None
+        self._base = 0
+        self._segment_df_delta: Dict[int, int] = {}
+        self.document_loader: Optional[Callable[[List[str], List[Optional[str]]], List[Optional[Document]]]] = None
+        
+        self._lock = threading.RLock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._stop_compaction = threading.Event()
+        
+        # Progress of the last (paged) build, reported by get_build_status()
+        self._cancel_build = threading.Event()
+        self._build_status: Dict[str, Any] = {
+            "state": "idle",
+            "documents_indexed": 0,
+            "documents_total": None,
+            "started_at": None,
+            "finished_at": None,
+            "error": None
+        }
+    
     def build_index(self, documents: List[Document]) -> None:
         """
         Build BM25 index from documents.
@@ -54,37 +141,211 @@ class BM25Retriever:
         if not documents:
             logger.warning("No documents provided to build BM25 index")
             return
-            
+        
         logger.info(f"Building BM25 index with {len(documents)} documents...")
         
-        # Extract text and metadata
-        self.corpus = [doc.page_content for doc in documents]
-        self.doc_metadata = [doc.metadata for doc in documents]
+        with self._lock:
+            self._reset()
+            for doc in documents:
+                self._append_document(doc)
+            
+            if self.scoring_mode == "sparse":
+                self._build_weight_matrix()
+            
+            self._is_built = True
+            self._set_build_ready()
         
-        # Tokenize corpus (simple whitespace + lowercase)
-        self.tokenized_corpus = [self._tokenize(text) for text in self.corpus]
+        logger.info(f"✅ BM25 index built: {self.N} documents, {len(self.doc_freqs)} unique terms, avg_length={self.avgdl:.1f}")
+    
+    def build_index_paged(self, page_loader: Callable[[int, int], List[Document]],
+                          page_size: int = 1000, total: Optional[int] = None) -> None:
+        """
+        Build the index from a paged source, e.g. a vector store collection.
         
-        # Calculate document lengths
-        self.doc_lengths = [len(tokens) for tokens in self.tokenized_corpus]
-        self.avgdl = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0
+        The lock is only held while a page is appended, so queries keep
+        running during the build; is_built() stays False until the last page
+        is in, so callers fall back to other retrieval meanwhile. Progress is
+        reported by get_build_status() and cancel_build() stops between pages.
         
-        # Calculate document frequencies
-        self.N = len(self.tokenized_corpus)
-        self.doc_freqs = {}
+        Args:
+            page_loader: Callable (offset, limit) -> documents; a short page ends the build
+            page_size: Number of documents requested per page
+            total: Expected number of documents, for progress reporting
+        """
+        self._cancel_build.clear()
+        with self._lock:
+            self._reset()
+            self._is_built = False
+            self._build_status = {
+                "state": "building",
+                "documents_indexed": 0,
+                "documents_total": total,
+                "started_at": time.time(),
+                "finished_at": None,
+                "error": None
+            }
+        logger.info(f"Building BM25 index in pages of {page_size} (expected documents: {total})...")
         
-        for tokens in self.tokenized_corpus:
-            unique_tokens = set(tokens)
-            for token in unique_tokens:
-                self.doc_freqs[token] = self.doc_freqs.get(token, 0) + 1
+        try:
+            offset = 0
+            while not self._cancel_build.is_set():
+                page = page_loader(offset, page_size)
+                if not page:
+                    break
+                
+                with self._lock:
+                    for doc in page:
+                        self._append_document(doc)
+                    self._build_status["documents_indexed"] += len(page)
+                
+                offset += len(page)
+                logger.debug(f"BM25 build progress: {offset}/{total if total is not None else '?'} documents")
+                if len(page) < page_size:
+                    break
+            
+            if self._cancel_build.is_set():
+                with self._lock:
+                    self._build_status.update(state="cancelled", finished_at=time.time())
+                logger.info("BM25 index build cancelled")
+                return
+            
+            with self._lock:
+                if self.scoring_mode == "sparse" and self.corpus:
+                    self._build_weight_matrix()
+                self._is_built = bool(self.corpus)
+                self._build_status.update(state="ready", finished_at=time.time())
+        except Exception as e:
+            with self._lock:
+                self._build_status.update(state="failed", finished_at=time.time(), error=str(e))
+            raise
+        
+        status = self.get_build_status()
+        logger.info(f"✅ BM25 index built: {self.N} documents in {status['elapsed_seconds']:.1f}s")
+    
+    def cancel_build(self) -> None:
+        """Stop a running build_index_paged() after the current page."""
+        self._cancel_build.set()
+    
+    def _set_build_ready(self) -> None:
+        """Record an index that was built or loaded in one step."""
+        now = time.time()
+        self._build_status = {
+            "state": "ready",
+            "documents_indexed": self.N,
+            "documents_total": self.N,
+            "started_at": now,
+            "finished_at": now,
+            "error": None
+        }
+    
+    def get_build_status(self) -> Dict[str, Any]:
+        """
+        Get the progress of the current or last build.
         
-        # Calculate IDF scores
-        self.idf = {}
-        for term, freq in self.doc_freqs.items():
-            # IDF formula: log((N - df + 0.5) / (df + 0.5) + 1)
-            self.idf[term] = self._calc_idf(freq)
+        Returns:
+            Dictionary with state ("idle", "building", "ready", "failed" or
+            "cancelled"), document counts, progress and elapsed seconds
+        """
+        with self._lock:
+            status = dict(self._build_status)
         
+        started_at, finished_at = status.pop("started_at"), status.pop("finished_at")
+        status["elapsed_seconds"] = ((finished_at or time.time()) - started_at) if started_at else 0.0
+        total = status["documents_total"]
+        status["progress"] = min(status["documents_indexed"] / total, 1.0) if total else None
+        return status
+    
+    def _reset(self) -> None:
+        """Clear all index state."""
+        self.corpus = []
+        self.tokenized_corpus = []
+        self.doc_metadata = []
+        self.doc_lengths = []
+        self.doc_freqs = {}
+        self.postings = {}
+        self.N = 0
+        self._total_length = 0
+        self.chunk_ids = []
+        self._chunk_index = {}
+        self._document_index = {}
+        self._user_index = {}
+        self._deleted = set()
+        self._weights = None
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = None
+        self._base = 0
+        self._segment_df_delta = {}
+    
+    def _attach_segment(self, segment) -> None:
+        """
+        Replace all index state with a segment as the base.
+        
+        Args:
+            segment: Open BM25Segment
+        """
+        self._reset()
+        self._segment = segment
+        self._base = segment.num_docs
+        self.N = segment.num_docs
+        self._total_length = segment.total_length
         self._is_built = True
-        logger.info(f"✅ BM25 index built: {self.N} documents, {len(self.idf)} unique terms, avg_length={self.avgdl:.1f}")
+        self._set_build_ready()
+    
+    @property
+    def avgdl(self) -> float:
+        """Average length of live documents, derived from maintained counters."""
+        return self._total_length / self.N if self.N else 0
+    
+    @property
+    def idf(self) -> Dict[str, float]:
+        """
+        IDF of every live term.
+        
+        Query scoring computes IDF per query term on demand; this mapping is
+        only materialized for inspection.
+        """
+        terms = set(self.doc_freqs)
+        if self._segment is not None:
+            terms.update(term for _, term in self._segment.iter_terms())
+        doc_freqs = {term: self._doc_freq(term) for term in terms}
+        return {term: self._calc_idf(freq) for term, freq in doc_freqs.items() if freq > 0}
+    
+    def _segment_term(self, term: str) -> int:
+        """Get the segment term id of a term, or -1 if it is not in the segment."""
+        return self._segment.lookup(term) if self._segment is not None else -1
+    
+    def _doc_freq(self, term: str, term_id: Optional[int] = None) -> int:
+        """
+        Number of live documents containing a term, across segment and delta.
+        
+        Args:
+            term: Term to count
+            term_id: Segment term id if already looked up
+            
+        Returns:
+            Live document frequency
+        """
+        doc_freq = self.doc_freqs.get(term, 0)
+        if self._segment is not None:
+            if term_id is None:
+                term_id = self._segment.lookup(term)
+            if term_id >= 0:
+                doc_freq += int(self._segment.doc_freqs[term_id]) + self._segment_df_delta.get(term_id, 0)
+        return doc_freq
+    
+    def _segment_doc_freqs(self):
+        """Live document frequency of every segment term as an array."""
+        doc_freqs = self._segment.doc_freqs.astype(np.int64)
+        for term_id, change in self._segment_df_delta.items():
+            doc_freqs[term_id] += change
+        return doc_freqs
+    
+    def _doc_length(self, doc_idx: int) -> int:
+        """Length in tokens of a segment or delta document."""
+        if doc_idx < self._base:
+            return int(self._segment.doc_lengths[doc_idx])
+        return self.doc_lengths[doc_idx - self._base]
     
     def _tokenize(self, text: str) -> List[str]:
         """
@@ -98,6 +359,115 @@ class BM25Retriever:
         """
         return text.lower().split()
     
+    def _append_document(self, doc: Document) -> None:
+        """
+        Append one document to the corpus and postings in O(its tokens).
+        
+        A document whose chunk_id is already indexed replaces the old copy,
+        which is tombstoned first.
+        
+        Args:
+            doc: LangChain Document to index
+        """
+        chunk_id = doc.metadata.get('chunk_id')
+        if chunk_id is not None:
+            existing = self._find_chunk(chunk_id)
+            if existing is not None:
+                self._tombstone(existing)
+        
+        doc_idx = self._base + len(self.corpus)
+        tokens = self._tokenize(doc.page_content)
+        self.corpus.append(doc.page_content)
+        self.doc_metadata.append(doc.metadata)
+        self.tokenized_corpus.append(tokens)
+        self.doc_lengths.append(len(tokens))
+        self._index_tokens(doc_idx, tokens)
+        
+        self.chunk_ids.append(chunk_id)
+        if chunk_id is not None:
+            self._chunk_index[chunk_id] = doc_idx
+        document_id = doc.metadata.get('document_id')
+        if document_id is not None:
+            self._document_index.setdefault(document_id, []).append(doc_idx)
+        user_id = doc.metadata.get('user_id')
+        if user_id:
+            self._user_index.setdefault(user_id, []).append(doc_idx)
+        
+        self.N += 1
+        self._total_length += len(tokens)
+    
+    def _find_chunk(self, chunk_id: str) -> Optional[int]:
+        """
+        Find the live document indexed under a chunk ID.
+        
+        Args:
+            chunk_id: Chunk ID to look up
+            
+        Returns:
+            Document index, or None if the chunk is not indexed
+        """
+        doc_idx = self._chunk_index.get(chunk_id)
+        if doc_idx is None and self._segment is not None:
+            for candidate in self._segment.columns['chunk_id'].find(chunk_id):
+                if candidate not in self._deleted:
+                    return candidate
+        return doc_idx
+    
+    def _index_tokens(self, doc_idx: int, tokens: List[str]) -> None:
+        """
+        Append a document's term frequencies to the postings lists.
+        
+        Documents are always indexed in increasing doc_idx order, so every
+        postings list stays sorted by document index.
+        
+        Args:
+            doc_idx: Index of the document in the corpus
+            tokens: Tokenized document text
+        """
+        for token, tf in Counter(tokens).items():
+            self.postings.setdefault(token, []).append((doc_idx, tf))
+            self.doc_freqs[token] = self.doc_freqs.get(token, 0) + 1
+    
+    def _tombstone(self, doc_idx: int) -> bool:
+        """
+        Mark a document as deleted and remove it from the live counters.
+        
+        Its postings stay in place until the next compaction.
+        
+        Args:
+            doc_idx: Index of the document in the corpus
+            
+        Returns:
+            True if the document was live
+        """
+        if doc_idx in self._deleted:
+            return False
+        
+        self._deleted.add(doc_idx)
+        self.N -= 1
+        
+        if doc_idx < self._base:
+            # Segment documents: adjust document frequencies via the forward index
+            for term_id in self._segment.doc_terms(doc_idx).tolist():
+                self._segment_df_delta[term_id] = self._segment_df_delta.get(term_id, 0) - 1
+            self._total_length -= int(self._segment.doc_lengths[doc_idx])
+            return True
+        
+        local_idx = doc_idx - self._base
+        for token in set(self.tokenized_corpus[local_idx]):
+            remaining = self.doc_freqs.get(token, 0) - 1
+            if remaining > 0:
+                self.doc_freqs[token] = remaining
+            else:
+                self.doc_freqs.pop(token, None)
+        
+        self._total_length -= self.doc_lengths[local_idx]
+        
+        chunk_id = self.chunk_ids[local_idx]
+        if chunk_id is not None and self._chunk_index.get(chunk_id) == doc_idx:
+            del self._chunk_index[chunk_id]
+        return True
+    
     def _calc_idf(self, doc_freq: int) -> float:
         """
         Calculate IDF score for a term.
@@ -108,13 +478,60 @@ class BM25Retriever:
         Returns:
             IDF score
         """
-        import math
         return math.log((self.N - doc_freq + 0.5) / (doc_freq + 0.5) + 1.0)
     
+    def _term_weight(self, tf: int, doc_len: int, avgdl: float) -> float:
+        """
+        Calculate the BM25 term-frequency component for one posting.
+        
+        Args:
+            tf: Frequency of the term in the document
+            doc_len: Length of the document in tokens
+            avgdl: Average document length
+            
+        Returns:
+            Saturated, length-normalized term frequency
+        """
+        norm = self.k1 * (1 - self.b + self.b * (doc_len / avgdl)) if avgdl else self.k1
+        return (tf * (self.k1 + 1)) / (tf + norm)
+    
+    def _term_weights(self, tfs, doc_lens, avgdl: float):
+        """Vectorized _term_weight over NumPy arrays of postings."""
+        norm = self.k1 * (1 - self.b + self.b * (doc_lens / avgdl)) if avgdl else self.k1
+        return (tfs * (self.k1 + 1)) / (tfs + norm)
+    
+    def _term_frequency(self, token: str, term_id: int, doc_idx: int) -> int:
+        """
+        Look up a term's frequency in one document with a binary search.
+        
+        Args:
+            token: Term
+            term_id: Segment term id of the term (-1 if absent)
+            doc_idx: Document index
+            
+        Returns:
+            Term frequency, 0 if the document does not contain the term
+        """
+        if doc_idx < self._base:
+            if term_id < 0:
+                return 0
+            docs, tfs = self._segment.postings(term_id)
+            pos = int(np.searchsorted(docs, doc_idx))
+            return int(tfs[pos]) if pos < len(docs) and docs[pos] == doc_idx else 0
+        
+        postings = self.postings.get(token)
+        if not postings:
+            return 0
+        pos = bisect_left(postings, (doc_idx, 0))
+        return postings[pos][1] if pos < len(postings) and postings[pos][0] == doc_idx else 0
+    
     def _calc_bm25_score(self, query_tokens: List[str], doc_idx: int) -> float:
         """
         Calculate BM25 score for a document given query tokens.
         
+        Term frequencies are looked up in the postings lists with a binary
+        search instead of re-counting the document's tokens.
+        
         Args:
             query_tokens: Tokenized query
             doc_idx: Document index
@@ -122,38 +539,175 @@ class BM25Retriever:
         Returns:
             BM25 score
         """
-        score = 0.0
-        doc_tokens = self.tokenized_corpus[doc_idx]
-        doc_len = self.doc_lengths[doc_idx]
+        if doc_idx in self._deleted:
+            return 0.0
         
-        # Count term frequencies in document
-        term_freqs = {}
-        for token in doc_tokens:
-            term_freqs[token] = term_freqs.get(token, 0) + 1
+        score = 0.0
+        doc_len = self._doc_length(doc_idx)
+        avgdl = self.avgdl
         
-        # Calculate score for each query term
         for token in query_tokens:
-            if token not in self.idf:
+            term_id = self._segment_term(token)
+            doc_freq = self._doc_freq(token, term_id)
+            if doc_freq <= 0:
                 continue
-                
-            tf = term_freqs.get(token, 0)
-            idf = self.idf[token]
             
-            # BM25 formula
-            numerator = tf * (self.k1 + 1)
-            denominator = tf + self.k1 * (1 - self.b + self.b * (doc_len / self.avgdl))
-            
-            score += idf * (numerator / denominator)
+            tf = self._term_frequency(token, term_id, doc_idx)
+            if tf:
+                idf = self._calc_idf(doc_freq)
+                score += idf * self._term_weight(tf, doc_len, avgdl)
         
         return score
     
-    def search(self, query: str, k: int = 20) -> List[Tuple[Document, float]]:
+    def _partition(self, document_ids: Optional[List[str]] = None,
+                   user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a document/user filter to the documents it allows.
+        
+        Segment documents are written grouped by (user_id, document_id), so a
+        partition is a few contiguous row ranges; delta documents come from
+        the in-memory partition lists. IDF and avgdl stay corpus-wide, so
+        filtered scores equal unfiltered ones.
+        
+        Args:
+            document_ids: Only allow chunks of these documents
+            user_id: Only allow chunks owned by this user
+            
+        Returns:
+            None when unfiltered, otherwise {"starts", "ends"} segment row
+            ranges and a "delta" set of delta document indices
+        """
+        if document_ids is None and not user_id:
+            return None
+        
+        starts = ends = None
+        if self._segment is not None:
+            columns = self._segment.columns
+            if document_ids is not None:
+                rows = []
+                for document_id in set(document_ids):
+                    document_rows = columns['document_id'].rows(document_id)
+                    # All chunks of a document share its owner; check the first one
+                    if len(document_rows) and (not user_id or columns['user_id'].get(int(document_rows[0])) == user_id):
+                        rows.append(document_rows)
+                rows = np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+            else:
+                rows = columns['user_id'].rows(user_id)
+            
+            # Collapse sorted rows into [start, end) runs
+            breaks = np.flatnonzero(np.diff(rows) != 1)
+            starts = rows[np.concatenate(([0], breaks + 1))] if len(rows) else rows
+            ends = rows[np.concatenate((breaks, [len(rows) - 1]))] + 1 if len(rows) else rows
+        
+        if document_ids is not None:
+            delta = {doc_idx for document_id in document_ids for doc_idx in self._document_index.get(document_id, ())}
+            if user_id:
+                delta.intersection_update(self._user_index.get(user_id, ()))
+        else:
+            delta = set(self._user_index.get(user_id, ()))
+        
+        return {"starts": starts, "ends": ends, "delta": delta}
+    
+    @staticmethod
+    def _slice_ranges(docs, starts, ends):
+        """
+        Get the positions of sorted postings docs that fall into row ranges.
+        
+        Args:
+            docs: Sorted document ids of a postings list
+            starts: Range starts (inclusive)
+            ends: Range ends (exclusive)
+            
+        Returns:
+            Array of positions into docs
+        """
+        lo = np.searchsorted(docs, starts)
+        lengths = np.searchsorted(docs, ends) - lo
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        return np.repeat(lo - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+    
+    def _score_query(self, query_tokens: List[str], partition: Optional[Dict[str, Any]] = None) -> Dict[int, float]:
+        """
+        Accumulate BM25 scores over the postings of the query terms.
+        
+        Only documents containing at least one query term are visited.
+        Repeated query terms contribute once per occurrence, matching the
+        term-at-a-time BM25 definition. Tombstoned documents are dropped.
+        Segment postings are scored with NumPy and summed per document.
+        With a partition only the postings inside it are scored.
+        
+        Args:
+            query_tokens: Tokenized query
+            partition: Allowed documents from _partition(), None for all
+            
+        Returns:
+            Mapping of doc_idx to BM25 score
+        """
+        scores: Dict[int, float] = {}
+        avgdl = self.avgdl
+        doc_lengths = self.doc_lengths
+        base = self._base
+        segment_docs, segment_scores = [], []
+        
+        for token, query_tf in Counter(query_tokens).items():
+            term_id = self._segment_term(token)
+            doc_freq = self._doc_freq(token, term_id)
+            if doc_freq <= 0:
+                continue
+            
+            idf = self._calc_idf(doc_freq) * query_tf
+            if term_id >= 0:
+                docs, tfs = self._segment.postings(term_id)
+                if partition is not None:
+                    positions = self._slice_ranges(docs, partition["starts"], partition["ends"])
+                    docs, tfs = docs[positions], tfs[positions]
+                segment_docs.append(docs)
+                segment_scores.append(idf * self._term_weights(tfs, self._segment.doc_lengths[docs], avgdl))
+            
+            postings = self.postings.get(token, ())
+            if partition is not None:
+                allowed = partition["delta"]
+                if len(allowed) < len(postings):
+                    # Small partition: binary-search each allowed document
+                    postings = [
+                        (doc_idx, tf) for doc_idx in sorted(allowed)
+                        for tf in (self._term_frequency(token, -1, doc_idx),) if tf
+                    ]
+                else:
+                    postings = [(doc_idx, tf) for doc_idx, tf in postings if doc_idx in allowed]
+            for doc_idx, tf in postings:
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * self._term_weight(tf, doc_lengths[doc_idx - base], avgdl)
+        
+        if segment_docs:
+            # Segment and delta indices are disjoint, so the sums just merge
+            unique_docs, inverse = np.unique(np.concatenate(segment_docs), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(segment_scores))
+            scores.update(zip(unique_docs.tolist(), totals.tolist()))
+        
+        if self._deleted:
+            if len(self._deleted) < len(scores):
+                for doc_idx in self._deleted:
+                    scores.pop(doc_idx, None)
+            else:
+                scores = {doc_idx: score for doc_idx, score in scores.items() if doc_idx not in self._deleted}
+        
+        return scores
+    
+    def search(self, query: str, k: int = 20, document_ids: Optional[List[str]] = None,
+               user_id: Optional[str] = None) -> List[Tuple[Document, float]]:
         """
         Search documents using BM25.
         
+        With document_ids and/or user_id only the matching partitions are
+        scored (always via postings, also in sparse mode).
+        
         Args:
             query: Search query
             k: Number of top results to return
+            document_ids: Only return chunks of these documents
+            user_id: Only return chunks owned by this user
             
         Returns:
             List of (Document, score) tuples
@@ -162,38 +716,310 @@ class BM25Retriever:
             logger.warning("BM25 index not built, returning empty results")
             return []
         
-        # Tokenize query
-        query_tokens = self._tokenize(query)
-        
-        # Calculate scores for all documents
-        scores = []
-        for idx in range(self.N):
-            score = self._calc_bm25_score(query_tokens, idx)
-            scores.append((idx, score))
+        filtered = document_ids is not None or bool(user_id)
+        if self.scoring_mode == "sparse" and not filtered:
+            return self._search_sparse([query], k)[0]
         
-        # Sort by score (descending)
-        scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # Get top k results
-        top_k = scores[:k]
+        with self._lock:
+            # Tokenize query and score only documents present in the postings
+            query_tokens = self._tokenize(query)
+            scores = self._score_query(query_tokens, self._partition(document_ids, user_id))
+            
+            # Heap-based top-k selection (ties broken by lower doc index)
+            top_k = heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+            top_k = [(idx, score) for idx, score in top_k if score > 0]  # Only non-zero scores
+            
+            hits = self._collect_hits([idx for idx, _ in top_k])
         
-        # Convert to Document objects with scores
-        results = []
-        for idx, score in top_k:
-            if score > 0:  # Only return documents with non-zero scores
-                doc = Document(
-                    page_content=self.corpus[idx],
-                    metadata=self.doc_metadata[idx]
-                )
-                results.append((doc, score))
+        # Segment text is loaded from the vector store without holding the index lock
+        documents = self._resolve_hits(hits)
+        results = [(doc, score) for doc, (_, score) in zip(documents, top_k) if doc is not None]
         
         logger.debug(f"BM25 search returned {len(results)} results for query: '{query[:50]}...'")
         return results
     
+    def search_batch(self, queries: List[str], k: int = 20, document_ids: Optional[List[str]] = None,
+                     user_id: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Search documents using BM25 for several queries at once.
+        
+        In sparse mode all queries are scored with a single sparse
+        matrix-matrix product; otherwise (or when filtered to partitions)
+        each query uses the postings lists.
+        
+        Args:
+            queries: Search queries
+            k: Number of top results to return per query
+            document_ids: Only return chunks of these documents
+            user_id: Only return chunks owned by this user
+            
+        Returns:
+            One list of (Document, score) tuples per query, in query order
+        """
+        if not self._is_built:
+            logger.warning("BM25 index not built, returning empty results")
+            return [[] for _ in queries]
+        
+        if self.scoring_mode != "sparse" or document_ids is not None or user_id:
+            return [self.search(query, k=k, document_ids=document_ids, user_id=user_id) for query in queries]
+        
+        return self._search_sparse(queries, k)
+    
+    def _build_weight_matrix(self) -> None:
+        """
+        Precompute the BM25 weight of every (document, term) pair as a CSR matrix.
+        
+        Entry (t, d) holds idf(t) * tf_component(d, t), so scoring a query is
+        a sparse product with its term-count vector. The matrix is stored
+        term-major (each row is a weighted postings list), which keeps the
+        product proportional to the postings actually touched. Tombstoned
+        documents get no entries.
+        
+        Segment terms use their term id as row; delta-only terms are numbered
+        after them in term_index.
+        """
+        avgdl = self.avgdl
+        base = self._base
+        num_segment_terms = self._segment.num_terms if self._segment is not None else 0
+        rows, cols, data = [], [], []
+        
+        if self._segment is not None:
+            doc_freqs = self._segment_doc_freqs()
+            for term, freq in self.doc_freqs.items():
+                term_id = self._segment.lookup(term)
+                if term_id >= 0:
+                    doc_freqs[term_id] += freq
+            idf = np.log((self.N - doc_freqs + 0.5) / (doc_freqs + 0.5) + 1.0)
+            
+            term_ids, docs, tfs = self._segment.all_postings()
+            if self._deleted:
+                live = np.ones(base, dtype=bool)
+                live[[doc_idx for doc_idx in self._deleted if doc_idx < base]] = False
+                keep = live[docs]
+                term_ids, docs, tfs = term_ids[keep], docs[keep], tfs[keep]
+            rows.append(term_ids)
+            cols.append(docs)
+            data.append(idf[term_ids] * self._term_weights(tfs, self._segment.doc_lengths[docs], avgdl))
+        
+        self.term_index = {}
+        delta_rows, delta_cols, delta_data = [], [], []
+        for term in self.doc_freqs:
+            term_id = self._segment_term(term)
+            if term_id < 0:
+                term_id = self.term_index[term] = num_segment_terms + len(self.term_index)
+            idf_term = self._calc_idf(self._doc_freq(term))
+            for doc_idx, tf in self.postings[term]:
+                if doc_idx in self._deleted:
+                    continue
+                delta_rows.append(term_id)
+                delta_cols.append(doc_idx)
+                delta_data.append(idf_term * self._term_weight(tf, self.doc_lengths[doc_idx - base], avgdl))
+        rows.append(np.asarray(delta_rows, dtype=np.int64))
+        cols.append(np.asarray(delta_cols, dtype=np.int64))
+        data.append(np.asarray(delta_data, dtype=np.float64))
+        
+        self._weights = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(num_segment_terms + len(self.term_index), base + len(self.corpus))
+        )
+        self._weights_docs = base + len(self.corpus)
+        self._weights_changes = 0
+        logger.debug(f"BM25 weight matrix built: shape={self._weights.shape}, nnz={self._weights.nnz}")
+    
+    def _query_matrix(self, queries: List[str]):
+        """
+        Encode queries as an (n_queries, vocab) sparse term-count matrix.
+        
+        Args:
+            queries: Search queries
+            
+        Returns:
+            CSR matrix of query term counts; unknown terms are dropped
+        """
+        rows, cols, data = [], [], []
+        for query_idx, query in enumerate(queries):
+            for token, count in Counter(self._tokenize(query)).items():
+                col = self._segment_term(token)
+                if col < 0:
+                    col = self.term_index.get(token)
+                if col is not None:
+                    rows.append(query_idx)
+                    cols.append(col)
+                    data.append(float(count))
+        
+        return sparse.csr_matrix(
+            (data, (rows, cols)),
+            shape=(len(queries), self._weights.shape[0])
+        )
+    
+    def _search_sparse(self, queries: List[str], k: int) -> List[List[Tuple[Document, float]]]:
+        """
+        Score queries with one sparse product and select top-k with argpartition.
+        
+        The weight matrix bakes in IDF and avgdl, which every add or delete
+        changes, so it is only rebuilt once the changes since the last build
+        exceed sparse_rebuild_ratio of the index. Meanwhile documents added
+        since are scored from their postings and deleted ones are dropped;
+        documents in the matrix keep the statistics of its build.
+        
+        Args:
+            queries: Search queries
+            k: Number of top results to return per query
+            
+        Returns:
+            One list of (Document, score) tuples per query
+        """
+        with self._lock:
+            if self._weights is None or self._weights_changes > self.sparse_rebuild_ratio * max(self.N, 1):
+                self._build_weight_matrix()
+            
+            # Result is sparse too: row q only holds documents matching query q
+            scores = sparse.csr_matrix(self._query_matrix(queries) @ self._weights)
+            
+            # Documents appended after the build, scored exactly from postings
+            total = self._base + len(self.corpus)
+            tail = None
+            if self._weights_docs < total:
+                empty = np.empty(0, dtype=np.int64)
+                tail = {"starts": empty, "ends": empty, "delta": set(range(self._weights_docs, total))}
+            deleted = np.fromiter(self._deleted, dtype=np.int64) if self._deleted else None
+            
+            all_hits = []
+            for query_idx in range(len(queries)):
+                start, end = scores.indptr[query_idx], scores.indptr[query_idx + 1]
+                doc_indices = scores.indices[start:end]
+                doc_scores = scores.data[start:end]
+                
+                if deleted is not None:
+                    live = ~np.isin(doc_indices, deleted)
+                    doc_indices, doc_scores = doc_indices[live], doc_scores[live]
+                if tail is not None:
+                    tail_scores = self._score_query(self._tokenize(queries[query_idx]), tail)
+                    if tail_scores:
+                        doc_indices = np.concatenate((doc_indices, np.fromiter(tail_scores.keys(), dtype=np.int64)))
+                        doc_scores = np.concatenate((doc_scores, np.fromiter(tail_scores.values(), dtype=np.float64)))
+                
+                top_k = [
+                    (int(doc_indices[pos]), float(doc_scores[pos]))
+                    for pos in self._top_k_indices(doc_indices, doc_scores, k)
+                    if doc_scores[pos] > 0  # Only return documents with non-zero scores
+                ]
+                all_hits.append((top_k, self._collect_hits([idx for idx, _ in top_k])))
+        
+        all_results = []
+        for top_k, hits in all_hits:
+            documents = self._resolve_hits(hits)
+            all_results.append([(doc, score) for doc, (_, score) in zip(documents, top_k) if doc is not None])
+        
+        logger.debug(f"BM25 sparse search scored {len(queries)} queries against {self.N} documents")
+        return all_results
+    
+    def _collect_hits(self, doc_indices: List[int]) -> List[Union[Document, Dict[str, str]]]:
+        """
+        Copy result documents out of the index; the caller holds the lock.
+        
+        Delta documents come from memory. Segment documents are returned as
+        their chunk metadata, to be resolved by _resolve_hits() after the
+        lock is released.
+        
+        Args:
+            doc_indices: Document indices of the results
+            
+        Returns:
+            A Document or segment chunk metadata per index
+        """
+        hits: List[Union[Document, Dict[str, str]]] = []
+        for doc_idx in doc_indices:
+            if doc_idx >= self._base:
+                local_idx = doc_idx - self._base
+                hits.append(Document(page_content=self.corpus[local_idx], metadata=self.doc_metadata[local_idx]))
+            else:
+                hits.append(self._segment_metadata(doc_idx))
+        return hits
+    
+    def _resolve_hits(self, hits: List[Union[Document, Dict[str, str]]]) -> List[Optional[Document]]:
+        """
+        Build result Documents from collected hits, without holding the lock.
+        
+        Segment documents are fetched by chunk_id, with their user_id as
+        the owner, in one document_loader call; without a loader they are returned with empty text and their
+        chunk metadata only.
+        
+        Args:
+            hits: Output of _collect_hits()
+            
+        Returns:
+            Documents aligned with hits, None where the loader found nothing
+        """
+        documents: List[Optional[Document]] = [hit if isinstance(hit, Document) else None for hit in hits]
+        segment_positions = [pos for pos, hit in enumerate(hits) if not isinstance(hit, Document)]
+        if not segment_positions:
+            return documents
+        
+        metadata = [hits[pos] for pos in segment_positions]
+        if self.document_loader is None:
+            for pos, doc_metadata in zip(segment_positions, metadata):
+                documents[pos] = Document(page_content="", metadata=doc_metadata)
+            return documents
+        
+        try:
+            loaded = self.document_loader(
+                [doc_metadata.get('chunk_id') for doc_metadata in metadata],
+                [doc_metadata.get('user_id') for doc_metadata in metadata]
+            )
+        except Exception as e:
+            logger.error(f"Failed to load BM25 segment documents: {e}")
+            loaded = [None] * len(segment_positions)
+        
+        for pos, doc in zip(segment_positions, loaded):
+            documents[pos] = doc
+        return documents
+    
+    def _segment_metadata(self, doc_idx: int) -> Dict[str, str]:
+        """Chunk metadata stored in the segment for one document."""
+        metadata = {}
+        for column in STRING_COLUMNS:
+            value = self._segment.columns[column].get(doc_idx)
+            if value is not None:
+                metadata[column] = value
+        return metadata
+    
+    @staticmethod
+    def _top_k_indices(doc_indices, scores, k: int):
+        """
+        Select the positions of the k highest scores, best first.
+        
+        argpartition finds the k-th best score; every candidate tied with it
+        is kept so that ties resolve to the lower document index, matching
+        postings-mode ordering.
+        
+        Args:
+            doc_indices: 1-D array of document indices
+            scores: 1-D array of scores aligned with doc_indices
+            k: Number of positions to return
+            
+        Returns:
+            Array of positions into doc_indices/scores ordered by descending score
+        """
+        if k <= 0 or scores.size == 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.size:
+            kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            candidates = np.flatnonzero(scores >= kth_score)
+        else:
+            candidates = np.arange(scores.size)
+        # Order by score descending, ties by lower document index
+        order = np.lexsort((doc_indices[candidates], -scores[candidates]))
+        return candidates[order][:k]
+    
     def add_documents(self, documents: List[Document]) -> None:
         """
         Add new documents to existing index (incremental update).
         
+        Cost is proportional to the new tokens only; IDF and avgdl are
+        derived from the updated counters at query time. Documents whose
+        chunk_id is already indexed replace the previous copy.
+        
         Args:
             documents: List of new documents to add
         """
@@ -202,30 +1028,192 @@ class BM25Retriever:
         
         logger.info(f"Adding {len(documents)} documents to BM25 index...")
         
-        # Add to corpus
-        for doc in documents:
-            self.corpus.append(doc.page_content)
-            self.doc_metadata.append(doc.metadata)
-            tokens = self._tokenize(doc.page_content)
-            self.tokenized_corpus.append(tokens)
-            self.doc_lengths.append(len(tokens))
+        with self._lock:
+            for doc in documents:
+                self._append_document(doc)
             
-            # Update document frequencies
-            unique_tokens = set(tokens)
-            for token in unique_tokens:
-                self.doc_freqs[token] = self.doc_freqs.get(token, 0) + 1
+            # New documents are scored from postings until the weight matrix is rebuilt
+            self._weights_changes += len(documents)
+            self._is_built = True
         
-        # Recalculate statistics
-        self.N = len(self.tokenized_corpus)
-        self.avgdl = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0
+        logger.info(f"✅ BM25 index updated: {self.N} total documents")
+    
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """
+        Tombstone documents by chunk ID.
         
-        # Recalculate IDF scores
-        self.idf = {}
-        for term, freq in self.doc_freqs.items():
-            self.idf[term] = self._calc_idf(freq)
+        Args:
+            chunk_ids: Chunk IDs to delete
+            
+        Returns:
+            Number of documents that were deleted
+        """
+        with self._lock:
+            deleted = 0
+            for chunk_id in chunk_ids:
+                doc_idx = self._find_chunk(chunk_id)
+                if doc_idx is not None and self._tombstone(doc_idx):
+                    deleted += 1
+            
+            # Tombstones are filtered from sparse scores until the weight matrix is rebuilt
+            self._weights_changes += deleted
         
-        self._is_built = True
-        logger.info(f"✅ BM25 index updated: {self.N} total documents")
+        if deleted:
+            logger.info(f"Deleted {deleted} chunks from BM25 index")
+        return deleted
+    
+    def delete_document(self, document_id: str) -> int:
+        """
+        Tombstone every chunk belonging to a document.
+        
+        Args:
+            document_id: Document ID whose chunks should be deleted
+            
+        Returns:
+            Number of chunks that were deleted
+        """
+        with self._lock:
+            doc_indices = self._document_index.pop(document_id, [])
+            if self._segment is not None:
+                doc_indices = self._segment.columns['document_id'].find(document_id) + doc_indices
+            
+            deleted = 0
+            for doc_idx in doc_indices:
+                if self._tombstone(doc_idx):
+                    deleted += 1
+            
+            self._weights_changes += deleted
+        
+        if deleted:
+            logger.info(f"Deleted document {document_id} from BM25 index ({deleted} chunks)")
+        return deleted
+    
+    def deleted_ratio(self) -> float:
+        """Fraction of indexed documents that are tombstoned."""
+        total = self._base + len(self.corpus)
+        return len(self._deleted) / total if total else 0.0
+    
+    def compact(self) -> int:
+        """
+        Purge tombstoned documents and renumber the survivors.
+        
+        Relative document order is preserved, so postings lists stay sorted.
+        A segment-backed index is folded (segment plus delta) into a new
+        segment written over the old file; delta documents are resolved
+        through document_loader from then on.
+        
+        Returns:
+            Number of tombstoned documents that were purged
+        """
+        with self._lock:
+            if not self._deleted:
+                return 0
+            
+            purged = len(self._deleted)
+            if self._segment is not None:
+                path, meta = self._segment.path, dict(self._segment.meta)
+                self.save_segment(path, meta=meta, reopen=True)
+                logger.info(f"✅ BM25 segment compacted: purged {purged} deleted documents, {self.N} remain")
+                return purged
+            
+            remap: Dict[int, int] = {}
+            for old_idx in range(len(self.corpus)):
+                if old_idx not in self._deleted:
+                    remap[old_idx] = len(remap)
+            
+            keep = list(remap.keys())
+            self.corpus = [self.corpus[i] for i in keep]
+            self.tokenized_corpus = [self.tokenized_corpus[i] for i in keep]
+            self.doc_metadata = [self.doc_metadata[i] for i in keep]
+            self.doc_lengths = [self.doc_lengths[i] for i in keep]
+            self.chunk_ids = [self.chunk_ids[i] for i in keep]
+            
+            postings = {}
+            for term, term_postings in self.postings.items():
+                kept = [(remap[doc_idx], tf) for doc_idx, tf in term_postings if doc_idx in remap]
+                if kept:
+                    postings[term] = kept
+            self.postings = postings
+            
+            self._chunk_index = {
+                chunk_id: doc_idx for doc_idx, chunk_id in enumerate(self.chunk_ids) if chunk_id is not None
+            }
+            self._document_index = self._remap_partitions(self._document_index, remap)
+            self._user_index = self._remap_partitions(self._user_index, remap)
+            
+            self._deleted = set()
+            self._weights = None
+        
+        logger.info(f"✅ BM25 index compacted: purged {purged} deleted documents, {self.N} remain")
+        return purged
+    
+    @staticmethod
+    def _remap_partitions(partitions: Dict[str, List[int]], remap: Dict[int, int]) -> Dict[str, List[int]]:
+        """Renumber partition member lists after compaction, dropping purged documents."""
+        remapped: Dict[str, List[int]] = {}
+        for key, doc_indices in partitions.items():
+            kept = [remap[doc_idx] for doc_idx in doc_indices if doc_idx in remap]
+            if kept:
+                remapped[key] = kept
+        return remapped
+    
+    def start_background_compaction(self, interval_seconds: float = 300.0,
+                                    min_deleted_ratio: float = 0.1) -> None:
+        """
+        Periodically compact the index from a daemon thread.
+        
+        Args:
+            interval_seconds: Seconds between tombstone checks
+            min_deleted_ratio: Compact once this fraction of documents is tombstoned
+        """
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        
+        def compaction_loop():
+            while not self._stop_compaction.wait(interval_seconds):
+                try:
+                    if self._deleted and self.deleted_ratio() >= min_deleted_ratio:
+                        self.compact()
+                except Exception as e:
+                    logger.error(f"BM25 background compaction failed: {e}")
+        
+        self._stop_compaction.clear()
+        self._compaction_thread = threading.Thread(
+            target=compaction_loop,
+            name="bm25-compaction",
+            daemon=True
+        )
+        self._compaction_thread.start()
+        logger.info(f"BM25 background compaction started (every {interval_seconds}s, threshold {min_deleted_ratio:.0%})")
+    
+    def stop_background_compaction(self) -> None:
+        """Stop the background compaction thread if it is running."""
+        self._stop_compaction.set()
+        if self._compaction_thread:
+            self._compaction_thread.join(timeout=5)
+            self._compaction_thread = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics.
+        
+        Returns:
+            Dictionary with live/deleted document counts and vocabulary size
+        """
+        with self._lock:
+            unique_terms = len(self.doc_freqs)
+            if self._segment is not None:
+                unique_terms = int(np.count_nonzero(self._segment_doc_freqs()))
+                unique_terms += sum(1 for term in self.doc_freqs if self._segment.lookup(term) < 0)
+        
+        return {
+            "documents": self.N,
+            "deleted_documents": len(self._deleted),
+            "segment_documents": self._base,
+            "unique_terms": unique_terms,
+            "avg_doc_length": self.avgdl,
+            "scoring_mode": self.scoring_mode
+        }
     
     def save(self, filepath: str) -> None:
         """
@@ -234,24 +1222,31 @@ class BM25Retriever:
         Args:
             filepath: Path to save the index
         """
+        if self._segment is not None:
+            logger.error("BM25 index is backed by a segment file and holds no text; use save_segment() instead")
+            return
+        
         try:
             # Create directory if it doesn't exist
             Path(filepath).parent.mkdir(parents=True, exist_ok=True)
             
-            with open(filepath, 'wb') as f:
-                pickle.dump({
-                    'corpus': self.corpus,
-                    'tokenized_corpus': self.tokenized_corpus,
-                    'doc_metadata': self.doc_metadata,
-                    'doc_lengths': self.doc_lengths,
-                    'avgdl': self.avgdl,
-                    'doc_freqs': self.doc_freqs,
-                    'idf': self.idf,
-                    'N': self.N,
-                    'k1': self.k1,
-                    'b': self.b,
-                    '_is_built': self._is_built
-                }, f)
+            with self._lock:
+                with open(filepath, 'wb') as f:
+                    pickle.dump({
+                        'corpus': self.corpus,
+                        'tokenized_corpus': self.tokenized_corpus,
+                        'doc_metadata': self.doc_metadata,
+                        'doc_lengths': self.doc_lengths,
+                        'doc_freqs': self.doc_freqs,
+                        'postings': self.postings,
+                        'chunk_ids': self.chunk_ids,
+                        'deleted': self._deleted,
+                        'N': self.N,
+                        'k1': self.k1,
+                        'b': self.b,
+                        'scoring_mode': self.scoring_mode,
+                        '_is_built': self._is_built
+                    }, f)
             logger.info(f"✅ BM25 index saved to {filepath}")
         except Exception as e:
             logger.error(f"Failed to save BM25 index: {e}")
@@ -271,23 +1266,205 @@ class BM25Retriever:
             with open(filepath, 'rb') as f:
                 data = pickle.load(f)
             
-            retriever = cls(k1=data['k1'], b=data['b'])
+            retriever = cls(k1=data['k1'], b=data['b'], scoring_mode=data.get('scoring_mode', 'postings'))
+            
+            # Indexes saved before postings/tombstones existed are re-indexed on load
+            if 'postings' not in data or 'deleted' not in data:
+                documents = [
+                    Document(page_content=text, metadata=metadata)
+                    for text, metadata in zip(data['corpus'], data['doc_metadata'])
+                ]
+                if documents:
+                    retriever.add_documents(documents)
+                retriever._is_built = data['_is_built']
+                logger.info(f"✅ BM25 index loaded from {filepath} ({retriever.N} documents, re-indexed)")
+                return retriever
+            
             retriever.corpus = data['corpus']
             retriever.tokenized_corpus = data['tokenized_corpus']
             retriever.doc_metadata = data['doc_metadata']
             retriever.doc_lengths = data['doc_lengths']
-            retriever.avgdl = data['avgdl']
             retriever.doc_freqs = data['doc_freqs']
-            retriever.idf = data['idf']
+            retriever.postings = data['postings']
+            retriever.chunk_ids = data['chunk_ids']
+            retriever._deleted = data['deleted']
             retriever.N = data['N']
+            retriever._total_length = sum(
+                length for doc_idx, length in enumerate(retriever.doc_lengths) if doc_idx not in retriever._deleted
+            )
             retriever._is_built = data['_is_built']
             
+            for doc_idx, chunk_id in enumerate(retriever.chunk_ids):
+                if doc_idx in retriever._deleted:
+                    continue
+                if chunk_id is not None:
+                    retriever._chunk_index[chunk_id] = doc_idx
+                document_id = retriever.doc_metadata[doc_idx].get('document_id')
+                if document_id is not None:
+                    retriever._document_index.setdefault(document_id, []).append(doc_idx)
+                user_id = retriever.doc_metadata[doc_idx].get('user_id')
+                if user_id:
+                    retriever._user_index.setdefault(user_id, []).append(doc_idx)
+            
             logger.info(f"✅ BM25 index loaded from {filepath} ({retriever.N} documents)")
             return retriever
         except Exception as e:
             logger.error(f"Failed to load BM25 index: {e}")
             return cls()
     
+    def save_segment(self, filepath: str, meta: Optional[Dict[str, Any]] = None, reopen: bool = False) -> None:
+        """
+        Write the live index (segment plus delta, tombstones purged) as a segment file.
+        
+        Only terms, postings, lengths and chunk_id/document_id/user_id are
+        written; text stays in the vector store and is resolved by chunk_id.
+        Documents are written grouped by (user_id, document_id) so that
+        every user and document partition is a contiguous row range.
+        
+        Args:
+            filepath: Path of the segment file
+            meta: Extra values stored in the segment header
+            reopen: Replace the in-memory index with the written segment
+                under the same lock, so no update can slip in between
+        """
+        with self._lock:
+            base = self._base
+            total = base + len(self.corpus)
+            live = np.ones(total, dtype=bool)
+            if self._deleted:
+                live[list(self._deleted)] = False
+            
+            # Live documents in index order
+            doc_lengths, columns = [], {column: [] for column in STRING_COLUMNS}
+            unresolvable = 0
+            if self._segment is not None:
+                live_segment = np.flatnonzero(live[:base])
+                doc_lengths.extend(self._segment.doc_lengths[live_segment].tolist())
+                for column in STRING_COLUMNS:
+                    segment_column = self._segment.columns[column]
+                    columns[column].extend(segment_column.get(doc_idx) for doc_idx in live_segment.tolist())
+            for local_idx in range(len(self.corpus)):
+                if base + local_idx in self._deleted:
+                    continue
+                doc_lengths.append(self.doc_lengths[local_idx])
+                columns['chunk_id'].append(self.chunk_ids[local_idx])
+                columns['document_id'].append(self.doc_metadata[local_idx].get('document_id'))
+                columns['user_id'].append(self.doc_metadata[local_idx].get('user_id'))
+                if self.chunk_ids[local_idx] is None:
+                    unresolvable += 1
+            
+            # New row of each live document, grouped by (user_id, document_id)
+            permutation = sorted(
+                range(len(doc_lengths)),
+                key=lambda i: (columns['user_id'][i] or "", columns['document_id'][i] or "")
+            )
+            new_rows = np.empty(len(permutation), dtype=np.int64)
+            new_rows[permutation] = np.arange(len(permutation))
+            remap = np.full(total, -1, dtype=np.int64)
+            remap[live] = new_rows
+            doc_lengths = [doc_lengths[i] for i in permutation]
+            columns = {column: [values[i] for i in permutation] for column, values in columns.items()}
+            
+            # Vocabulary in sorted order; terms left without live postings are dropped below
+            segment_terms = [term for _, term in self._segment.iter_terms()] if self._segment is not None else []
+            vocabulary = sorted(set(segment_terms).union(self.doc_freqs))
+            term_to_id = {term: term_id for term_id, term in enumerate(vocabulary)}
+            
+            term_ids, docs, tfs = [], [], []
+            if self._segment is not None:
+                segment_term_ids, segment_docs, segment_tfs = self._segment.all_postings()
+                keep = live[segment_docs]
+                segment_map = np.asarray([term_to_id[term] for term in segment_terms], dtype=np.int64)
+                term_ids.append(segment_map[segment_term_ids[keep]])
+                docs.append(remap[segment_docs[keep]])
+                tfs.append(segment_tfs[keep].astype(np.int64))
+            
+            delta_term_ids, delta_docs, delta_tfs = [], [], []
+            for term in self.doc_freqs:
+                for doc_idx, tf in self.postings[term]:
+                    if doc_idx not in self._deleted:
+                        delta_term_ids.append(term_to_id[term])
+                        delta_docs.append(remap[doc_idx])
+                        delta_tfs.append(tf)
+            term_ids.append(np.asarray(delta_term_ids, dtype=np.int64))
+            docs.append(np.asarray(delta_docs, dtype=np.int64))
+            tfs.append(np.asarray(delta_tfs, dtype=np.int64))
+            
+            term_ids, docs, tfs = np.concatenate(term_ids), np.concatenate(docs), np.concatenate(tfs)
+            order = np.lexsort((docs, term_ids))
+            term_ids, docs, tfs = term_ids[order], docs[order], tfs[order]
+            counts = np.bincount(term_ids, minlength=len(vocabulary))
+            bounds = np.concatenate(([0], np.cumsum(counts)))
+            present = np.flatnonzero(counts)
+            terms = [vocabulary[term_id] for term_id in present.tolist()]
+            postings = [(docs[bounds[term_id]:bounds[term_id + 1]], tfs[bounds[term_id]:bounds[term_id + 1]])
+                        for term_id in present.tolist()]
+            
+            write_segment(
+                filepath,
+                terms,
+                postings,
+                np.asarray(doc_lengths, dtype=np.int64),
+                columns,
+                meta={**(meta or {}), 'k1': self.k1, 'b': self.b}
+            )
+            
+            if reopen:
+                self._attach_segment(BM25Segment(filepath))
+        
+        if unresolvable:
+            logger.warning(f"{unresolvable} documents without chunk_id written to BM25 segment; their text cannot be resolved")
+    
+    def get_segment_meta(self) -> Dict[str, Any]:
+        """Extra values stored in the header of the backing segment ({} if none)."""
+        return dict(self._segment.meta) if self._segment is not None else {}
+    
+    @classmethod
+    def load_segment(cls, filepath: str,
+                     document_loader: Optional[Callable[[List[str], List[Optional[str]]], List[Optional[Document]]]] = None,
+                     scoring_mode: str = "postings") -> 'BM25Retriever':
+        """
+        Open a segment file as the base of a new index.
+        
+        The file is memory-mapped, so loading does not depend on corpus size.
+        
+        Args:
+            filepath: Path of the segment file
+            document_loader: Callable mapping chunk IDs and their owners (user_id,
+                None if unknown) to Documents (None if missing)
+            scoring_mode: "postings" or "sparse"
+            
+        Returns:
+            Loaded BM25Retriever instance
+        """
+        try:
+            segment = BM25Segment(filepath)
+            retriever = cls(k1=segment.meta.get('k1', 1.5), b=segment.meta.get('b', 0.75), scoring_mode=scoring_mode)
+            retriever.document_loader = document_loader
+            retriever._attach_segment(segment)
+            
+            if document_loader is None:
+                logger.warning("No document loader given - BM25 segment results will carry chunk metadata only")
+            logger.info(f"✅ BM25 segment loaded from {filepath} ({retriever.N} documents, format v{segment.version})")
+            return retriever
+        except Exception as e:
+            logger.error(f"Failed to load BM25 segment: {e}")
+            return cls(scoring_mode=scoring_mode)
+    
+    def set_scoring_mode(self, scoring_mode: str) -> None:
+        """
+        Switch between postings and sparse-matrix scoring.
+        
+        Args:
+            scoring_mode: "postings" or "sparse"
+        """
+        if scoring_mode not in SCORING_MODES:
+            raise ValueError(f"Unknown BM25 scoring mode '{scoring_mode}', expected one of {SCORING_MODES}")
+        if scoring_mode == "sparse" and not SCIPY_AVAILABLE:
+            logger.warning("SciPy not available - BM25 sparse scoring disabled, using postings")
+            return
+        self.scoring_mode = scoring_mode
+    
     def is_built(self) -> bool:
         """Check if index is built."""
         return self._is_built
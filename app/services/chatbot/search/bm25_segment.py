@@ -0,0 +1,345 @@
+"""
+On-disk segment format for the BM25 index
+
+A segment is a single immutable, versioned file holding everything BM25 needs
+to score queries: a sorted term dictionary, postings (doc, tf), document
+lengths, a forward index (doc -> term ids) used to keep document frequencies
+exact when documents are deleted, and string columns for chunk_id,
+document_id and user_id. Chunk text and metadata are NOT stored; they are
+resolved by chunk_id from the vector store when results are returned.
+
+The file is opened with mmap and every section is exposed as a NumPy view,
+so loading is O(1) regardless of corpus size and only the pages touched by a
+query become resident.
+
+Layout (little-endian):
+    magic (8 bytes) | version (uint32) | header length (uint32) | header JSON
+    followed by 8-byte aligned sections described in the header.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple
+from pathlib import Path
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b"BM25SEG\x00"
+SEGMENT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGNMENT = 8
+
+STRING_COLUMNS = ("chunk_id", "document_id", "user_id")
+
+
+def _encode_strings(values: List[Optional[str]]) -> Tuple[np.ndarray, bytes]:
+    """Encode strings as (offsets, utf-8 blob); None is stored as an empty string."""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+    return offsets, b"".join(encoded)
+
+
+class _StringColumn:
+    """
+    Read-only view over an encoded string column.
+    
+    The column is stored with a permutation sorted by value, so point
+    lookups are a binary search over the mmap without decoding the column.
+    """
+    
+    def __init__(self, offsets: np.ndarray, blob: memoryview, sorted_order: np.ndarray):
+        self._offsets = offsets
+        self._blob = blob
+        self._sorted_order = sorted_order
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def _raw(self, idx: int) -> bytes:
+        return bytes(self._blob[int(self._offsets[idx]):int(self._offsets[idx + 1])])
+    
+    def get(self, idx: int) -> Optional[str]:
+        """Get the value of row idx (None for empty values)."""
+        value = self._raw(idx)
+        return value.decode("utf-8") if value else None
+    
+    def rows(self, value: str) -> np.ndarray:
+        """
+        Get all row indices whose value equals value.
+        
+        Rows with equal values are stored in ascending order, so the result
+        is sorted; when rows were written grouped by value it is a single
+        contiguous run.
+        """
+        target = value.encode("utf-8")
+        order = self._sorted_order
+        
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._raw(int(order[mid])) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        start, hi = lo, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._raw(int(order[mid])) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return order[start:lo]
+    
+    def find(self, value: str) -> List[int]:
+        """Get all row indices whose value equals value."""
+        return self.rows(value).tolist()
+
+
+class BM25Segment:
+    """
+    Memory-mapped, read-only BM25 segment.
+    
+    Term and document ids are positions in the segment: term ids follow the
+    sorted term dictionary, document ids follow the order documents were
+    written in.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Open a segment file.
+        
+        Args:
+            path: Path of the segment file
+            
+        Raises:
+            ValueError: If the file is not a segment or has an unsupported version
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._buffer = memoryview(self._mmap)
+        
+        magic, version, header_length = _PREAMBLE.unpack_from(self._buffer, 0)
+        if magic != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a BM25 segment file")
+        if version > SEGMENT_VERSION:
+            self.close()
+            raise ValueError(f"BM25 segment version {version} is newer than supported version {SEGMENT_VERSION}")
+        
+        header_start = _PREAMBLE.size
+        self.header: Dict[str, Any] = json.loads(bytes(self._buffer[header_start:header_start + header_length]))
+        self.version = version
+        
+        sections = {
+            name: np.frombuffer(self._buffer, dtype=np.dtype(dtype), count=count, offset=offset)
+            for name, (offset, dtype, count) in self.header["sections"].items()
+        }
+        
+        self.num_docs: int = self.header["num_docs"]
+        self.num_terms: int = self.header["num_terms"]
+        self.total_length: int = self.header["total_length"]
+        self.meta: Dict[str, Any] = self.header.get("meta", {})
+        
+        self._term_offsets = sections["term_offsets"]
+        blob_offset, _, blob_length = self.header["sections"]["term_blob"]
+        self._term_blob = self._buffer[blob_offset:blob_offset + blob_length]
+        self._postings_offsets = sections["postings_offsets"]
+        self._postings_docs = sections["postings_docs"]
+        self._postings_tfs = sections["postings_tfs"]
+        self.doc_lengths: np.ndarray = sections["doc_lengths"]
+        self._doc_term_offsets = sections["doc_term_offsets"]
+        self._doc_terms = sections["doc_terms"]
+        self.doc_freqs: np.ndarray = np.diff(self._postings_offsets)
+        
+        self.columns: Dict[str, _StringColumn] = {}
+        for column in STRING_COLUMNS:
+            blob_offset, _, blob_length = self.header["sections"][f"{column}_blob"]
+            self.columns[column] = _StringColumn(
+                sections[f"{column}_offsets"],
+                self._buffer[blob_offset:blob_offset + blob_length],
+                sections[f"{column}_order"]
+            )
+    
+    def term(self, term_id: int) -> str:
+        """Get the term string for a term id."""
+        start, end = int(self._term_offsets[term_id]), int(self._term_offsets[term_id + 1])
+        return bytes(self._term_blob[start:end]).decode("utf-8")
+    
+    def lookup(self, term: str) -> int:
+        """
+        Find a term in the dictionary by binary search.
+        
+        Args:
+            term: Term to look up
+            
+        Returns:
+            Term id, or -1 if the term is not in the segment
+        """
+        target = term.encode("utf-8")
+        offsets = self._term_offsets
+        blob = self._term_blob
+        
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(blob[int(offsets[mid]):int(offsets[mid + 1])]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        if lo < self.num_terms and bytes(blob[int(offsets[lo]):int(offsets[lo + 1])]) == target:
+            return lo
+        return -1
+    
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the postings of a term.
+        
+        Args:
+            term_id: Term id from lookup()
+            
+        Returns:
+            (doc ids, term frequencies), sorted by doc id
+        """
+        start, end = int(self._postings_offsets[term_id]), int(self._postings_offsets[term_id + 1])
+        return self._postings_docs[start:end], self._postings_tfs[start:end]
+    
+    def all_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get every posting of the segment at once.
+        
+        Returns:
+            (term ids, doc ids, term frequencies), grouped by term id
+        """
+        term_ids = np.repeat(np.arange(self.num_terms, dtype=np.int32), self.doc_freqs)
+        return term_ids, self._postings_docs, self._postings_tfs
+    
+    def doc_terms(self, doc_idx: int) -> np.ndarray:
+        """Get the term ids that occur in a document."""
+        start, end = int(self._doc_term_offsets[doc_idx]), int(self._doc_term_offsets[doc_idx + 1])
+        return self._doc_terms[start:end]
+    
+    def iter_terms(self):
+        """Iterate over (term_id, term) in dictionary order."""
+        for term_id in range(self.num_terms):
+            yield term_id, self.term(term_id)
+    
+    def close(self) -> None:
+        """Release the memory map and file handle."""
+        # Drop every view into the map first so it can be closed
+        for name in ("columns", "_term_offsets", "_term_blob", "_postings_offsets", "_postings_docs",
+                     "_postings_tfs", "doc_lengths", "_doc_term_offsets", "_doc_terms", "doc_freqs"):
+            self.__dict__.pop(name, None)
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except (BufferError, ValueError):
+            # Views handed out to callers are still alive; the map is
+            # released when they are garbage collected
+            pass
+        finally:
+            self._file.close()
+
+
+def write_segment(path: str, terms: List[str], postings: List[Tuple[np.ndarray, np.ndarray]],
+                  doc_lengths: np.ndarray, string_columns: Dict[str, List[Optional[str]]],
+                  meta: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Write a segment file atomically.
+    
+    Args:
+        path: Destination path
+        terms: Sorted list of terms
+        postings: (doc ids, tfs) for each term, aligned with terms, doc ids sorted
+        doc_lengths: Length in tokens of every document
+        string_columns: chunk_id, document_id and user_id of every document
+        meta: Extra JSON-serializable values stored in the header
+    """
+    if any(terms[i] >= terms[i + 1] for i in range(len(terms) - 1)):
+        raise ValueError("Segment terms must be sorted and unique")
+    
+    num_docs = len(doc_lengths)
+    term_offsets, term_blob = _encode_strings(terms)
+    
+    postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    if postings:
+        postings_offsets[1:] = np.cumsum([len(docs) for docs, _ in postings])
+    postings_docs = np.concatenate([docs for docs, _ in postings]).astype(np.int32) if postings else np.empty(0, np.int32)
+    postings_tfs = np.concatenate([tfs for _, tfs in postings]).astype(np.int32) if postings else np.empty(0, np.int32)
+    
+    # Forward index: group (doc, term) pairs by document
+    term_ids = np.repeat(np.arange(len(terms), dtype=np.int32), np.diff(postings_offsets))
+    by_doc = np.argsort(postings_docs, kind="stable")
+    doc_terms = term_ids[by_doc]
+    doc_term_offsets = np.zeros(num_docs + 1, dtype=np.int64)
+    doc_term_offsets[1:] = np.cumsum(np.bincount(postings_docs, minlength=num_docs))
+    
+    sections: List[Tuple[str, bytes, str, int]] = [
+        ("term_offsets", term_offsets.tobytes(), "<i8", len(term_offsets)),
+        ("term_blob", term_blob, "u1", len(term_blob)),
+        ("postings_offsets", postings_offsets.tobytes(), "<i8", len(postings_offsets)),
+        ("postings_docs", postings_docs.astype("<i4").tobytes(), "<i4", len(postings_docs)),
+        ("postings_tfs", postings_tfs.astype("<i4").tobytes(), "<i4", len(postings_tfs)),
+        ("doc_lengths", np.asarray(doc_lengths, dtype="<i4").tobytes(), "<i4", num_docs),
+        ("doc_term_offsets", doc_term_offsets.tobytes(), "<i8", len(doc_term_offsets)),
+        ("doc_terms", doc_terms.astype("<i4").tobytes(), "<i4", len(doc_terms)),
+    ]
+    for column in STRING_COLUMNS:
+        values = string_columns.get(column) or [None] * num_docs
+        offsets, blob = _encode_strings(values)
+        order = np.asarray(sorted(range(num_docs), key=lambda i: (values[i] or "").encode("utf-8")), dtype=np.int32)
+        sections.append((f"{column}_offsets", offsets.tobytes(), "<i8", len(offsets)))
+        sections.append((f"{column}_blob", blob, "u1", len(blob)))
+        sections.append((f"{column}_order", order.astype("<i4").tobytes(), "<i4", len(order)))
+    
+    header = {
+        "num_docs": num_docs,
+        "num_terms": len(terms),
+        "total_length": int(np.asarray(doc_lengths, dtype=np.int64).sum()),
+        "created_at": time.time(),
+        "meta": meta or {},
+        "sections": {}
+    }
+    
+    # Section offsets depend on the header size, which depends on the offsets;
+    # iterate until the header length is stable
+    header_length = 0
+    while True:
+        offset = _PREAMBLE.size + header_length
+        offset += -offset % _ALIGNMENT
+        for name, data, dtype, count in sections:
+            header["sections"][name] = [offset, dtype, count]
+            offset += len(data)
+            offset += -offset % _ALIGNMENT
+        header_bytes = json.dumps(header).encode("utf-8")
+        if len(header_bytes) == header_length:
+            break
+        header_length = len(header_bytes)
+    
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(SEGMENT_MAGIC, SEGMENT_VERSION, header_length))
+        f.write(header_bytes)
+        for name, data, _, _ in sections:
+            f.write(b"\x00" * (header["sections"][name][0] - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    
+    logger.info(f"✅ BM25 segment written to {path} ({num_docs} documents, {len(terms)} terms)")
@@ -6,6 +6,7 @@ from typing import List, Dict, Any, Optional
 from langchain.llms.base import BaseLLM
 from langchain.schema import Document
 import asyncio
+import functools
 
 logger = logging.getLogger(__name__)
 
@@ -316,6 +317,59 @@ class EnhancedSearchEngine:
         documents = self.retriever.get_relevant_documents(query)
         return documents[:k]
     
+    async def _aget_filtered_documents(self, query: str, k: int = 5) -> List[Document]:
+        """
+        Get documents with optional document ID filtering, off the event loop.
+        
+        Hybrid retrievers (HybridSearchRetriever) run their BM25 and semantic
+        legs concurrently through asearch; any other retriever is run in the
+        event loop's executor so the chat endpoint is not blocked.
+        
+        Args:
+            query: Search query
+            k: Number of documents to retrieve
+            
+        Returns:
+            List of documents, filtered by document IDs if specified
+        """
+        if hasattr(self.retriever, 'asearch'):
+            return await self.retriever.asearch(query, k=k, document_ids=self.document_ids)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get_filtered_documents, query, k)
+    
+    async def _aget_filtered_documents_batch(self, queries: List[str], k: int = 5) -> List[List[Document]]:
+        """
+        Get documents for several queries with optional document ID filtering.
+        
+        Hybrid retrievers score all queries together with search_batch (one
+        BM25 call for the batch) in the event loop's executor; otherwise the
+        queries are searched concurrently, one executor call each.
+        
+        Args:
+            queries: Search queries
+            k: Number of documents to retrieve per query
+            
+        Returns:
+            One list of documents per query, in query order
+        """
+        if hasattr(self.retriever, 'search_batch'):
+            logger.info(f"Using batched search for {len(queries)} queries")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, functools.partial(self.retriever.search_batch, queries, k=k, document_ids=self.document_ids)
+            )
+        
+        async def search_one(i: int, sub_query: str) -> List[Document]:
+            try:
+                print(f"Searching with sub-query {i+1}: '{sub_query}'")
+                return await self._aget_filtered_documents(sub_query, k)
+            except Exception as e:
+                logger.warning(f"Error searching with sub-query '{sub_query}': {e}")
+                print(f"[ERROR] Sub-query {i+1} failed: {e}")
+                return []
+        
+        return list(await asyncio.gather(*(search_one(i, sub_query) for i, sub_query in enumerate(queries))))
+    
     async def search_standard(self, query: str, k: int = 5) -> List[Document]:
         """
         Standard search mode - direct query search
@@ -332,7 +386,7 @@ class EnhancedSearchEngine:
             print(f"[STANDARD] Direct query search")
             if self.document_ids:
                 print(f"[STANDARD] Filtering by {len(self.document_ids)} selected documents")
-            documents = self._get_filtered_documents(query, k)
+            documents = await self._aget_filtered_documents(query, k)
             logger.info(f"[STANDARD] Search returned {len(documents)} documents")
             return documents
         except Exception as e:
@@ -362,7 +416,7 @@ class EnhancedSearchEngine:
             # Search with rephrased query
             if self.document_ids:
                 print(f"[REPHRASE] Filtering by {len(self.document_ids)} selected documents")
-            documents = self._get_filtered_documents(rephrased_query, k)
+            documents = await self._aget_filtered_documents(rephrased_query, k)
             
             # Add metadata to indicate this was from a rephrased query
             for doc in documents:
@@ -401,36 +455,29 @@ class EnhancedSearchEngine:
             for i, sub_query in enumerate(queries, 1):
                 print(f"   {i}. {sub_query}")
             
-            # Search with each query
+            # Search with all sub-queries together
+            if self.document_ids:
+                print(f"[MULTIPLE] Filtering by {len(self.document_ids)} selected documents")
+            document_batches = await self._aget_filtered_documents_batch(queries, k)
+            
             all_documents = []
             seen_content = set()
             
-            for i, sub_query in enumerate(queries):
-                try:
-                    print(f"Searching with sub-query {i+1}: '{sub_query}'")
-                    if self.document_ids:
-                        print(f"[MULTIPLE] Filtering by {len(self.document_ids)} selected documents")
-                    documents = self._get_filtered_documents(sub_query, k)
-                    
-                    # Add metadata and deduplicate
-                    for doc in documents:
-                        # Use content hash for deduplication
-                        content_hash = hash(doc.page_content)
-                        if content_hash not in seen_content:
-                            seen_content.add(content_hash)
-                            
-                            if hasattr(doc, 'metadata'):
-                                doc.metadata['original_query'] = query
-                                doc.metadata['sub_query'] = sub_query
-                                doc.metadata['sub_query_index'] = i
-                                doc.metadata['search_mode'] = 'multiple_queries'
-                            
-                            all_documents.append(doc)
-                            
-                except Exception as e:
-                    logger.warning(f"Error searching with sub-query '{sub_query}': {e}")
-                    print(f"[ERROR] Sub-query {i+1} failed: {e}")
-                    continue
+            for i, (sub_query, documents) in enumerate(zip(queries, document_batches)):
+                # Add metadata and deduplicate
+                for doc in documents:
+                    # Use content hash for deduplication
+                    content_hash = hash(doc.page_content)
+                    if content_hash not in seen_content:
+                        seen_content.add(content_hash)
+                        
+                        if hasattr(doc, 'metadata'):
+                            doc.metadata['original_query'] = query
+                            doc.metadata['sub_query'] = sub_query
+                            doc.metadata['sub_query_index'] = i
+                            doc.metadata['search_mode'] = 'multiple_queries'
+                        
+                        all_documents.append(doc)
             
             # Sort by relevance score if available, otherwise keep order
             try:
@@ -7,12 +7,20 @@ to combine BM25 keyword search with semantic vector search.
 
 from typing import List, Dict, Any, Optional, Tuple
 from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
 from ..vector_db.langchain_chroma import LangChainChromaStore
 from .bm25_retriever import BM25Retriever
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
+import threading
+import time
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_WORKERS = settings.HYBRID_BATCH_WORKERS
+
 
 class HybridRetriever:
     """
@@ -20,13 +28,19 @@ class HybridRetriever:
     
     This retriever merges results from both BM25 (keyword-based) and
     semantic (embedding-based) search to provide better retrieval quality.
+    search() runs the two legs one after the other; asearch() runs them
+    concurrently in the event loop's executor, so hybrid latency is that
+    of the slower leg rather than the sum.
     """
     
+    LATENCY_LEGS = ("bm25", "semantic", "hybrid")
+    
     def __init__(
         self,
         vectorstore: LangChainChromaStore,
         bm25_retriever: BM25Retriever,
-        rrf_k: int = 60
+        rrf_k: int = 60,
+        batch_workers: int = DEFAULT_BATCH_WORKERS
     ):
         """
         Initialize hybrid retriever.
@@ -35,10 +49,163 @@ class HybridRetriever:
             vectorstore: ChromaDB vector store for semantic search
             bm25_retriever: BM25 retriever for keyword search
             rrf_k: RRF constant (default: 60, standard value)
+            batch_workers: Threads running the semantic queries of search_batch
         """
         self.vectorstore = vectorstore
         self.bm25_retriever = bm25_retriever
         self.rrf_k = rrf_k
+        self.batch_workers = max(1, batch_workers)
+        
+        self._latency_lock = threading.Lock()
+        self._latency = {leg: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0} for leg in self.LATENCY_LEGS}
+    
+    def _record_latency(self, leg: str, started: float) -> None:
+        """
+        Record the latency of one search leg.
+        
+        Args:
+            leg: "bm25", "semantic" or "hybrid"
+            started: time.perf_counter() value when the leg started
+        """
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._latency_lock:
+            stats = self._latency[leg]
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["last_ms"] = elapsed_ms
+    
+    def get_latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get per-leg search latency statistics.
+        
+        Returns:
+            Mapping of leg ("bm25", "semantic", "hybrid") to count, average,
+            maximum and last latency in milliseconds
+        """
+        with self._latency_lock:
+            return {
+                leg: {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 2),
+                    "last_ms": round(stats["last_ms"], 2)
+                }
+                for leg, stats in self._latency.items()
+            }
+    
+    def _bm25_ready(self) -> bool:
+        """
+        Check whether the BM25 leg can be used.
+        
+        While the index is still being built (or failed to build) searches
+        are served by semantic search only.
+        """
+        if self.bm25_retriever.is_built():
+            return True
+        logger.debug(
+            f"BM25 index not ready ({self.bm25_retriever.get_build_status()['state']}), using semantic search only"
+        )
+        return False
+    
+    @staticmethod
+    def _filter_values(filter: Optional[Dict], key: str) -> Optional[List[str]]:
+        """
+        Extract the allowed values of a metadata key from a Chroma filter.
+        
+        Understands plain equality, $eq, $in and top-level $and clauses;
+        anything else is left to the semantic leg only.
+        
+        Args:
+            filter: Chroma metadata filter
+            key: Metadata key to look for
+            
+        Returns:
+            Allowed values, or None if the filter does not restrict the key
+        """
+        if not filter:
+            return None
+        clauses = filter.get("$and", [filter])
+        for clause in clauses:
+            if key not in clause:
+                continue
+            condition = clause[key]
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    return [condition["$eq"]]
+                if "$in" in condition:
+                    return list(condition["$in"])
+                return None
+            return [condition]
+        return None
+    
+    def _semantic_filter(
+        self,
+        filter: Optional[Dict],
+        document_ids: Optional[List[str]],
+        user_id: Optional[str]
+    ) -> Optional[Dict]:
+        """
+        Build the Chroma filter for the semantic leg.
+        
+        Args:
+            filter: Caller-provided metadata filter
+            document_ids: Optional document IDs to restrict to
+            user_id: Optional owner to restrict to
+            
+        Returns:
+            Combined metadata filter, None if unfiltered
+        """
+        clauses = [filter] if filter else []
+        if document_ids:
+            clauses.append({"document_id": {"$in": document_ids}})
+        if user_id:
+            clauses.append({"user_id": user_id})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+    
+    def _bm25_partition(
+        self,
+        filter: Optional[Dict],
+        document_ids: Optional[List[str]],
+        user_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Get the document/user partition the BM25 leg should score.
+        
+        Args:
+            filter: Caller-provided metadata filter
+            document_ids: Optional document IDs to restrict to
+            user_id: Optional owner to restrict to
+            
+        Returns:
+            Keyword arguments (document_ids, user_id) for BM25 search
+        """
+        # An empty selection means no document restriction, as for the vector store
+        document_ids = document_ids or None
+        filtered_ids = self._filter_values(filter, "document_id")
+        if filtered_ids is not None:
+            allowed = set(filtered_ids)
+            document_ids = filtered_ids if document_ids is None else [
+                document_id for document_id in document_ids if document_id in allowed
+            ]
+        if not user_id:
+            users = self._filter_values(filter, "user_id")
+            if users and len(users) == 1:
+                user_id = users[0]
+        return {"document_ids": document_ids, "user_id": user_id}
+    
+    @staticmethod
+    def _fusion_key(doc: Document) -> Any:
+        """
+        Identify a chunk across the two legs.
+        
+        Chunks indexed without a chunk_id in their metadata are matched by their
+        Chroma ID (set as chunk_id by the vector store, or as the document ID),
+        and by content hash only when neither is known.
+        """
+        return doc.metadata.get('chunk_id') or doc.id or hash(doc.page_content)
     
     def _reciprocal_rank_fusion(
         self,
@@ -65,15 +232,14 @@ class HybridRetriever:
         
         # Process BM25 results
         for rank, (doc, score) in enumerate(bm25_results, start=1):
-            # Use chunk_id as unique identifier, fallback to content hash
-            doc_id = doc.metadata.get('chunk_id', hash(doc.page_content))
+            doc_id = self._fusion_key(doc)
             rrf_score = 1.0 / (self.rrf_k + rank)
             doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
             doc_objects[doc_id] = doc
-            
+        
         # Process semantic results
         for rank, (doc, score) in enumerate(semantic_results, start=1):
-            doc_id = doc.metadata.get('chunk_id', hash(doc.page_content))
+            doc_id = self._fusion_key(doc)
             rrf_score = 1.0 / (self.rrf_k + rank)
             doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
             doc_objects[doc_id] = doc
@@ -99,56 +265,155 @@ class HybridRetriever:
         self,
         query: str,
         k: int = 5,
-        filter: Optional[Dict] = None
+        filter: Optional[Dict] = None,
+        document_ids: Optional[List[str]] = None,
+        user_id: Optional[str] = None
     ) -> List[Document]:
         """
         Perform hybrid search combining BM25 and semantic search.
         
+        Document and user restrictions (given directly or as document_id /
+        user_id conditions in filter) are applied by BM25 before scoring,
+        so only the selected partitions are scored.
+        
         Args:
             query: Search query
             k: Number of final results to return
             filter: Optional metadata filter for semantic search
+            document_ids: Optional list of document IDs to restrict both legs to
+            user_id: Optional owner to restrict both legs to
             
         Returns:
             List of top k documents
         """
+        started = time.perf_counter()
         # Retrieve more results from each method for better fusion
         retrieval_k = k * 4  # Get 4x results for fusion
         
-        # BM25 search
-        bm25_results = []
-        if self.bm25_retriever.is_built():
-            bm25_results = self.bm25_retriever.search(query, k=retrieval_k)
-            logger.debug(f"BM25 retrieved {len(bm25_results)} results")
-        else:
-            logger.warning("BM25 index not built, using semantic search only")
+        bm25_results = self._bm25_leg(query, retrieval_k, filter, document_ids, user_id)
+        semantic_results = self._semantic_leg(query, retrieval_k, filter, document_ids, user_id)
+        
+        merged_results = self._merge(bm25_results, semantic_results, k)
+        self._record_latency("hybrid", started)
+        return merged_results
+    
+    async def asearch(
+        self,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        document_ids: Optional[List[str]] = None,
+        user_id: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Perform hybrid search with the BM25 and semantic legs running concurrently.
+        
+        Both legs run in the event loop's default executor, so the calling
+        event loop is not blocked and the latency is that of the slower leg.
+        
+        Args:
+            query: Search query
+            k: Number of final results to return
+            filter: Optional metadata filter for semantic search
+            document_ids: Optional list of document IDs to restrict both legs to
+            user_id: Optional owner to restrict both legs to
+            
+        Returns:
+            List of top k documents
+        """
+        started = time.perf_counter()
+        retrieval_k = k * 4
+        loop = asyncio.get_running_loop()
+        
+        bm25_results, semantic_results = await asyncio.gather(
+            loop.run_in_executor(None, self._bm25_leg, query, retrieval_k, filter, document_ids, user_id),
+            loop.run_in_executor(None, self._semantic_leg, query, retrieval_k, filter, document_ids, user_id)
+        )
+        
+        merged_results = self._merge(bm25_results, semantic_results, k)
+        self._record_latency("hybrid", started)
+        return merged_results
+    
+    def _bm25_leg(
+        self,
+        query: str,
+        retrieval_k: int,
+        filter: Optional[Dict],
+        document_ids: Optional[List[str]],
+        user_id: Optional[str]
+    ) -> List[Tuple[Document, float]]:
+        """
+        Run the BM25 leg, restricted to the selected partitions.
         
-        # Semantic search
+        Returns:
+            BM25 results with scores, empty while the index is not ready
+        """
+        if not self._bm25_ready():
+            return []
+        
+        started = time.perf_counter()
+        bm25_results = self.bm25_retriever.search(
+            query,
+            k=retrieval_k,
+            **self._bm25_partition(filter, document_ids, user_id)
+        )
+        self._record_latency("bm25", started)
+        logger.debug(f"BM25 retrieved {len(bm25_results)} results")
+        return bm25_results
+    
+    def _semantic_leg(
+        self,
+        query: str,
+        retrieval_k: int,
+        filter: Optional[Dict],
+        document_ids: Optional[List[str]],
+        user_id: Optional[str]
+    ) -> List[Tuple[Document, float]]:
+        """
+        Run the semantic leg against the vector store.
+        
+        Returns:
+            Semantic results with scores
+        """
+        started = time.perf_counter()
         semantic_results = self.vectorstore.similarity_search_with_score(
             query,
             k=retrieval_k,
-            filter=filter
+            filter=self._semantic_filter(filter, document_ids, user_id)
         )
+        self._record_latency("semantic", started)
         logger.debug(f"Semantic search retrieved {len(semantic_results)} results")
+        return semantic_results
+    
+    def _merge(
+        self,
+        bm25_results: List[Tuple[Document, float]],
+        semantic_results: List[Tuple[Document, float]],
+        k: int
+    ) -> List[Document]:
+        """
+        Fuse the two legs, falling back to semantic results without BM25 hits.
         
+        Returns:
+            List of top k documents
+        """
         # If BM25 is not available, return semantic results only
         if not bm25_results:
             return [doc for doc, score in semantic_results[:k]]
         
         # Merge using RRF
-        merged_results = self._reciprocal_rank_fusion(
+        return self._reciprocal_rank_fusion(
             bm25_results,
             semantic_results,
             k=k
         )
-        
-        return merged_results
     
     def search_by_documents(
         self,
         query: str,
         document_ids: List[str],
-        k: int = 5
+        k: int = 5,
+        user_id: Optional[str] = None
     ) -> List[Document]:
         """
         Perform hybrid search filtered by specific document IDs.
@@ -157,42 +422,116 @@ class HybridRetriever:
             query: Search query
             document_ids: List of document IDs to filter by
             k: Number of final results to return
+            user_id: Optional owner to restrict to
             
         Returns:
             List of top k documents from specified documents
         """
-        # Retrieve more results for fusion
-        retrieval_k = k * 4
+        return self.search(query, k=k, document_ids=document_ids, user_id=user_id)
+    
+    async def asearch_by_documents(
+        self,
+        query: str,
+        document_ids: List[str],
+        k: int = 5,
+        user_id: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Async variant of search_by_documents with concurrent legs.
         
-        # BM25 search (filter results by document_id after retrieval)
-        bm25_results = []
-        if self.bm25_retriever.is_built():
-            all_bm25_results = self.bm25_retriever.search(query, k=retrieval_k * 2)
-            # Filter by document_id
-            bm25_results = [
-                (doc, score) for doc, score in all_bm25_results
-                if doc.metadata.get('document_id') in document_ids
-            ][:retrieval_k]
-            logger.debug(f"BM25 retrieved {len(bm25_results)} filtered results")
-        
-        # Semantic search with filter
-        filter_dict = {"document_id": {"$in": document_ids}}
-        semantic_results = self.vectorstore.similarity_search_with_score(
-            query,
-            k=retrieval_k,
-            filter=filter_dict
-        )
-        logger.debug(f"Semantic search retrieved {len(semantic_results)} filtered results")
+        Args:
+            query: Search query
+            document_ids: List of document IDs to filter by
+            k: Number of final results to return
+            user_id: Optional owner to restrict to
+            
+        Returns:
+            List of top k documents from specified documents
+        """
+        return await self.asearch(query, k=k, document_ids=document_ids, user_id=user_id)
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        document_ids: Optional[List[str]] = None,
+        user_id: Optional[str] = None
+    ) -> List[List[Document]]:
+        """
+        Perform hybrid search for several queries at once.
         
-        # If BM25 is not available, return semantic results only
-        if not bm25_results:
-            return [doc for doc, score in semantic_results[:k]]
+        All queries are scored by BM25 in a single batched call (one sparse
+        matrix product in sparse scoring mode). Meanwhile the semantic queries
+        run on up to batch_workers threads, so the batch takes as long as the
+        slower of the two legs.
         
-        # Merge using RRF
-        merged_results = self._reciprocal_rank_fusion(
-            bm25_results,
-            semantic_results,
-            k=k
-        )
+        Args:
+            queries: Search queries
+            k: Number of final results to return per query
+            filter: Optional metadata filter for semantic search
+            document_ids: Optional list of document IDs to restrict both legs to
+            user_id: Optional owner to restrict both legs to
+            
+        Returns:
+            One list of top k documents per query, in query order
+        """
+        if not queries:
+            return []
+        retrieval_k = k * 4
+        semantic_filter = self._semantic_filter(filter, document_ids, user_id)
         
-        return merged_results
+        with ThreadPoolExecutor(max_workers=min(self.batch_workers, len(queries))) as executor:
+            semantic_futures = [
+                executor.submit(self.vectorstore.similarity_search_with_score, query, k=retrieval_k, filter=semantic_filter)
+                for query in queries
+            ]
+            
+            # BM25 search for all queries together
+            bm25_batches = [[] for _ in queries]
+            if self._bm25_ready():
+                bm25_batches = self.bm25_retriever.search_batch(
+                    queries,
+                    k=retrieval_k,
+                    **self._bm25_partition(filter, document_ids, user_id)
+                )
+            semantic_batches = [future.result() for future in semantic_futures]
+        
+        merged_batches = [
+            self._merge(bm25_results, semantic_results, k)
+            for bm25_results, semantic_results in zip(bm25_batches, semantic_batches)
+        ]
+        
+        logger.debug(f"Hybrid batch search completed for {len(queries)} queries")
+        return merged_batches
+
+
+class HybridSearchRetriever(BaseRetriever):
+    """
+    LangChain retriever over HybridRetriever, bound to one user.
+    
+    Handed to the chat engine when hybrid search is enabled, so both legs
+    are restricted to the user's chunks (BM25 scores only the user's
+    partition) and async callers get the concurrent legs of asearch().
+    EnhancedSearchEngine also uses asearch() and search_batch() directly
+    to pass the selected documents.
+    """
+    
+    hybrid: Any
+    user_id: Optional[str] = None
+    k: int = 4
+    
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.hybrid.search(query, k=self.k, user_id=self.user_id)
+    
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return await self.hybrid.asearch(query, k=self.k, user_id=self.user_id)
+    
+    async def asearch(self, query: str, k: int = 4, document_ids: Optional[List[str]] = None) -> List[Document]:
+        """Hybrid search within the user's chunks, optionally restricted to document_ids."""
+        return await self.hybrid.asearch(query, k=k, document_ids=document_ids, user_id=self.user_id)
+    
+    def search_batch(self, queries: List[str], k: int = 4,
+                     document_ids: Optional[List[str]] = None) -> List[List[Document]]:
+        """Batched hybrid search within the user's chunks, optionally restricted to document_ids."""
+        return self.hybrid.search_batch(queries, k=k, document_ids=document_ids, user_id=self.user_id)
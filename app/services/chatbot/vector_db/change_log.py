@@ -0,0 +1,289 @@
+"""
+Append-only change log of chunk additions and deletions.
+
+Writers (the indexing pipeline and document delete paths) append one JSON
+event per line after the vector store has accepted the change; readers such
+as the BM25 change feed tail the file and apply the events to their own
+indexes. Every event carries a nanosecond timestamp "ts" so a reader can
+resume after restarts or log truncation by skipping events it has applied.
+
+Several processes (uvicorn workers) may tail the same log. Each reports how
+far it has applied the log as a consumer, and truncation never drops events
+a live consumer has not applied yet. A consumer that stops reporting for
+CHANGE_LOG_CONSUMER_TTL seconds is considered gone.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
+from langchain.schema import Document
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+from app.core.config import settings
+
+# File locking across processes is only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_FILENAME = "chunk_changes.jsonl"
+# Seconds after its last report that a consumer stops holding back truncation
+DEFAULT_CONSUMER_TTL = settings.CHANGE_LOG_CONSUMER_TTL
+
+OP_ADD = "add"
+OP_DELETE = "delete"
+OP_DELETE_DOCUMENT = "delete_document"
+
+
+class ChunkChangeLog:
+    """
+    JSONL change log shared by every process that writes to a vector store.
+
+    Appends and truncation are serialized with an exclusive lock on a
+    separate ".lock" file, so rewriting the log never strands a writer on
+    the old file. Readers take no lock and only consume complete lines.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the change log.
+
+        Args:
+            path: Path of the log file; created on first append
+        """
+        self.path = path
+        self._lock_path = f"{path}.lock"
+        self._consumers_path = f"{path}.consumers.json"
+        self._thread_lock = threading.Lock()
+        self._last_ts = 0
+
+    @classmethod
+    def for_directory(cls, persist_directory: str) -> 'ChunkChangeLog':
+        """
+        Get the change log stored next to a vector database.
+
+        Args:
+            persist_directory: Vector database directory
+
+        Returns:
+            ChunkChangeLog for that directory
+        """
+        return cls(os.path.join(persist_directory, CHANGE_LOG_FILENAME))
+
+    @contextmanager
+    def _locked(self):
+        """Hold the process and cross-process locks of the log."""
+        with self._thread_lock:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Append events to the log, stamping each with a unique timestamp.
+
+        Args:
+            events: Events with at least an "op" key
+
+        Returns:
+            Timestamp of the last appended event (0 if there were none)
+        """
+        if not events:
+            return 0
+
+        with self._locked():
+            lines = []
+            for event in events:
+                # Strictly increasing within this process, even for same-ns events
+                self._last_ts = max(time.time_ns(), self._last_ts + 1)
+                lines.append(json.dumps({**event, "ts": self._last_ts}, ensure_ascii=False) + "\n")
+
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+        return self._last_ts
+
+    def record_added(self, chunk_ids: List[str], documents: List[Document]) -> int:
+        """
+        Record chunks that were added to the vector store.
+
+        Args:
+            chunk_ids: IDs assigned by the vector store
+            documents: Stored documents, aligned with chunk_ids
+
+        Returns:
+            Timestamp of the last event
+        """
+        return self.append([
+            {"op": OP_ADD, "chunk_id": chunk_id, "text": doc.page_content, "metadata": doc.metadata}
+            for chunk_id, doc in zip(chunk_ids, documents)
+        ])
+
+    def record_deleted(self, chunk_ids: Optional[List[str]] = None, document_id: Optional[str] = None) -> int:
+        """
+        Record chunks (or a whole document) that were deleted from the vector store.
+
+        Args:
+            chunk_ids: Deleted chunk IDs
+            document_id: Document whose chunks were all deleted
+
+        Returns:
+            Timestamp of the last event
+        """
+        events = [{"op": OP_DELETE, "chunk_id": chunk_id} for chunk_id in chunk_ids or []]
+        if document_id is not None:
+            events.append({"op": OP_DELETE_DOCUMENT, "document_id": document_id})
+        return self.append(events)
+
+    def read(self, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read complete events starting at a byte offset.
+
+        A trailing line that is still being written is left for the next read.
+
+        Args:
+            offset: Byte offset returned by the previous read
+
+        Returns:
+            (events, offset to continue from)
+        """
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        end = data.rfind(b"\n") + 1
+        events = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping corrupt change log line in {self.path}")
+        return events, offset + end
+
+    def file_id(self) -> Optional[Tuple[int, int]]:
+        """Identity (device, inode) of the current log file, None if it does not exist."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def truncate(self, up_to_ts: int) -> int:
+        """
+        Drop events with ts <= up_to_ts, whatever the consumers have applied.
+
+        Only for a log nobody tails any more (e.g. replaced by an imported
+        snapshot); consumers truncate with truncate_applied().
+
+        Args:
+            up_to_ts: Timestamp of the last event to drop
+
+        Returns:
+            Number of events dropped
+        """
+        with self._locked():
+            return self._truncate(up_to_ts)
+
+    def truncate_applied(self, up_to_ts: int, ttl: float = DEFAULT_CONSUMER_TTL) -> int:
+        """
+        Drop events with ts <= up_to_ts that every live consumer has applied.
+
+        Args:
+            up_to_ts: Timestamp of the last event the caller has in a snapshot
+            ttl: Seconds after its last report that a consumer is considered gone
+
+        Returns:
+            Number of events dropped
+        """
+        with self._locked():
+            consumers = self._read_consumers()
+            live = {consumer_id: consumer for consumer_id, consumer in consumers.items()
+                    if time.time() - consumer["reported_at"] < ttl}
+            if len(live) != len(consumers):
+                self._write_consumers(live)
+            applied = [consumer["applied_ts"] for consumer in live.values()]
+            return self._truncate(min([up_to_ts] + applied))
+
+    def _truncate(self, up_to_ts: int) -> int:
+        """
+        Rewrite the log without events with ts <= up_to_ts; the caller holds the lock.
+
+        The log is rewritten atomically; readers notice the new file via
+        file_id() and resume by timestamp.
+        """
+        events, _ = self.read(0)
+        kept = [event for event in events if event.get("ts", 0) > up_to_ts]
+        dropped = len(events) - len(kept)
+        if not dropped:
+            return 0
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in kept))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        logger.info(f"Change log truncated: dropped {dropped} applied events, {len(kept)} remain")
+        return dropped
+
+    def _read_consumers(self) -> Dict[str, Dict[str, Any]]:
+        """Consumer ID -> applied_ts and reported_at; the caller holds the lock."""
+        try:
+            with open(self._consumers_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_consumers(self, consumers: Dict[str, Dict[str, Any]]) -> None:
+        """Replace the consumers file; the caller holds the lock."""
+        tmp_path = f"{self._consumers_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(consumers, f)
+        os.replace(tmp_path, self._consumers_path)
+
+    def record_applied(self, consumer_id: str, applied_ts: int) -> None:
+        """
+        Report how far a consumer has applied the log.
+
+        A consumer reports before it starts reading (with the timestamp it
+        resumes from) and then at least every ttl / 2 seconds.
+
+        Args:
+            consumer_id: Unique ID of the consumer, e.g. one per process
+            applied_ts: Timestamp of the last event the consumer has applied
+        """
+        with self._locked():
+            consumers = self._read_consumers()
+            consumers[consumer_id] = {"applied_ts": applied_ts, "reported_at": time.time()}
+            self._write_consumers(consumers)
+
+    def remove_consumer(self, consumer_id: str) -> None:
+        """
+        Stop holding back truncation for a consumer that no longer reads the log.
+
+        Args:
+            consumer_id: ID the consumer reported with
+        """
+        with self._locked():
+            consumers = self._read_consumers()
+            if consumers.pop(consumer_id, None) is not None:
+                self._write_consumers(consumers)
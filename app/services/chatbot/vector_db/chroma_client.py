@@ -0,0 +1,122 @@
+"""
+Chroma client modes.
+
+    persistent  every process opens the Chroma directory itself (the default);
+                only safe with a single process per directory
+    http        every process talks to one Chroma server per node, which owns
+                the directory, so several uvicorn workers can share it
+
+The server is started next to the API with the Chroma CLI:
+
+    chroma run --path ./data/chroma_db --port 8001
+
+and the API workers with CHROMA_CLIENT_MODE=http and CHROMA_SERVER_URL
+(default http://localhost:8001). The persist directory still holds what the
+application keeps next to the vectors (change log, BM25 segment, embedding
+cache, collection aliases).
+
+HTTP clients keep a pool of CHROMA_HTTP_POOL_SIZE connections and retry
+failed requests CHROMA_HTTP_RETRIES times with exponential backoff.
+Retrying writes is safe because chunks are upserted under deterministic IDs.
+"""
+from typing import Optional
+from urllib.parse import urlparse
+from chromadb.config import Settings as ChromaSettings
+import chromadb
+import logging
+import time
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLIENT_PERSISTENT = "persistent"
+CLIENT_HTTP = "http"
+CLIENT_MODES = (CLIENT_PERSISTENT, CLIENT_HTTP)
+
+DEFAULT_CLIENT_MODE = settings.CHROMA_CLIENT_MODE
+DEFAULT_SERVER_URL = settings.CHROMA_SERVER_URL
+DEFAULT_POOL_SIZE = settings.CHROMA_HTTP_POOL_SIZE
+DEFAULT_RETRIES = settings.CHROMA_HTTP_RETRIES
+DEFAULT_BACKOFF = settings.CHROMA_HTTP_BACKOFF
+
+
+def server_url_for(client_mode: str = DEFAULT_CLIENT_MODE, server_url: str = DEFAULT_SERVER_URL) -> Optional[str]:
+    """
+    Chroma server a client mode talks to.
+
+    Args:
+        client_mode: One of CLIENT_MODES
+        server_url: URL of the Chroma server
+
+    Returns:
+        The server URL in http mode, None in persistent mode
+
+    Raises:
+        ValueError: If the client mode is unknown
+    """
+    if client_mode not in CLIENT_MODES:
+        raise ValueError(f"Unknown Chroma client mode: {client_mode}. Use one of {CLIENT_MODES}")
+    return server_url if client_mode == CLIENT_HTTP else None
+
+
+def open_http_client(
+    server_url: str,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF
+):
+    """
+    Open a Chroma client on a Chroma server.
+
+    Connecting is retried like requests are, so API workers that start
+    together with the server wait for it.
+
+    Args:
+        server_url: URL of the Chroma server, e.g. http://localhost:8001
+        pool_size: Connections kept open to the server
+        retries: Retries of a failed request (connection errors and 502/503/504)
+        backoff: Backoff factor in seconds; retry n waits backoff * 2 ** (n - 1)
+
+    Returns:
+        Chroma HTTP client
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    url = urlparse(server_url)
+    if url.scheme not in ("http", "https") or not url.hostname:
+        raise ValueError(f"Invalid Chroma server URL: {server_url}")
+
+    for attempt in range(retries + 1):
+        try:
+            client = chromadb.HttpClient(
+                host=url.hostname,
+                port=str(url.port or (443 if url.scheme == "https" else 80)),
+                ssl=url.scheme == "https",
+                settings=ChromaSettings(anonymized_telemetry=False)
+            )
+            break
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Chroma server {server_url} not reachable ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    # The client's requests session is shared by all its collections
+    session = getattr(getattr(client, "_server", None), "_session", None)
+    if session is not None:
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=None,
+                raise_on_status=False
+            )
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return client
@@ -0,0 +1,339 @@
+"""
+Content-addressed cache of chunk embeddings.
+
+The same chunk text is embedded again whenever a file is uploaded by
+another user or a document is re-embedded. ChunkEmbeddingCache stores each
+vector once, keyed by SHA-256 of (model name, chunk text), in files next to
+the Chroma directory:
+
+    <dir>/<model>.f32    float32 vectors, one row per entry (memory-mapped)
+    <dir>/<model>.keys   32-byte SHA-256 digests, row i belongs to digest i
+    <dir>/<model>.json   model name, vector dimension and compaction generation
+
+Both data files are append-only between compactions. Vectors are written before their digests,
+so a crash can only leave unreferenced vector bytes behind, which the next
+writer trims. Appends from several processes are serialized with an
+exclusive lock on a separate ".lock" file; readers pick up rows appended by
+other processes on their next lookup.
+
+The cache holds at most max_entries vectors (CHUNK_EMBEDDING_CACHE_MAX_ENTRIES).
+A write that goes over the bound compacts both files under the exclusive lock
+and keeps the most recently used entries. Recency is tracked by the compacting
+process; entries it has not used rank by age. Lookups hold a shared lock, so
+they never see a half-compacted cache. Every compaction bumps the generation
+in the .json file before rewriting the data files, which tells other processes
+to reload their digests.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import numpy as np
+from app.core.config import settings
+
+# File locking across processes is only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = "embedding_cache"
+DIGEST_SIZE = 32
+DEFAULT_MAX_ENTRIES = settings.CHUNK_EMBEDDING_CACHE_MAX_ENTRIES
+# Compaction keeps this fraction of max_entries, so it does not run on every write
+COMPACT_KEEP_RATIO = 0.9
+
+
+class ChunkEmbeddingCache:
+    """
+    Persistent, memory-mapped map from (model, chunk text) to embedding.
+    """
+
+    _instances: Dict[Tuple[str, str], 'ChunkEmbeddingCache'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory: str, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Initialize the cache, loading the digests of existing entries.
+
+        Args:
+            directory: Directory holding the cache files (created on first write)
+            model_name: Embedding model whose vectors are cached
+            max_entries: Maximum number of cached vectors
+        """
+        self.directory = directory
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        base = os.path.join(directory, slug)
+        self._vectors_path = f"{base}.f32"
+        self._keys_path = f"{base}.keys"
+        self._meta_path = f"{base}.json"
+        self._lock_path = f"{base}.lock"
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._keys_offset = 0
+        self._generation: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        # Row -> tick of its last lookup or write in this process
+        self._last_used: Dict[int, int] = {}
+        self._clock = 0
+        self._thread_lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._locked(shared=True):
+            self._refresh()
+
+    @classmethod
+    def for_directory(cls, persist_directory: str, model_name: str) -> 'ChunkEmbeddingCache':
+        """
+        Get the cache stored next to a vector database.
+
+        One instance is shared per directory and model, so the digests are
+        loaded once per process.
+
+        Args:
+            persist_directory: Vector database directory
+            model_name: Embedding model whose vectors are cached
+
+        Returns:
+            ChunkEmbeddingCache for that directory and model
+        """
+        directory = os.path.join(os.path.abspath(persist_directory), CACHE_DIRNAME)
+        with cls._instances_lock:
+            cache = cls._instances.get((directory, model_name))
+            if cache is None:
+                cache = cls._instances[(directory, model_name)] = cls(directory, model_name)
+            return cache
+
+    def _digest(self, text: str) -> bytes:
+        """SHA-256 of the model name and the chunk text."""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        """Contents of the .json file, None before the first write."""
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, generation: int) -> None:
+        """Atomically write the .json file."""
+        meta = {"model": self.model_name, "dim": self.dim, "generation": generation}
+        self._replace_file(self._meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _refresh(self) -> None:
+        """Load digests appended since the last refresh (e.g. by other processes)."""
+        meta = self._read_meta()
+        if meta is None:
+            return
+        self.dim = int(meta["dim"])
+        generation = int(meta.get("generation", 0))
+
+        try:
+            with open(self._keys_path, "rb") as f:
+                if generation != self._generation or os.fstat(f.fileno()).st_size < self._keys_offset:
+                    # First load, or compacted by another process: reload every digest
+                    self._rows, self._last_used = {}, {}
+                    self._keys_offset = 0
+                    self._vectors = None
+                    self._generation = generation
+                f.seek(self._keys_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # Ignore a digest that is still being written
+        data = data[:len(data) - len(data) % DIGEST_SIZE]
+        row = self._keys_offset // DIGEST_SIZE
+        for start in range(0, len(data), DIGEST_SIZE):
+            self._rows.setdefault(data[start:start + DIGEST_SIZE], row)
+            row += 1
+        self._keys_offset += len(data)
+
+    def _vector_rows(self) -> np.ndarray:
+        """Memory-mapped vectors, remapped when rows were appended."""
+        rows = self._keys_offset // DIGEST_SIZE
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._vectors
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        """
+        Hold the process lock and the cross-process lock of the cache.
+
+        Args:
+            shared: Take the cross-process lock for reading only
+        """
+        with self._thread_lock:
+            if shared and not os.path.isdir(self.directory):
+                # Nothing written yet
+                yield
+                return
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            texts: Chunk texts
+
+        Returns:
+            Embeddings aligned with texts, None where not cached
+        """
+        with self._locked(shared=True):
+            self._refresh()
+            if not self._rows or self.dim is None:
+                self.misses += len(texts)
+                return [None] * len(texts)
+
+            vectors = self._vector_rows()
+            self._clock += 1
+            results: List[Optional[List[float]]] = []
+            for text in texts:
+                row = self._rows.get(self._digest(text))
+                if row is not None:
+                    self._last_used[row] = self._clock
+                results.append(vectors[row].tolist() if row is not None else None)
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(texts) - found
+            return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> int:
+        """
+        Store embeddings of chunks that are not cached yet.
+
+        Args:
+            texts: Chunk texts
+            vectors: Embeddings aligned with texts
+
+        Returns:
+            Number of new entries written
+        """
+        if not texts:
+            return 0
+
+        with self._locked():
+            self._refresh()
+            new_keys, new_vectors, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                digest = self._digest(text)
+                if digest in self._rows or digest in seen:
+                    continue
+                seen.add(digest)
+                new_keys.append(digest)
+                new_vectors.append(vector)
+            if not new_keys:
+                return 0
+
+            matrix = np.asarray(new_vectors, dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                self._generation = 0
+                self._write_meta(self._generation)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}")
+
+            # Vectors first, then the digests that make them visible; bytes left
+            # behind by a crashed writer are trimmed before appending
+            rows = self._keys_offset // DIGEST_SIZE
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(rows * self.dim * 4)
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+
+            self._clock += 1
+            for row in range(rows, self._keys_offset // DIGEST_SIZE):
+                self._last_used[row] = self._clock
+            if len(self._rows) > self.max_entries:
+                self._compact()
+
+        return len(new_keys)
+
+    def _compact(self) -> None:
+        """Rewrite the cache files with the most recently used entries (under the write lock)."""
+        rows = self._keys_offset // DIGEST_SIZE
+        keep = max(1, int(self.max_entries * COMPACT_KEEP_RATIO))
+        digests: List[Optional[bytes]] = [None] * rows
+        for digest, row in self._rows.items():
+            digests[row] = digest
+        # Most recently used first; rows this process never used rank by age
+        kept = sorted(
+            (row for row in range(rows) if digests[row] is not None),
+            key=lambda row: (self._last_used.get(row, 0), row),
+            reverse=True
+        )[:keep]
+        kept.sort()
+        vectors = np.ascontiguousarray(self._vector_rows()[kept])
+        last_used = [self._last_used.get(row, 0) for row in kept]
+
+        # Other processes reload on the new generation, even if a crash stops
+        # the rewrite. Every entry is hidden before the vectors are swapped, so
+        # a crash in between leaves an empty cache rather than digests of the
+        # wrong rows
+        self._write_meta(self._generation + 1)
+        self._replace_file(self._keys_path, b"")
+        self._replace_file(self._vectors_path, vectors.tobytes())
+        self._replace_file(self._keys_path, b"".join(digests[row] for row in kept))
+
+        self.evictions += rows - len(kept)
+        self._refresh()
+        self._last_used = {row: tick for row, tick in enumerate(last_used) if tick}
+        logger.info(f"Compacted chunk embedding cache {self.model_name}: kept {len(kept)} of {rows} entries")
+
+    @staticmethod
+    def _replace_file(path: str, data: bytes) -> None:
+        """Atomically replace a cache file."""
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with entry count, vector dimension, file size, hits and misses
+        """
+        with self._thread_lock:
+            entries = len(self._rows)
+            size = self._keys_offset // DIGEST_SIZE * (self.dim or 0) * 4
+            return {
+                "model": self.model_name,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "dim": self.dim,
+                "size_mb": round(size / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,208 @@
+"""
+Per-user sharding of the chunk collection.
+
+With one collection for every user, each query filters the whole tenant base
+and the HNSW index grows with it. In a sharded store, each chunk is written to
+the collection of its owner (metadata "user_id"), and a query that filters on a
+user only searches that user's collection:
+
+    user   one collection per user:  <collection>_u_<sha1(user_id)[:16]>
+    hash   a fixed number of buckets: <collection>_h_<sha1(user_id) % buckets>
+
+Chunks without a user_id stay in the base collection. Sharding is chosen
+per deployment with VECTOR_SHARDING ("none", "user" or "hash") and
+VECTOR_SHARD_BUCKETS. Existing chunks are moved out of the base collection
+with the migration tool in this module:
+
+    python -m app.services.chatbot.vector_db.collection_sharding --db ./data/chroma_db --sharding user
+"""
+from typing import List, Dict, Any, Optional
+import argparse
+import hashlib
+import logging
+from app.core.config import settings
+
+from .hnsw_params import creation_metadata
+
+logger = logging.getLogger(__name__)
+
+SHARDING_NONE = "none"
+SHARDING_USER = "user"
+SHARDING_HASH = "hash"
+SHARDINGS = (SHARDING_NONE, SHARDING_USER, SHARDING_HASH)
+
+DEFAULT_SHARDING = settings.VECTOR_SHARDING
+DEFAULT_SHARD_BUCKETS = settings.VECTOR_SHARD_BUCKETS
+
+
+def shard_collection_name(collection_name: str, user_id: Optional[str], sharding: str, buckets: int = DEFAULT_SHARD_BUCKETS) -> str:
+    """
+    Name of the collection holding a user's chunks.
+
+    Args:
+        collection_name: Base collection name
+        user_id: Owner of the chunks (None or "" for unowned chunks)
+        sharding: One of SHARDINGS
+        buckets: Number of buckets in hash sharding
+
+    Returns:
+        Shard collection name, or the base name when unsharded or unowned
+    """
+    if sharding == SHARDING_NONE or not user_id:
+        return collection_name
+    digest = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()
+    if sharding == SHARDING_USER:
+        return f"{collection_name}_u_{digest[:16]}"
+    return f"{collection_name}_h_{int(digest, 16) % buckets:04d}"
+
+
+def is_shard_name(name: str, collection_name: str) -> bool:
+    """Whether a collection is a shard (of either kind) of the base collection."""
+    return name.startswith(f"{collection_name}_u_") or name.startswith(f"{collection_name}_h_")
+
+
+def user_id_from_filter(where: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Extract the user a Chroma metadata filter restricts to.
+
+    Recognizes {"user_id": x}, {"user_id": {"$eq": x}} and either one inside
+    a top-level $and.
+
+    Args:
+        where: Chroma metadata filter
+
+    Returns:
+        The user ID, or None if the filter does not pin a single user
+    """
+    if not where:
+        return None
+    if "$and" in where:
+        for clause in where["$and"]:
+            user_id = user_id_from_filter(clause)
+            if user_id:
+                return user_id
+        return None
+    condition = where.get("user_id")
+    if isinstance(condition, dict):
+        condition = condition.get("$eq") if set(condition) == {"$eq"} else None
+    return condition or None
+
+
+def migrate_to_shards(
+    persist_directory: str,
+    collection_name: str = "documents",
+    sharding: str = SHARDING_USER,
+    buckets: int = DEFAULT_SHARD_BUCKETS,
+    batch_size: int = 1000,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    Move chunks of the base collection into their user shards.
+
+    Vectors are copied as stored, nothing is re-embedded. Chunks are upserted
+    into their shard before they are deleted from the base collection, so an
+    interrupted migration can simply be run again. A sharded store also
+    searches the base collection while it still holds chunks, so the
+    application can keep serving during the migration.
+
+    Args:
+        persist_directory: Chroma persist directory
+        collection_name: Base collection name
+        sharding: SHARDING_USER or SHARDING_HASH
+        buckets: Number of buckets in hash sharding
+        batch_size: Chunks moved per batch
+        dry_run: Only count the chunks per shard
+
+    Returns:
+        Dictionary with the number of chunks moved per shard, chunks left in
+        the base collection (unowned chunks) and whether it was a dry run
+    """
+    if sharding not in (SHARDING_USER, SHARDING_HASH):
+        raise ValueError(f"Unknown sharding: {sharding}. Use {SHARDING_USER} or {SHARDING_HASH}")
+
+    from .model_registry import model_registry
+    from .chroma_client import server_url_for
+
+    server_url = server_url_for()
+    client = model_registry.acquire_client(persist_directory, server_url)
+    try:
+        source = client.get_collection(collection_name)
+        moved: Dict[str, int] = {}
+        unowned = 0
+        offset = 0
+        targets = {}
+        while True:
+            page = source.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not page["ids"]:
+                break
+
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(page["metadatas"]):
+                name = shard_collection_name(collection_name, (metadata or {}).get("user_id"), sharding, buckets)
+                groups.setdefault(name, []).append(i)
+
+            migrated_ids = []
+            for name, rows in groups.items():
+                if name == collection_name:
+                    unowned += len(rows)
+                    continue
+                moved[name] = moved.get(name, 0) + len(rows)
+                if dry_run:
+                    continue
+                if name not in targets:
+                    targets[name] = client.get_or_create_collection(
+                        name, metadata=creation_metadata(client, name, source.metadata)
+                    )
+                targets[name].upsert(
+                    ids=[page["ids"][i] for i in rows],
+                    embeddings=[page["embeddings"][i] for i in rows],
+                    documents=[page["documents"][i] for i in rows],
+                    metadatas=[page["metadatas"][i] for i in rows]
+                )
+                migrated_ids.extend(page["ids"][i] for i in rows)
+
+            if migrated_ids:
+                # Deleted rows shift the next page back; only unowned rows stay ahead of the offset
+                source.delete(ids=migrated_ids)
+                offset += len(page["ids"]) - len(migrated_ids)
+            else:
+                offset += len(page["ids"])
+            logger.info(f"Shard migration: {sum(moved.values())} chunks routed, {unowned} unowned")
+
+        return {
+            "sharding": sharding,
+            "shards": moved,
+            "chunks_moved": sum(moved.values()),
+            "chunks_left_in_base": unowned,
+            "dry_run": dry_run
+        }
+    finally:
+        model_registry.release_client(persist_directory, server_url)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Move chunks of the vector store into per-user shard collections")
+    parser.add_argument("--db", default=settings.VECTOR_DB_PATH, help="Chroma persist directory")
+    parser.add_argument("--collection", default="documents", help="Base collection name")
+    parser.add_argument("--sharding", choices=[SHARDING_USER, SHARDING_HASH], default=SHARDING_USER)
+    parser.add_argument("--buckets", type=int, default=DEFAULT_SHARD_BUCKETS, help="Number of buckets for hash sharding")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report how chunks would be distributed")
+    args = parser.parse_args()
+
+    result = migrate_to_shards(
+        args.db,
+        collection_name=args.collection,
+        sharding=args.sharding,
+        buckets=args.buckets,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run
+    )
+    print(f"{'Would move' if result['dry_run'] else 'Moved'} {result['chunks_moved']} chunks into {len(result['shards'])} shards; "
+          f"{result['chunks_left_in_base']} chunks left in {args.collection}")
@@ -0,0 +1,187 @@
+"""
+Document-level vectors for coarse-to-fine retrieval.
+
+Every indexed document gets one vector, the normalized centroid of its
+chunk vectors, stored in a separate "<collection>_docvectors" collection
+(one entry per document, ID = document_id). A full-library query can then
+shortlist the user's top-M documents by their centroid and search chunks
+only inside them, which bounds per-query work as the library grows. The
+same vectors give "related documents" lookups for free.
+"""
+from typing import List, Dict, Any, Optional
+import logging
+import numpy as np
+from app.core.config import settings
+
+from .hnsw_params import creation_metadata
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_VECTORS_SUFFIX = "_docvectors"
+
+# Documents shortlisted per query before chunk search (0 disables two-stage search)
+DEFAULT_COARSE_DOCUMENTS = settings.COARSE_TO_FINE_DOCUMENTS
+
+
+def document_centroid(chunk_vectors: List[List[float]]) -> List[float]:
+    """
+    Unit-length mean of a document's chunk vectors.
+
+    Args:
+        chunk_vectors: Embeddings of the document's chunks
+
+    Returns:
+        Document vector
+    """
+    centroid = np.asarray(chunk_vectors, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return (centroid / norm if norm > 0 else centroid).tolist()
+
+
+class DocumentVectorIndex:
+    """
+    Collection of per-document centroid vectors next to a chunk store.
+    """
+
+    def __init__(self, store: Any):
+        """
+        Initialize the index on the store's Chroma client.
+
+        Args:
+            store: LangChainChromaStore whose chunks the documents belong to
+        """
+        self.store = store
+        self.collection_name = f"{store.collection_name}{DOCUMENT_VECTORS_SUFFIX}"
+        self.collection = store.client.get_or_create_collection(
+            self.collection_name,
+            metadata=creation_metadata(store.client, self.collection_name, store.vectorstore._collection.metadata)
+        )
+
+    def count(self) -> int:
+        """Number of documents with a vector."""
+        return self.collection.count()
+
+    def upsert(self, document_id: str, chunk_vectors: List[List[float]], metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store or replace a document's vector.
+
+        Args:
+            document_id: Document ID
+            chunk_vectors: Embeddings of all the document's chunks
+            metadata: Document metadata (user_id, filename, ...) with Chroma-compatible values
+        """
+        if not len(chunk_vectors):
+            return
+        self.collection.upsert(
+            ids=[str(document_id)],
+            embeddings=[document_centroid(chunk_vectors)],
+            metadatas=[{**(metadata or {}), "document_id": str(document_id), "chunks": len(chunk_vectors)}]
+        )
+
+    def delete(self, document_id: str) -> None:
+        """Remove a document's vector (unknown documents are ignored)."""
+        self.collection.delete(ids=[str(document_id)])
+
+    def shortlist(self, embedding: List[float], m: int, user_id: Optional[str] = None) -> List[str]:
+        """
+        Find the documents closest to a query.
+
+        Args:
+            embedding: Query embedding
+            m: Number of documents
+            user_id: Optional owner to restrict to
+
+        Returns:
+            Document IDs, closest first
+        """
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=m,
+            where={"user_id": user_id} if user_id else None,
+            include=[]
+        )
+        return results["ids"][0] if results["ids"] else []
+
+    def related(self, document_id: str, user_id: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Find the user's documents closest to one of their documents.
+
+        Args:
+            document_id: Document to find related documents for
+            user_id: Owner of the document; other users' documents are never returned
+            k: Number of related documents
+
+        Returns:
+            List of document metadata with "distance", closest first (empty if
+            the document has no vector or belongs to another user)
+        """
+        found = self.collection.get(ids=[str(document_id)], include=["embeddings", "metadatas"])
+        if not found["ids"] or (found["metadatas"][0] or {}).get("user_id") != user_id:
+            return []
+        results = self.collection.query(
+            query_embeddings=[found["embeddings"][0]],
+            n_results=k + 1,
+            where={"user_id": user_id},
+            include=["metadatas", "distances"]
+        )
+        related = [
+            {**(metadata or {}), "document_id": related_id, "distance": distance}
+            for related_id, metadata, distance in zip(results["ids"][0], results["metadatas"][0], results["distances"][0])
+            if related_id != str(document_id)
+        ]
+        return related[:k]
+
+    def backfill(self, page_size: int = 2000) -> int:
+        """
+        Compute vectors of all documents from the chunks already stored.
+
+        Chunk vectors are summed per document while paging through the chunk
+        collections, so memory holds one vector per document.
+
+        Args:
+            page_size: Chunks read per request
+
+        Returns:
+            Number of documents written
+        """
+        sums: Dict[str, np.ndarray] = {}
+        counts: Dict[str, int] = {}
+        metadatas: Dict[str, Dict[str, Any]] = {}
+        for name in self.store._shard_names():
+            vectorstore = self.store._collection(name)
+            if vectorstore is None:
+                continue
+            offset = 0
+            while True:
+                page = vectorstore._collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                for vector, metadata in zip(page["embeddings"], page["metadatas"]):
+                    document_id = (metadata or {}).get("document_id")
+                    if not document_id:
+                        continue
+                    vector = np.asarray(vector, dtype=np.float32)
+                    if document_id in sums:
+                        sums[document_id] += vector
+                        counts[document_id] += 1
+                    else:
+                        sums[document_id] = vector.copy()
+                        counts[document_id] = 1
+                        metadatas[document_id] = {
+                            key: metadata[key] for key in ("user_id", "filename", "document_type") if key in metadata
+                        }
+                offset += len(page["ids"])
+
+        document_ids = list(sums)
+        for start in range(0, len(document_ids), page_size):
+            batch = document_ids[start:start + page_size]
+            self.collection.upsert(
+                ids=[str(document_id) for document_id in batch],
+                embeddings=[document_centroid([sums[document_id]]) for document_id in batch],
+                metadatas=[
+                    {**metadatas[document_id], "document_id": str(document_id), "chunks": counts[document_id]}
+                    for document_id in batch
+                ]
+            )
+        logger.info(f"Backfilled vectors of {len(document_ids)} documents")
+        return len(document_ids)
@@ -0,0 +1,203 @@
+"""
+Cross-request micro-batching of chunk embeddings.
+
+Concurrent document uploads each encode their own handful of chunks, which
+means many small encode calls contending for the same model. The
+EmbeddingBatcher queues the chunks of every caller, and a single worker
+thread encodes them together in batches of a fixed size. It waits at most
+a short window for a batch to fill. Each caller gets a Future for the
+vectors of its own texts.
+"""
+from typing import List, Dict, Any, Callable, Optional
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """Texts submitted by one caller and the future for their vectors."""
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers into fixed-size batches.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        batch_size: int = 64,
+        max_wait_ms: float = 20.0
+    ):
+        """
+        Initialize the batcher; the worker thread starts on first use.
+
+        Args:
+            embed_fn: Encodes a list of texts (e.g. a store's embed_documents)
+            batch_size: Number of texts encoded per call
+            max_wait_ms: Longest time a request waits for a batch to fill
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "encode_seconds": 0.0,
+            "queue_wait_seconds": 0.0,
+            "failed_requests": 0
+        }
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Queue texts for embedding.
+
+        Args:
+            texts: Texts of one caller (e.g. the chunks of one document)
+
+        Returns:
+            Future resolving to the embeddings, aligned with texts
+        """
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+
+        self._ensure_started()
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts through the batcher, blocking until they are encoded.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embeddings aligned with texts
+        """
+        return self.submit(texts).result()
+
+    def _ensure_started(self) -> None:
+        """Start the worker thread if it is not running."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        """
+        Gather requests until a batch is full or the wait window has passed.
+
+        Args:
+            first: Request that opened the batch
+
+        Returns:
+            Requests to encode together
+        """
+        requests = [first]
+        pending = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while pending < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Stop signal: encode what we have, then let the worker exit
+                self._queue.put(None)
+                break
+            requests.append(request)
+            pending += len(request.texts)
+        return requests
+
+    def _worker(self) -> None:
+        """Encode queued requests batch by batch until stopped."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._encode(self._collect(first))
+
+    def _encode(self, requests: List[_Request]) -> None:
+        """
+        Encode the texts of several requests in batches and resolve their futures.
+
+        Args:
+            requests: Requests collected for this round
+        """
+        texts = [text for request in requests for text in request.texts]
+        started = time.perf_counter()
+        try:
+            vectors: List[List[float]] = []
+            batches = 0
+            for start in range(0, len(texts), self.batch_size):
+                vectors.extend(self.embed_fn(texts[start:start + self.batch_size]))
+                batches += 1
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+            for request in requests:
+                request.future.set_exception(e)
+            with self._stats_lock:
+                self._stats["failed_requests"] += len(requests)
+            return
+
+        encode_seconds = time.perf_counter() - started
+        offset = 0
+        for request in requests:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+        with self._stats_lock:
+            self._stats["requests"] += len(requests)
+            self._stats["texts"] += len(texts)
+            self._stats["batches"] += batches
+            self._stats["encode_seconds"] += encode_seconds
+            self._stats["queue_wait_seconds"] += sum(started - request.submitted_at for request in requests)
+
+    def stop(self) -> None:
+        """Encode everything still queued, then stop the worker thread."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join(timeout=30)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get throughput metrics.
+
+        Returns:
+            Dictionary with request/text/batch counts, average batch size,
+            encode throughput (texts per second) and average queue wait
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["texts"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["texts_per_second"] = round(stats["texts"] / stats["encode_seconds"], 1) if stats["encode_seconds"] else 0.0
+        stats["avg_queue_wait_ms"] = round(stats["queue_wait_seconds"] * 1000 / stats["requests"], 2) if stats["requests"] else 0.0
+        stats["queued_requests"] = self._queue.qsize()
+        stats["batch_size"] = self.batch_size
+        stats["max_wait_ms"] = self.max_wait_ms
+        return stats
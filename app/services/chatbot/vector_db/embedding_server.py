@@ -0,0 +1,351 @@
+"""
+Local embedding server process owning the embedding models.
+
+Encodes inside the API process hold the GIL for the tokenizer and parts of
+the forward pass, so a large upload stalls unrelated requests, and every
+uvicorn worker loads its own copy of the model. With EMBEDDING_SERVER_SOCKET
+set, the model registry loads RemoteSentenceTransformer handles instead of
+models: encodes are sent over a Unix socket to one embedding server per
+node, which owns the models and batches the requests of all workers.
+
+    python -m app.services.chatbot.vector_db.embedding_server --socket /tmp/embeddings.sock
+
+The server keeps the two encode lanes of the registry: interactive encodes
+(queries) are run right away and go first on the model; bulk encodes
+(chunks) are coalesced across connections into batches of --batch-size.
+It loads models with its own EMBEDDING_BACKEND, which has to match the API
+processes' so embedding cache keys stay correct (the client warns otherwise).
+
+Messages in both directions are a 4-byte big-endian length and a JSON
+header; an encode response is followed by the float32 vectors, row-major.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from app.core.config import settings
+
+from .model_registry import ModelRegistry, BACKENDS, LANE_INTERACTIVE, LANE_BULK
+from .embedding_batcher import EmbeddingBatcher
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+
+# SentenceTransformer.encode arguments that change the vectors; others (progress bars) stay local
+FORWARDED_ENCODE_KWARGS = ("normalize_embeddings", "batch_size", "prompt_name", "prompt", "precision")
+
+
+def _send(sock: socket.socket, header: Dict[str, Any], payload: bytes = b"") -> None:
+    """Send a JSON header and an optional binary payload."""
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(data)) + data + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Read exactly size bytes, raising ConnectionError if the peer closes first."""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_header(sock: socket.socket) -> Dict[str, Any]:
+    """Read one JSON header."""
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+class RemoteSentenceTransformer:
+    """
+    Drop-in for a SentenceTransformer whose encodes run in the embedding server.
+
+    Connections are pooled and reopened once after a failure, so a
+    restarted server is picked up without restarting the API. Lanes are
+    scheduled by the server, so the registry passes them through instead
+    of serializing encodes in this process.
+    """
+
+    schedules_lanes = True
+
+    def __init__(self, model_name: str, socket_path: str, pool_size: int = 4, timeout: float = 120.0,
+                 backend: Optional[str] = None):
+        """
+        Initialize the client; the model is loaded in the server on first use.
+
+        Args:
+            model_name: Model name, as the server loads it
+            socket_path: Unix socket of the embedding server
+            pool_size: Idle connections kept open
+            timeout: Socket timeout per request in seconds
+            backend: Backend this process expects, to warn about a mismatch with the server
+        """
+        self.model_name = model_name
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=max(1, pool_size))
+        self._expected_backend = backend
+        self._checked = False
+
+    def _connect(self) -> socket.socket:
+        """Open a connection to the server."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _request(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        """
+        Send a request on a pooled connection and read the response.
+
+        Args:
+            header: Request header
+
+        Returns:
+            (response header, payload)
+
+        Raises:
+            RuntimeError: If the server reports an error
+        """
+        for attempt in range(2):
+            try:
+                sock = self._pool.get_nowait()
+            except queue.Empty:
+                sock = self._connect()
+            try:
+                _send(sock, header)
+                response = _recv_header(sock)
+                payload = _recv_exact(sock, response.get("bytes", 0))
+            except (OSError, ConnectionError):
+                sock.close()
+                # A pooled connection may be stale after a server restart
+                if attempt:
+                    raise
+                continue
+            try:
+                self._pool.put_nowait(sock)
+            except queue.Full:
+                sock.close()
+            if "error" in response:
+                raise RuntimeError(f"Embedding server: {response['error']}")
+            return response, payload
+
+    def _check_backend(self) -> None:
+        """Warn once if the server encodes with another backend than this process expects."""
+        if self._checked or self._expected_backend is None:
+            return
+        self._checked = True
+        backend = self.info().get("backend")
+        if backend != self._expected_backend:
+            logger.warning(f"Embedding server uses the {backend} backend, this process expects {self._expected_backend}")
+
+    def encode(self, texts, lane: str = LANE_INTERACTIVE, **kwargs):
+        """
+        Encode texts in the embedding server.
+
+        Args:
+            texts: Text or list of texts, as for SentenceTransformer.encode
+            lane: LANE_INTERACTIVE for query encodes, LANE_BULK for ingestion
+            **kwargs: SentenceTransformer.encode arguments; those in
+                FORWARDED_ENCODE_KWARGS are applied by the server
+
+        Returns:
+            numpy array of embeddings (one row per text, 1-D for a single string)
+        """
+        self._check_backend()
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.zeros((0, 0), dtype=np.float32)
+        response, payload = self._request({
+            "op": "encode",
+            "model": self.model_name,
+            "lane": lane,
+            "texts": batch,
+            "kwargs": {key: kwargs[key] for key in FORWARDED_ENCODE_KWARGS if key in kwargs}
+        })
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(response["shape"])
+        return vectors[0] if single else vectors
+
+    def info(self) -> Dict[str, Any]:
+        """Backend, loaded models and lane statistics of the server."""
+        response, _ = self._request({"op": "info"})
+        return response
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _EncodeHandler(socketserver.BaseRequestHandler):
+    """Serves the requests of one client connection until it closes."""
+
+    def handle(self):
+        while True:
+            try:
+                header = _recv_header(self.request)
+            except (OSError, ConnectionError, struct.error):
+                return
+            try:
+                if header.get("op") == "info":
+                    _send(self.request, self.server.embedding_server.info())
+                    continue
+                vectors = self.server.embedding_server.encode(
+                    header["model"], header["texts"], header.get("lane", LANE_INTERACTIVE), header.get("kwargs") or {}
+                )
+            except Exception as e:
+                logger.error(f"Encode request failed: {e}")
+                _send(self.request, {"error": str(e)})
+                continue
+            payload = np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+            _send(self.request, {"shape": list(vectors.shape), "bytes": len(payload)}, payload)
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class EmbeddingServer:
+    """
+    Owns the embedding models of a node and serves encode requests over a Unix socket.
+    """
+
+    def __init__(self, socket_path: str, registry: Optional[ModelRegistry] = None,
+                 batch_size: int = 64, max_wait_ms: float = 5.0):
+        """
+        Initialize the server; models are loaded on their first request.
+
+        Args:
+            socket_path: Unix socket to listen on (a stale socket file is replaced)
+            registry: Registry loading the models (default: local models on EMBEDDING_BACKEND)
+            batch_size: Texts per bulk encode batch, across connections
+            max_wait_ms: Longest wait for a bulk batch to fill
+        """
+        self.socket_path = socket_path
+        self.registry = registry or ModelRegistry(
+            bulk_slice_size=settings.EMBEDDING_BULK_SLICE_SIZE,
+            backend=settings.EMBEDDING_BACKEND,
+            quantization=settings.EMBEDDING_ONNX_QUANTIZATION
+        )
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._models: Dict[str, Any] = {}
+        self._batchers: Dict[Tuple[str, str], EmbeddingBatcher] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[_ThreadingUnixServer] = None
+
+    def _model(self, model_name: str):
+        """Shared model handle, loaded on first use and kept until shutdown."""
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self.registry.acquire_model(model_name)
+            return self._models[model_name]
+
+    def _batcher(self, model_name: str, kwargs: Dict[str, Any]) -> EmbeddingBatcher:
+        """Bulk batcher of a model and encode arguments."""
+        key = (model_name, json.dumps(kwargs, sort_keys=True))
+        model = self._model(model_name)
+        with self._lock:
+            if key not in self._batchers:
+                self._batchers[key] = EmbeddingBatcher(
+                    lambda texts: model.encode(texts, lane=LANE_BULK, show_progress_bar=False, **kwargs),
+                    batch_size=self.batch_size,
+                    max_wait_ms=self.max_wait_ms
+                )
+            return self._batchers[key]
+
+    def encode(self, model_name: str, texts: List[str], lane: str, kwargs: Dict[str, Any]) -> np.ndarray:
+        """
+        Encode the texts of one request.
+
+        Args:
+            model_name: Model to encode with
+            texts: Texts of the request
+            lane: LANE_INTERACTIVE or LANE_BULK
+            kwargs: Forwarded SentenceTransformer.encode arguments
+
+        Returns:
+            2-D float32 array of embeddings
+        """
+        if lane == LANE_BULK:
+            return np.asarray(self._batcher(model_name, kwargs).embed(texts), dtype=np.float32)
+        return np.asarray(
+            self._model(model_name).encode(texts, lane=lane, show_progress_bar=False, **kwargs), dtype=np.float32
+        )
+
+    def info(self) -> Dict[str, Any]:
+        """Backend, loaded models with their lane statistics, and bulk batcher statistics."""
+        with self._lock:
+            batchers = {f"{model} {kwargs}": batcher.get_stats() for (model, kwargs), batcher in self._batchers.items()}
+        return {
+            "backend": self.registry.backend,
+            "models": self.registry.memory_report()["models"],
+            "batchers": batchers
+        }
+
+    def serve_forever(self) -> None:
+        """Listen on the socket until shutdown() is called."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _ThreadingUnixServer(self.socket_path, _EncodeHandler)
+        self._server.embedding_server = self
+        logger.info(f"Embedding server listening on {self.socket_path} ({self.registry.backend} backend)")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        """Stop serving and the bulk batchers."""
+        if self._server is not None:
+            self._server.shutdown()
+        with self._lock:
+            for batcher in self._batchers.values():
+                batcher.stop()
+            self._batchers.clear()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Serve embedding encodes to the API workers of this node")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET or "/tmp/document-analyzer-embeddings.sock")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE,
+                        help="Texts per bulk encode batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Longest wait for a bulk batch to fill")
+    parser.add_argument("--preload", nargs="*", default=[settings.EMBEDDING_MODEL],
+                        help="Models to load before accepting requests")
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="Overrides EMBEDDING_BACKEND")
+    args = parser.parse_args()
+
+    registry = None
+    if args.backend:
+        registry = ModelRegistry(
+            bulk_slice_size=settings.EMBEDDING_BULK_SLICE_SIZE,
+            backend=args.backend,
+            quantization=settings.EMBEDDING_ONNX_QUANTIZATION
+        )
+    server = EmbeddingServer(args.socket, registry=registry, batch_size=args.batch_size, max_wait_ms=args.max_wait_ms)
+    for model_name in args.preload:
+        server._model(model_name)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
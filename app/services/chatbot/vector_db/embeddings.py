@@ -1,6 +1,6 @@
-from sentence_transformers import SentenceTransformer
 from typing import List, Union
 import numpy as np
+from .model_registry import model_registry, LANE_BULK, LANE_INTERACTIVE
 
 
 class EmbeddingGenerator:
@@ -18,7 +18,15 @@ class EmbeddingGenerator:
                              Default is 'all-MiniLM-L6-v2' which offers good performance
                              with reasonable speed and memory usage.
         """
-        self.model = SentenceTransformer(model_name)
+        # Shared with the vector stores, so the model is loaded once per process
+        self.model_name = model_name
+        self.model = model_registry.acquire_model(model_name)
+
+    def release(self):
+        """Release the shared model reference."""
+        if self.model is not None:
+            model_registry.release_model(self.model_name)
+            self.model = None
 
     def generate_embeddings(self, texts: Union[str, List[str]]) -> List[List[float]]:
         """
@@ -38,7 +46,8 @@ class EmbeddingGenerator:
         if isinstance(texts, str):
             texts = [texts]
 
-        embeddings = self.model.encode(texts)
+        # Batch encodes yield to query encodes on the shared model
+        embeddings = self.model.encode(texts, lane=LANE_BULK)
         return embeddings.tolist()
 
     def generate_query_embedding(self, query: str) -> List[float]:
@@ -54,7 +63,7 @@ class EmbeddingGenerator:
         Returns:
             List[float]: Single embedding vector as a list of floats
         """
-        embedding = self.model.encode([query])
+        embedding = self.model.encode([query], lane=LANE_INTERACTIVE)
         
         # Return the first (and only) embedding as a list
         return embedding[0].tolist()
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+HNSW index parameters of the chunk collections.
+
+Chroma builds an HNSW graph per collection. Its parameters trade recall
+against query latency, build time and memory:
+
+    space            distance: "l2" (squared L2), "cosine" or "ip"
+    M                graph links per vector; more links raise recall and memory
+    construction_ef  candidate list size while building; higher builds a better graph, slower
+    search_ef        candidate list size while querying; higher raises recall and latency
+
+The parameters are stored in the collection metadata ("hnsw:*" keys) and
+only apply when a collection is created; existing collections keep the
+parameters they were created with (shards inherit those of the base
+collection). Chroma's get_or_create_collection() overwrites the metadata
+of an existing collection, so stores pass it through creation_metadata().
+Set per deployment with HNSW_SPACE, HNSW_M,
+HNSW_CONSTRUCTION_EF and HNSW_SEARCH_EF; unset values use Chroma's defaults.
+tests/chroma_db_test/performance_test.py --hnsw-sweep measures the trade-off.
+"""
+from typing import Dict, Any, Optional
+from app.core.config import settings
+
+HNSW_SPACES = ("l2", "cosine", "ip")
+
+DEFAULT_HNSW_SPACE = settings.HNSW_SPACE
+DEFAULT_HNSW_M = settings.HNSW_M
+DEFAULT_HNSW_CONSTRUCTION_EF = settings.HNSW_CONSTRUCTION_EF
+DEFAULT_HNSW_SEARCH_EF = settings.HNSW_SEARCH_EF
+
+
+def hnsw_metadata(
+    space: Optional[str] = None,
+    m: Optional[int] = None,
+    construction_ef: Optional[int] = None,
+    search_ef: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Collection metadata that creates a collection with these HNSW parameters.
+
+    Args:
+        space: Distance space, one of HNSW_SPACES
+        m: Links per vector
+        construction_ef: Candidate list size while building
+        search_ef: Candidate list size while querying
+
+    Returns:
+        Metadata with the "hnsw:*" keys that are set, or None if all use Chroma's defaults
+
+    Raises:
+        ValueError: If the space is unknown or a size is not positive
+    """
+    if space is not None and space not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space: {space}. Use one of {HNSW_SPACES}")
+    params = {
+        "hnsw:space": space,
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef
+    }
+    for key, value in params.items():
+        if key != "hnsw:space" and value is not None and value <= 0:
+            raise ValueError(f"{key} must be positive, got {value}")
+    metadata = {key: value for key, value in params.items() if value is not None}
+    return metadata or None
+
+
+def creation_metadata(client: Any, name: str, metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Metadata to open a collection with: the given one if it does not exist yet.
+
+    Passing metadata when an existing collection is opened would replace its
+    stored "hnsw:*" keys, e.g. the space its index was built in.
+
+    Args:
+        client: Chroma client
+        name: Collection name
+        metadata: Metadata of a new collection (see hnsw_metadata)
+
+    Returns:
+        The metadata for a new collection, None for an existing one
+    """
+    if metadata is None:
+        return None
+    try:
+        client.get_collection(name)
+        return None
+    except Exception:
+        return metadata
+
+
+def index_params(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    HNSW parameters of an existing collection.
+
+    Args:
+        metadata: Collection metadata
+
+    Returns:
+        Dictionary with space, M, construction_ef and search_ef (None where Chroma's default applies)
+    """
+    metadata = metadata or {}
+    return {
+        "space": metadata.get("hnsw:space", "l2"),
+        "M": metadata.get("hnsw:M"),
+        "construction_ef": metadata.get("hnsw:construction_ef"),
+        "search_ef": metadata.get("hnsw:search_ef")
+    }
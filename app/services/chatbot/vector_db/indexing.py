@@ -2,7 +2,11 @@ from .langchain_chroma import LangChainChromaStore
 from langchain.schema import Document
 from .chunking import DocumentChunker
 from .contextual_chunking import DocumentAwareAugmenter
-from typing import Dict, List, Optional
+from .change_log import ChunkChangeLog
+from .chunk_embedding_cache import ChunkEmbeddingCache
+from .embedding_batcher import EmbeddingBatcher
+from .document_vectors import DocumentVectorIndex
+from typing import Any, Dict, List, Optional
 import logging
 
 
@@ -20,7 +24,11 @@ class LangChainDocumentIndexer:
     plain text documents, automatically choosing the appropriate chunking strategy.
     """
     
-    def __init__(self, vectorstore: LangChainChromaStore, chunker: DocumentChunker, llm: Optional[Any] = None):
+    def __init__(self, vectorstore: LangChainChromaStore, chunker: DocumentChunker, llm: Optional[Any] = None,
+                 change_log: Optional[ChunkChangeLog] = None,
+                 embedding_cache: Optional[ChunkEmbeddingCache] = None,
+                 embedding_batcher: Optional[EmbeddingBatcher] = None,
+                 document_vectors: Optional[DocumentVectorIndex] = None):
         """
         Initialize the document indexer with vector store and chunker components.
         
@@ -28,9 +36,21 @@ class LangChainDocumentIndexer:
             vectorstore: The vector database store for storing document chunks
             chunker: The document chunker for splitting documents into manageable pieces
             llm: Optional language model for contextual chunking
+            change_log: Optional change log that stored chunks are recorded in,
+                        so other indexes (e.g. BM25) can follow along
+            embedding_cache: Optional content-addressed cache of chunk embeddings,
+                             so identical chunks are only encoded once
+            embedding_batcher: Optional batcher that encodes chunks together with
+                               those of concurrent index_document calls
+            document_vectors: Optional index that the centroid of each indexed
+                              document's chunk vectors is stored in
         """
         self.vectorstore = vectorstore
         self.chunker = chunker
+        self.change_log = change_log
+        self.embedding_cache = embedding_cache
+        self.embedding_batcher = embedding_batcher
+        self.document_vectors = document_vectors
         self.document_augmenter = DocumentAwareAugmenter(llm=llm)
         self.logger = logging.getLogger(__name__)
 
@@ -68,6 +88,72 @@ class LangChainDocumentIndexer:
         
         return cleaned_metadata
 
+    def _embed_documents(self, documents: List[Document]) -> Optional[List[List[float]]]:
+        """
+        Get chunk embeddings, encoding only chunks missing from the embedding cache.
+        
+        Missing chunks are encoded through the embedding batcher when one is
+        configured, otherwise directly with the vector store's model.
+        
+        Args:
+            documents: Chunks to embed
+            
+        Returns:
+            Embeddings aligned with documents, or None without a cache and a
+            batcher (the vector store then embeds the chunks itself)
+        """
+        if self.embedding_cache is None and self.embedding_batcher is None:
+            return None
+        
+        texts = [doc.page_content for doc in documents]
+        embeddings = [None] * len(texts)
+        if self.embedding_cache is not None:
+            try:
+                embeddings = self.embedding_cache.get_many(texts)
+            except Exception as e:
+                self.logger.warning(f"Chunk embedding cache lookup failed, encoding all chunks: {str(e)}")
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            if self.embedding_batcher is not None:
+                encoded = self.embedding_batcher.embed(missing_texts)
+            else:
+                encoded = self.vectorstore.embed_documents(missing_texts)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+            if self.embedding_cache is not None:
+                try:
+                    self.embedding_cache.put_many(missing_texts, encoded)
+                except Exception as e:
+                    self.logger.warning(f"Failed to store chunk embeddings in cache: {str(e)}")
+        
+        self.logger.info(f"Chunk embeddings: {len(texts) - len(missing)} from cache, {len(missing)} encoded")
+        return embeddings
+
+    def _delete_stale_chunks(self, document_data: Dict, ids: List[str]) -> List[str]:
+        """
+        Delete chunks of a document that were not part of its latest indexing.
+        
+        Args:
+            document_data: Document information (id and optional user_id)
+            ids: Chunk IDs just stored for the document
+            
+        Returns:
+            IDs of the deleted chunks
+        """
+        where = {"document_id": document_data['id']}
+        if document_data.get('user_id'):
+            # Lets a sharded store look at the owner's shard only
+            where = {"$and": [where, {"user_id": document_data['user_id']}]}
+        
+        current = set(ids)
+        stale_ids = [chunk_id for chunk_id in self.vectorstore.get_chunk_ids(where) if chunk_id not in current]
+        if stale_ids:
+            self.vectorstore.delete_documents(stale_ids, user_id=document_data.get('user_id'))
+            self.logger.info(f"Removed {len(stale_ids)} stale chunks of document {document_data['id']}")
+        return stale_ids
+
     def index_document(self, document_data: Dict) -> List[str]:
         """
         Index a document by chunking it and storing the chunks in the vector database.
@@ -129,10 +215,15 @@ class LangChainDocumentIndexer:
             # ===== LANGCHAIN DOCUMENT CONVERSION =====
             # Convert chunks to LangChain Document objects for vector storage
             # Each chunk becomes a separate Document with its own metadata
+            # and the deterministic ID "{document_id}:{chunk_index}"
             documents = []
-            for chunk in chunks:
+            ids = []
+            for chunk_index, chunk in enumerate(chunks):
+                chunk_id = f"{document_data['id']}:{chunk_index}"
+                ids.append(chunk_id)
+                
                 # Clean metadata to be compatible with ChromaDB
-                cleaned_metadata = self._clean_metadata(chunk['metadata'])
+                cleaned_metadata = self._clean_metadata({**chunk['metadata'], 'chunk_index': chunk_index, 'chunk_id': chunk_id})
                 
                 # Create LangChain Document object with chunk content and metadata
                 doc = Document(
@@ -142,9 +233,47 @@ class LangChainDocumentIndexer:
                 documents.append(doc)
 
             # ===== VECTOR DATABASE STORAGE =====
-            # Store documents in vector database and get their IDs
-            # The vectorstore will create embeddings and store them for retrieval
-            ids = self.vectorstore.add_documents(documents)
+            # Upsert the chunks under their deterministic IDs, so re-indexing a
+            # document replaces its chunks instead of adding duplicates
+            # Embeddings of chunks seen before come from the embedding cache;
+            # without a cache the vectorstore creates the embeddings itself
+            # Document vectors need the chunk vectors, so they are computed here then
+            embeddings = self._embed_documents(documents)
+            if embeddings is None and self.document_vectors is not None and documents:
+                embeddings = self.vectorstore.embed_documents([doc.page_content for doc in documents])
+            ids = self.vectorstore.add_documents(documents, ids=ids, embeddings=embeddings)
+            
+            # Chunks of an earlier version that the new version no longer has
+            # (a shorter document, or random IDs from before deterministic IDs)
+            stale_ids = self._delete_stale_chunks(document_data, ids)
+            
+            # ===== CHANGE FEED =====
+            # Record the stored chunks for indexes that tail the change log
+            # (the chunks are already stored, so a log failure is not fatal)
+            if self.change_log is not None:
+                try:
+                    self.change_log.record_added(ids, documents)
+                    if stale_ids:
+                        self.change_log.record_deleted(chunk_ids=stale_ids)
+                except Exception as e:
+                    self.logger.error(f"Failed to record document {document_data['id']} in change log: {str(e)}")
+
+            # ===== DOCUMENT VECTOR =====
+            # Centroid of the chunk vectors for coarse-to-fine search and related
+            # documents (the chunks are already stored, so a failure is not fatal)
+            if self.document_vectors is not None and embeddings:
+                try:
+                    self.document_vectors.upsert(
+                        document_data['id'],
+                        embeddings,
+                        self._clean_metadata({
+                            'user_id': document_metadata['user_id'],
+                            'filename': document_metadata['filename'],
+                            'document_type': document_metadata['document_type']
+                        })
+                    )
+                except Exception as e:
+                    self.logger.error(f"Failed to store vector of document {document_data['id']}: {str(e)}")
            
             self.logger.info(f"Indexed document {document_data['id']} with {len(chunks)} chunks")
             return ids
@@ -1,10 +1,48 @@
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
 from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+import logging
+import os
+import threading
+import uuid
+import numpy as np
+from .model_registry import model_registry
+from .chroma_client import DEFAULT_CLIENT_MODE, DEFAULT_SERVER_URL, server_url_for
+from .query_embedding_cache import CachedQueryEmbeddings, query_embedding_cache
+from .quantized_index import (
+    QUANTIZATION_NONE, QUANTIZATIONS, DEFAULT_QUANTIZATION, DEFAULT_RESCORE_FACTOR, DEFAULT_SYNC_INTERVAL,
+    QuantizedVectorIndex, shared_quantized_index
+)
+from .change_log import ChunkChangeLog
+from .selection_vector_cache import SelectedVectors, is_selection_filter, selection_key, selection_vector_cache
+from .collection_sharding import (
+    SHARDING_NONE, SHARDINGS, DEFAULT_SHARDING, DEFAULT_SHARD_BUCKETS,
+    shard_collection_name, is_shard_name, user_id_from_filter
+)
+from .document_vectors import DEFAULT_COARSE_DOCUMENTS, DocumentVectorIndex
+from .hnsw_params import (
+    DEFAULT_HNSW_SPACE, DEFAULT_HNSW_M, DEFAULT_HNSW_CONSTRUCTION_EF, DEFAULT_HNSW_SEARCH_EF,
+    hnsw_metadata, creation_metadata, index_params
+)
 
+logger = logging.getLogger(__name__)
+
+
+class StoreRetriever(BaseRetriever):
+    """
+    LangChain retriever over LangChainChromaStore.similarity_search.
+
+    Used instead of Chroma's own retriever when the store shards its
+    collection, searches a quantized index or shortlists documents first,
+    which Chroma knows nothing about.
+    """
+
+    store: Any
+    search_kwargs: Dict[str, Any] = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.store.similarity_search(query, **self.search_kwargs)
 
 
 class LangChainChromaStore:
@@ -19,7 +57,14 @@ class LangChainChromaStore:
     """
     
     def __init__(self, persist_directory: str, collection_name: str = "documents",
-                 embedding_model: str = "all-MiniLM-L6-v2"):
+                 embedding_model: str = "all-MiniLM-L6-v2", quantization: str = DEFAULT_QUANTIZATION,
+                 rescore_factor: int = DEFAULT_RESCORE_FACTOR, quantized_sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 sharding: str = DEFAULT_SHARDING,
+                 shard_buckets: int = DEFAULT_SHARD_BUCKETS, coarse_documents: int = DEFAULT_COARSE_DOCUMENTS,
+                 hnsw_space: Optional[str] = DEFAULT_HNSW_SPACE, hnsw_m: Optional[int] = DEFAULT_HNSW_M,
+                 hnsw_construction_ef: Optional[int] = DEFAULT_HNSW_CONSTRUCTION_EF,
+                 hnsw_search_ef: Optional[int] = DEFAULT_HNSW_SEARCH_EF,
+                 client_mode: str = DEFAULT_CLIENT_MODE, chroma_server_url: str = DEFAULT_SERVER_URL):
         """
         Initialize the LangChain ChromaDB store with persistent storage.
         
@@ -27,28 +72,165 @@ class LangChainChromaStore:
             persist_directory (str): Directory path where ChromaDB will store its data
             collection_name (str): Name of the collection to use (default: "documents")
             embedding_model (str): Name of the SentenceTransformer model to use for embeddings
+            quantization (str): "none" to search with Chroma, or "int8" / "binary" to find
+                candidates in a compact quantized index and rescore them exactly
+            rescore_factor (int): Candidates fetched from the quantized index per result
+            quantized_sync_interval (float): Minimum seconds between background syncs of the
+                quantized index with its collection
+            sharding (str): "none" for one collection, "user" for a collection per user, or
+                "hash" for a fixed number of user buckets (see collection_sharding)
+            shard_buckets (int): Number of buckets for "hash" sharding
+            coarse_documents (int): Documents shortlisted by their document vector before
+                searching chunks of a whole user library (0 searches all chunks directly)
+            hnsw_space (Optional[str]): Distance space of a new collection ("l2", "cosine" or "ip")
+            hnsw_m (Optional[int]): HNSW links per vector of a new collection
+            hnsw_construction_ef (Optional[int]): HNSW build candidate list size of a new collection
+            hnsw_search_ef (Optional[int]): HNSW query candidate list size of a new collection
+                (the hnsw parameters only apply when the collection is created, see hnsw_params;
+                None uses Chroma's default)
+            client_mode (str): "persistent" to open persist_directory in this process, or "http"
+                to use the Chroma server owning it, shared by several workers (see chroma_client)
+            chroma_server_url (str): URL of the Chroma server in "http" mode
         """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization}. Use one of {QUANTIZATIONS}")
+        if sharding not in SHARDINGS:
+            raise ValueError(f"Unknown sharding: {sharding}. Use one of {SHARDINGS}")
+        self.server_url = server_url_for(client_mode, chroma_server_url)
         self.persist_directory = persist_directory
         self.collection_name = collection_name
-        # Use SentenceTransformer for consistent embedding across indexing and retrieval
-        self.embeddings = SentenceTransformerEmbeddings(model_name=embedding_model)
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=ChromaSettings(anonymized_telemetry=False)
+        self.embedding_model = embedding_model
+        # Use SentenceTransformer for consistent embedding across indexing and retrieval;
+        # the model and the client are shared with every other store in the process,
+        # and query embeddings are cached so repeated queries are encoded once
+        self.embeddings = CachedQueryEmbeddings(
+            model_registry.acquire_embeddings(embedding_model),
+            model_registry.model_id(embedding_model),
+            query_embedding_cache
         )
+        self.client = model_registry.acquire_client(persist_directory, self.server_url)
+        self._released = False
         self.vectorstore = Chroma(
             client=self.client,
             collection_name=collection_name,
             embedding_function=self.embeddings,
+            # Only a new collection gets the parameters; an existing one keeps its own
+            collection_metadata=creation_metadata(
+                self.client, collection_name,
+                hnsw_metadata(hnsw_space, hnsw_m, hnsw_construction_ef, hnsw_search_ef)
+            ),
         )
+        # Shared by every store on this collection; filled from Chroma in the background
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.quantized_sync_interval = quantized_sync_interval
+        self.quantized_index = None
+        self._change_log = None
+        if quantization != QUANTIZATION_NONE:
+            self.quantized_index = shared_quantized_index(persist_directory, collection_name, quantization)
+            self._change_log = ChunkChangeLog.for_directory(persist_directory)
+        # Shard collections are opened on first use
+        self.sharding = sharding
+        self.shard_buckets = shard_buckets
+        self._collections: Dict[str, Chroma] = {collection_name: self.vectorstore}
+        self._collections_lock = threading.Lock()
+        # Knowledge Base selections are searched exactly in memory; writes invalidate them
+        self.selection_cache = selection_vector_cache
+        self._selection_namespace = (os.path.abspath(persist_directory), collection_name)
+        # Document vectors are opened on first use
+        self.coarse_documents = max(0, coarse_documents)
+        self._document_vectors = None
+
+    @property
+    def document_vectors(self) -> DocumentVectorIndex:
+        """Per-document centroid vectors of this store (see document_vectors)."""
+        with self._collections_lock:
+            if self._document_vectors is None:
+                self._document_vectors = DocumentVectorIndex(self)
+            return self._document_vectors
+
+    def _direct(self) -> bool:
+        """Whether every operation can go straight to the single Chroma collection."""
+        return self.sharding == SHARDING_NONE and self.quantized_index is None
+
+    def _collection(self, name: str, create: bool = False) -> Optional[Chroma]:
+        """
+        Get the LangChain wrapper of a collection of this store.
+        
+        Args:
+            name (str): Base or shard collection name
+            create (bool): Create the collection if it does not exist
+            
+        Returns:
+            Optional[Chroma]: The collection, None if it does not exist and create is False
+        """
+        with self._collections_lock:
+            vectorstore = self._collections.get(name)
+            if vectorstore is None:
+                if not create:
+                    try:
+                        self.client.get_collection(name)
+                    except Exception:
+                        return None
+                # Shards use the distance space and HNSW parameters of the base collection
+                vectorstore = Chroma(
+                    client=self.client,
+                    collection_name=name,
+                    embedding_function=self.embeddings,
+                    collection_metadata=creation_metadata(self.client, name, self.vectorstore._collection.metadata),
+                )
+                self._collections[name] = vectorstore
+            return vectorstore
+
+    def _index(self, name: str) -> Optional[QuantizedVectorIndex]:
+        """Quantized index of a collection of this store, None without quantization."""
+        if self.quantized_index is None:
+            return None
+        if name == self.collection_name:
+            return self.quantized_index
+        return shared_quantized_index(self.persist_directory, name, self.quantization)
+
+    def _shard_names(self) -> List[str]:
+        """Names of the base collection and every existing shard."""
+        if self.sharding == SHARDING_NONE:
+            return [self.collection_name]
+        names = [getattr(collection, "name", collection) for collection in self.client.list_collections()]
+        return [self.collection_name] + sorted(name for name in names if is_shard_name(name, self.collection_name))
+
+    def _route(self, where: Optional[Dict[str, Any]]) -> List[str]:
+        """
+        Collections a read with this metadata filter has to look at.
+        
+        A filter on one user goes to that user's shard, plus the base
+        collection while it still holds chunks that were not migrated.
+        Anything else looks at every shard.
+        
+        Args:
+            where (Optional[Dict[str, Any]]): Chroma metadata filter
+            
+        Returns:
+            List[str]: Collection names
+        """
+        user_id = user_id_from_filter(where)
+        if self.sharding == SHARDING_NONE:
+            return [self.collection_name]
+        if not user_id:
+            return self._shard_names()
+        names = [shard_collection_name(self.collection_name, user_id, self.sharding, self.shard_buckets)]
+        if self.vectorstore._collection.count() > 0:
+            names.append(self.collection_name)
+        return names
 
-    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None,
+                      embeddings: Optional[List[List[float]]] = None):
         """
         Add LangChain Document objects to the vector store.
         
         Args:
             documents (List[Document]): List of LangChain Document objects to add
             ids (Optional[List[str]]): Optional list of document IDs
+            embeddings (Optional[List[List[float]]]): Precomputed embeddings aligned with
+                documents (e.g. from a chunk embedding cache); computed here if omitted
             
         Returns:
             List[str]: List of document IDs that were added to the store
@@ -56,7 +238,58 @@ class LangChainChromaStore:
         # Handle empty documents list to avoid unnecessary processing
         if not documents:
             return []
-        return self.vectorstore.add_documents(documents, ids=ids)
+        self.selection_cache.invalidate(self._selection_namespace)
+        if embeddings is None:
+            if self._direct():
+                return self.vectorstore.add_documents(documents, ids=ids)
+            # Shards and the quantized index are written with explicit vectors
+            embeddings = self.embed_documents([doc.page_content for doc in documents])
+        
+        # Same write LangChain performs, minus the embedding step, per owner's shard
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        shards: Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            name = shard_collection_name(self.collection_name, doc.metadata.get("user_id"), self.sharding, self.shard_buckets)
+            shards.setdefault(name, []).append(i)
+        
+        for name, rows in shards.items():
+            shard_ids = [ids[i] for i in rows]
+            shard_embeddings = [embeddings[i] for i in rows]
+            metadatas = [documents[i].metadata for i in rows]
+            self._collection(name, create=True)._collection.upsert(
+                ids=shard_ids,
+                embeddings=shard_embeddings,
+                metadatas=metadatas,
+                documents=[documents[i].page_content for i in rows]
+            )
+            index = self._index(name)
+            if index is not None:
+                index.add(shard_ids, shard_embeddings, metadatas)
+        return ids
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Compute embeddings of chunk texts with the store's embedding model.
+        
+        Args:
+            texts (List[str]): Chunk texts
+            
+        Returns:
+            List[List[float]]: Embeddings aligned with texts
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Get the embedding of a query, from the query embedding cache when possible.
+        
+        Args:
+            query (str): The query text
+            
+        Returns:
+            List[float]: Query embedding
+        """
+        return self.embeddings.embed_query(query)
 
     def similarity_search(self, query: str, k: int = 4,
                           filter: Optional[Dict] = None) -> List[Document]:
@@ -71,7 +304,9 @@ class LangChainChromaStore:
         Returns:
             List[Document]: List of LangChain Document objects most similar to the query
         """
-        return self.vectorstore.similarity_search(query, k=k, filter=filter)
+        if not self._direct() or self.coarse_documents or is_selection_filter(filter):
+            return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+        return self.vectorstore.similarity_search_by_vector(self.embed_query(query), k=k, filter=filter)
 
     def similarity_search_with_score(self, query: str, k: int = 4,
                                      filter: Optional[Dict] = None) -> List[tuple]:
@@ -86,7 +321,274 @@ class LangChainChromaStore:
         Returns:
             List[tuple]: List of tuples containing (Document, score) pairs
         """
-        return self.vectorstore.similarity_search_with_score(query, k=k, filter=filter)
+        return self.similarity_search_by_vector_with_score(self.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict] = None) -> List[tuple]:
+        """
+        Perform similarity search with a precomputed query embedding.
+        
+        Args:
+            embedding (List[float]): Query embedding, e.g. from embed_query()
+            k (int): Number of most similar documents to return (default: 4)
+            filter (Optional[Dict]): Optional metadata filter to apply to the search
+            
+        Returns:
+            List[tuple]: List of tuples containing (Document, distance) pairs
+        """
+        if is_selection_filter(filter):
+            selection = self._load_selection(filter)
+            if selection is not None:
+                space = (self.vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+                return selection.search(embedding, k, space)
+        else:
+            # A shortlist differs per query, so it is searched by Chroma rather than cached
+            filter = self._shortlist_documents(embedding, filter)
+        if self._direct():
+            return self._search_collection(self.vectorstore, embedding, k, filter)
+        
+        names = self._route(filter)
+        results = []
+        for name in names:
+            vectorstore = self._collection(name)
+            if vectorstore is None:
+                continue
+            index = self._index(name)
+            if index is not None and index.supports_filter(filter):
+                results.extend(self._quantized_search(vectorstore, index, embedding, k, filter))
+            else:
+                results.extend(self._search_collection(vectorstore, embedding, k, filter))
+        
+        # Distances of all collections are in the same space
+        if len(names) > 1:
+            results = sorted(results, key=lambda pair: pair[1])[:k]
+        return results
+
+    def _shortlist_documents(self, embedding: List[float], where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Narrow a search over a whole user library to the closest documents.
+        
+        With coarse_documents set, a filter on one user only is replaced by a
+        document_id filter on the user's top documents by document vector,
+        which Chroma searches like any other filter. Shortlists are not loaded
+        into the selection cache, which is kept for Knowledge Base selections.
+        Libraries with no more documents than that are searched as before.
+        
+        Args:
+            embedding (List[float]): Query embedding
+            where (Optional[Dict[str, Any]]): Chroma metadata filter
+            
+        Returns:
+            Optional[Dict[str, Any]]: The filter to search chunks with
+        """
+        if not self.coarse_documents or not where:
+            return where
+        user_id = user_id_from_filter(where)
+        clauses = where["$and"] if set(where) == {"$and"} else [where]
+        if not user_id or any(user_id_from_filter(clause) != user_id for clause in clauses):
+            return where
+        document_ids = self.document_vectors.shortlist(embedding, self.coarse_documents, user_id)
+        if len(document_ids) < self.coarse_documents:
+            return where
+        return {"$and": [{"document_id": {"$in": document_ids}}, {"user_id": user_id}]}
+
+    def _load_selection(self, where: Dict[str, Any]) -> Optional[SelectedVectors]:
+        """
+        Get the vectors of a document selection, from the selection cache when possible.
+        
+        Args:
+            where (Dict[str, Any]): Selection filter (see is_selection_filter)
+            
+        Returns:
+            Optional[SelectedVectors]: Loaded selection, None if it is too large to
+            search in memory
+        """
+        key = selection_key(where)
+        selection = self.selection_cache.get(self._selection_namespace, key)
+        if selection is not None:
+            return selection
+        
+        # Generation read before loading, so a concurrent write leaves the entry stale
+        generation = self.selection_cache.generation(self._selection_namespace)
+        vectors, documents, metadatas = [], [], []
+        for name in self._route(where):
+            vectorstore = self._collection(name)
+            if vectorstore is None:
+                continue
+            results = vectorstore._collection.get(
+                where=where,
+                limit=self.selection_cache.max_selection_vectors + 1,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            vectors.extend(results["embeddings"])
+            documents.extend(results["documents"])
+            metadatas.extend(results["metadatas"])
+        if len(documents) > self.selection_cache.max_selection_vectors:
+            return None
+        
+        selection = SelectedVectors(vectors, documents, metadatas, generation)
+        self.selection_cache.put(self._selection_namespace, key, selection)
+        return selection
+
+    def _sync_quantized_index(self, vectorstore: Chroma, index: QuantizedVectorIndex):
+        """
+        Start a background sync of a collection's quantized index when one is due.
+        
+        The first sync fills the index; later ones pick up chunks written or
+        deleted by other processes (see QuantizedVectorIndex.sync). Searches
+        never wait for a sync.
+        
+        Args:
+            vectorstore (Chroma): The collection
+            index (QuantizedVectorIndex): Its quantized index
+        """
+        if not index.start_sync(self.quantized_sync_interval):
+            return
+        
+        def run():
+            try:
+                index.sync(vectorstore._collection, self._change_log)
+            except Exception as e:
+                logger.error(f"Quantized index sync of {vectorstore._collection.name} failed: {e}")
+        
+        threading.Thread(target=run, name="quantized-index-sync", daemon=True).start()
+
+    def _search_collection(self, vectorstore: Chroma, embedding: List[float], k: int,
+                           filter: Optional[Dict]) -> List[tuple]:
+        """
+        Search one collection with Chroma's HNSW index.
+        
+        Unlike LangChain's Chroma search, the results keep the Chroma IDs: chunks
+        indexed without a chunk_id in their metadata get their ID as chunk_id,
+        so hybrid fusion can match them with their BM25 hits.
+        
+        Args:
+            vectorstore (Chroma): The collection to search
+            embedding (List[float]): Query embedding
+            k (int): Number of results
+            filter (Optional[Dict]): Optional metadata filter
+            
+        Returns:
+            List[tuple]: (Document, distance) pairs
+        """
+        results = vectorstore._collection.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            where=filter,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (Document(page_content=text or "", metadata={"chunk_id": chunk_id, **(metadata or {})}), distance)
+            for chunk_id, text, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def _quantized_search(self, vectorstore: Chroma, index: QuantizedVectorIndex, embedding: List[float],
+                          k: int, filter: Optional[Dict]) -> List[tuple]:
+        """
+        Search a quantized index, then rescore the candidates with full-precision vectors.
+        
+        Until the first sync has filled the index, Chroma's HNSW index is searched instead.
+        
+        Args:
+            vectorstore (Chroma): The collection the index belongs to
+            index (QuantizedVectorIndex): Its quantized index
+            embedding (List[float]): Query embedding
+            k (int): Number of results
+            filter (Optional[Dict]): Metadata filter supported by the quantized index
+            
+        Returns:
+            List[tuple]: (Document, distance) pairs, with the distances Chroma would return
+        """
+        self._sync_quantized_index(vectorstore, index)
+        if not index.ready:
+            return self._search_collection(vectorstore, embedding, k, filter)
+        candidates = index.search(embedding, k * self.rescore_factor, where=filter)
+        if not candidates:
+            return []
+        
+        # Rescoring reads the candidates' float32 vectors from Chroma
+        results = vectorstore._collection.get(
+            ids=[chunk_id for chunk_id, _ in candidates],
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not results["ids"]:
+            return []
+        
+        # Exact distances in the collection's space, as Chroma's HNSW search computes them
+        query = np.asarray(embedding, dtype=np.float32)
+        vectors = np.asarray(results["embeddings"], dtype=np.float32)
+        space = (vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            distances = 1.0 - (vectors @ query) / np.where(norms == 0, 1.0, norms)
+        elif space == "ip":
+            distances = 1.0 - vectors @ query
+        else:
+            distances = np.sum((vectors - query) ** 2, axis=1)
+        
+        order = np.argsort(distances, kind="stable")[:k]
+        return [
+            (Document(page_content=results["documents"][i] or "",
+                      metadata={"chunk_id": results["ids"][i], **(results["metadatas"][i] or {})}),
+             float(distances[i]))
+            for i in order
+        ]
+
+    def get_quantization_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Get statistics of the quantized index.
+        
+        memory_mb is what the codes add to the process; float32_mb is the size
+        of the same vectors in Chroma's HNSW index, which stays resident, so
+        quantization does not lower the memory of a node.
+        
+        Returns:
+            Optional[Dict[str, Any]]: Index statistics (summed over shards) plus the rescore
+            factor, None when quantization is disabled
+        """
+        if self.quantized_index is None:
+            return None
+        shards = [self._index(name).get_stats() for name in self._shard_names()]
+        return {
+            "mode": self.quantization,
+            "vectors": sum(stats["vectors"] for stats in shards),
+            "dim": self.quantized_index.dim,
+            "memory_mb": round(sum(stats["memory_mb"] for stats in shards), 2),
+            "float32_mb": round(sum(stats["float32_mb"] for stats in shards), 2),
+            "ready": all(stats["ready"] for stats in shards),
+            "rescore_factor": self.rescore_factor
+        }
+
+    def get_index_params(self) -> Dict[str, Any]:
+        """
+        Get the HNSW parameters the collection was created with.
+        
+        Returns:
+            Dict[str, Any]: Space, M, construction_ef and search_ef (None where Chroma's default applies)
+        """
+        return index_params(self.vectorstore._collection.metadata)
+
+    def get_shard_stats(self) -> Dict[str, Any]:
+        """
+        Get the sharding mode and the number of chunks per collection.
+        
+        Returns:
+            Dict[str, Any]: Sharding mode, shard count, and chunk counts of the base
+            collection (unowned or not yet migrated chunks) and the shards
+        """
+        counts = {}
+        for name in self._shard_names():
+            vectorstore = self._collection(name)
+            counts[name] = vectorstore._collection.count() if vectorstore is not None else 0
+        return {
+            "sharding": self.sharding,
+            "shards": len(counts) - 1,
+            "base_chunks": counts.pop(self.collection_name, 0),
+            "shard_chunks": sum(counts.values()),
+            "largest_shard_chunks": max(counts.values(), default=0)
+        }
 
     def similarity_search_by_documents(self, query: str, document_ids: List[str], k: int = 4) -> List[Document]:
         """
@@ -121,7 +623,7 @@ class LangChainChromaStore:
         
         print(f"ChromaDB filter: {filter_dict}")
         
-        results = self.vectorstore.similarity_search(query, k=k, filter=filter_dict)
+        results = self.similarity_search(query, k=k, filter=filter_dict)
         
         print(f"Filtered search returned {len(results)} results")
         if results:
@@ -205,7 +707,7 @@ class LangChainChromaStore:
             "document_id": {"$in": document_ids}
         }
         
-        return self.vectorstore.similarity_search_with_score(query, k=k, filter=filter_dict)
+        return self.similarity_search_with_score(query, k=k, filter=filter_dict)
 
     def as_retriever(self, search_type: str = "similarity", search_kwargs: Dict = None):
         """
@@ -221,25 +723,197 @@ class LangChainChromaStore:
         # Set default search parameters if none provided
         if search_kwargs is None:
             search_kwargs = {"k": 4}
+        if (not self._direct() or self.coarse_documents) and search_type == "similarity":
+            # Chroma's retriever would only see the base collection, and search all of it
+            return StoreRetriever(store=self, search_kwargs=search_kwargs)
         return self.vectorstore.as_retriever(
             search_type=search_type,
             search_kwargs=search_kwargs
         )
 
-    def delete_documents(self, ids: List[str]):
-        self.vectorstore.delete(ids=ids)
+    def get_documents(self, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None,
+                      offset: Optional[int] = None) -> List[Document]:
+        """
+        Read stored chunks directly from the collection, without a query embedding.
+
+        Args:
+            where (Optional[Dict[str, Any]]): Optional metadata filter
+            limit (Optional[int]): Maximum number of chunks to return
+            offset (Optional[int]): Number of chunks to skip (for paging)
+
+        Returns:
+            List[Document]: Chunks with their Chroma ID in metadata["chunk_id"]
+        """
+        names = self._route(where)
+        if len(names) == 1:
+            vectorstore = self._collection(names[0])
+            return self._get_documents(vectorstore, where, limit, offset) if vectorstore is not None else []
+        
+        # Page across collections in a fixed order, skipping whole collections by their size
+        documents: List[Document] = []
+        skip = offset or 0
+        for name in names:
+            if limit is not None and len(documents) >= limit:
+                break
+            vectorstore = self._collection(name)
+            if vectorstore is None:
+                continue
+            if skip:
+                matched = vectorstore._collection.count() if not where else len(vectorstore.get(where=where, include=[])["ids"])
+                if skip >= matched:
+                    skip -= matched
+                    continue
+            remaining = None if limit is None else limit - len(documents)
+            documents.extend(self._get_documents(vectorstore, where, remaining, skip or None))
+            skip = 0
+        return documents
+
+    def _get_documents(self, vectorstore: Chroma, where: Optional[Dict[str, Any]], limit: Optional[int],
+                       offset: Optional[int]) -> List[Document]:
+        """Read chunks of one collection (see get_documents)."""
+        results = vectorstore.get(
+            where=where,
+            limit=limit,
+            offset=offset,
+            include=["documents", "metadatas"]
+        )
+        return [
+            Document(page_content=text or "", metadata={**(metadata or {}), "chunk_id": chunk_id})
+            for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+    def count(self) -> int:
+        """
+        Get the number of chunks stored in the collection.
+
+        Returns:
+            int: Number of stored chunks, over all shards
+        """
+        if self.sharding == SHARDING_NONE:
+            return self.vectorstore._collection.count()
+        return sum(
+            vectorstore._collection.count()
+            for vectorstore in (self._collection(name) for name in self._shard_names())
+            if vectorstore is not None
+        )
+
+    def get_documents_by_ids(self, ids: List[str],
+                             user_ids: Optional[List[Optional[str]]] = None) -> List[Optional[Document]]:
+        """
+        Fetch chunks by their Chroma IDs.
+
+        Args:
+            ids (List[str]): Chunk IDs to fetch
+            user_ids (Optional[List[Optional[str]]]): Owner of each chunk, aligned with ids;
+                a sharded store then reads only the owners' shards. Chunks of an
+                unknown owner (None) are looked for in every shard.
+
+        Returns:
+            List[Optional[Document]]: Documents aligned with ids, None for IDs not in the store
+        """
+        if not ids:
+            return []
+        owners: Dict[Optional[str], List[str]] = {}
+        for chunk_id, user_id in zip(ids, user_ids or [None] * len(ids)):
+            if chunk_id:
+                owners.setdefault(user_id or None, []).append(chunk_id)
+        
+        found: Dict[str, Document] = {}
+        for user_id, owned_ids in owners.items():
+            for name in self._owner_shards(user_id):
+                missing = [chunk_id for chunk_id in owned_ids if chunk_id not in found]
+                if not missing:
+                    break
+                vectorstore = self._collection(name)
+                if vectorstore is None:
+                    continue
+                results = vectorstore.get(ids=missing, include=["documents", "metadatas"])
+                found.update({
+                    chunk_id: Document(page_content=text or "", metadata={**(metadata or {}), "chunk_id": chunk_id})
+                    for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+                })
+        return [found.get(chunk_id) for chunk_id in ids]
+
+    def _owner_shards(self, user_id: Optional[str]) -> List[str]:
+        """Collections that can hold chunks of an owner, every shard if the owner is unknown."""
+        return self._route({"user_id": user_id}) if user_id else self._shard_names()
+
+    def get_chunk_ids(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Get the IDs of the chunks matching a metadata filter, without reading their content.
+
+        Args:
+            where (Optional[Dict[str, Any]]): Chroma metadata filter (None for every chunk)
+
+        Returns:
+            List[str]: Chunk IDs
+        """
+        ids: List[str] = []
+        for name in self._route(where):
+            vectorstore = self._collection(name)
+            if vectorstore is not None:
+                ids.extend(vectorstore._collection.get(where=where, include=[])["ids"])
+        return ids
+
+    def delete_where(self, where: Dict[str, Any]) -> int:
+        """
+        Delete every chunk matching a metadata filter, e.g. {"document_id": ...}.
+
+        Args:
+            where (Dict[str, Any]): Chroma metadata filter
+
+        Returns:
+            int: Number of chunks deleted
+        """
+        self.selection_cache.invalidate(self._selection_namespace)
+        deleted = 0
+        for name in self._route(where):
+            vectorstore = self._collection(name)
+            if vectorstore is None:
+                continue
+            ids = vectorstore._collection.get(where=where, include=[])["ids"]
+            if not ids:
+                continue
+            vectorstore._collection.delete(where=where)
+            index = self._index(name)
+            if index is not None:
+                index.remove(ids)
+            deleted += len(ids)
+        return deleted
+
+    def delete_documents(self, ids: List[str], user_id: Optional[str] = None):
+        """
+        Delete chunks by their Chroma IDs.
+
+        Args:
+            ids (List[str]): Chunk IDs to delete
+            user_id (Optional[str]): Owner of the chunks; a sharded store then only
+                touches the owner's shard. Chunk IDs do not say which shard holds
+                them, so without an owner every shard is looked at.
+        """
+        self.selection_cache.invalidate(self._selection_namespace)
+        for name in self._owner_shards(user_id):
+            vectorstore = self._collection(name)
+            if vectorstore is None:
+                continue
+            vectorstore.delete(ids=ids)
+            index = self._index(name)
+            if index is not None:
+                index.remove(ids)
 
     def cleanup(self):
         """
         Clean up resources to prevent file locking issues.
         
-        This method resets the ChromaDB client to release any file handles
-        and prevent issues when the application is shut down or restarted.
+        This method releases this store's references to the shared model and
+        ChromaDB client; they are dropped once no other store uses them.
         """
+        if self._released:
+            return
+        self._released = True
         try:
-            # Reset the ChromaDB client to release file handles
-            if hasattr(self, 'vectorstore') and self.vectorstore:
-                self.vectorstore._client.reset()
+            model_registry.release_model(self.embedding_model)
+            model_registry.release_client(self.persist_directory, self.server_url)
         except:
             # Ignore any errors during cleanup to prevent crashes
             pass
\ No newline at end of file
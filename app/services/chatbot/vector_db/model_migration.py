@@ -0,0 +1,792 @@
+"""
+Zero-downtime migration of the chunk collection to a new embedding model.
+
+The services open their collection through an alias: the configured
+COLLECTION_NAME resolves to the physical collection and the embedding model
+recorded in "collection_aliases.json" next to the Chroma directory (or to
+the configured collection and EMBEDDING_MODEL while no migration has run).
+A migration builds a shadow collection with the new model while queries
+keep hitting the active one:
+
+    start     register the shadow collection <alias>_m_<sha1(model)[:10]>
+    build     re-embed the stored chunks into the shadow, page by page,
+              throttled and resumable (the page offset is saved after every
+              page), then reconcile the chunk IDs of both collections
+    compare   recall@k of both models on a sample of queries
+    switch    make the shadow the active collection (one atomic file replace)
+    rollback  switch back to the previous collection
+    drop      delete the previous collection once it is no longer needed
+
+From start until drop, the indexing pipeline writes every document to the
+active collection and mirrors it into the shadow (or previous) collection
+with the ShadowWriter, so uploads made during the migration are not lost.
+Running services pick up a switch on their next request.
+
+The build opens the directory while the API keeps writing to it, which is
+only safe through a Chroma server (CHROMA_CLIENT_MODE=http, see
+chroma_client). In persistent mode build refuses to run unless the API is
+stopped and --api-stopped is passed.
+
+    python -m app.services.chatbot.vector_db.model_migration --db ./data/chroma_db start --model BAAI/bge-small-en-v1.5
+    CHROMA_CLIENT_MODE=http python -m app.services.chatbot.vector_db.model_migration --db ./data/chroma_db build --max-chunks-per-second 200
+    python -m app.services.chatbot.vector_db.model_migration --db ./data/chroma_db compare --sample 100
+    python -m app.services.chatbot.vector_db.model_migration --db ./data/chroma_db switch
+"""
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from app.core.config import settings
+from .chroma_client import CLIENT_PERSISTENT, CLIENT_MODES, DEFAULT_CLIENT_MODE, DEFAULT_SERVER_URL, server_url_for
+
+# File locking across processes is only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ALIASES_FILENAME = "collection_aliases.json"
+
+SHADOW_BUILDING = "building"
+SHADOW_READY = "ready"
+
+
+def shadow_collection_name(alias: str, model_name: str) -> str:
+    """
+    Name of the collection holding an alias's chunks embedded with a model.
+
+    Short enough to leave room for shard and document vector suffixes
+    within Chroma's 63 character limit.
+
+    Args:
+        alias: Configured collection name
+        model_name: Embedding model
+
+    Returns:
+        Collection name
+    """
+    return f"{alias}_m_{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:10]}"
+
+
+class CollectionAliases:
+    """
+    JSON file mapping collection aliases to their active, shadow and previous collections.
+
+    Every alias entry has the active "collection" and "model", and optionally
+    a "shadow" being built and the "previous" collection of the last switch.
+    Updates are serialized with an exclusive lock on a separate ".lock" file
+    and written to a temporary file that replaces the aliases file, so a
+    reader sees either the old or the new mapping. Reads are cached until
+    the file changes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the aliases.
+
+        Args:
+            path: Path of the aliases file; created on first update
+        """
+        self.path = path
+        self._lock_path = f"{path}.lock"
+        self._thread_lock = threading.Lock()
+        self._cache: Tuple[Optional[Tuple[int, int, int]], Dict[str, Any]] = (None, {})
+
+    @classmethod
+    def for_directory(cls, persist_directory: str) -> 'CollectionAliases':
+        """
+        Get the aliases stored next to a vector database.
+
+        Args:
+            persist_directory: Vector database directory
+
+        Returns:
+            CollectionAliases for that directory
+        """
+        return cls(os.path.join(persist_directory, ALIASES_FILENAME))
+
+    @contextmanager
+    def _locked(self):
+        """Hold the process and cross-process locks of the aliases file."""
+        with self._thread_lock:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Read every alias entry (cached until the file changes).
+
+        Returns:
+            Mapping of alias to entry, empty if no migration has run
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self._cache[0] == version:
+            return self._cache[1]
+        with open(self.path, "r", encoding="utf-8") as f:
+            aliases = json.load(f)
+        self._cache = (version, aliases)
+        return aliases
+
+    def get(self, alias: str) -> Optional[Dict[str, Any]]:
+        """Entry of an alias, None if it was never migrated."""
+        return self.load().get(alias)
+
+    def resolve(self, alias: str, default_model: str) -> Tuple[str, str]:
+        """
+        Physical collection and embedding model an alias points to.
+
+        Args:
+            alias: Configured collection name
+            default_model: Configured embedding model, used while the alias has no entry
+
+        Returns:
+            (collection name, embedding model)
+        """
+        entry = self.get(alias)
+        if entry is None:
+            return alias, default_model
+        return entry["collection"], entry["model"]
+
+    def update(self, alias: str, change: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Atomically replace an alias entry.
+
+        Args:
+            alias: Configured collection name
+            change: Gets the current entry (None if there is none) and returns
+                the new one (None removes the alias); may raise to abort
+
+        Returns:
+            The new entry
+        """
+        with self._locked():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    aliases = json.load(f)
+            except FileNotFoundError:
+                aliases = {}
+            entry = change(json.loads(json.dumps(aliases.get(alias))))
+            if entry is None:
+                aliases.pop(alias, None)
+            else:
+                aliases[alias] = entry
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(aliases, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        return entry
+
+    def mirror_targets(self, alias: str, collection_name: str) -> List[Dict[str, str]]:
+        """
+        Collections a writer on one collection of an alias has to mirror its writes to.
+
+        Args:
+            alias: Configured collection name
+            collection_name: Collection the writer writes to
+
+        Returns:
+            Entries with "collection" and "model" of the active, shadow and previous
+            collections, except the writer's own
+        """
+        entry = self.get(alias)
+        if entry is None:
+            return []
+        candidates = [entry, entry.get("shadow"), entry.get("previous")]
+        return [
+            {"collection": candidate["collection"], "model": candidate["model"]}
+            for candidate in candidates
+            if candidate and candidate["collection"] != collection_name
+        ]
+
+
+def start_shadow(aliases: CollectionAliases, alias: str, current_model: str, model_name: str) -> Dict[str, Any]:
+    """
+    Register a shadow collection for a new embedding model.
+
+    Starting again with the same model keeps the build progress.
+
+    Args:
+        aliases: Aliases of the vector database
+        alias: Configured collection name
+        current_model: Model of the collection the alias points to when it has no entry yet
+        model_name: New embedding model
+
+    Returns:
+        The alias entry
+
+    Raises:
+        ValueError: If the alias already uses the model or a shadow with another model exists
+    """
+    def change(entry):
+        entry = entry or {"collection": alias, "model": current_model}
+        if entry["model"] == model_name:
+            raise ValueError(f"{alias} already uses {model_name}")
+        shadow = entry.get("shadow")
+        if shadow and shadow["model"] != model_name:
+            raise ValueError(f"{alias} already has a shadow collection for {shadow['model']}; drop it first")
+        if not shadow:
+            entry["shadow"] = {
+                "collection": shadow_collection_name(alias, model_name),
+                "model": model_name,
+                "state": SHADOW_BUILDING,
+                "offset": 0,
+                "started_at": datetime.now().isoformat()
+            }
+        return entry
+    return aliases.update(alias, change)
+
+
+def update_shadow(aliases: CollectionAliases, alias: str, **fields) -> Dict[str, Any]:
+    """
+    Record build progress or results on the shadow of an alias.
+
+    Args:
+        aliases: Aliases of the vector database
+        alias: Configured collection name
+        **fields: Shadow fields to set
+
+    Returns:
+        The alias entry
+
+    Raises:
+        ValueError: If the alias has no shadow collection
+    """
+    def change(entry):
+        if not entry or not entry.get("shadow"):
+            raise ValueError(f"{alias} has no shadow collection")
+        entry["shadow"].update(fields)
+        return entry
+    return aliases.update(alias, change)
+
+
+def switch_to_shadow(aliases: CollectionAliases, alias: str, max_recall_drop: float = 0.05,
+                     force: bool = False) -> Dict[str, Any]:
+    """
+    Make the shadow collection of an alias the active one.
+
+    The active collection becomes the previous one, which keeps receiving
+    mirrored writes until it is dropped, so a rollback loses nothing.
+
+    Args:
+        aliases: Aliases of the vector database
+        alias: Configured collection name
+        max_recall_drop: Largest accepted drop of recall@k against the active model
+        force: Switch even if the shadow is not built or its recall was not compared
+
+    Returns:
+        The alias entry
+
+    Raises:
+        ValueError: If there is no shadow, it is not ready, or its recall is too low
+    """
+    def change(entry):
+        shadow = (entry or {}).get("shadow")
+        if not shadow:
+            raise ValueError(f"{alias} has no shadow collection")
+        if not force:
+            if shadow["state"] != SHADOW_READY:
+                raise ValueError(f"Shadow collection {shadow['collection']} is still {shadow['state']}; run build first")
+            recall = shadow.get("recall")
+            if recall is None:
+                raise ValueError("Recall of the shadow collection was not compared; run compare first")
+            if recall["shadow_recall"] < recall["active_recall"] - max_recall_drop:
+                raise ValueError(
+                    f"Shadow recall@{recall['k']} {recall['shadow_recall']:.3f} is more than {max_recall_drop} "
+                    f"below active recall {recall['active_recall']:.3f}"
+                )
+        return {
+            "collection": shadow["collection"],
+            "model": shadow["model"],
+            "previous": {"collection": entry["collection"], "model": entry["model"]},
+            "switched_at": datetime.now().isoformat()
+        }
+    return aliases.update(alias, change)
+
+
+def rollback_switch(aliases: CollectionAliases, alias: str) -> Dict[str, Any]:
+    """
+    Make the previous collection of an alias the active one again.
+
+    Args:
+        aliases: Aliases of the vector database
+        alias: Configured collection name
+
+    Returns:
+        The alias entry
+
+    Raises:
+        ValueError: If there is no previous collection
+    """
+    def change(entry):
+        previous = (entry or {}).get("previous")
+        if not previous:
+            raise ValueError(f"{alias} has no previous collection to roll back to")
+        return {
+            "collection": previous["collection"],
+            "model": previous["model"],
+            "previous": {"collection": entry["collection"], "model": entry["model"]},
+            "switched_at": datetime.now().isoformat()
+        }
+    return aliases.update(alias, change)
+
+
+class ShadowWriter:
+    """
+    Mirrors documents written to one collection of an alias into its other collections.
+
+    Chunks are copied as stored (same IDs, text and metadata) and embedded
+    with each target collection's model, so both collections hold the same
+    chunks; the document vector is recomputed from the new chunk vectors.
+    Failures are logged, not raised: the primary write already succeeded,
+    and the next build or reconcile pass repairs the target.
+    """
+
+    def __init__(self, store: Any, alias: str, aliases: Optional[CollectionAliases] = None):
+        """
+        Initialize the writer.
+
+        Args:
+            store: LangChainChromaStore the indexing pipeline writes to
+            alias: Configured collection name of the store
+            aliases: Aliases of the store's directory (default: next to it)
+        """
+        self.store = store
+        self.alias = alias
+        self.aliases = aliases or CollectionAliases.for_directory(store.persist_directory)
+        self._stores: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def _target_stores(self) -> List[Any]:
+        """Open stores of the current mirror targets, closing those no longer targeted."""
+        try:
+            targets = self.aliases.mirror_targets(self.alias, self.store.collection_name)
+        except Exception as e:
+            logger.error(f"Could not read collection aliases: {e}")
+            return []
+        keys = [(target["collection"], target["model"]) for target in targets]
+
+        from .langchain_chroma import LangChainChromaStore
+        with self._lock:
+            for key in [key for key in self._stores if key not in keys]:
+                self._stores.pop(key).cleanup()
+            for key in keys:
+                if key not in self._stores:
+                    self._stores[key] = LangChainChromaStore(
+                        self.store.persist_directory, collection_name=key[0], embedding_model=key[1]
+                    )
+            return [self._stores[key] for key in keys]
+
+    def mirror_document(self, document_id: str, chunk_ids: List[str], user_id: Optional[str] = None) -> None:
+        """
+        Copy a document's freshly stored chunks into every mirror target.
+
+        Args:
+            document_id: Document that was indexed
+            chunk_ids: IDs of all its chunks in the primary collection
+            user_id: Owner of the document, so sharded stores only touch the owner's shard
+        """
+        targets = self._target_stores()
+        if not targets:
+            return
+        where = {"document_id": document_id}
+        if user_id:
+            where = {"$and": [where, {"user_id": user_id}]}
+        documents = [
+            doc for doc in self.store.get_documents_by_ids(chunk_ids, [user_id] * len(chunk_ids)) if doc is not None
+        ]
+        for target in targets:
+            try:
+                embeddings = copy_chunks(target, documents)
+                if embeddings:
+                    metadata = documents[0].metadata
+                    target.document_vectors.upsert(document_id, embeddings, {
+                        key: metadata[key] for key in ("user_id", "filename", "document_type") if key in metadata
+                    })
+                current = {doc.metadata["chunk_id"] for doc in documents}
+                stale_ids = [
+                    chunk_id for chunk_id in target.get_chunk_ids(where)
+                    if chunk_id not in current
+                ]
+                if stale_ids:
+                    target.delete_documents(stale_ids, user_id=user_id)
+            except Exception as e:
+                logger.error(f"Failed to mirror document {document_id} into {target.collection_name}: {e}")
+
+    def delete_document(self, document_id: str) -> None:
+        """
+        Delete a document's chunks and vector from every mirror target.
+
+        Args:
+            document_id: Deleted document
+        """
+        for target in self._target_stores():
+            try:
+                target.delete_where({"document_id": document_id})
+                target.document_vectors.delete(document_id)
+            except Exception as e:
+                logger.error(f"Failed to delete document {document_id} from {target.collection_name}: {e}")
+
+    def cleanup(self) -> None:
+        """Release the stores of the mirror targets."""
+        with self._lock:
+            for target in self._stores.values():
+                target.cleanup()
+            self._stores.clear()
+
+
+def copy_chunks(target: Any, documents: List[Any]) -> List[List[float]]:
+    """
+    Store chunks read from another collection, embedded with the target's model.
+
+    Args:
+        target: LangChainChromaStore to write to
+        documents: Chunks with their ID in metadata["chunk_id"]
+
+    Returns:
+        Embeddings of the stored chunks
+    """
+    if not documents:
+        return []
+    embeddings = target.embed_documents([doc.page_content for doc in documents])
+    target.add_documents(documents, ids=[doc.metadata["chunk_id"] for doc in documents], embeddings=embeddings)
+    return embeddings
+
+
+class EmbeddingModelMigration:
+    """
+    Builds, evaluates and switches the shadow collection of an alias (see module docstring).
+    """
+
+    def __init__(self, persist_directory: str, alias: str = "documents", current_model: str = "all-MiniLM-L6-v2",
+                 client_mode: str = DEFAULT_CLIENT_MODE, chroma_server_url: str = DEFAULT_SERVER_URL):
+        """
+        Initialize the migration.
+
+        Args:
+            persist_directory: Chroma persist directory
+            alias: Configured collection name
+            current_model: Configured embedding model, used while the alias has no entry
+            client_mode: "persistent" to open the directory, "http" to use the Chroma server
+            chroma_server_url: URL of the Chroma server in http mode
+        """
+        if client_mode not in CLIENT_MODES:
+            raise ValueError(f"Unknown Chroma client mode: {client_mode}. Use one of {CLIENT_MODES}")
+        self.persist_directory = persist_directory
+        self.alias = alias
+        self.current_model = current_model
+        self.client_mode = client_mode
+        self.chroma_server_url = chroma_server_url
+        self.aliases = CollectionAliases.for_directory(persist_directory)
+
+    def status(self) -> Dict[str, Any]:
+        """Alias entry, or the configured collection and model if no migration has run."""
+        return self.aliases.get(self.alias) or {"collection": self.alias, "model": self.current_model}
+
+    def start(self, model_name: str) -> Dict[str, Any]:
+        """Register a shadow collection for a new model (see start_shadow)."""
+        return start_shadow(self.aliases, self.alias, self.current_model, model_name)
+
+    @contextmanager
+    def _stores(self):
+        """Open the active and the shadow store of the alias."""
+        from .langchain_chroma import LangChainChromaStore
+
+        entry = self.aliases.get(self.alias)
+        if not entry or not entry.get("shadow"):
+            raise ValueError(f"{self.alias} has no shadow collection; run start first")
+        client = {"client_mode": self.client_mode, "chroma_server_url": self.chroma_server_url}
+        active = LangChainChromaStore(self.persist_directory, collection_name=entry["collection"],
+                                      embedding_model=entry["model"], **client)
+        shadow = LangChainChromaStore(self.persist_directory, collection_name=entry["shadow"]["collection"],
+                                      embedding_model=entry["shadow"]["model"], **client)
+        try:
+            yield active, shadow
+        finally:
+            shadow.cleanup()
+            active.cleanup()
+
+    def build(self, page_size: int = 256, max_chunks_per_second: Optional[float] = None,
+              stop_event: Optional[threading.Event] = None, api_stopped: bool = False) -> Dict[str, Any]:
+        """
+        Re-embed the active collection's chunks into the shadow collection.
+
+        Pages are encoded in the bulk lane of the shared model, so queries of
+        the same process are served first, and max_chunks_per_second caps the
+        CPU taken from other processes. The offset is saved after every page;
+        an interrupted build continues from there. Chunks written or deleted
+        while paging are caught by the final reconcile pass.
+
+        Args:
+            page_size: Chunks read and encoded per page
+            max_chunks_per_second: Throughput cap (None for no cap)
+            stop_event: Set to stop after the current page
+            api_stopped: Confirms that no API process has the directory open (persistent mode only)
+
+        Returns:
+            Dictionary with the chunks copied, the reconcile results and whether the build completed
+
+        Raises:
+            ValueError: In persistent mode without api_stopped, or without a shadow collection
+        """
+        if self.client_mode == CLIENT_PERSISTENT and not api_stopped:
+            raise ValueError(
+                "build writes while the API's ShadowWriter may have the same Chroma directory open; "
+                "run it with CHROMA_CLIENT_MODE=http, or stop the API and pass --api-stopped"
+            )
+        with self._stores() as (active, shadow):
+            offset = self.aliases.get(self.alias)["shadow"].get("offset", 0)
+            total = active.count()
+            copied = 0
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    logger.info(f"Shadow build stopped at offset {offset} of {total}")
+                    return {"completed": False, "copied": copied, "offset": offset, "total": total}
+                started = time.perf_counter()
+                page = active.get_documents(limit=page_size, offset=offset)
+                if not page:
+                    break
+                copy_chunks(shadow, page)
+                copied += len(page)
+                offset += len(page)
+                update_shadow(self.aliases, self.alias, offset=offset)
+                logger.info(f"Shadow build: {offset}/{total} chunks")
+                if max_chunks_per_second:
+                    time.sleep(max(0.0, len(page) / max_chunks_per_second - (time.perf_counter() - started)))
+
+            reconciled = self._reconcile(active, shadow)
+            documents = shadow.document_vectors.backfill()
+            update_shadow(
+                self.aliases, self.alias,
+                state=SHADOW_READY,
+                chunks=shadow.count(),
+                built_at=datetime.now().isoformat()
+            )
+            return {"completed": True, "copied": copied, "total": total, "documents": documents, **reconciled}
+
+    def _reconcile(self, active: Any, shadow: Any, batch_size: int = 256) -> Dict[str, int]:
+        """
+        Make the shadow hold exactly the active collection's chunk IDs.
+
+        Args:
+            active: Store of the active collection
+            shadow: Store of the shadow collection
+            batch_size: Chunks copied per request
+
+        Returns:
+            Dictionary with the number of missing chunks copied and extra chunks deleted
+        """
+        active_ids = set(active.get_chunk_ids())
+        shadow_ids = set(shadow.get_chunk_ids())
+        missing = sorted(active_ids - shadow_ids)
+        extra = sorted(shadow_ids - active_ids)
+        for start in range(0, len(missing), batch_size):
+            documents = active.get_documents_by_ids(missing[start:start + batch_size])
+            copy_chunks(shadow, [doc for doc in documents if doc is not None])
+        if extra:
+            shadow.delete_documents(extra)
+        logger.info(f"Shadow reconcile: {len(missing)} missing chunks copied, {len(extra)} extra chunks deleted")
+        return {"missing_copied": len(missing), "extra_deleted": len(extra)}
+
+    def compare(self, sample_size: int = 50, k: int = 5, queries: Optional[List[Dict[str, Any]]] = None,
+                query_words: int = 12, seed: int = 0) -> Dict[str, Any]:
+        """
+        Compare recall@k of the active and the shadow collection.
+
+        Without explicit queries, a random passage of query_words words is
+        taken from each of sample_size stored chunks and counts as a hit
+        when the chunk's document is among the top k results. Searches are
+        restricted to the chunk owner's documents, as in chat.
+
+        Args:
+            sample_size: Number of sampled chunks (ignored with queries)
+            k: Results per query
+            queries: Optional labeled queries, each with "query", "document_id"
+                and optionally "user_id"
+            query_words: Words per sampled query
+            seed: Random seed of the sample
+
+        Returns:
+            Dictionary with k, the number of queries, recall and average latency per
+            collection, and the average overlap of their top-k documents
+        """
+        rng = random.Random(seed)
+        with self._stores() as (active, shadow):
+            if queries is None:
+                queries = []
+                total = active.count()
+                for offset in rng.sample(range(total), min(sample_size, total)):
+                    chunk = active.get_documents(limit=1, offset=offset)
+                    words = chunk[0].page_content.split() if chunk else []
+                    if len(words) < 3:
+                        continue
+                    start = rng.randrange(max(1, len(words) - query_words + 1))
+                    queries.append({
+                        "query": " ".join(words[start:start + query_words]),
+                        "document_id": chunk[0].metadata.get("document_id"),
+                        "user_id": chunk[0].metadata.get("user_id")
+                    })
+
+            hits = {"active": 0, "shadow": 0}
+            seconds = {"active": 0.0, "shadow": 0.0}
+            overlap = 0.0
+            for labeled in queries:
+                found = {}
+                for name, store in (("active", active), ("shadow", shadow)):
+                    started = time.perf_counter()
+                    results = store.similarity_search(
+                        labeled["query"], k=k,
+                        filter={"user_id": labeled["user_id"]} if labeled.get("user_id") else None
+                    )
+                    seconds[name] += time.perf_counter() - started
+                    found[name] = {doc.metadata.get("document_id") for doc in results}
+                    hits[name] += labeled["document_id"] in found[name]
+                union = found["active"] | found["shadow"]
+                overlap += len(found["active"] & found["shadow"]) / len(union) if union else 1.0
+
+        count = len(queries)
+        recall = {
+            "k": k,
+            "queries": count,
+            "active_recall": hits["active"] / count if count else 0.0,
+            "shadow_recall": hits["shadow"] / count if count else 0.0,
+            "active_latency_ms": round(seconds["active"] * 1000 / count, 2) if count else 0.0,
+            "shadow_latency_ms": round(seconds["shadow"] * 1000 / count, 2) if count else 0.0,
+            "overlap": overlap / count if count else 0.0,
+            "compared_at": datetime.now().isoformat()
+        }
+        update_shadow(self.aliases, self.alias, recall=recall)
+        return recall
+
+    def switch(self, max_recall_drop: float = 0.05, force: bool = False) -> Dict[str, Any]:
+        """Make the shadow collection active (see switch_to_shadow)."""
+        return switch_to_shadow(self.aliases, self.alias, max_recall_drop=max_recall_drop, force=force)
+
+    def rollback(self) -> Dict[str, Any]:
+        """Make the previous collection active again (see rollback_switch)."""
+        return rollback_switch(self.aliases, self.alias)
+
+    def drop(self, which: str = "previous") -> List[str]:
+        """
+        Delete the previous or the shadow collection with its shards and document vectors.
+
+        Args:
+            which: "previous" or "shadow"
+
+        Returns:
+            Names of the deleted collections
+        """
+        from .collection_sharding import is_shard_name
+        from .document_vectors import DOCUMENT_VECTORS_SUFFIX
+        from .model_registry import model_registry
+
+        entry = self.aliases.get(self.alias) or {}
+        target = entry.get(which)
+        if not target:
+            raise ValueError(f"{self.alias} has no {which} collection")
+        if target["collection"] == entry["collection"]:
+            raise ValueError(f"{target['collection']} is the active collection")
+
+        # Writers stop mirroring before the collection disappears
+        def change(current):
+            current.pop(which, None)
+            return current
+        self.aliases.update(self.alias, change)
+
+        server_url = server_url_for(self.client_mode, self.chroma_server_url)
+        client = model_registry.acquire_client(self.persist_directory, server_url)
+        try:
+            base = target["collection"]
+            names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+            dropped = [
+                name for name in names
+                if name in (base, f"{base}{DOCUMENT_VECTORS_SUFFIX}") or is_shard_name(name, base)
+            ]
+            for name in dropped:
+                client.delete_collection(name)
+            logger.info(f"Dropped {which} collection {base} ({len(dropped)} collections)")
+            return dropped
+        finally:
+            model_registry.release_client(self.persist_directory, server_url)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Migrate the vector store to a new embedding model without downtime")
+    parser.add_argument("--db", default=settings.VECTOR_DB_PATH, help="Chroma persist directory")
+    parser.add_argument("--collection", default=settings.COLLECTION_NAME, help="Configured collection name")
+    parser.add_argument("--current-model", default=settings.EMBEDDING_MODEL,
+                        help="Configured embedding model (used until the first switch)")
+    parser.add_argument("--client-mode", choices=CLIENT_MODES, default=DEFAULT_CLIENT_MODE)
+    parser.add_argument("--server-url", default=DEFAULT_SERVER_URL, help="Chroma server in http client mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Show the active, shadow and previous collections")
+    start_parser = commands.add_parser("start", help="Register a shadow collection for a new model")
+    start_parser.add_argument("--model", required=True, help="New embedding model")
+    build_parser = commands.add_parser("build", help="Re-embed the chunks into the shadow collection (resumable)")
+    build_parser.add_argument("--page-size", type=int, default=256)
+    build_parser.add_argument("--max-chunks-per-second", type=float, default=None)
+    build_parser.add_argument("--api-stopped", action="store_true",
+                              help="Allow a persistent-mode build; the API must not be running")
+    compare_parser = commands.add_parser("compare", help="Compare recall@k of the active and shadow models")
+    compare_parser.add_argument("--sample", type=int, default=50, help="Chunks sampled as queries")
+    compare_parser.add_argument("--k", type=int, default=5)
+    compare_parser.add_argument("--queries", help="JSON file of labeled queries (query, document_id, user_id)")
+    switch_parser = commands.add_parser("switch", help="Make the shadow collection active")
+    switch_parser.add_argument("--max-recall-drop", type=float, default=0.05)
+    switch_parser.add_argument("--force", action="store_true", help="Skip the build and recall checks")
+    commands.add_parser("rollback", help="Make the previous collection active again")
+    drop_parser = commands.add_parser("drop", help="Delete the previous (or an abandoned shadow) collection")
+    drop_parser.add_argument("--which", choices=["previous", "shadow"], default="previous")
+    args = parser.parse_args()
+
+    migration = EmbeddingModelMigration(args.db, alias=args.collection, current_model=args.current_model,
+                                        client_mode=args.client_mode, chroma_server_url=args.server_url)
+    if args.command == "status":
+        result = migration.status()
+    elif args.command == "start":
+        result = migration.start(args.model)
+    elif args.command == "build":
+        try:
+            result = migration.build(page_size=args.page_size, max_chunks_per_second=args.max_chunks_per_second,
+                                     api_stopped=args.api_stopped)
+        except KeyboardInterrupt:
+            # The offset of the last page is saved; running build again resumes from it
+            result = {"completed": False, "resume": "run build again"}
+    elif args.command == "compare":
+        labeled = None
+        if args.queries:
+            with open(args.queries, "r", encoding="utf-8") as f:
+                labeled = json.load(f)
+        result = migration.compare(sample_size=args.sample, k=args.k, queries=labeled)
+    elif args.command == "switch":
+        result = migration.switch(max_recall_drop=args.max_recall_drop, force=args.force)
+    elif args.command == "rollback":
+        result = migration.rollback()
+    else:
+        result = {"dropped": migration.drop(args.which)}
+    print(json.dumps(result, indent=2))
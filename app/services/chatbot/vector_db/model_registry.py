@@ -0,0 +1,491 @@
+"""
+Process-wide registry of embedding models and Chroma clients.
+
+The chat service, the document embedding service and the embedding
+generator all need the same SentenceTransformer model and a client on the
+same Chroma directory. Loading them separately keeps several copies of the
+model in RAM and several SQLite handles on one database, so they are
+acquired from the shared `model_registry` instead. Entries are reference
+counted and dropped once the last user releases them.
+
+Encodes on a shared model are scheduled in two lanes: interactive (query
+embeddings) and bulk (chunk batches during ingestion). Bulk work is split
+into slices and yields to waiting interactive encodes between slices, so a
+large upload does not delay chat queries by more than one slice.
+
+The backend is chosen per deployment with EMBEDDING_BACKEND: "torch" (fp32
+PyTorch, the default), "onnx" (fp32 ONNX Runtime) or "onnx-int8" (dynamically
+int8-quantized ONNX, the cheapest on CPU-only nodes). The ONNX backends need
+optimum[onnxruntime] in the process that loads the models.
+
+With EMBEDDING_SERVER_SOCKET set, models are not loaded in this process:
+encodes go to the embedding server at that socket (see embedding_server),
+which owns one copy of each model for all API workers of the node.
+
+Clients on a Chroma server (CHROMA_CLIENT_MODE=http, see chroma_client) are
+shared the same way, keyed by server URL instead of directory.
+"""
+from typing import List, Dict, Any, Optional, Callable
+from contextlib import contextmanager
+from functools import partial
+from langchain_core.embeddings import Embeddings
+from chromadb.config import Settings as ChromaSettings
+import chromadb
+import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+
+# Peak RSS reporting is only available on POSIX
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8)
+
+# Int8 ONNX file per CPU target, as published on the hub and written by
+# sentence_transformers.export_dynamic_quantized_onnx_model
+ONNX_INT8_FILES = {
+    "avx2": "onnx/model_quint8_avx2.onnx",
+    "avx512": "onnx/model_qint8_avx512.onnx",
+    "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+    "arm64": "onnx/model_qint8_arm64.onnx"
+}
+
+# Packages SentenceTransformer needs for backend="onnx"
+ONNX_REQUIREMENTS = ("optimum", "onnxruntime")
+
+# Local exports of models without a published int8 file
+ONNX_EXPORT_DIR = settings.EMBEDDING_ONNX_EXPORT_DIR
+
+
+def _load_sentence_transformer(model_name: str, backend: str = BACKEND_TORCH, quantization: str = "avx2"):
+    """
+    Load a SentenceTransformer model (imported lazily, it pulls in torch).
+
+    Args:
+        model_name: Model name or path
+        backend: One of BACKENDS
+        quantization: CPU target of the int8 model (a key of ONNX_INT8_FILES)
+
+    Returns:
+        Loaded SentenceTransformer
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == BACKEND_TORCH:
+        return SentenceTransformer(model_name)
+    if backend == BACKEND_ONNX:
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend != BACKEND_ONNX_INT8:
+        raise ValueError(f"Unknown embedding backend: {backend}. Use one of {BACKENDS}")
+
+    file_name = ONNX_INT8_FILES[quantization]
+    try:
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": file_name})
+    except Exception as e:
+        logger.info(f"No published int8 ONNX model for {model_name} ({e}); quantizing locally")
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    export_dir = os.path.join(ONNX_EXPORT_DIR, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        onnx_model = SentenceTransformer(model_name, backend="onnx")
+        onnx_model.save(export_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, export_dir)
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def _load_remote_model(model_name: str, socket_path: str, backend: str = BACKEND_TORCH):
+    """
+    Connect to a model in the embedding server (imported lazily, it imports this module).
+
+    Args:
+        model_name: Model name, as the server loads it
+        socket_path: Unix socket of the embedding server
+        backend: Backend this process expects the server to use
+
+    Returns:
+        RemoteSentenceTransformer
+    """
+    from .embedding_server import RemoteSentenceTransformer
+    return RemoteSentenceTransformer(model_name, socket_path, backend=backend)
+
+
+def _open_persistent_client(path: str):
+    """Open a persistent Chroma client on a directory."""
+    return chromadb.PersistentClient(path=path, settings=ChromaSettings(anonymized_telemetry=False))
+
+
+def _open_http_client(server_url: str):
+    """Open a pooled, retrying Chroma client on a Chroma server."""
+    from .chroma_client import open_http_client
+    return open_http_client(server_url)
+
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+
+
+class EncodeScheduler:
+    """
+    Grants exclusive use of a model, interactive lane first.
+
+    A bulk encode only gets the model while no interactive encode is waiting.
+    Each lane records how long its encodes waited for the model.
+    """
+
+    LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+    def __init__(self):
+        """Initialize the scheduler with an idle model."""
+        self._cond = threading.Condition()
+        self._busy = False
+        self._waiting = {lane: 0 for lane in self.LANES}
+        self._stats = {lane: {"encodes": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for lane in self.LANES}
+
+    @contextmanager
+    def slot(self, lane: str):
+        """
+        Hold the model for one encode in the given lane.
+
+        Args:
+            lane: LANE_INTERACTIVE or LANE_BULK
+        """
+        if lane not in self._waiting:
+            raise ValueError(f"Unknown encode lane: {lane}")
+        started = time.perf_counter()
+        with self._cond:
+            self._waiting[lane] += 1
+            while self._busy or (lane == LANE_BULK and self._waiting[LANE_INTERACTIVE]):
+                self._cond.wait()
+            self._waiting[lane] -= 1
+            self._busy = True
+
+            waited = time.perf_counter() - started
+            stats = self._stats[lane]
+            stats["encodes"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get per-lane queue-wait statistics.
+
+        Returns:
+            Mapping of lane to encode count, average and maximum wait in
+            milliseconds, and encodes currently waiting
+        """
+        with self._cond:
+            return {
+                lane: {
+                    "encodes": stats["encodes"],
+                    "avg_wait_ms": round(stats["wait_seconds"] * 1000 / stats["encodes"], 2) if stats["encodes"] else 0.0,
+                    "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 2),
+                    "waiting": self._waiting[lane]
+                }
+                for lane, stats in self._stats.items()
+            }
+
+
+class SharedSentenceTransformer:
+    """
+    Thread-safe handle on a SentenceTransformer shared within the process.
+
+    Calls to encode() are serialized by an EncodeScheduler, since the
+    tokenizer and the model are not safe to use from several threads at
+    once. Bulk encodes run in slices of bulk_slice_size texts and give the
+    model to waiting interactive encodes between slices. Models that
+    schedule lanes themselves (the embedding server client) get the lane
+    instead and are not serialized here.
+    """
+
+    def __init__(self, model_name: str, model: Any, bulk_slice_size: int = 32):
+        """
+        Initialize the handle.
+
+        Args:
+            model_name: Name the model was loaded with
+            model: Loaded SentenceTransformer
+            bulk_slice_size: Texts encoded per slice in the bulk lane
+        """
+        self.model_name = model_name
+        self.model = model
+        self.bulk_slice_size = max(1, bulk_slice_size)
+        self.scheduler = EncodeScheduler()
+
+    def encode(self, texts, lane: str = LANE_INTERACTIVE, **kwargs):
+        """
+        Encode texts with the shared model.
+
+        Args:
+            texts: Text or list of texts, as for SentenceTransformer.encode
+            lane: LANE_INTERACTIVE for query encodes, LANE_BULK for ingestion
+            **kwargs: Passed to SentenceTransformer.encode
+
+        Returns:
+            Embeddings as returned by SentenceTransformer.encode
+        """
+        if getattr(self.model, "schedules_lanes", False):
+            return self.model.encode(texts, lane=lane, **kwargs)
+        if lane != LANE_BULK or isinstance(texts, str) or len(texts) <= self.bulk_slice_size:
+            with self.scheduler.slot(lane):
+                return self.model.encode(texts, **kwargs)
+
+        # Preemption point between slices: waiting interactive encodes go first
+        slices = []
+        for start in range(0, len(texts), self.bulk_slice_size):
+            with self.scheduler.slot(lane):
+                slices.append(self.model.encode(texts[start:start + self.bulk_slice_size], **kwargs))
+        return np.concatenate(slices)
+
+    def memory_bytes(self) -> int:
+        """Size of the model parameters in bytes (0 if it cannot be determined)."""
+        try:
+            return sum(p.numel() * p.element_size() for p in self.model.parameters())
+        except Exception:
+            return 0
+
+
+class SharedEmbeddings(Embeddings):
+    """
+    LangChain embeddings backed by a shared SentenceTransformer.
+
+    Produces the same vectors as SentenceTransformerEmbeddings with default
+    settings, so stores indexed with either stay compatible.
+    """
+
+    def __init__(self, model: SharedSentenceTransformer):
+        """
+        Initialize the embeddings.
+
+        Args:
+            model: Shared model handle from the registry
+        """
+        self.model = model
+        self.model_name = model.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents (newlines are replaced by spaces, as in SentenceTransformerEmbeddings)."""
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.model.encode(texts, lane=LANE_BULK, show_progress_bar=False).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query in the interactive lane."""
+        return self.model.encode([text.replace("\n", " ")], lane=LANE_INTERACTIVE, show_progress_bar=False).tolist()[0]
+
+
+class ModelRegistry:
+    """
+    Reference-counted cache of embedding models and Chroma clients.
+
+    Models are keyed by model name and clients by absolute directory (or
+    server URL), so every store on the same (path, model) pair shares one
+    client and one model. All models of a registry use the same backend.
+    """
+
+    def __init__(
+        self,
+        model_loader: Optional[Callable[[str], Any]] = None,
+        client_factory: Callable[[str], Any] = _open_persistent_client,
+        http_client_factory: Callable[[str], Any] = _open_http_client,
+        bulk_slice_size: int = 32,
+        backend: str = BACKEND_TORCH,
+        quantization: str = "avx2"
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            model_loader: Loads a model by name (default: SentenceTransformer on the backend)
+            client_factory: Opens a Chroma client on a directory
+            http_client_factory: Opens a Chroma client on a server URL
+            bulk_slice_size: Texts per bulk encode slice (the preemption granularity)
+            backend: Embedding backend, one of BACKENDS
+            quantization: CPU target of the int8 model for the onnx-int8 backend
+
+        Raises:
+            ImportError: If an ONNX backend loads models locally and optimum or onnxruntime is missing
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}. Use one of {BACKENDS}")
+        if quantization not in ONNX_INT8_FILES:
+            raise ValueError(f"Unknown int8 quantization target: {quantization}. Use one of {tuple(ONNX_INT8_FILES)}")
+        if model_loader is None and backend != BACKEND_TORCH:
+            missing = [name for name in ONNX_REQUIREMENTS if importlib.util.find_spec(name) is None]
+            if missing:
+                raise ImportError(
+                    f"Embedding backend {backend} needs {', '.join(missing)}; install optimum[onnxruntime] "
+                    f"(see requirements.txt) or set EMBEDDING_BACKEND={BACKEND_TORCH}"
+                )
+        self.backend = backend
+        self._model_loader = model_loader or partial(_load_sentence_transformer, backend=backend, quantization=quantization)
+        self._client_factory = client_factory
+        self._http_client_factory = http_client_factory
+        self.bulk_slice_size = bulk_slice_size
+        self._lock = threading.RLock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, Dict[str, Any]] = {}
+
+    def model_id(self, model_name: str) -> str:
+        """
+        Identify the vectors a model produces on this registry's backend.
+
+        Used as the model part of embedding cache keys, so vectors of
+        different backends are never mixed.
+
+        Args:
+            model_name: SentenceTransformer model name
+
+        Returns:
+            The model name, suffixed with the backend unless it is torch
+        """
+        return model_name if self.backend == BACKEND_TORCH else f"{model_name}@{self.backend}"
+
+    def acquire_model(self, model_name: str) -> SharedSentenceTransformer:
+        """
+        Get the shared model, loading it on first use.
+
+        Args:
+            model_name: SentenceTransformer model name
+
+        Returns:
+            Shared model handle; pair with release_model()
+        """
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is None:
+                logger.info(f"Loading embedding model {model_name} ({self.backend} backend)")
+                entry = {
+                    "model": SharedSentenceTransformer(model_name, self._model_loader(model_name), self.bulk_slice_size),
+                    "refs": 0
+                }
+                self._models[model_name] = entry
+            entry["refs"] += 1
+            return entry["model"]
+
+    def acquire_embeddings(self, model_name: str) -> SharedEmbeddings:
+        """
+        Get LangChain embeddings backed by the shared model.
+
+        Args:
+            model_name: SentenceTransformer model name
+
+        Returns:
+            Embeddings; pair with release_model(model_name)
+        """
+        return SharedEmbeddings(self.acquire_model(model_name))
+
+    def release_model(self, model_name: str) -> None:
+        """
+        Release a model reference, unloading the model after the last one.
+
+        Args:
+            model_name: SentenceTransformer model name
+        """
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] <= 0:
+                del self._models[model_name]
+                logger.info(f"Unloaded embedding model {model_name}")
+
+    def acquire_client(self, path: str, server_url: Optional[str] = None):
+        """
+        Get the shared Chroma client for a directory, opening it on first use.
+
+        Args:
+            path: Chroma persist directory
+            server_url: Chroma server to use instead of opening the directory
+
+        Returns:
+            Chroma client; pair with release_client()
+        """
+        key = server_url or os.path.abspath(path)
+        with self._lock:
+            entry = self._clients.get(key)
+            # Connections are not shared with a forked child; it opens its own client
+            if entry is None or entry["pid"] != os.getpid():
+                factory = self._http_client_factory if server_url else self._client_factory
+                entry = {"client": factory(key), "refs": 0, "pid": os.getpid()}
+                self._clients[key] = entry
+            entry["refs"] += 1
+            return entry["client"]
+
+    def release_client(self, path: str, server_url: Optional[str] = None) -> None:
+        """
+        Release a client reference, dropping the client after the last one.
+
+        Args:
+            path: Chroma persist directory
+            server_url: Chroma server the client was acquired for
+        """
+        key = server_url or os.path.abspath(path)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] <= 0:
+                del self._clients[key]
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Report what is loaded and how much memory it takes.
+
+        Returns:
+            Dictionary with per-model references and parameter size, per-client
+            references, and the process peak RSS in MB (None if unavailable)
+        """
+        with self._lock:
+            models = {
+                name: {
+                    "refs": entry["refs"],
+                    "parameters_mb": round(entry["model"].memory_bytes() / (1024 * 1024), 1),
+                    "lanes": entry["model"].scheduler.get_stats()
+                }
+                for name, entry in self._models.items()
+            }
+            clients = {path: {"refs": entry["refs"]} for path, entry in self._clients.items()}
+
+        peak_rss_mb: Optional[float] = None
+        if resource is not None:
+            # ru_maxrss is in KB on Linux
+            peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        return {
+            "backend": self.backend,
+            "models": models,
+            "clients": clients,
+            "model_parameters_mb": round(sum(model["parameters_mb"] for model in models.values()), 1),
+            "peak_rss_mb": peak_rss_mb
+        }
+
+
+# Shared by every service in the process
+model_registry = ModelRegistry(
+    model_loader=partial(
+        _load_remote_model, socket_path=settings.EMBEDDING_SERVER_SOCKET, backend=settings.EMBEDDING_BACKEND
+    ) if settings.EMBEDDING_SERVER_SOCKET else None,
+    bulk_slice_size=settings.EMBEDDING_BULK_SLICE_SIZE,
+    backend=settings.EMBEDDING_BACKEND,
+    quantization=settings.EMBEDDING_ONNX_QUANTIZATION
+)
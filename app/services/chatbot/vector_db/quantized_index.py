@@ -0,0 +1,514 @@
+"""
+In-memory index of quantized chunk vectors for first-pass search.
+
+The QuantizedVectorIndex keeps a quantized copy of every chunk vector and is
+used for first-pass candidate generation, with the common document and user
+filters applied before scoring:
+
+    int8     one signed byte per dimension plus a per-vector scale
+    binary   one sign bit per dimension, scored against the full-precision
+             query
+
+The store then rescores the top candidates with their full-precision vectors
+read from Chroma, so the returned scores are exact and only the candidate
+set can differ from a plain Chroma search. Quantization is enabled per
+deployment with VECTOR_QUANTIZATION ("none", "int8" or "binary"), and
+VECTOR_RESCORE_FACTOR sets how many candidates are rescored per result
+(binary codes need more than int8 for the same recall).
+
+This is a latency and recall option, not a memory saving. Chroma loads a
+collection's float32 HNSW index for every vector read or write, including
+the rescoring reads, so the codes are held in addition to it: int8 codes
+add about a quarter of the float32 vector size to the process, binary codes
+about a thirty-second. What the index buys is an exact, filter-first scan
+of compact codes, which keeps recall for narrow document and user filters
+where a filtered HNSW search can miss candidates. The stats report the size of the codes, and the
+quantization benchmark reports the resident memory of the whole process.
+
+The store keeps the index in line with its collection with sync(), which
+runs on a background thread at most every VECTOR_QUANTIZED_SYNC_SECONDS.
+Searches use Chroma until the first sync has filled the index. The first
+sync compares the chunk IDs of index and collection; later syncs apply the
+change log since the previous one and only read the chunks it reports as
+added. Without a change log (it is written with hybrid search enabled), or
+after it was truncated, a sync compares the chunk IDs again.
+"""
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable
+from .change_log import ChunkChangeLog, OP_ADD, OP_DELETE, OP_DELETE_DOCUMENT
+import logging
+import os
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_NONE = "none"
+QUANTIZATION_INT8 = "int8"
+QUANTIZATION_BINARY = "binary"
+QUANTIZATIONS = (QUANTIZATION_NONE, QUANTIZATION_INT8, QUANTIZATION_BINARY)
+
+# Metadata fields the index can filter on without asking Chroma
+FILTER_FIELDS = ("document_id", "user_id")
+
+# Rows scored per block, bounds the float32 scratch memory of a search
+SCORE_BLOCK_ROWS = 8192
+
+DEFAULT_QUANTIZATION = settings.VECTOR_QUANTIZATION
+DEFAULT_RESCORE_FACTOR = settings.VECTOR_RESCORE_FACTOR
+DEFAULT_SYNC_INTERVAL = settings.VECTOR_QUANTIZED_SYNC_SECONDS
+
+# Vectors read from Chroma per request while syncing
+SYNC_PAGE_SIZE = 1000
+
+
+class QuantizedVectorIndex:
+    """
+    Thread-safe, append-only store of quantized vectors with tombstone deletes.
+
+    Rows are identified by chunk ID; adding an ID again replaces its vector.
+    The document_id and user_id of each row are kept as integer-coded
+    columns so the common Chroma filters can be applied before scoring.
+    """
+
+    def __init__(self, mode: str = QUANTIZATION_INT8):
+        """
+        Initialize an empty index.
+
+        Args:
+            mode: QUANTIZATION_INT8 or QUANTIZATION_BINARY
+        """
+        if mode not in (QUANTIZATION_INT8, QUANTIZATION_BINARY):
+            raise ValueError(f"Unknown vector quantization: {mode}. Use {QUANTIZATION_INT8} or {QUANTIZATION_BINARY}")
+        self.mode = mode
+        self._lock = threading.RLock()
+        self._reset()
+
+        # Sync state, see sync()
+        self.ready = False
+        self._sync_lock = threading.Lock()
+        self._syncing = False
+        self._synced_at = 0.0
+        self._log_file_id = None
+        self._log_offset = 0
+
+    def _reset(self) -> None:
+        """Drop every row."""
+        self.dim: Optional[int] = None
+        self._size = 0
+        self._codes: Optional[np.ndarray] = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        self._columns = {field: np.zeros(0, dtype=np.int32) for field in FILTER_FIELDS}
+        self._values: Dict[str, Dict[Any, int]] = {field: {} for field in FILTER_FIELDS}
+
+    def __len__(self) -> int:
+        """Number of live vectors."""
+        return len(self._row_of)
+
+    def ids(self) -> Set[str]:
+        """Chunk IDs of the live vectors."""
+        with self._lock:
+            return set(self._row_of)
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Quantize full-precision vectors.
+
+        Args:
+            vectors: float32 matrix, one vector per row
+
+        Returns:
+            Codes and per-row scales (scales are unused in binary mode)
+        """
+        if self.mode == QUANTIZATION_BINARY:
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+
+        # Symmetric per-vector scale keeps the largest component at +-127
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _grow(self, rows: int) -> None:
+        """Make room for at least rows more rows, growing the capacity by a quarter."""
+        needed = self._size + rows
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        # Modest growth keeps the slack small, the codes come on top of Chroma's vectors
+        capacity = max(needed, capacity + capacity // 4, 256)
+
+        def resized(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._codes = resized(self._codes)
+        self._scales = resized(self._scales)
+        self._norms = resized(self._norms)
+        self._alive = resized(self._alive)
+        for field in FILTER_FIELDS:
+            self._columns[field] = resized(self._columns[field])
+
+    def _value_code(self, field: str, value: Any) -> int:
+        """Integer code of a metadata value (0 means missing)."""
+        if value is None or value == "":
+            return 0
+        codes = self._values[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes) + 1
+        return code
+
+    def add(self, ids: List[str], vectors: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Add or replace vectors.
+
+        Args:
+            ids: Chunk IDs
+            vectors: Full-precision vectors aligned with ids
+            metadatas: Optional chunk metadata aligned with ids
+        """
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        if len(set(ids)) < len(ids):
+            # Keep the last vector of a repeated ID, as an upsert would
+            last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            keep = sorted(last.values())
+            ids, vectors, metadatas = [ids[i] for i in keep], [vectors[i] for i in keep], [metadatas[i] for i in keep]
+        matrix = np.asarray(vectors, dtype=np.float32)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                width = (self.dim + 7) // 8 if self.mode == QUANTIZATION_BINARY else self.dim
+                self._codes = np.zeros((0, width), dtype=np.uint8 if self.mode == QUANTIZATION_BINARY else np.int8)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dim}")
+
+            self.remove(ids)
+            codes, scales = self._encode(matrix)
+            self._grow(len(ids))
+            rows = slice(self._size, self._size + len(ids))
+            self._codes[rows] = codes
+            self._scales[rows] = scales
+            self._norms[rows] = np.einsum("ij,ij->i", matrix, matrix)
+            self._alive[rows] = True
+            for field in FILTER_FIELDS:
+                self._columns[field][rows] = [self._value_code(field, (metadata or {}).get(field)) for metadata in metadatas]
+            for offset, chunk_id in enumerate(ids):
+                self._row_of[chunk_id] = self._size + offset
+            self._ids.extend(ids)
+            self._size += len(ids)
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """
+        Remove vectors by chunk ID, compacting once most rows are dead.
+
+        Args:
+            ids: Chunk IDs (unknown IDs are ignored)
+
+        Returns:
+            Number of vectors removed
+        """
+        removed = 0
+        with self._lock:
+            for chunk_id in ids:
+                row = self._row_of.pop(chunk_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._ids[row] = None
+                    removed += 1
+            if removed and self._size - len(self._row_of) > len(self._row_of):
+                self._compact()
+        return removed
+
+    def remove_document(self, document_id: str) -> int:
+        """
+        Remove every vector of a document.
+
+        Args:
+            document_id: Document ID (unknown IDs are ignored)
+
+        Returns:
+            Number of vectors removed
+        """
+        with self._lock:
+            code = self._values["document_id"].get(document_id)
+            if code is None:
+                return 0
+            rows = np.flatnonzero(self._alive[:self._size] & (self._columns["document_id"][:self._size] == code))
+            return self.remove([self._ids[row] for row in rows])
+
+    def trim(self) -> None:
+        """Drop dead rows and release unused capacity (e.g. after a bulk build)."""
+        with self._lock:
+            if self._codes is not None:
+                self._compact()
+
+    def clear(self) -> None:
+        """Remove every vector."""
+        with self._lock:
+            self._reset()
+
+    def _compact(self) -> None:
+        """Drop dead rows and renumber the live ones."""
+        live = np.flatnonzero(self._alive[:self._size])
+        self._codes = self._codes[live]
+        self._scales = self._scales[live]
+        self._norms = self._norms[live]
+        self._alive = self._alive[live]
+        for field in FILTER_FIELDS:
+            self._columns[field] = self._columns[field][live]
+        self._ids = [self._ids[row] for row in live]
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._size = len(live)
+
+    def start_sync(self, interval: float = DEFAULT_SYNC_INTERVAL) -> bool:
+        """
+        Claim the next sync, if none is running and the last one is old enough.
+
+        Args:
+            interval: Minimum seconds between syncs once the index is ready
+
+        Returns:
+            True if the caller should run sync()
+        """
+        with self._sync_lock:
+            if self._syncing or (self.ready and time.time() - self._synced_at < interval):
+                return False
+            self._syncing = True
+            return True
+
+    def sync(self, collection: Any, change_log: Optional[ChunkChangeLog] = None) -> Dict[str, int]:
+        """
+        Bring the index in line with a Chroma collection.
+
+        Once the index is ready and the change log has been followed since
+        the previous sync, only the logged changes are applied: deleted
+        chunks and documents are removed, and the chunks logged as added are
+        read from the collection (which skips chunks of other collections and
+        chunks deleted again since). Otherwise the chunk IDs of index and
+        collection are compared, and missing chunks are read. Searches keep
+        running on the current rows meanwhile.
+
+        Args:
+            collection: Chroma collection the index belongs to
+            change_log: Change log of the collection's directory (optional)
+
+        Returns:
+            Dictionary with the number of vectors read and removed
+        """
+        try:
+            events, followed = [], False
+            if change_log is not None:
+                file_id = change_log.file_id()
+                followed = self.ready and file_id is not None and file_id == self._log_file_id
+                events, offset = change_log.read(self._log_offset if followed else 0)
+                if change_log.file_id() != file_id:
+                    # Truncated while reading, the offset belongs to the old file
+                    file_id, followed = None, False
+                self._log_file_id, self._log_offset = file_id, offset
+
+            if followed:
+                removed, missing = self._apply_changes(events)
+            else:
+                # IDs of the index first: a chunk added by this process meanwhile
+                # is already in the collection, so it is not removed below
+                indexed = self.ids()
+                stored = set(collection.get(include=[])["ids"])
+                removed = self.remove(indexed - stored)
+                missing = sorted(stored - indexed)
+
+            read = 0
+            for start in range(0, len(missing), SYNC_PAGE_SIZE):
+                page = collection.get(ids=missing[start:start + SYNC_PAGE_SIZE], include=["embeddings", "metadatas"])
+                self.add(page["ids"], page["embeddings"], page["metadatas"])
+                read += len(page["ids"])
+            if not self.ready:
+                self.trim()
+                self.ready = True
+            if read or removed:
+                logger.info(f"Synced quantized index: {read} vectors read, {removed} removed")
+            return {"read": read, "removed": removed}
+        finally:
+            with self._sync_lock:
+                self._syncing = False
+                self._synced_at = time.time()
+
+    def _apply_changes(self, events: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+        """
+        Remove the chunks deleted by change log events.
+
+        Args:
+            events: Change log events since the previous sync
+
+        Returns:
+            (number of vectors removed, IDs of the chunks to read again)
+        """
+        added, deleted, documents = set(), set(), set()
+        for event in events:
+            op = event.get("op")
+            if op == OP_ADD:
+                added.add(event["chunk_id"])
+            elif op == OP_DELETE:
+                deleted.add(event["chunk_id"])
+            elif op == OP_DELETE_DOCUMENT:
+                documents.add(event["document_id"])
+
+        # Deletes first; a chunk added again after its delete is still in the
+        # collection and is read back below
+        removed = self.remove(deleted)
+        for document_id in documents:
+            removed += self.remove_document(document_id)
+        return removed, sorted(added)
+
+    def supports_filter(self, where: Optional[Dict[str, Any]]) -> bool:
+        """
+        Check whether a Chroma metadata filter can be applied by the index.
+
+        Supported are equality, $eq and $in on FILTER_FIELDS, combined with $and.
+
+        Args:
+            where: Chroma metadata filter
+
+        Returns:
+            True if search() can apply the filter
+        """
+        if not where:
+            return True
+        if set(where) == {"$and"}:
+            return all(self.supports_filter(clause) for clause in where["$and"])
+        if len(where) != 1:
+            return False
+        field, condition = next(iter(where.items()))
+        if field not in FILTER_FIELDS:
+            return False
+        if isinstance(condition, dict):
+            return len(condition) == 1 and next(iter(condition)) in ("$eq", "$in")
+        return True
+
+    def _filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean mask of the rows matching a supported filter."""
+        if "$and" in where:
+            mask = np.ones(self._size, dtype=bool)
+            for clause in where["$and"]:
+                mask &= self._filter_mask(clause)
+            return mask
+
+        field, condition = next(iter(where.items()))
+        if isinstance(condition, dict):
+            values = condition.get("$in", [condition.get("$eq")])
+        else:
+            values = [condition]
+        codes = [self._values[field][value] for value in values if value in self._values[field]]
+        return np.isin(self._columns[field][:self._size], codes)
+
+    def search(self, query: List[float], k: int, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Find candidate chunks by their quantized vectors.
+
+        In int8 mode candidates are ranked by approximate squared L2 distance.
+        In binary mode they are ranked by the negated dot product of the query
+        with the sign vectors, which ranks far better than Hamming distance
+        between sign bits.
+
+        Args:
+            query: Full-precision query vector
+            k: Number of candidates
+            where: Optional metadata filter (see supports_filter())
+
+        Returns:
+            List of (chunk ID, approximate distance), closest first
+        """
+        if where and not self.supports_filter(where):
+            raise ValueError(f"Unsupported filter for the quantized index: {where}")
+
+        with self._lock:
+            if not self._row_of or k <= 0:
+                return []
+            q = np.asarray(query, dtype=np.float32)
+            mask = self._alive[:self._size].copy()
+            if where:
+                mask &= self._filter_mask(where)
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return []
+
+            distances = np.empty(len(rows), dtype=np.float32)
+            if self.mode == QUANTIZATION_BINARY:
+                # q . (2b - 1) with b the 0/1 sign bits of each row
+                for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                    block = rows[start:start + SCORE_BLOCK_ROWS]
+                    bits = np.unpackbits(self._codes[block], axis=1, count=self.dim).astype(np.float32)
+                    distances[start:start + len(block)] = q.sum() - 2 * (bits @ q)
+            else:
+                for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                    block = rows[start:start + SCORE_BLOCK_ROWS]
+                    dots = (self._codes[block].astype(np.float32) @ q) * self._scales[block]
+                    distances[start:start + len(block)] = self._norms[block] - 2 * dots
+
+            k = min(k, len(rows))
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top], kind="stable")]
+            return [(self._ids[rows[i]], float(distances[i])) for i in top]
+
+    def memory_bytes(self) -> int:
+        """Bytes allocated for codes, scales, norms and filter columns (excluding IDs)."""
+        with self._lock:
+            if self._codes is None:
+                return 0
+            arrays = [self._codes, self._scales, self._norms, self._alive] + list(self._columns.values())
+            return int(sum(array.nbytes for array in arrays))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics.
+
+        Returns:
+            Dictionary with mode, vector count, dimension, the memory of the
+            codes (held in addition to Chroma's vectors) and the size of the
+            same vectors in float32, as Chroma holds them
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "vectors": len(self),
+                "dim": self.dim,
+                "memory_mb": round(self.memory_bytes() / (1024 * 1024), 2),
+                "float32_mb": round(len(self) * (self.dim or 0) * 4 / (1024 * 1024), 2),
+                "ready": self.ready
+            }
+
+
+_shared_indexes: Dict[Tuple[str, str, str], QuantizedVectorIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_quantized_index(persist_directory: str, collection_name: str, mode: str) -> QuantizedVectorIndex:
+    """
+    Get the process-wide index of a collection.
+
+    Every store on the same collection shares one index, so chunks added
+    through one store are found through the others.
+
+    Args:
+        persist_directory: Chroma persist directory
+        collection_name: Chroma collection name
+        mode: QUANTIZATION_INT8 or QUANTIZATION_BINARY
+
+    Returns:
+        Shared QuantizedVectorIndex (empty until the store builds it)
+    """
+    key = (os.path.abspath(persist_directory), collection_name, mode)
+    with _shared_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            index = _shared_indexes[key] = QuantizedVectorIndex(mode)
+        return index
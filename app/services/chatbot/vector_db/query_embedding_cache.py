@@ -0,0 +1,143 @@
+"""
+LRU cache of query embeddings.
+
+The same query text is embedded many times: by both legs of hybrid search,
+by every sub-query of multiple-query mode, by rephrase retries and by
+different users asking the same question. QueryEmbeddingCache keeps the
+most recent query vectors keyed on (model name, normalized query text);
+CachedQueryEmbeddings puts it in front of a LangChain embedding function.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+import logging
+import threading
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Collapse runs of whitespace and strip the ends of a query."""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of query embeddings with hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of cached embeddings (0 disables caching)
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        """
+        Look up a cached embedding, marking it as recently used.
+
+        Args:
+            model_name: Embedding model name
+            text: Normalized query text
+
+        Returns:
+            The embedding, or None on a miss
+        """
+        key = (model_name, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(vector)
+
+    def put(self, model_name: str, text: str, vector: List[float]) -> None:
+        """
+        Cache an embedding, evicting the least recently used one when full.
+
+        Args:
+            model_name: Embedding model name
+            text: Normalized query text
+            vector: Query embedding
+        """
+        if self.max_size <= 0:
+            return
+        key = (model_name, text)
+        with self._lock:
+            self._entries[key] = tuple(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached embedding and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with size, capacity, hits, misses and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embedding function that caches query embeddings.
+
+    Document embeddings are passed straight through; they are computed once
+    at indexing time and rarely repeat.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: 'QueryEmbeddingCache'):
+        """
+        Initialize the wrapper.
+
+        Args:
+            embeddings: Underlying embedding function
+            model_name: Model name used in the cache key
+            cache: Cache to use (usually the shared query_embedding_cache)
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents without caching."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing the cached vector for the same normalized text."""
+        text = normalize_query(text)
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(self.model_name, text, vector)
+        return vector
+
+
+# Shared by every vector store in the process
+query_embedding_cache = QueryEmbeddingCache(max_size=settings.QUERY_EMBEDDING_CACHE_SIZE)
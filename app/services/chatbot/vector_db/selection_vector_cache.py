@@ -0,0 +1,241 @@
+"""
+Exact in-memory search over a selection of documents.
+
+In Knowledge Base mode a conversation searches only the documents the user
+selected, through a Chroma filter on document_id $in. HNSW handles such
+filters poorly: on small selections it is slow and can return fewer than k
+chunks. The vectors of a selection are few, so they are loaded once into a
+NumPy matrix and searched exactly (one matrix-vector product and an
+argpartition). Loaded selections are kept in an LRU cache bounded by the
+total number of vectors.
+
+Entries are invalidated when the collection they were read from is
+written to in this process, and expire after a TTL to pick up writes of
+other processes.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from langchain.schema import Document
+import json
+import logging
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields a selection filter may use
+SELECTION_FIELDS = ("document_id", "user_id")
+
+
+def is_selection_filter(where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Check whether a Chroma filter selects a set of documents.
+
+    True for {"document_id": {"$in": [...]}} or {"document_id": ...}, alone
+    or in a top-level $and with user_id clauses.
+
+    Args:
+        where: Chroma metadata filter
+
+    Returns:
+        True if the filter can be served from a loaded selection
+    """
+    if not where:
+        return False
+    clauses = where["$and"] if set(where) == {"$and"} else [where]
+    fields = []
+    for clause in clauses:
+        if not isinstance(clause, dict) or len(clause) != 1:
+            return False
+        field, condition = next(iter(clause.items()))
+        if field not in SELECTION_FIELDS:
+            return False
+        if isinstance(condition, dict) and (len(condition) != 1 or next(iter(condition)) not in ("$eq", "$in")):
+            return False
+        fields.append(field)
+    return "document_id" in fields
+
+
+def selection_key(where: Dict[str, Any]) -> str:
+    """Canonical form of a selection filter ($in lists sorted), used as cache key."""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {key: sorted(item) if key == "$in" else canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return sorted((canonical(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+        return value
+    return json.dumps(canonical(where), sort_keys=True)
+
+
+class SelectedVectors:
+    """
+    Vectors, texts and metadata of the chunks of a document selection.
+    """
+
+    def __init__(self, vectors: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]], generation: int):
+        """
+        Initialize the selection.
+
+        Args:
+            vectors: Chunk embeddings
+            documents: Chunk texts, aligned with vectors
+            metadatas: Chunk metadata, aligned with vectors
+            generation: Collection generation the chunks were read at
+        """
+        self.vectors = np.asarray(vectors, dtype=np.float32) if len(documents) else np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.documents = documents
+        self.metadatas = metadatas
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: List[float], k: int, space: str = "l2") -> List[Tuple[Document, float]]:
+        """
+        Exact top k by the distance Chroma uses for the collection.
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            space: Collection distance ("l2", "cosine" or "ip")
+
+        Returns:
+            List of (Document, distance), closest first
+        """
+        if not len(self) or k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        dots = self.vectors @ q
+        if space == "cosine":
+            norms = np.sqrt(self.norms) * np.linalg.norm(q)
+            distances = 1.0 - dots / np.where(norms == 0, 1.0, norms)
+        elif space == "ip":
+            distances = 1.0 - dots
+        else:
+            distances = self.norms - 2 * dots + float(q @ q)
+
+        k = min(k, len(self))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [
+            (Document(page_content=self.documents[i] or "", metadata=self.metadatas[i] or {}), float(distances[i]))
+            for i in top
+        ]
+
+
+class SelectionVectorCache:
+    """
+    Thread-safe LRU cache of loaded selections, bounded by total vector count.
+    """
+
+    def __init__(self, max_vectors: int = 200000, max_selection_vectors: int = 20000, ttl_seconds: float = 300.0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_vectors: Total vectors kept over all selections (0 disables the cache)
+            max_selection_vectors: Largest selection served exactly; larger ones go to Chroma
+            ttl_seconds: Age after which a selection is reloaded
+        """
+        self.max_vectors = max_vectors
+        self.max_selection_vectors = max_selection_vectors
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[Any, str], SelectedVectors]" = OrderedDict()
+        self._generations: Dict[Any, int] = {}
+        self._vectors = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, namespace: Any) -> int:
+        """Current write generation of a collection (see invalidate())."""
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace: Any) -> None:
+        """
+        Mark selections read from a collection as stale, after a write to it.
+
+        Args:
+            namespace: Collection identifier used in the cache keys
+        """
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def get(self, namespace: Any, key: str) -> Optional[SelectedVectors]:
+        """
+        Look up a loaded selection, marking it as recently used.
+
+        Args:
+            namespace: Collection identifier
+            key: Selection key (see selection_key())
+
+        Returns:
+            The selection, or None if missing, stale or expired
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and (
+                entry.generation != self._generations.get(namespace, 0)
+                or time.monotonic() - entry.loaded_at > self.ttl_seconds
+            ):
+                self._vectors -= len(entry)
+                del self._entries[(namespace, key)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return entry
+
+    def put(self, namespace: Any, key: str, selection: SelectedVectors) -> None:
+        """
+        Cache a loaded selection, evicting the least recently used ones over budget.
+
+        Args:
+            namespace: Collection identifier
+            key: Selection key
+            selection: Loaded selection
+        """
+        if len(selection) > min(self.max_vectors, self.max_selection_vectors):
+            return
+        with self._lock:
+            previous = self._entries.pop((namespace, key), None)
+            if previous is not None:
+                self._vectors -= len(previous)
+            self._entries[(namespace, key)] = selection
+            self._vectors += len(selection)
+            while self._vectors > self.max_vectors:
+                _, evicted = self._entries.popitem(last=False)
+                self._vectors -= len(evicted)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with cached selections, vectors, hits, misses and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "selections": len(self._entries),
+                "vectors": self._vectors,
+                "max_vectors": self.max_vectors,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared by every vector store in the process
+selection_vector_cache = SelectionVectorCache(
+    max_vectors=settings.SELECTION_CACHE_MAX_VECTORS,
+    max_selection_vectors=settings.SELECTION_CACHE_MAX_SELECTION_VECTORS,
+    ttl_seconds=settings.SELECTION_CACHE_TTL_SECONDS
+)
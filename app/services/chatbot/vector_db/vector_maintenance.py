@@ -0,0 +1,662 @@
+"""
+Vector store maintenance: orphan sweep, compaction and integrity report.
+
+Failed uploads, documents deleted from Postgres only, and chunks written
+under random IDs before chunk IDs became deterministic leave vectors that no
+document owns. The maintenance job cross-checks the store against Postgres:
+
+    report   per-user chunk counts, disk usage per collection (including the
+             share of deleted vectors still held by its HNSW index), and
+             drift between the document_embeddings table and the vectors
+    sweep    remove orphans (chunks and document vectors whose document_id
+             is not in the documents table) and duplicates (see
+             find_duplicates); removed chunks are recorded in the change log
+             so the BM25 index drops them too
+    compact  rebuild the HNSW index of collections whose deleted share is
+             above a threshold, by copying them into a fresh collection
+
+Hnswlib only marks deleted vectors, so an index keeps their memory and disk
+until it is rebuilt. A rebuild copies the collection, deletes the original
+and renames the copy; an interrupted rebuild is finished on the next run.
+Compaction replaces collections under open clients, so it only runs from
+the command line with the API stopped. The report and the sweep are also
+served to admins (ADMIN_EMAILS) at /api/chat/vector-store/report and
+/api/chat/vector-store/maintenance, without the sweep's --force.
+
+    python -m app.services.chatbot.vector_db.vector_maintenance --db ./data/chroma_db report
+    python -m app.services.chatbot.vector_db.vector_maintenance --db ./data/chroma_db sweep --apply
+    python -m app.services.chatbot.vector_db.vector_maintenance --db ./data/chroma_db compact
+"""
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable
+from datetime import datetime
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from app.core.config import settings
+
+from .collection_sharding import is_shard_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = settings.VECTOR_MAINTENANCE_PAGE_SIZE
+# Share of deleted vectors in an HNSW index above which compaction rebuilds it
+DEFAULT_COMPACT_MIN_DELETED = settings.VECTOR_COMPACT_MIN_DELETED
+# A sweep refuses to remove more than this share of the chunks without force
+DEFAULT_MAX_ORPHAN_RATIO = settings.VECTOR_SWEEP_MAX_ORPHAN_RATIO
+
+REBUILD_PREFIX = "rebuild_"
+REBUILD_OF_KEY = "maintenance:rebuild_of"
+SAMPLE_SIZE = 20
+
+# (collection name, chunk ID, chunk metadata)
+Chunk = Tuple[str, str, Dict[str, Any]]
+
+
+def load_postgres_documents() -> Dict[str, str]:
+    """
+    Read every document of the documents table.
+
+    Returns:
+        Dictionary of document ID to owner user ID ("" without owner)
+    """
+    from ....core.database import db_manager
+
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, user_id FROM documents")
+            return {str(document_id): str(user_id) if user_id else "" for document_id, user_id in cursor.fetchall()}
+
+
+def load_postgres_embedding_rows() -> Dict[str, List[Optional[str]]]:
+    """
+    Read the document_embeddings table.
+
+    Returns:
+        Dictionary of document ID to the embedding IDs of its rows
+    """
+    from ....core.database import db_manager
+
+    rows: Dict[str, List[Optional[str]]] = {}
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT document_id, embedding_id FROM document_embeddings WHERE document_id IS NOT NULL")
+            for document_id, embedding_id in cursor.fetchall():
+                rows.setdefault(str(document_id), []).append(embedding_id)
+    return rows
+
+
+def find_orphans(chunks: List[Chunk], known_documents: Dict[str, str]) -> List[Tuple[str, str]]:
+    """
+    Find chunks whose document is not in Postgres (or that have no document_id).
+
+    Args:
+        chunks: Every chunk of the store
+        known_documents: Document IDs in the documents table
+
+    Returns:
+        (collection, chunk ID) of the orphans
+    """
+    return [
+        (name, chunk_id) for name, chunk_id, metadata in chunks
+        if str(metadata.get("document_id") or "") not in known_documents
+    ]
+
+
+def find_duplicates(chunks: List[Chunk], base_collection: str) -> List[Tuple[str, str]]:
+    """
+    Find chunks that another chunk of the same document supersedes.
+
+    Chunks are stored under the ID "<document_id>:<chunk_index>" and every
+    re-index deletes the IDs it did not write, so chunks of such a document
+    under other (random) IDs are leftovers of earlier indexings. The same ID
+    in several collections (an interrupted shard migration) is kept in the
+    shard. Documents stored under random IDs only keep one chunk per
+    chunk_index.
+
+    Args:
+        chunks: Every chunk of the store
+        base_collection: Name of the base (unsharded) collection
+
+    Returns:
+        (collection, chunk ID) of the duplicates
+    """
+    by_document: Dict[str, List[Chunk]] = {}
+    for chunk in chunks:
+        document_id = chunk[2].get("document_id")
+        if document_id:
+            by_document.setdefault(str(document_id), []).append(chunk)
+
+    duplicates: List[Tuple[str, str]] = []
+    for document_id, members in by_document.items():
+        prefix = f"{document_id}:"
+        groups: Dict[Any, List[Chunk]] = {}
+        if any(chunk_id.startswith(prefix) for _, chunk_id, _ in members):
+            for name, chunk_id, metadata in members:
+                if chunk_id.startswith(prefix):
+                    groups.setdefault(chunk_id, []).append((name, chunk_id, metadata))
+                else:
+                    duplicates.append((name, chunk_id))
+        else:
+            for member in members:
+                if member[2].get("chunk_index") is not None:
+                    groups.setdefault(member[2]["chunk_index"], []).append(member)
+
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            keep = next((member for member in group if member[0] != base_collection), group[0])
+            duplicates.extend((name, chunk_id) for name, chunk_id, _ in group if (name, chunk_id) != keep[:2])
+    return duplicates
+
+
+def embedding_drift(vector_ids: Dict[str, Set[str]], rows: Dict[str, List[Optional[str]]],
+                    sample_size: int = SAMPLE_SIZE) -> Dict[str, Any]:
+    """
+    Compare the document_embeddings table with the stored vectors.
+
+    Args:
+        vector_ids: Chunk IDs in the store per document
+        rows: Embedding IDs in document_embeddings per document
+        sample_size: Document IDs listed per kind of drift
+
+    Returns:
+        Dictionary with documents that have rows but no vectors, vectors but
+        no rows, a different number of rows and vectors, the number of rows
+        whose embedding ID is not a stored chunk, and whether both agree
+    """
+    missing_vectors = sorted(document_id for document_id in rows if document_id not in vector_ids)
+    missing_rows = sorted(document_id for document_id in vector_ids if document_id not in rows)
+    mismatched = sorted(
+        document_id for document_id, embedding_ids in rows.items()
+        if document_id in vector_ids and len(embedding_ids) != len(vector_ids[document_id])
+    )
+    dangling = sum(
+        1 for document_id, embedding_ids in rows.items()
+        for embedding_id in embedding_ids
+        if embedding_id and embedding_id not in vector_ids.get(document_id, ())
+    )
+    return {
+        "documents_with_rows": len(rows),
+        "documents_with_vectors": len(vector_ids),
+        "missing_vectors": {"documents": len(missing_vectors), "sample": missing_vectors[:sample_size]},
+        "missing_rows": {"documents": len(missing_rows), "sample": missing_rows[:sample_size]},
+        "count_mismatch": {
+            "documents": len(mismatched),
+            "sample": [
+                {"document_id": document_id, "rows": len(rows[document_id]), "vectors": len(vector_ids[document_id])}
+                for document_id in mismatched[:sample_size]
+            ]
+        },
+        "dangling_embedding_ids": dangling,
+        "in_sync": not (missing_vectors or missing_rows or mismatched or dangling)
+    }
+
+
+def _directory_size(path: str) -> int:
+    """Total size of the files under a directory in bytes."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def hnsw_elements(segment_folder: str) -> Dict[str, Any]:
+    """
+    Count the vectors an HNSW index holds and how many of them are deleted.
+
+    Read from the index metadata Chroma persists next to the index, which
+    trails the index by up to one sync batch.
+
+    Args:
+        segment_folder: Folder of the collection's vector segment
+
+    Returns:
+        Dictionary with elements ever added, live elements and the deleted
+        share (None where the index has not been persisted yet)
+    """
+    path = os.path.join(segment_folder, "index_metadata.pickle")
+    if not os.path.exists(path):
+        return {"elements": None, "live": None, "deleted_ratio": None}
+    try:
+        from chromadb.segment.impl.vector.local_persistent_hnsw import PersistentData
+        data = PersistentData.load_from_file(path)
+    except Exception as e:
+        logger.warning(f"Could not read HNSW metadata {path}: {str(e)}")
+        return {"elements": None, "live": None, "deleted_ratio": None}
+    elements, live = data.total_elements_added, len(data.id_to_label)
+    return {
+        "elements": elements,
+        "live": live,
+        "deleted_ratio": round((elements - live) / elements, 4) if elements else 0.0
+    }
+
+
+def disk_usage(persist_directory: str) -> Dict[str, Any]:
+    """
+    Measure the disk used by a Chroma directory, per collection where possible.
+
+    Collections are mapped to their vector segment folders through Chroma's
+    SQLite catalog, so this only sees collections stored in this directory
+    (not those of a remote Chroma server).
+
+    Args:
+        persist_directory: Chroma persist directory
+
+    Returns:
+        Dictionary with the total size, the SQLite database size and, per
+        collection, the size and element counts of its HNSW index
+    """
+    sqlite_path = os.path.join(persist_directory, "chroma.sqlite3")
+    collections: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(sqlite_path):
+        try:
+            conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+            try:
+                segments = conn.execute(
+                    "SELECT s.id, c.name FROM segments s JOIN collections c ON s.collection = c.id "
+                    "WHERE s.scope = 'VECTOR'"
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read the Chroma catalog {sqlite_path}: {str(e)}")
+            segments = []
+        for segment_id, name in segments:
+            folder = os.path.join(persist_directory, segment_id)
+            collections[name] = {"bytes": _directory_size(folder), **hnsw_elements(folder)}
+
+    return {
+        "persist_directory": os.path.abspath(persist_directory),
+        "total_bytes": _directory_size(persist_directory),
+        "sqlite_bytes": os.path.getsize(sqlite_path) if os.path.exists(sqlite_path) else None,
+        "collections": collections
+    }
+
+
+def rebuild_collection_name(name: str) -> str:
+    """Name of the copy a collection is rebuilt into (within Chroma's 63 characters)."""
+    return f"{REBUILD_PREFIX}{hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]}"
+
+
+def _restored_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Metadata of a rebuilt collection without the rebuild marker."""
+    restored = {key: value for key, value in (metadata or {}).items() if key != REBUILD_OF_KEY}
+    # Chroma cannot clear collection metadata; l2 is its default space anyway
+    return restored or {"hnsw:space": "l2"}
+
+
+def finish_rebuilds(client) -> List[str]:
+    """
+    Clean up after interrupted rebuilds.
+
+    A copy whose original still exists was not complete and is dropped; a
+    copy whose original is gone was complete and takes the original's name.
+
+    Args:
+        client: Chroma client
+
+    Returns:
+        Names of the collections whose rebuild was finished
+    """
+    collections = {collection.name: collection for collection in client.list_collections()}
+    finished = []
+    for name, collection in sorted(collections.items()):
+        original = (collection.metadata or {}).get(REBUILD_OF_KEY) if name.startswith(REBUILD_PREFIX) else None
+        if not original:
+            continue
+        if original in collections:
+            client.delete_collection(name)
+            logger.info(f"Dropped incomplete rebuild of {original}")
+        else:
+            collection.modify(name=original, metadata=_restored_metadata(collection.metadata))
+            finished.append(original)
+            logger.info(f"Finished interrupted rebuild of {original}")
+    return finished
+
+
+def rebuild_collection(client, name: str, page_size: int = DEFAULT_PAGE_SIZE) -> int:
+    """
+    Rebuild a collection's HNSW index without its deleted vectors.
+
+    The vectors are copied as stored into a fresh collection with the same
+    metadata (so the same HNSW parameters), which then replaces the original.
+    Nothing may write to the collection meanwhile.
+
+    Args:
+        client: Chroma client
+        name: Collection name
+        page_size: Vectors copied per page
+
+    Returns:
+        Number of vectors in the rebuilt collection
+
+    Raises:
+        RuntimeError: If the copy does not hold every vector of the original
+    """
+    source = client.get_collection(name)
+    copy = client.create_collection(
+        rebuild_collection_name(name),
+        metadata={**(source.metadata or {}), REBUILD_OF_KEY: name}
+    )
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        copy.add(
+            ids=page["ids"],
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            metadatas=page["metadatas"]
+        )
+        offset += len(page["ids"])
+
+    copied, expected = copy.count(), source.count()
+    if copied != expected:
+        client.delete_collection(copy.name)
+        raise RuntimeError(f"Rebuild of {name} copied {copied} of {expected} vectors; is something still writing to it?")
+    # The original is only deleted once the copy is complete (see finish_rebuilds)
+    client.delete_collection(name)
+    copy.modify(name=name, metadata=_restored_metadata(copy.metadata))
+    logger.info(f"Rebuilt {name} with {copied} vectors")
+    return copied
+
+
+class VectorStoreMaintenance:
+    """
+    Maintenance job of a chunk store, its shards and its document vectors.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        change_log: Optional[Any] = None,
+        load_documents: Callable[[], Dict[str, str]] = load_postgres_documents,
+        load_embedding_rows: Callable[[], Dict[str, List[Optional[str]]]] = load_postgres_embedding_rows,
+        page_size: int = DEFAULT_PAGE_SIZE
+    ):
+        """
+        Initialize the job.
+
+        Args:
+            store: LangChainChromaStore of the active collection
+            change_log: ChunkChangeLog that removed chunks are recorded in (optional)
+            load_documents: Reads document ID -> user ID of every document
+            load_embedding_rows: Reads document ID -> embedding IDs of document_embeddings
+            page_size: Chunks read or deleted per request
+        """
+        self.store = store
+        self.change_log = change_log
+        self.load_documents = load_documents
+        self.load_embedding_rows = load_embedding_rows
+        self.page_size = page_size
+
+    def _collection_names(self) -> List[str]:
+        """The base collection and every shard in the database, whatever the configured sharding."""
+        base = self.store.collection_name
+        names = [getattr(collection, "name", collection) for collection in self.store.client.list_collections()]
+        return [base] + sorted(name for name in names if is_shard_name(name, base))
+
+    def scan(self) -> List[Chunk]:
+        """
+        Read the ID and metadata of every chunk, without vectors or text.
+
+        Returns:
+            (collection, chunk ID, metadata) of every chunk
+        """
+        chunks: List[Chunk] = []
+        for name in self._collection_names():
+            vectorstore = self.store._collection(name)
+            if vectorstore is None:
+                continue
+            offset = 0
+            while True:
+                page = vectorstore._collection.get(include=["metadatas"], limit=self.page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                chunks.extend((name, chunk_id, metadata or {}) for chunk_id, metadata in zip(page["ids"], page["metadatas"]))
+                offset += len(page["ids"])
+        return chunks
+
+    def _analyze(self) -> Dict[str, Any]:
+        """Scan the store and find orphans and duplicates."""
+        chunks = self.scan()
+        document_vector_ids = self.store.document_vectors.collection.get(include=[])["ids"]
+        # Read after the scan: a document's row is written before its chunks, so
+        # every scanned chunk of a live document finds its row
+        known = self.load_documents()
+        orphans = find_orphans(chunks, known)
+        orphaned = set(orphans)
+        duplicates = find_duplicates(
+            [chunk for chunk in chunks if chunk[:2] not in orphaned],
+            self.store.collection_name
+        )
+        return {
+            "chunks": chunks,
+            "known": known,
+            "orphans": orphans,
+            "duplicates": duplicates,
+            "orphan_document_vectors": [document_id for document_id in document_vector_ids if document_id not in known]
+        }
+
+    @staticmethod
+    def _summary(analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Counts and samples of what a sweep removes."""
+        orphan_ids = {chunk[:2] for chunk in analysis["orphans"]}
+        orphan_documents = sorted({
+            str(metadata.get("document_id") or "")
+            for name, chunk_id, metadata in analysis["chunks"] if (name, chunk_id) in orphan_ids
+        })
+        return {
+            "orphans": {
+                "chunks": len(analysis["orphans"]),
+                "documents": len(orphan_documents),
+                "sample": orphan_documents[:SAMPLE_SIZE]
+            },
+            "duplicates": {
+                "chunks": len(analysis["duplicates"]),
+                "sample": [chunk_id for _, chunk_id in analysis["duplicates"][:SAMPLE_SIZE]]
+            },
+            "orphan_document_vectors": len(analysis["orphan_document_vectors"])
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Report the state of the store without changing it.
+
+        Returns:
+            Dictionary with chunk and document counts, chunks per user, what a
+            sweep would remove, disk usage and drift against document_embeddings
+        """
+        analysis = self._analyze()
+        chunks_per_user: Dict[str, int] = {}
+        vector_ids: Dict[str, Set[str]] = {}
+        for _, chunk_id, metadata in analysis["chunks"]:
+            document_id = str(metadata.get("document_id") or "")
+            user_id = str(metadata.get("user_id") or analysis["known"].get(document_id) or "") or "unowned"
+            chunks_per_user[user_id] = chunks_per_user.get(user_id, 0) + 1
+            if document_id:
+                vector_ids.setdefault(document_id, set()).add(chunk_id)
+
+        try:
+            drift = embedding_drift(vector_ids, self.load_embedding_rows())
+        except Exception as e:
+            logger.error(f"Failed to read document_embeddings: {str(e)}")
+            drift = {"error": str(e)}
+
+        return {
+            "collection": self.store.collection_name,
+            "collections": self._collection_names(),
+            "chunks": len(analysis["chunks"]),
+            "documents_with_vectors": len(vector_ids),
+            "documents_without_vectors": len(set(analysis["known"]) - set(vector_ids)),
+            "chunks_per_user": dict(sorted(chunks_per_user.items(), key=lambda item: item[1], reverse=True)),
+            **self._summary(analysis),
+            "disk": disk_usage(self.store.persist_directory),
+            "drift": drift,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def sweep(self, dry_run: bool = True, max_orphan_ratio: float = DEFAULT_MAX_ORPHAN_RATIO,
+              force: bool = False) -> Dict[str, Any]:
+        """
+        Remove orphaned and duplicated chunks and orphaned document vectors.
+
+        Args:
+            dry_run: Only report what would be removed
+            max_orphan_ratio: Refuse when more than this share of the chunks is
+                orphaned, which rather means the wrong Postgres database
+            force: Remove even above max_orphan_ratio
+
+        Returns:
+            Dictionary with counts and samples of the orphans and duplicates,
+            the number of removed chunks and whether it was a dry run
+
+        Raises:
+            ValueError: If too many chunks look orphaned and force is not set
+        """
+        analysis = self._analyze()
+        summary = self._summary(analysis)
+        total = len(analysis["chunks"])
+        if total and len(analysis["orphans"]) / total > max_orphan_ratio and not force and not dry_run:
+            raise ValueError(
+                f"{len(analysis['orphans'])} of {total} chunks have no document in Postgres; "
+                f"refusing to remove them without force"
+            )
+
+        removed = 0
+        if not dry_run:
+            removed = self._delete_chunks(analysis["orphans"] + analysis["duplicates"], analysis["chunks"])
+            orphan_vectors = analysis["orphan_document_vectors"]
+            for start in range(0, len(orphan_vectors), self.page_size):
+                self.store.document_vectors.collection.delete(ids=orphan_vectors[start:start + self.page_size])
+            logger.info(
+                f"Vector store sweep removed {removed} chunks and {len(orphan_vectors)} document vectors"
+            )
+
+        return {**summary, "chunks_scanned": total, "removed_chunks": removed, "dry_run": dry_run}
+
+    def _delete_chunks(self, targets: List[Tuple[str, str]], chunks: List[Chunk]) -> int:
+        """
+        Delete chunks from their collections and record them in the change log.
+
+        Args:
+            targets: (collection, chunk ID) to delete
+            chunks: Every scanned chunk
+
+        Returns:
+            Number of deleted chunks
+        """
+        if not targets:
+            return 0
+        by_collection: Dict[str, List[str]] = {}
+        for name, chunk_id in targets:
+            by_collection.setdefault(name, []).append(chunk_id)
+
+        self.store.selection_cache.invalidate(self.store._selection_namespace)
+        for name, ids in by_collection.items():
+            vectorstore = self.store._collection(name)
+            for start in range(0, len(ids), self.page_size):
+                vectorstore._collection.delete(ids=ids[start:start + self.page_size])
+            index = self.store._index(name)
+            if index is not None:
+                index.remove(ids)
+
+        # An ID kept in another collection is still live for keyword search
+        removed = set(targets)
+        remaining = {chunk_id for name, chunk_id, _ in chunks if (name, chunk_id) not in removed}
+        logged = sorted({chunk_id for _, chunk_id in targets if chunk_id not in remaining})
+        if self.change_log is not None and logged:
+            try:
+                self.change_log.record_deleted(chunk_ids=logged)
+            except Exception as e:
+                logger.error(f"Failed to record swept chunks in change log: {str(e)}")
+        return len(targets)
+
+    def compact(self, min_deleted_ratio: float = DEFAULT_COMPACT_MIN_DELETED, force: bool = False) -> Dict[str, Any]:
+        """
+        Rebuild the HNSW indexes that hold too many deleted vectors.
+
+        Run with the API stopped: rebuilt collections get new IDs, which
+        clients opened before the rebuild do not see.
+
+        Args:
+            min_deleted_ratio: Deleted share above which a collection is rebuilt
+            force: Rebuild every collection (also where the share is unknown)
+
+        Returns:
+            Dictionary with the rebuilds finished from an interrupted run and,
+            per rebuilt collection, its vectors, deleted share and size before
+            and after
+        """
+        client = self.store.client
+        resumed = finish_rebuilds(client)
+        before = disk_usage(self.store.persist_directory)["collections"]
+        names = self._collection_names() + [self.store.document_vectors.collection_name]
+
+        rebuilt: Dict[str, Dict[str, Any]] = {}
+        for name in names:
+            usage = before.get(name, {})
+            deleted_ratio = usage.get("deleted_ratio")
+            if not force and (deleted_ratio is None or deleted_ratio < min_deleted_ratio):
+                continue
+            rebuilt[name] = {
+                "vectors": rebuild_collection(client, name, self.page_size),
+                "deleted_ratio": deleted_ratio,
+                "bytes_before": usage.get("bytes")
+            }
+
+        after = disk_usage(self.store.persist_directory)["collections"]
+        for name, result in rebuilt.items():
+            result["bytes_after"] = after.get(name, {}).get("bytes")
+        return {"resumed": resumed, "rebuilt": rebuilt, "min_deleted_ratio": min_deleted_ratio}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    from .langchain_chroma import LangChainChromaStore
+    from .change_log import ChunkChangeLog, CHANGE_LOG_FILENAME
+    from .model_migration import CollectionAliases
+
+    parser = argparse.ArgumentParser(description="Sweep, compact and report on the vector store")
+    parser.add_argument("--db", default=settings.VECTOR_DB_PATH, help="Chroma persist directory")
+    parser.add_argument("--collection", default=settings.COLLECTION_NAME, help="Configured collection name")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL,
+                        help="Configured embedding model (used until the first migration switch)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("report", help="Report chunk counts, disk usage, orphans and drift")
+    sweep_parser = commands.add_parser("sweep", help="Remove orphaned and duplicated chunks (dry run without --apply)")
+    sweep_parser.add_argument("--apply", action="store_true", help="Remove the chunks instead of only counting them")
+    sweep_parser.add_argument("--max-orphan-ratio", type=float, default=DEFAULT_MAX_ORPHAN_RATIO)
+    sweep_parser.add_argument("--force", action="store_true", help="Remove orphans even above --max-orphan-ratio")
+    compact_parser = commands.add_parser("compact", help="Rebuild HNSW indexes with many deleted vectors (API stopped)")
+    compact_parser.add_argument("--min-deleted-ratio", type=float, default=DEFAULT_COMPACT_MIN_DELETED)
+    compact_parser.add_argument("--force", action="store_true", help="Rebuild every collection")
+    args = parser.parse_args()
+
+    collection_name, model_name = CollectionAliases.for_directory(args.db).resolve(args.collection, args.model)
+    store = LangChainChromaStore(args.db, collection_name, embedding_model=model_name)
+    # Only followed by the BM25 index when hybrid search has created the log
+    change_log = None
+    if os.path.exists(os.path.join(args.db, CHANGE_LOG_FILENAME)):
+        change_log = ChunkChangeLog.for_directory(args.db)
+    maintenance = VectorStoreMaintenance(store, change_log=change_log, page_size=args.page_size)
+    try:
+        if args.command == "report":
+            result = maintenance.report()
+        elif args.command == "sweep":
+            result = maintenance.sweep(dry_run=not args.apply, max_orphan_ratio=args.max_orphan_ratio, force=args.force)
+        else:
+            result = maintenance.compact(min_deleted_ratio=args.min_deleted_ratio, force=args.force)
+    finally:
+        store.cleanup()
+    print(json.dumps(result, indent=2))
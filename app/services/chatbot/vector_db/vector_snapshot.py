@@ -0,0 +1,579 @@
+"""
+Snapshot export/import of the vector and keyword indexes for node bootstrap.
+
+Re-embedding every document (or rebuilding BM25 from Chroma) makes a new
+node wait hours before it serves hybrid search. A snapshot archive carries
+everything the search needs instead:
+
+    manifest.json                       format version, snapshot timestamp,
+                                        embedding model and backend, the
+                                        collections and their metadata (HNSW
+                                        parameters), and the SHA-256 of
+                                        every other member
+    collections/<name>/part-NNNNN.npy   float32 vectors of one page
+    collections/<name>/part-NNNNN.jsonl id, text and metadata of that page
+    bm25_index.seg                      BM25 segment of the exported chunks
+
+The active collection of the alias is exported with its shards and its
+document vectors (a shadow collection of a running migration is not). The
+snapshot timestamp is taken before anything is read, and chunk IDs are
+listed before the pages are read by ID, so writes during the export can
+only make the archive newer than its timestamp, never leave it with holes
+from shifted offsets. The BM25 segment is built from the exported chunks,
+so it matches the vectors exactly; its change-log position is 0, so the
+importing node's BM25 change feed applies every change logged after import.
+
+Import verifies the format version, the checksums and that the embedding
+backend of the node produces the snapshot's vectors before it writes
+anything, then fills the collections, writes the BM25 segment, points the
+alias at the snapshot's collection and model, and records the snapshot in
+"snapshot_state.json". The API must be stopped meanwhile. On the next start
+the document embedding service catches up in the background: documents
+created or updated in Postgres since the snapshot timestamp (minus
+SNAPSHOT_CATCH_UP_MARGIN seconds for clock skew) and documents without
+vectors are re-embedded, and chunks of documents deleted since are swept.
+
+    python -m app.services.chatbot.vector_db.vector_snapshot --db ./data/chroma_db export snapshot.tar.gz
+    python -m app.services.chatbot.vector_db.vector_snapshot --db ./data/chroma_db verify snapshot.tar.gz
+    python -m app.services.chatbot.vector_db.vector_snapshot --db ./data/chroma_db import snapshot.tar.gz
+    python -m app.services.chatbot.vector_db.vector_snapshot --db ./data/chroma_db catch-up
+"""
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+from app.core.config import settings
+
+from .collection_sharding import is_shard_name
+from .document_vectors import DOCUMENT_VECTORS_SUFFIX
+from .model_registry import model_registry
+from .model_migration import CollectionAliases
+from .change_log import ChunkChangeLog, CHANGE_LOG_FILENAME
+from .vector_maintenance import VectorStoreMaintenance, load_postgres_documents
+from ..search.bm25_retriever import BM25Retriever
+from ..search.bm25_change_feed import APPLIED_TS_KEY
+
+# File locking across processes is only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "document-analyzer-vector-snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# Same file the chat service loads its BM25 index from
+BM25_SEGMENT_NAME = "bm25_index.seg"
+SNAPSHOT_STATE_FILENAME = "snapshot_state.json"
+SNAPSHOT_TS_KEY = "snapshot_ts"
+
+DEFAULT_PAGE_SIZE = settings.SNAPSHOT_PAGE_SIZE
+# Documents changed this many seconds before the snapshot are re-embedded too
+DEFAULT_CATCH_UP_MARGIN = settings.SNAPSHOT_CATCH_UP_MARGIN
+
+
+def _sha256_file(fileobj, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file object, read in chunks."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_collection_names(client, collection_name: str) -> List[str]:
+    """
+    Collections of a snapshot: the chunk collection, its shards and its document vectors.
+
+    Args:
+        client: Chroma client
+        collection_name: Active chunk collection
+
+    Returns:
+        Names of the collections that exist, chunk collections first
+    """
+    existing = {getattr(collection, "name", collection) for collection in client.list_collections()}
+    names = [collection_name] + sorted(name for name in existing if is_shard_name(name, collection_name))
+    names.append(f"{collection_name}{DOCUMENT_VECTORS_SUFFIX}")
+    return [name for name in names if name in existing]
+
+
+def load_postgres_changed_documents(since: float) -> List[str]:
+    """
+    Read the documents created or updated since a point in time.
+
+    Args:
+        since: Unix timestamp in seconds
+
+    Returns:
+        Document IDs
+    """
+    from ....core.database import db_manager
+
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT d.id
+                FROM documents d
+                LEFT JOIN document_processing dp ON dp.document_id = d.id
+                WHERE d.created_at >= to_timestamp(%s)::timestamp
+                   OR d.updated_at >= to_timestamp(%s)::timestamp
+                   OR dp.indexing_completed_at >= to_timestamp(%s)::timestamp
+            """, (since, since, since))
+            return [str(row[0]) for row in cursor.fetchall()]
+
+
+class _ArchiveWriter:
+    """Tar archive whose members are checksummed as they are added."""
+
+    def __init__(self, tar: tarfile.TarFile):
+        self.tar = tar
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        """Add a member from memory."""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.files[name] = {"sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+
+    def add_file(self, name: str, path: str) -> None:
+        """Add a member from a file on disk."""
+        with open(path, "rb") as f:
+            sha256 = _sha256_file(f)
+        self.tar.add(path, arcname=name)
+        self.files[name] = {"sha256": sha256, "bytes": os.path.getsize(path)}
+
+
+def _encode_page(page: Dict[str, Any]) -> Tuple[bytes, bytes]:
+    """Serialize the vectors and the records of a page."""
+    vectors = io.BytesIO()
+    np.save(vectors, np.asarray(page["embeddings"], dtype=np.float32), allow_pickle=False)
+    records = "".join(
+        json.dumps({"id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n"
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+    )
+    return vectors.getvalue(), records.encode("utf-8")
+
+
+def export_snapshot(
+    client,
+    archive_path: str,
+    alias: str,
+    default_model: str,
+    persist_directory: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    scoring_mode: str = "postings"
+) -> Dict[str, Any]:
+    """
+    Write a snapshot archive of the active collection of an alias.
+
+    The archive is written next to its path and renamed into place once
+    complete; a ".gz" path is gzip-compressed.
+
+    Args:
+        client: Chroma client of the vector database
+        archive_path: Path of the archive to write
+        alias: Configured collection name
+        default_model: Configured embedding model, used while the alias has no entry
+        persist_directory: Vector database directory, for the collection aliases
+            (None exports the alias itself)
+        page_size: Chunks read per request and stored per archive part
+        scoring_mode: BM25 scoring mode the segment is built with
+
+    Returns:
+        The manifest
+    """
+    # Everything changed after this point is caught up by the importing node
+    snapshot_ts = time.time_ns()
+    if persist_directory is not None:
+        collection_name, model_name = CollectionAliases.for_directory(persist_directory).resolve(alias, default_model)
+    else:
+        collection_name, model_name = alias, default_model
+    names = snapshot_collection_names(client, collection_name)
+    if collection_name not in names:
+        raise ValueError(f"Collection {collection_name} does not exist")
+
+    partial_path = f"{archive_path}.partial"
+    collections: List[Dict[str, Any]] = []
+    bm25_documents: List[Any] = []
+    with tarfile.open(partial_path, "w:gz" if archive_path.endswith(".gz") else "w") as tar:
+        archive = _ArchiveWriter(tar)
+        for name in names:
+            collection = client.get_collection(name)
+            chunk_collection = not name.endswith(DOCUMENT_VECTORS_SUFFIX)
+            ids = collection.get(include=[])["ids"]
+            parts, exported = [], 0
+            for start in range(0, len(ids), page_size):
+                # Chunks deleted since the IDs were listed are simply missing
+                page = collection.get(ids=ids[start:start + page_size], include=["embeddings", "documents", "metadatas"])
+                if not page["ids"]:
+                    continue
+                vectors, records = _encode_page(page)
+                part = f"collections/{name}/part-{len(parts):05d}"
+                archive.add_bytes(f"{part}.npy", vectors)
+                archive.add_bytes(f"{part}.jsonl", records)
+                parts.append(part)
+                exported += len(page["ids"])
+                if chunk_collection:
+                    bm25_documents.extend(_bm25_documents(page))
+            collections.append({
+                "name": name,
+                "metadata": collection.metadata,
+                "count": exported,
+                "parts": parts
+            })
+            logger.info(f"Exported {exported} vectors of {name}")
+
+        bm25 = None
+        if bm25_documents:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                segment_path = os.path.join(tmp_dir, BM25_SEGMENT_NAME)
+                retriever = BM25Retriever(scoring_mode=scoring_mode)
+                retriever.build_index(bm25_documents)
+                # Position 0: the importing node applies every change it logs after import
+                retriever.save_segment(segment_path, meta={APPLIED_TS_KEY: 0, SNAPSHOT_TS_KEY: snapshot_ts})
+                archive.add_file(BM25_SEGMENT_NAME, segment_path)
+            bm25 = {"file": BM25_SEGMENT_NAME, "chunks": len(bm25_documents)}
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "snapshot_ts": snapshot_ts,
+            "alias": alias,
+            "collection": collection_name,
+            "embedding_model": model_name,
+            "model_id": model_registry.model_id(model_name),
+            "collections": collections,
+            "bm25": bm25,
+            "files": archive.files
+        }
+        archive.add_bytes(MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"))
+    os.replace(partial_path, archive_path)
+    logger.info(f"Snapshot of {collection_name} written to {archive_path}")
+    return manifest
+
+
+def _bm25_documents(page: Dict[str, Any]) -> List[Any]:
+    """LangChain documents of the chunks of a page, for the BM25 segment."""
+    from langchain.schema import Document
+
+    return [
+        Document(page_content=text or "", metadata={**(metadata or {}), "chunk_id": chunk_id})
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+    ]
+
+
+def verify_snapshot(archive_path: str) -> Dict[str, Any]:
+    """
+    Check the format version and the checksum of every member of an archive.
+
+    Args:
+        archive_path: Path of the snapshot archive
+
+    Returns:
+        The manifest
+
+    Raises:
+        ValueError: If the archive is not a snapshot, has an unsupported
+            version, or a member is missing, unexpected or corrupted
+    """
+    digests: Dict[str, str] = {}
+    manifest = None
+    with tarfile.open(archive_path, "r:*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            fileobj = tar.extractfile(member)
+            if member.name == MANIFEST_NAME:
+                manifest = json.loads(fileobj.read().decode("utf-8"))
+            else:
+                digests[member.name] = _sha256_file(fileobj)
+
+    if not manifest or manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{archive_path} is not a vector snapshot")
+    if manifest.get("version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Snapshot format version {manifest.get('version')} is not supported (expected {SNAPSHOT_FORMAT_VERSION})"
+        )
+    expected = manifest["files"]
+    for name, info in expected.items():
+        if name not in digests:
+            raise ValueError(f"Snapshot member {name} is missing")
+        if digests[name] != info["sha256"]:
+            raise ValueError(f"Checksum mismatch for snapshot member {name}")
+    unexpected = sorted(set(digests) - set(expected))
+    if unexpected:
+        raise ValueError(f"Snapshot has members not in its manifest: {unexpected[:5]}")
+    return manifest
+
+
+def _read_parts(tar: tarfile.TarFile, parts: List[str]) -> Iterator[Dict[str, Any]]:
+    """Pages of a collection, in export order."""
+    for part in parts:
+        vectors = np.load(io.BytesIO(tar.extractfile(f"{part}.npy").read()), allow_pickle=False)
+        records = [json.loads(line) for line in tar.extractfile(f"{part}.jsonl").read().decode("utf-8").splitlines()]
+        yield {
+            "ids": [record["id"] for record in records],
+            "embeddings": vectors.tolist(),
+            "documents": [record["document"] for record in records],
+            "metadatas": [record["metadata"] for record in records]
+        }
+
+
+def import_snapshot(
+    client,
+    archive_path: str,
+    persist_directory: str,
+    alias: str,
+    replace: bool = False,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Load a snapshot archive into a vector database.
+
+    Nothing may use the database meanwhile. The local change log is
+    cleared, since the imported BM25 segment replays it from the start.
+
+    Args:
+        client: Chroma client of the vector database
+        archive_path: Path of the snapshot archive
+        persist_directory: Vector database directory (BM25 segment, aliases, state)
+        alias: Configured collection name on this node
+        replace: Delete collections of the snapshot that already hold vectors
+        force: Import even if this node's embedding backend differs from the snapshot's
+
+    Returns:
+        Dictionary with the snapshot timestamp, collection, model and vector counts
+
+    Raises:
+        ValueError: If the archive does not verify, the backend differs, or a
+            collection already holds vectors and replace is not set
+    """
+    manifest = verify_snapshot(archive_path)
+    model_name = manifest["embedding_model"]
+    if not force and model_registry.model_id(model_name) != manifest["model_id"]:
+        raise ValueError(
+            f"Snapshot vectors are {manifest['model_id']} but this node embeds queries as "
+            f"{model_registry.model_id(model_name)}; set EMBEDDING_BACKEND accordingly or use force"
+        )
+
+    existing = {getattr(collection, "name", collection): collection for collection in client.list_collections()}
+    occupied = [entry["name"] for entry in manifest["collections"]
+                if entry["name"] in existing and existing[entry["name"]].count()]
+    if occupied and not replace:
+        raise ValueError(f"Collections {occupied} already hold vectors; use replace to overwrite them")
+    for entry in manifest["collections"]:
+        if entry["name"] in existing:
+            client.delete_collection(entry["name"])
+
+    counts: Dict[str, int] = {}
+    with tarfile.open(archive_path, "r:*") as tar:
+        for entry in manifest["collections"]:
+            collection = client.create_collection(entry["name"], metadata=entry["metadata"] or None)
+            for page in _read_parts(tar, entry["parts"]):
+                collection.add(**page)
+            counts[entry["name"]] = collection.count()
+            if counts[entry["name"]] != entry["count"]:
+                raise RuntimeError(f"Imported {counts[entry['name']]} of {entry['count']} vectors into {entry['name']}")
+            logger.info(f"Imported {counts[entry['name']]} vectors into {entry['name']}")
+
+        os.makedirs(persist_directory, exist_ok=True)
+        segment_path = os.path.join(persist_directory, BM25_SEGMENT_NAME)
+        if manifest["bm25"]:
+            with open(f"{segment_path}.tmp", "wb") as f:
+                shutil.copyfileobj(tar.extractfile(manifest["bm25"]["file"]), f)
+            os.replace(f"{segment_path}.tmp", segment_path)
+        elif os.path.exists(segment_path):
+            os.remove(segment_path)
+
+    # Earlier changes belong to the replaced collections
+    change_log_path = os.path.join(persist_directory, CHANGE_LOG_FILENAME)
+    if os.path.exists(change_log_path):
+        ChunkChangeLog.for_directory(persist_directory).truncate(time.time_ns())
+
+    CollectionAliases.for_directory(persist_directory).update(alias, lambda entry: {
+        "collection": manifest["collection"],
+        "model": model_name,
+        "imported_at": datetime.now().isoformat()
+    })
+    state = {
+        SNAPSHOT_TS_KEY: manifest["snapshot_ts"],
+        "snapshot_created_at": manifest["created_at"],
+        "collection": manifest["collection"],
+        "embedding_model": model_name,
+        "imported_at": datetime.now().isoformat(),
+        "caught_up_at": None
+    }
+    write_snapshot_state(persist_directory, state)
+    logger.info(f"Snapshot {archive_path} imported; documents changed since it are caught up on next start")
+    return {**state, "vectors": counts}
+
+
+def read_snapshot_state(persist_directory: str) -> Optional[Dict[str, Any]]:
+    """State of the last imported snapshot, None if none was imported."""
+    try:
+        with open(os.path.join(persist_directory, SNAPSHOT_STATE_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot_state(persist_directory: str, state: Dict[str, Any]) -> None:
+    """Atomically replace the snapshot state file."""
+    path = os.path.join(persist_directory, SNAPSHOT_STATE_FILENAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def catch_up_pending(persist_directory: str) -> bool:
+    """Whether an imported snapshot still has to catch up on later changes."""
+    state = read_snapshot_state(persist_directory)
+    return bool(state) and not state.get("caught_up_at")
+
+
+@contextmanager
+def _catch_up_lock(persist_directory: str):
+    """Yield whether this process got the catch-up lock (one worker runs it)."""
+    with open(os.path.join(persist_directory, f"{SNAPSHOT_STATE_FILENAME}.lock"), "a") as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def catch_up_snapshot(
+    persist_directory: str,
+    store: Any,
+    embed_document: Callable[[str], Dict[str, Any]],
+    change_log: Optional[Any] = None,
+    load_changed_documents: Callable[[float], List[str]] = load_postgres_changed_documents,
+    load_documents: Callable[[], Dict[str, str]] = load_postgres_documents,
+    margin: float = DEFAULT_CATCH_UP_MARGIN
+) -> Dict[str, Any]:
+    """
+    Bring an imported snapshot up to date with Postgres.
+
+    Re-embeds documents created or updated since the snapshot and documents
+    that have no vectors, then sweeps chunks of documents deleted since.
+    The indexer logs its changes, so the BM25 index follows. A failed
+    catch-up stays pending and is retried on the next start.
+
+    Args:
+        persist_directory: Vector database directory
+        store: LangChainChromaStore of the active collection
+        embed_document: Embeds a document by ID and returns a result with "success"
+        change_log: ChunkChangeLog that swept chunks are recorded in (optional)
+        load_changed_documents: Reads the IDs of documents changed since a Unix timestamp
+        load_documents: Reads document ID -> user ID of every document
+        margin: Seconds before the snapshot timestamp that changes are caught up from
+
+    Returns:
+        Dictionary with the re-embedded, failed and swept counts, or
+        "skipped" with the reason when nothing was done
+    """
+    with _catch_up_lock(persist_directory) as locked:
+        if not locked:
+            return {"skipped": "catch-up is running in another process"}
+        state = read_snapshot_state(persist_directory)
+        if not state or state.get("caught_up_at"):
+            return {"skipped": "no snapshot to catch up"}
+
+        started = time.time()
+        since = state[SNAPSHOT_TS_KEY] / 1e9 - margin
+        maintenance = VectorStoreMaintenance(store, change_log=change_log, load_documents=load_documents)
+        embedded = {str(metadata.get("document_id") or "") for _, _, metadata in maintenance.scan()}
+        known = load_documents()
+        targets = sorted(set(load_changed_documents(since)) | (set(known) - embedded))
+        logger.info(f"Catching up snapshot: re-embedding {len(targets)} documents changed since it or without vectors")
+
+        failed = []
+        for document_id in targets:
+            if not embed_document(document_id).get("success"):
+                failed.append(document_id)
+        # Documents deleted since the snapshot
+        swept = maintenance.sweep(dry_run=False)
+
+        result = {
+            "documents": len(targets),
+            "embedded": len(targets) - len(failed),
+            "failed": len(failed),
+            "failed_sample": failed[:20],
+            "removed_chunks": swept["removed_chunks"],
+            "elapsed_seconds": round(time.time() - started, 1)
+        }
+        write_snapshot_state(persist_directory, {**state, "caught_up_at": datetime.now().isoformat(), "catch_up": result})
+        logger.info(f"Snapshot caught up: {result}")
+        return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    from .chroma_client import DEFAULT_CLIENT_MODE, DEFAULT_SERVER_URL, CLIENT_MODES, server_url_for
+
+    parser = argparse.ArgumentParser(description="Export, verify and import vector store snapshots")
+    parser.add_argument("--db", default=settings.VECTOR_DB_PATH, help="Chroma persist directory")
+    parser.add_argument("--collection", default=settings.COLLECTION_NAME, help="Configured collection name")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL,
+                        help="Configured embedding model (used until the first migration switch)")
+    parser.add_argument("--client-mode", choices=CLIENT_MODES, default=DEFAULT_CLIENT_MODE)
+    parser.add_argument("--server-url", default=DEFAULT_SERVER_URL, help="Chroma server in http client mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a snapshot archive (.tar or .tar.gz)")
+    export_parser.add_argument("archive")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    verify_parser = commands.add_parser("verify", help="Check the version and checksums of an archive")
+    verify_parser.add_argument("archive")
+    import_parser = commands.add_parser("import", help="Load an archive into this node (API stopped)")
+    import_parser.add_argument("archive")
+    import_parser.add_argument("--replace", action="store_true", help="Overwrite collections that hold vectors")
+    import_parser.add_argument("--force", action="store_true", help="Import even if the embedding backend differs")
+    commands.add_parser("catch-up", help="Re-embed documents changed since the imported snapshot")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        result = verify_snapshot(args.archive)
+    elif args.command == "catch-up":
+        from ...document_embedding_service import document_embedding_service
+        result = document_embedding_service.catch_up_after_snapshot()
+    else:
+        server_url = server_url_for(args.client_mode, args.server_url)
+        client = model_registry.acquire_client(args.db, server_url)
+        try:
+            if args.command == "export":
+                manifest = export_snapshot(
+                    client, args.archive, args.collection, args.model,
+                    persist_directory=args.db, page_size=args.page_size,
+                    scoring_mode=settings.BM25_SCORING_MODE
+                )
+                result = {key: value for key, value in manifest.items() if key != "files"}
+            else:
+                result = import_snapshot(client, args.archive, args.db, args.collection, replace=args.replace, force=args.force)
+        finally:
+            model_registry.release_client(args.db, server_url)
+    print(json.dumps(result, indent=2))
@@ -9,6 +9,7 @@ import os
 import sys
 import uuid
 import logging
+import threading
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
@@ -17,9 +18,17 @@ app_dir = os.path.join(os.path.dirname(__file__), '..')
 if app_dir not in sys.path:
     sys.path.append(app_dir)
 
-from services.chatbot.vector_db.chunking import DocumentChunker
-from services.chatbot.vector_db.indexing import LangChainDocumentIndexer
-from services.chatbot.vector_db.langchain_chroma import LangChainChromaStore
+# Relative imports, so the vector DB modules (and the shared model registry)
+# are the same module objects the chat service uses
+from .chatbot.vector_db.chunking import DocumentChunker
+from .chatbot.vector_db.indexing import LangChainDocumentIndexer
+from .chatbot.vector_db.langchain_chroma import LangChainChromaStore
+from .chatbot.vector_db.change_log import ChunkChangeLog
+from .chatbot.vector_db.chunk_embedding_cache import ChunkEmbeddingCache
+from .chatbot.vector_db.embedding_batcher import EmbeddingBatcher
+from .chatbot.vector_db.model_registry import model_registry
+from .chatbot.vector_db.model_migration import CollectionAliases, ShadowWriter
+from .chatbot.vector_db.vector_snapshot import catch_up_pending, catch_up_snapshot
 from core.database import db_manager
 from core.config import settings
 
@@ -33,27 +42,69 @@ class DocumentEmbeddingService:
         # Use centralized config - same path as chat service
         self.db_path = os.path.abspath(settings.VECTOR_DB_PATH)
         self.collection_name = settings.COLLECTION_NAME
+        self.embedding_model = settings.EMBEDDING_MODEL
         self.chunk_size = settings.CHUNK_SIZE
         self.chunk_overlap = settings.CHUNK_OVERLAP
         
+        # Chunk changes are logged for the BM25 index, which only exists with hybrid search
+        self.log_changes = os.getenv('ENABLE_HYBRID_SEARCH', 'false').lower() in ('true', '1', 'yes', 'on')
+        
         # Initialize components
         self.vectorstore = None
         self.chunker = None
         self.indexer = None
+        self.batcher = None
+        self.shadow_writer = None
+        # The collection name is an alias, switched by embedding model migrations
+        self.aliases = CollectionAliases.for_directory(self.db_path)
+        self._active = None
+        self._init_lock = threading.Lock()
         
         logger.info(f"DocumentEmbeddingService initialized with ChromaDB path: {self.db_path}")
     
     def _initialize_components(self):
-        """Lazy initialization of ChromaDB components"""
-        if self.vectorstore is None:
-            try:
-                self.vectorstore = LangChainChromaStore(self.db_path, self.collection_name)
-                self.chunker = DocumentChunker(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
-                self.indexer = LangChainDocumentIndexer(self.vectorstore, self.chunker)
-                logger.info("ChromaDB components initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize ChromaDB components: {str(e)}")
-                raise
+        """Lazy initialization of ChromaDB components, again after a model migration switch"""
+        # Concurrent uploads may get here together; initialize only once
+        with self._init_lock:
+            active = self.aliases.resolve(self.collection_name, self.embedding_model)
+            if self.indexer is None or active != self._active:
+                try:
+                    if self.indexer is not None:
+                        logger.info(f"Collection {self.collection_name} switched to {active[0]} ({active[1]})")
+                        self._release_components()
+                    vectorstore = LangChainChromaStore(self.db_path, active[0], embedding_model=active[1])
+                    self.chunker = DocumentChunker(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+                    # Chunks of concurrent embed_document calls are encoded together
+                    self.batcher = EmbeddingBatcher(
+                        vectorstore.embed_documents,
+                        batch_size=settings.EMBEDDING_BATCH_SIZE,
+                        max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS
+                    )
+                    self.indexer = LangChainDocumentIndexer(
+                        vectorstore,
+                        self.chunker,
+                        change_log=ChunkChangeLog.for_directory(self.db_path) if self.log_changes else None,
+                        embedding_cache=ChunkEmbeddingCache.for_directory(
+                            self.db_path, model_registry.model_id(vectorstore.embedding_model)
+                        ),
+                        embedding_batcher=self.batcher,
+                        document_vectors=vectorstore.document_vectors
+                    )
+                    # New uploads are also written to the other collection of a running migration
+                    self.shadow_writer = ShadowWriter(vectorstore, self.collection_name, self.aliases)
+                    self.vectorstore = vectorstore
+                    self._active = active
+                    logger.info("ChromaDB components initialized successfully")
+                except Exception as e:
+                    logger.error(f"Failed to initialize ChromaDB components: {str(e)}")
+                    raise
+    
+    def _release_components(self):
+        """Stop the batcher and release the stores of the previous active collection"""
+        self.batcher.stop()
+        self.shadow_writer.cleanup()
+        self.vectorstore.cleanup()
+        self.indexer = None
     
     def get_document_content_from_db(self, document_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -134,6 +185,9 @@ class DocumentEmbeddingService:
             # Create embeddings using the indexer
             chunk_ids = self.indexer.index_document(doc_data)
             
+            # Dual-write during an embedding model migration (failures are logged there)
+            self.shadow_writer.mirror_document(document_id, chunk_ids, doc_data.get('user_id'))
+            
             logger.info(f"Successfully embedded document {document_id}: {len(chunk_ids)} chunks created")
             
             return {
@@ -178,13 +232,18 @@ class DocumentEmbeddingService:
         """
         try:
             self._initialize_components()
-            collection = self.vectorstore.client.get_collection(name=self.collection_name)
-            count = collection.count()
+            count = self.vectorstore.count()
             
             return {
                 'collection_name': self.collection_name,
+                'active_collection': self.vectorstore.collection_name,
+                'embedding_model': self.vectorstore.embedding_model,
                 'total_chunks': count,
-                'db_path': self.db_path
+                'sharding': self.vectorstore.get_shard_stats(),
+                'db_path': self.db_path,
+                'embedding_batcher': self.batcher.get_stats() if self.batcher else None,
+                'embedding_cache': self.indexer.embedding_cache.get_stats() if self.indexer else None,
+                'quantization': self.vectorstore.get_quantization_stats()
             }
         except Exception as e:
             logger.error(f"Error getting collection info: {str(e)}")
@@ -206,19 +265,49 @@ class DocumentEmbeddingService:
         """
         try:
             self._initialize_components()
-            collection = self.vectorstore.client.get_collection(name=self.collection_name)
             
-            # Query for chunks with this document_id
-            results = collection.get(
+            # Query for chunks with this document_id (in any shard)
+            results = self.vectorstore.get_documents(
                 where={"document_id": document_id},
                 limit=1
             )
             
-            return len(results['ids']) > 0
+            return len(results) > 0
             
         except Exception as e:
             logger.error(f"Error checking if document {document_id} is embedded: {str(e)}")
             return False
+    
+    def catch_up_after_snapshot(self) -> Dict[str, Any]:
+        """
+        Re-embed documents changed since an imported vector snapshot
+        
+        Returns:
+            Dictionary with catch-up results (see vector_snapshot.catch_up_snapshot)
+        """
+        if not catch_up_pending(self.db_path):
+            return {'skipped': 'no snapshot to catch up'}
+        self._initialize_components()
+        return catch_up_snapshot(
+            self.db_path,
+            self.vectorstore,
+            self.embed_document,
+            change_log=self.indexer.change_log
+        )
+    
+    def start_snapshot_catch_up(self) -> None:
+        """Catch up on an imported vector snapshot in a background thread, if one is pending"""
+        if not catch_up_pending(self.db_path):
+            return
+        
+        def run():
+            try:
+                result = self.catch_up_after_snapshot()
+                logger.info(f"Snapshot catch-up finished: {result}")
+            except Exception as e:
+                logger.error(f"Snapshot catch-up failed (retried on next start): {str(e)}")
+        
+        threading.Thread(target=run, daemon=True, name="snapshot-catch-up").start()
 
 
 # Global instance for use across the application
@@ -11,8 +11,9 @@ import time
 import gc
 from abc import ABC, abstractmethod
 
-# Add the app directory to Python path
+# Add the app directory to Python path, and the project root for app.core.config
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from services.chatbot.vector_db.langchain_chroma import LangChainChromaStore
 from langchain.schema import Document
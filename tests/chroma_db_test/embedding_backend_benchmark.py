@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Embedding Backend Benchmark
+Measures encode throughput of the fp32 PyTorch, ONNX and int8 ONNX backends
+"""
+
+import os
+import time
+from base_test import BaseChromaDBTest
+
+
+class EmbeddingBackendBenchmark(BaseChromaDBTest):
+    """Compare embedding throughput of the available backends on this machine"""
+    
+    def run_test(self):
+        """Benchmark every backend on the same chunk-sized texts"""
+        print("Benchmarking embedding backends...")
+        
+        from services.chatbot.vector_db.model_registry import _load_sentence_transformer, BACKENDS
+        
+        model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        # Chunk-sized texts, as produced by the chunker during ingestion
+        texts = [doc.page_content * 4 for doc in self.create_test_documents(256)]
+        
+        results = {}
+        for backend in BACKENDS:
+            try:
+                model = _load_sentence_transformer(model_name, backend)
+            except Exception as e:
+                print(f"{backend}: unavailable ({e})")
+                continue
+            
+            # Warm-up run so one-off graph and session setup is not timed
+            model.encode(texts[:32])
+            
+            start_time = time.time()
+            model.encode(texts, batch_size=32)
+            chunk_seconds = time.time() - start_time
+            
+            start_time = time.time()
+            for text in texts[:64]:
+                model.encode([text])
+            query_ms = (time.time() - start_time) * 1000 / 64
+            
+            results[backend] = {
+                'chunks_per_second': len(texts) / chunk_seconds,
+                'query_ms': query_ms
+            }
+            print(f"{backend}: {results[backend]['chunks_per_second']:.1f} chunks/s, {query_ms:.2f} ms/query")
+        
+        if 'torch' not in results or len(results) < 2:
+            self.last_result_details = f"Not enough backends available to compare: {list(results)}"
+            return False
+        
+        print("\nBackend throughput summary (relative to fp32 torch):")
+        baseline = results['torch']['chunks_per_second']
+        for backend, result in results.items():
+            print(f"  {backend:10s} {result['chunks_per_second']:8.1f} chunks/s  "
+                  f"x{result['chunks_per_second'] / baseline:.2f}  {result['query_ms']:6.2f} ms/query")
+        
+        self.last_result_details = ", ".join(
+            f"{backend}: {result['chunks_per_second']:.0f} chunks/s" for backend, result in results.items()
+        )
+        return True
@@ -4,8 +4,10 @@ Embedding Consistency Test for ChromaDB
 Tests that embeddings remain consistent across operations
 """
 
+import os
 import time
 import json
+import numpy as np
 from base_test import BaseChromaDBTest
 
 
@@ -31,6 +33,11 @@ class EmbeddingConsistencyTest(BaseChromaDBTest):
         if not restart_consistency_result:
             return False
         
+        # Test 4: Quantized/ONNX backend consistency with fp32
+        backend_consistency_result = self.test_backend_consistency()
+        if not backend_consistency_result:
+            return False
+        
         print("All embedding consistency tests passed!")
         self.last_result_details = "All embedding consistency checks successful"
         return True
@@ -225,3 +232,53 @@ class EmbeddingConsistencyTest(BaseChromaDBTest):
             print("Restart consistency: FAILED")
             self.last_result_details = "Results not consistent after restart"
             return False
+    
+    def test_backend_consistency(self):
+        """Test that the ONNX / int8 backend produces vectors close to fp32 PyTorch"""
+        print("\nTest 4: Backend consistency")
+        
+        from services.chatbot.vector_db.model_registry import _load_sentence_transformer, BACKEND_TORCH
+        
+        backend = os.getenv("EMBEDDING_BACKEND", "onnx-int8").lower()
+        if backend == BACKEND_TORCH:
+            backend = "onnx-int8"
+        model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        
+        documents = [doc.page_content for doc in self.create_test_documents(5)] + [
+            "The quarterly report shows revenue growth of twelve percent.",
+            "Patient was prescribed 20mg of atorvastatin daily.",
+            "The lease agreement terminates on the last day of March.",
+            "Neural networks learn representations from labelled data.",
+            "Invoice 4471 is overdue by thirty days."
+        ]
+        queries = ["revenue growth", "medication dosage", "contract end date", "deep learning", "late payment"]
+        
+        reference = _load_sentence_transformer(model_name, BACKEND_TORCH)
+        candidate = _load_sentence_transformer(model_name, backend)
+        
+        ref_docs = reference.encode(documents, normalize_embeddings=True)
+        cand_docs = candidate.encode(documents, normalize_embeddings=True)
+        ref_queries = reference.encode(queries, normalize_embeddings=True)
+        cand_queries = candidate.encode(queries, normalize_embeddings=True)
+        
+        # Per-text cosine similarity between the two backends
+        cosines = np.sum(ref_docs * cand_docs, axis=1)
+        print(f"Cosine fp32 vs {backend}: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+        
+        # Top-3 retrieval agreement when querying fp32-indexed vectors with candidate queries
+        ref_top = np.argsort(-ref_queries @ ref_docs.T, axis=1)[:, :3]
+        mixed_top = np.argsort(-cand_queries @ ref_docs.T, axis=1)[:, :3]
+        overlap = np.mean([len(set(a) & set(b)) / 3 for a, b in zip(ref_top, mixed_top)])
+        top1 = np.mean(ref_top[:, 0] == mixed_top[:, 0])
+        print(f"Top-3 overlap: {overlap:.2%}, top-1 agreement: {top1:.2%}")
+        
+        if cosines.min() >= 0.97 and cosines.mean() >= 0.99 and top1 == 1.0 and overlap >= 0.9:
+            print("Backend consistency: PASSED")
+            return True
+        
+        print("Backend consistency: FAILED")
+        self.last_result_details = (
+            f"{backend} vectors drift from fp32: min cosine {cosines.min():.4f}, "
+            f"mean {cosines.mean():.4f}, top-3 overlap {overlap:.2%}"
+        )
+        return False
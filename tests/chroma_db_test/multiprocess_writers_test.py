@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Multi-Process Writers Test for ChromaDB
+Tests several worker processes writing to and searching one Chroma server
+(CHROMA_CLIENT_MODE=http), the way several uvicorn workers share a node
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import multiprocessing
+from base_test import BaseChromaDBTest
+from services.chatbot.vector_db.langchain_chroma import LangChainChromaStore
+from langchain.schema import Document
+
+NUM_WRITERS = 4
+DOCS_PER_WRITER = 25
+COLLECTION_NAME = "test_documents"
+
+
+def _free_port():
+    """Pick a free local TCP port for the test server"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_documents(writer_id, db_path, server_url):
+    """Writer process: add documents through its own HTTP client, then search them"""
+    store = LangChainChromaStore(
+        persist_directory=db_path,
+        collection_name=COLLECTION_NAME,
+        client_mode="http",
+        chroma_server_url=server_url
+    )
+    try:
+        documents = [
+            Document(
+                page_content=f"Writer {writer_id} document {i+1}. Content written by a separate worker process for multi-process testing.",
+                metadata={
+                    "document_id": f"writer_{writer_id}_doc_{i+1}",
+                    "filename": f"writer_{writer_id}_{i+1}.pdf",
+                    "writer_id": writer_id
+                }
+            )
+            for i in range(DOCS_PER_WRITER)
+        ]
+        start_time = time.time()
+        # Add in small batches so the writers interleave on the server
+        ids = []
+        for i in range(0, len(documents), 5):
+            batch = documents[i:i+5]
+            ids.extend(store.add_documents(batch, ids=[doc.metadata["document_id"] for doc in batch]))
+        write_time = time.time() - start_time
+
+        results = store.similarity_search(f"Writer {writer_id} document", k=5, filter={"writer_id": writer_id})
+        return {
+            'writer_id': writer_id,
+            'documents_added': len(ids),
+            'time': write_time,
+            'search_hits': len(results),
+            'success': len(ids) == DOCS_PER_WRITER and len(results) == 5
+        }
+    except Exception as e:
+        return {'writer_id': writer_id, 'documents_added': 0, 'time': 0, 'search_hits': 0,
+                'success': False, 'error': str(e)}
+    finally:
+        store.cleanup()
+
+
+class MultiProcessWritersTest(BaseChromaDBTest):
+    """Test several processes writing to one Chroma server"""
+
+    def __init__(self):
+        super().__init__()
+        self.server = None
+        self.server_url = os.getenv("CHROMA_SERVER_URL")
+
+    def setup(self):
+        """Start a Chroma server on a temporary database (unless CHROMA_SERVER_URL is set)"""
+        import tempfile
+        self.test_db_path = tempfile.mkdtemp(prefix="chroma_test_")
+        if not self.server_url:
+            port = _free_port()
+            chroma = shutil.which("chroma")
+            command = [chroma] if chroma else [sys.executable, "-c", "from chromadb.cli.cli import app; app()"]
+            self.server = subprocess.Popen(
+                command + ["run", "--path", self.test_db_path, "--port", str(port)],
+                # The server writes chroma.log into its working directory
+                cwd=self.test_db_path,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            self.server_url = f"http://localhost:{port}"
+        # The store connects with retries, so it waits for the server to come up
+        self.vectorstore = LangChainChromaStore(
+            persist_directory=self.test_db_path,
+            collection_name=COLLECTION_NAME,
+            client_mode="http",
+            chroma_server_url=self.server_url
+        )
+        print(f"Chroma server at {self.server_url} on {self.test_db_path}")
+
+    def teardown(self):
+        """Stop the server, then remove the database"""
+        if self.vectorstore:
+            self.vectorstore.cleanup()
+            self.vectorstore = None
+        if self.server:
+            self.server.terminate()
+            try:
+                self.server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.server.kill()
+            self.server = None
+            self.server_url = None
+        super().teardown()
+
+    def run_test(self):
+        """Test concurrent writer processes against one server"""
+        print("Testing multi-process writers...")
+
+        # Each writer is a separate process with its own client, like a uvicorn worker
+        start_time = time.time()
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(NUM_WRITERS) as pool:
+            results = pool.starmap(
+                write_documents,
+                [(writer_id, self.test_db_path, self.server_url) for writer_id in range(NUM_WRITERS)]
+            )
+        total_time = time.time() - start_time
+
+        successful_writers = sum(1 for r in results if r['success'])
+        total_docs_added = sum(r['documents_added'] for r in results)
+        expected_total = NUM_WRITERS * DOCS_PER_WRITER
+
+        print(f"Writers completed in {total_time:.2f}s")
+        print(f"Successful writers: {successful_writers}/{NUM_WRITERS}")
+        print(f"Total documents added: {total_docs_added}/{expected_total}")
+        for result in results:
+            if not result['success']:
+                print(f"ERROR in writer {result['writer_id']}: {result.get('error', 'search returned ' + str(result['search_hits']))}")
+
+        # Every write must be visible to the other processes' clients
+        stored = len(self.vectorstore.get_chunk_ids())
+        missing = [
+            writer_id for writer_id in range(NUM_WRITERS)
+            if not self.vectorstore.similarity_search(f"Writer {writer_id} document", k=1, filter={"writer_id": writer_id})
+        ]
+        print(f"Documents visible from the test process: {stored}/{expected_total}")
+
+        if successful_writers == NUM_WRITERS and stored == expected_total and not missing:
+            print("Multi-process writers: PASSED")
+            self.last_result_details = f"{NUM_WRITERS} writer processes, {stored} documents"
+            return True
+        else:
+            print("Multi-process writers: FAILED")
+            self.last_result_details = f"Multi-process writers failed: {stored}/{expected_total} documents stored, writers without results: {missing}"
+            return False
+
+
+if __name__ == "__main__":
+    sys.exit(0 if MultiProcessWritersTest().run() else 1)
@@ -2,12 +2,21 @@
 """
 Performance Test for ChromaDB
 Tests insertion and query performance at different scales
+
+Run with --hnsw-sweep to benchmark HNSW index parameters instead:
+    python performance_test.py --hnsw-sweep
 """
 
+import argparse
+import itertools
+import tempfile
 import time
 import psutil
 import os
+import numpy as np
 from base_test import BaseChromaDBTest
+from services.chatbot.vector_db.langchain_chroma import LangChainChromaStore
+from langchain.schema import Document
 
 
 class PerformanceTest(BaseChromaDBTest):
@@ -188,3 +197,140 @@ class PerformanceTest(BaseChromaDBTest):
             self.last_result_details = "Performance benchmarks failed"
         
         return all_passed
+
+
+class HNSWSweepBenchmark(BaseChromaDBTest):
+    """Sweep HNSW index parameters and measure recall against brute force"""
+    
+    def __init__(self, corpus_size=20000, dimensions=384, query_count=200, k=10,
+                 spaces=("l2", "cosine"), m_values=(8, 16, 32), construction_efs=(64, 200),
+                 search_efs=(10, 50, 200)):
+        super().__init__()
+        self.corpus_size = corpus_size
+        self.dimensions = dimensions
+        self.query_count = query_count
+        self.k = k
+        self.spaces = spaces
+        self.m_values = m_values
+        self.construction_efs = construction_efs
+        self.search_efs = search_efs
+    
+    def create_synthetic_corpus(self):
+        """Create clustered unit vectors (like sentence embeddings) and queries near them"""
+        rng = np.random.default_rng(42)
+        centers = rng.normal(size=(max(1, self.corpus_size // 200), self.dimensions))
+        vectors = centers[rng.integers(0, len(centers), self.corpus_size)]
+        vectors = vectors + rng.normal(scale=0.6, size=vectors.shape)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[rng.choice(self.corpus_size, self.query_count, replace=False)]
+        queries = queries + rng.normal(scale=0.3, size=queries.shape)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        return vectors.astype(np.float32), queries.astype(np.float32)
+    
+    def ground_truth(self, vectors, queries, space):
+        """Exact top k chunk indexes per query by brute force"""
+        if space == "l2":
+            distances = (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+        elif space == "cosine":
+            distances = -(queries @ vectors.T) / np.linalg.norm(vectors, axis=1)[None, :]
+        else:
+            distances = -(queries @ vectors.T)
+        top = np.argpartition(distances, self.k, axis=1)[:, :self.k]
+        return [set(row) for row in top]
+    
+    def directory_size_mb(self, path):
+        """Size of all files below a directory"""
+        total = 0
+        for root, _, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total / 1024 / 1024
+    
+    def run_configuration(self, vectors, queries, truth, space, m, construction_ef, search_ef):
+        """Build one collection with the given parameters and measure it"""
+        path = tempfile.mkdtemp(prefix="hnsw_", dir=self.test_db_path)
+        store = LangChainChromaStore(
+            persist_directory=path,
+            collection_name="sweep",
+            hnsw_space=space,
+            hnsw_m=m,
+            hnsw_construction_ef=construction_ef,
+            hnsw_search_ef=search_ef
+        )
+        try:
+            documents = [Document(page_content=f"chunk {i}", metadata={"chunk_index": i}) for i in range(len(vectors))]
+            start_time = time.time()
+            for start in range(0, len(vectors), 5000):
+                store.add_documents(
+                    documents[start:start + 5000],
+                    ids=[str(i) for i in range(start, min(start + 5000, len(vectors)))],
+                    embeddings=vectors[start:start + 5000].tolist()
+                )
+            # The first query finishes any pending index work
+            store.similarity_search_by_vector_with_score(queries[0].tolist(), k=self.k)
+            build_seconds = time.time() - start_time
+            
+            latencies = []
+            recall = 0.0
+            for query, expected in zip(queries, truth):
+                start_time = time.perf_counter()
+                results = store.similarity_search_by_vector_with_score(query.tolist(), k=self.k)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                recall += len({doc.metadata["chunk_index"] for doc, _ in results} & expected) / self.k
+            
+            return {
+                'space': space,
+                'M': m,
+                'construction_ef': construction_ef,
+                'search_ef': search_ef,
+                'recall': recall / len(queries),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'build_s': build_seconds,
+                'disk_mb': self.directory_size_mb(path)
+            }
+        finally:
+            store.cleanup()
+    
+    def run_test(self):
+        """Sweep every parameter combination and print a table"""
+        print(f"Sweeping HNSW parameters on {self.corpus_size} synthetic vectors ({self.dimensions} dims), "
+              f"{self.query_count} queries, recall@{self.k}...")
+        vectors, queries = self.create_synthetic_corpus()
+        
+        results = []
+        for space in self.spaces:
+            truth = self.ground_truth(vectors, queries, space)
+            for m, construction_ef, search_ef in itertools.product(self.m_values, self.construction_efs, self.search_efs):
+                result = self.run_configuration(vectors, queries, truth, space, m, construction_ef, search_ef)
+                results.append(result)
+                print(f"{space:>6} M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                      f"recall {result['recall']:.3f}  p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms  "
+                      f"build {result['build_s']:.1f} s  disk {result['disk_mb']:.1f} MB")
+        
+        best = max(results, key=lambda result: (result['recall'], -result['p95_ms']))
+        self.last_result_details = (
+            f"Best recall@{self.k} {best['recall']:.3f} with space={best['space']} M={best['M']} "
+            f"construction_ef={best['construction_ef']} search_ef={best['search_ef']}"
+        )
+        print(self.last_result_details)
+        return bool(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChromaDB performance test")
+    parser.add_argument("--hnsw-sweep", action="store_true", help="Benchmark HNSW parameters instead")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    
+    if args.hnsw_sweep:
+        HNSWSweepBenchmark(
+            corpus_size=args.corpus_size,
+            dimensions=args.dimensions,
+            query_count=args.queries,
+            k=args.k
+        ).run()
+    else:
+        PerformanceTest().run()
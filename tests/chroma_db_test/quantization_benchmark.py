@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Quantized Index Benchmark
+Measures recall and memory of the int8 / binary quantized index against
+plain Chroma similarity_search_with_score. Memory is reported both for the
+index alone and as the resident memory of the whole process, since the
+index is held in addition to Chroma's float32 HNSW index.
+"""
+
+import os
+import random
+import time
+import psutil
+from base_test import BaseChromaDBTest
+from services.chatbot.vector_db.langchain_chroma import LangChainChromaStore
+from langchain.schema import Document
+
+
+TOPICS = [
+    "quarterly revenue and operating margin", "patient medication and dosage", "lease agreement and termination",
+    "neural network training data", "invoice payment and overdue balance", "employee onboarding and benefits",
+    "software release and bug fixes", "shipping delays and inventory", "tax deductions and filing deadlines",
+    "clinical trial results and side effects"
+]
+FILLER = ["report", "summary", "section", "table", "figure", "note", "appendix", "review", "update", "draft"]
+
+
+class QuantizationBenchmark(BaseChromaDBTest):
+    """Compare quantized first-pass search with exact Chroma search"""
+    
+    def create_varied_documents(self, count):
+        """Create chunks on different topics so neighbours are not all ties"""
+        rng = random.Random(42)
+        documents = []
+        for i in range(count):
+            topic = TOPICS[i % len(TOPICS)]
+            words = " ".join(rng.choice(FILLER) for _ in range(12))
+            documents.append(Document(
+                page_content=f"{topic} {words} item {i}",
+                metadata={"document_id": f"doc_{i % 25}", "chunk_index": i}
+            ))
+        return documents
+    
+    def run_test(self):
+        """Measure recall@k and memory for every quantization mode"""
+        print("Benchmarking quantized vector index...")
+        
+        documents = self.create_varied_documents(2000)
+        self.vectorstore.add_documents(documents)
+        queries = [f"{topic} {filler}" for topic in TOPICS for filler in FILLER[:3]]
+        k = 10
+        
+        process = psutil.Process(os.getpid())
+        start_time = time.time()
+        exact = [self.vectorstore.similarity_search_with_score(query, k=k) for query in queries]
+        exact_ms = (time.time() - start_time) * 1000 / len(queries)
+        # Chroma's HNSW index is loaded by now
+        chroma_rss_mb = process.memory_info().rss / (1024 * 1024)
+        print(f"Chroma search: {exact_ms:.2f} ms/query, process RSS {chroma_rss_mb:.1f} MB")
+        
+        results = {}
+        for mode, rescore_factor in [("int8", 4), ("binary", 10)]:
+            store = LangChainChromaStore(
+                persist_directory=self.test_db_path,
+                collection_name="test_documents",
+                quantization=mode,
+                rescore_factor=rescore_factor
+            )
+            try:
+                # First search starts filling the index in the background
+                store.similarity_search_with_score(queries[0], k=k)
+                deadline = time.time() + 60
+                while not store.get_quantization_stats()["ready"] and time.time() < deadline:
+                    time.sleep(0.05)
+                
+                start_time = time.time()
+                quantized = [store.similarity_search_with_score(query, k=k) for query in queries]
+                query_ms = (time.time() - start_time) * 1000 / len(queries)
+                
+                recall = sum(
+                    len({doc.page_content for doc, _ in a} & {doc.page_content for doc, _ in b}) / k
+                    for a, b in zip(exact, quantized)
+                ) / len(queries)
+                stats = store.get_quantization_stats()
+                rss_mb = process.memory_info().rss / (1024 * 1024)
+                results[mode] = {'recall': recall, 'query_ms': query_ms, 'rss_mb': rss_mb, **stats}
+                print(f"{mode}: recall@{k} {recall:.3f}, {query_ms:.2f} ms/query, "
+                      f"codes {stats['memory_mb']} MB (float32 vectors {stats['float32_mb']} MB), "
+                      f"process RSS {rss_mb:.1f} MB ({rss_mb - chroma_rss_mb:+.1f} MB over Chroma alone)")
+            finally:
+                store.cleanup()
+        
+        self.last_result_details = ", ".join(
+            f"{mode}: recall {result['recall']:.3f}, RSS {result['rss_mb'] - chroma_rss_mb:+.1f} MB" for mode, result in results.items()
+        )
+        
+        # Rescoring makes int8 practically exact; binary trades some recall for smaller codes
+        return results["int8"]["recall"] >= 0.99 and results["binary"]["recall"] >= 0.9
@@ -8,14 +8,18 @@ import sys
 import time
 from datetime import datetime
 
-# Add the app directory to Python path
+# Add the app directory to Python path, and the project root for app.core.config
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from metadata_filtering_test import MetadataFilteringTest
 from performance_test import PerformanceTest
 from concurrent_access_test import ConcurrentAccessTest
+from multiprocess_writers_test import MultiProcessWritersTest
 from corruption_recovery_test import CorruptionRecoveryTest
 from embedding_consistency_test import EmbeddingConsistencyTest
+from embedding_backend_benchmark import EmbeddingBackendBenchmark
+from quantization_benchmark import QuantizationBenchmark
 from integration_test import IntegrationTest
 
 
@@ -27,8 +31,11 @@ class ChromaDBTestRunner:
             MetadataFilteringTest(),
             PerformanceTest(),
             ConcurrentAccessTest(),
+            MultiProcessWritersTest(),
             CorruptionRecoveryTest(),
             EmbeddingConsistencyTest(),
+            EmbeddingBackendBenchmark(),
+            QuantizationBenchmark(),
             IntegrationTest()
         ]
         self.results = {}
@@ -0,0 +1,127 @@
+"""
+Unit tests for the chunk change log and the BM25 change feed
+"""
+
+import pytest
+from langchain.schema import Document
+from app.services.chatbot.vector_db.change_log import ChunkChangeLog
+from app.services.chatbot.search.bm25_retriever import BM25Retriever
+from app.services.chatbot.search.bm25_change_feed import BM25ChangeFeed, APPLIED_TS_KEY
+
+
+class TestBM25ChangeFeed:
+    """Test suite for ChunkChangeLog and BM25ChangeFeed"""
+    
+    @pytest.fixture
+    def change_log(self, tmp_path):
+        """Create an empty change log"""
+        return ChunkChangeLog.for_directory(str(tmp_path))
+    
+    @pytest.fixture
+    def documents(self):
+        """Create chunks of two documents"""
+        return [
+            Document(page_content="Quarterly revenue grew by ten percent", metadata={"document_id": "a"}),
+            Document(page_content="Operating costs were flat this quarter", metadata={"document_id": "a"}),
+            Document(page_content="The contract renewal is due in March", metadata={"document_id": "b"})
+        ]
+    
+    def test_append_and_read(self, change_log, documents):
+        """Test that events are read back in order with increasing timestamps"""
+        change_log.record_added(["a:0", "a:1"], documents[:2])
+        change_log.record_deleted(chunk_ids=["a:0"])
+        
+        events, offset = change_log.read()
+        more, next_offset = change_log.read(offset)
+        
+        assert [event["op"] for event in events] == ["add", "add", "delete"]
+        assert events[0]["metadata"] == {"document_id": "a"}
+        assert events[0]["ts"] < events[1]["ts"] < events[2]["ts"]
+        assert more == [] and next_offset == offset
+    
+    def test_read_ignores_partial_line(self, change_log, documents):
+        """Test that a line still being written is left for the next read"""
+        change_log.record_added(["a:0"], documents[:1])
+        with open(change_log.path, "a") as f:
+            f.write('{"op": "delete"')
+        
+        events, offset = change_log.read()
+        
+        assert len(events) == 1
+        assert change_log.read(offset) == ([], offset)
+    
+    def test_feed_applies_adds_and_deletes(self, change_log, documents):
+        """Test that new chunks become searchable and deletes are applied"""
+        retriever = BM25Retriever()
+        feed = BM25ChangeFeed(retriever, change_log)
+        
+        change_log.record_added(["a:0", "a:1", "b:0"], documents)
+        assert feed.poll() == 3
+        assert [doc.metadata["chunk_id"] for doc, _ in retriever.search("contract renewal", k=5)] == ["b:0"]
+        
+        change_log.record_deleted(document_id="a")
+        assert feed.poll() == 1
+        assert retriever.N == 1
+        assert feed.poll() == 0
+    
+    def test_snapshot_truncates_log_and_resumes(self, change_log, documents, tmp_path):
+        """Test that a snapshot records the applied timestamp and a new feed resumes from it"""
+        snapshot_path = str(tmp_path / "bm25_index.seg")
+        retriever = BM25Retriever()
+        feed = BM25ChangeFeed(retriever, change_log, snapshot_path=snapshot_path)
+        
+        change_log.record_added(["a:0", "a:1"], documents[:2])
+        feed.poll()
+        assert feed.snapshot()
+        assert change_log.read()[0] == []
+        
+        # Written after the snapshot, must be replayed by a restarted feed
+        change_log.record_added(["b:0"], documents[2:])
+        
+        loaded = BM25Retriever.load_segment(snapshot_path)
+        restarted = BM25ChangeFeed(loaded, change_log, applied_ts=loaded.get_segment_meta()[APPLIED_TS_KEY])
+        
+        assert restarted.poll() == 1
+        assert loaded.N == 3
+        assert loaded.get_stats()["segment_documents"] == 2
+    
+    def test_feed_follows_rewritten_log(self, change_log, documents):
+        """Test that the feed picks up events after the log file is rewritten"""
+        retriever = BM25Retriever()
+        feed = BM25ChangeFeed(retriever, change_log)
+        
+        last_ts = change_log.record_added(["a:0", "a:1"], documents[:2])
+        feed.poll()
+        change_log.truncate(last_ts)
+        change_log.record_added(["b:0"], documents[2:])
+        
+        assert feed.poll() == 1
+        assert retriever.N == 3
+    
+    def test_truncation_waits_for_slowest_worker(self, change_log, documents, tmp_path):
+        """Test that one worker's snapshot keeps events another worker has not applied"""
+        snapshot_path = str(tmp_path / "bm25_index.seg")
+        fast = BM25ChangeFeed(BM25Retriever(), change_log, snapshot_path=snapshot_path)
+        slow_retriever = BM25Retriever()
+        slow = BM25ChangeFeed(slow_retriever, change_log)
+        
+        change_log.record_added(["a:0", "a:1"], documents[:2])
+        fast.poll()
+        assert fast.snapshot()
+        assert len(change_log.read()[0]) == 2
+        
+        assert slow.poll() == 2
+        assert slow_retriever.N == 2
+        fast.snapshot()
+        assert change_log.read()[0] == []
+        
+        # A stopped worker no longer holds back truncation, an expired one neither
+        change_log.record_added(["b:0"], documents[2:])
+        slow.stop()
+        fast.poll()
+        fast.snapshot()
+        assert change_log.read()[0] == []
+        change_log.record_applied("crashed", 0)
+        change_log.record_added(["c:0"], documents[:1])
+        fast.poll()
+        assert change_log.truncate_applied(fast.applied_ts, ttl=0) == 1
@@ -2,6 +2,7 @@
 Unit tests for BM25 Retriever
 """
 
+import threading
 import pytest
 from unittest.mock import Mock, patch
 from langchain.schema import Document
@@ -252,3 +253,412 @@ class TestBM25Retriever:
             docs_mixed = [doc.metadata["doc_id"] for doc, _ in results_mixed]
             
             assert docs_lower == docs_upper == docs_mixed
+    
+    def test_postings_lists(self, retriever, sample_documents):
+        """Test that postings map terms to (doc_idx, tf) in doc order"""
+        retriever.build_index(sample_documents)
+        
+        assert retriever.postings["brown"] == [(0, 1), (1, 1)]
+        assert retriever.postings["python"] == [(2, 1)]
+        assert all(
+            [doc_idx for doc_idx, _ in postings] == sorted(doc_idx for doc_idx, _ in postings)
+            for postings in retriever.postings.values()
+        )
+    
+    def test_search_only_scores_matching_documents(self, retriever, sample_documents):
+        """Test that only documents containing a query term are scored"""
+        retriever.build_index(sample_documents)
+        
+        scores = retriever._score_query(retriever._tokenize("brown fox"))
+        
+        assert set(scores.keys()) == {0, 1}
+        for doc_idx, score in scores.items():
+            assert score == pytest.approx(retriever._calc_bm25_score(["brown", "fox"], doc_idx))
+    
+    def test_add_documents_extends_postings(self, retriever, sample_documents):
+        """Test that incremental adds are searchable via the postings lists"""
+        retriever.build_index(sample_documents[:2])
+        retriever.add_documents(sample_documents[2:])
+        
+        results = retriever.search("python", k=5)
+        
+        assert [doc.metadata["doc_id"] for doc, _ in results] == ["3"]
+        assert retriever.postings["python"] == [(2, 1)]
+    
+    def test_sparse_mode_matches_postings(self, sample_documents):
+        """Test that sparse-matrix scoring ranks and scores like postings scoring"""
+        postings_retriever = BM25Retriever(scoring_mode="postings")
+        sparse_retriever = BM25Retriever(scoring_mode="sparse")
+        postings_retriever.build_index(sample_documents)
+        sparse_retriever.build_index(sample_documents)
+        
+        for query in ["brown fox", "python programming", "fox fox dog", "quantum physics"]:
+            expected = postings_retriever.search(query, k=3)
+            actual = sparse_retriever.search(query, k=3)
+            
+            assert [doc.metadata["doc_id"] for doc, _ in actual] == [doc.metadata["doc_id"] for doc, _ in expected]
+            for (_, actual_score), (_, expected_score) in zip(actual, expected):
+                assert actual_score == pytest.approx(expected_score)
+    
+    def test_search_batch(self, sample_documents):
+        """Test that batched queries return one result list per query"""
+        retriever = BM25Retriever(scoring_mode="sparse")
+        retriever.build_index(sample_documents)
+        queries = ["brown fox", "python", "quantum physics"]
+        
+        batches = retriever.search_batch(queries, k=2)
+        
+        assert len(batches) == 3
+        for query, results in zip(queries, batches):
+            assert [doc.metadata["doc_id"] for doc, _ in results] == \
+                [doc.metadata["doc_id"] for doc, _ in retriever.search(query, k=2)]
+        assert batches[2] == []
+    
+    def test_sparse_mode_after_add_documents(self, sample_documents):
+        """Test that the weight matrix is rebuilt after incremental adds"""
+        retriever = BM25Retriever(scoring_mode="sparse")
+        retriever.build_index(sample_documents[:2])
+        retriever.add_documents(sample_documents[2:])
+        
+        results = retriever.search("python", k=5)
+        
+        assert [doc.metadata["doc_id"] for doc, _ in results] == ["3"]
+    
+    def test_invalid_scoring_mode(self):
+        """Test that unknown scoring modes are rejected"""
+        with pytest.raises(ValueError):
+            BM25Retriever(scoring_mode="dense")
+    
+    @pytest.fixture
+    def chunked_documents(self):
+        """Create documents carrying chunk and document identifiers"""
+        return [
+            Document(
+                page_content="The quick brown fox jumps over the lazy dog",
+                metadata={"doc_id": "1", "chunk_id": "a:0", "document_id": "a"}
+            ),
+            Document(
+                page_content="A fast brown fox leaps across a sleepy canine",
+                metadata={"doc_id": "2", "chunk_id": "a:1", "document_id": "a"}
+            ),
+            Document(
+                page_content="Python programming language is powerful and versatile",
+                metadata={"doc_id": "3", "chunk_id": "b:0", "document_id": "b"}
+            ),
+            Document(
+                page_content="Brown bears and python snakes live in the wild",
+                metadata={"doc_id": "4", "chunk_id": "c:0", "document_id": "c"}
+            )
+        ]
+    
+    def test_sparse_mode_batches_weight_rebuilds(self, chunked_documents):
+        """Test that single adds and deletes are served without rebuilding the weight matrix each time"""
+        retriever = BM25Retriever(scoring_mode="sparse")
+        retriever.sparse_rebuild_ratio = 0.7
+        retriever.build_index(chunked_documents[:3])
+        retriever.search("fox", k=5)
+        weights = retriever._weights
+        
+        retriever.add_documents(chunked_documents[3:])
+        retriever.delete_chunks(["a:1"])
+        results = retriever.search("brown python", k=5)
+        
+        assert retriever._weights is weights
+        assert {doc.metadata["chunk_id"] for doc, _ in results} == {"a:0", "b:0", "c:0"}
+        
+        # Past the ratio the matrix is rebuilt and scores are exact again
+        retriever.delete_chunks(["a:0"])
+        postings = BM25Retriever(scoring_mode="postings")
+        postings.build_index([chunked_documents[2], chunked_documents[3]])
+        actual = retriever.search("brown python", k=5)
+        assert retriever._weights is not weights
+        assert [doc.metadata["chunk_id"] for doc, _ in actual] == \
+            [doc.metadata["chunk_id"] for doc, _ in postings.search("brown python", k=5)]
+        assert [score for _, score in actual] == \
+            pytest.approx([score for _, score in postings.search("brown python", k=5)])
+    
+    def test_delete_document(self, retriever, chunked_documents):
+        """Test that deleted documents are no longer returned"""
+        retriever.build_index(chunked_documents)
+        
+        deleted = retriever.delete_document("a")
+        results = retriever.search("brown fox", k=5)
+        
+        assert deleted == 2
+        assert retriever.N == 2
+        assert [doc.metadata["document_id"] for doc, _ in results] == ["c"]
+        assert retriever.delete_document("a") == 0
+    
+    def test_delete_chunks(self, retriever, chunked_documents):
+        """Test deleting individual chunks by chunk ID"""
+        retriever.build_index(chunked_documents)
+        
+        deleted = retriever.delete_chunks(["a:0", "missing"])
+        results = retriever.search("brown fox", k=5)
+        
+        assert deleted == 1
+        assert "a:0" not in [doc.metadata["chunk_id"] for doc, _ in results]
+    
+    def test_scores_after_delete_match_fresh_index(self, chunked_documents):
+        """Test that lazy IDF/avgdl reflect deletes exactly"""
+        retriever = BM25Retriever()
+        retriever.build_index(chunked_documents)
+        retriever.delete_document("b")
+        
+        fresh = BM25Retriever()
+        fresh.build_index([doc for doc in chunked_documents if doc.metadata["document_id"] != "b"])
+        
+        for query in ["brown fox", "python snakes", "lazy dog"]:
+            actual = [(doc.metadata["chunk_id"], score) for doc, score in retriever.search(query, k=5)]
+            expected = [(doc.metadata["chunk_id"], score) for doc, score in fresh.search(query, k=5)]
+            assert [chunk for chunk, _ in actual] == [chunk for chunk, _ in expected]
+            assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+    
+    def test_add_existing_chunk_id_replaces(self, retriever, chunked_documents):
+        """Test that re-adding a chunk ID replaces the previous copy"""
+        retriever.build_index(chunked_documents)
+        
+        retriever.add_documents([Document(
+            page_content="Completely rewritten chunk about databases",
+            metadata={"doc_id": "3", "chunk_id": "b:0", "document_id": "b"}
+        )])
+        
+        assert retriever.N == 4
+        assert retriever.search("versatile", k=5) == []
+        assert [doc.metadata["chunk_id"] for doc, _ in retriever.search("databases", k=5)] == ["b:0"]
+    
+    def test_compact(self, chunked_documents):
+        """Test that compaction purges tombstones without changing results"""
+        retriever = BM25Retriever(scoring_mode="sparse")
+        retriever.build_index(chunked_documents)
+        retriever.delete_document("a")
+        before = [(doc.metadata["chunk_id"], score) for doc, score in retriever.search("brown python", k=5)]
+        
+        purged = retriever.compact()
+        after = [(doc.metadata["chunk_id"], score) for doc, score in retriever.search("brown python", k=5)]
+        
+        assert purged == 2
+        assert len(retriever.corpus) == 2
+        assert retriever.deleted_ratio() == 0.0
+        assert after == before
+        assert retriever.delete_chunks(["c:0"]) == 1
+    
+    def test_save_and_load_preserves_tombstones(self, retriever, chunked_documents, tmp_path):
+        """Test that tombstones survive a save/load round trip"""
+        retriever.build_index(chunked_documents)
+        retriever.delete_document("a")
+        filepath = tmp_path / "bm25_index.pkl"
+        retriever.save(str(filepath))
+        
+        loaded = BM25Retriever.load(str(filepath))
+        
+        assert loaded.N == 2
+        assert [doc.metadata["document_id"] for doc, _ in loaded.search("brown fox", k=5)] == ["c"]
+        assert loaded.delete_document("b") == 1
+    
+    def test_segment_round_trip(self, retriever, chunked_documents, tmp_path):
+        """Test that a segment-backed index scores like the in-memory one"""
+        retriever.build_index(chunked_documents)
+        filepath = tmp_path / "bm25_index.seg"
+        retriever.save_segment(str(filepath))
+        
+        by_chunk = {doc.metadata["chunk_id"]: doc for doc in chunked_documents}
+        loaded = BM25Retriever.load_segment(
+            str(filepath),
+            document_loader=lambda chunk_ids, user_ids: [by_chunk.get(chunk_id) for chunk_id in chunk_ids]
+        )
+        
+        assert loaded.N == 4
+        assert loaded.corpus == []  # Text is not held in memory
+        for query in ["brown fox", "python snakes", "lazy dog"]:
+            actual = [(doc.page_content, score) for doc, score in loaded.search(query, k=5)]
+            expected = [(doc.page_content, score) for doc, score in retriever.search(query, k=5)]
+            assert [text for text, _ in actual] == [text for text, _ in expected]
+            assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+    
+    def test_segment_without_loader_returns_chunk_metadata(self, retriever, chunked_documents, tmp_path):
+        """Test that segment results carry chunk identifiers when no loader is set"""
+        retriever.build_index(chunked_documents)
+        filepath = tmp_path / "bm25_index.seg"
+        retriever.save_segment(str(filepath))
+        
+        loaded = BM25Retriever.load_segment(str(filepath))
+        results = loaded.search("python", k=5)
+        
+        assert {doc.metadata["chunk_id"] for doc, _ in results} == {"b:0", "c:0"}
+        assert all(doc.page_content == "" for doc, _ in results)
+    
+    @pytest.mark.parametrize("scoring_mode", ["postings", "sparse"])
+    def test_segment_loader_runs_without_index_lock(self, retriever, chunked_documents, tmp_path, scoring_mode):
+        """Test that loading segment text from the vector store does not block other threads on the index"""
+        retriever.build_index(chunked_documents)
+        filepath = tmp_path / "bm25_index.seg"
+        retriever.save_segment(str(filepath))
+        by_chunk = {doc.metadata["chunk_id"]: doc for doc in chunked_documents}
+        lock_free = []
+        
+        def probe():
+            acquired = loaded._lock.acquire(timeout=1)
+            if acquired:
+                loaded._lock.release()
+            lock_free.append(acquired)
+        
+        def loader(chunk_ids, user_ids):
+            # Another thread (a query or the change feed) must get the lock meanwhile
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return [by_chunk.get(chunk_id) for chunk_id in chunk_ids]
+        
+        loaded = BM25Retriever.load_segment(str(filepath), document_loader=loader, scoring_mode=scoring_mode)
+        
+        assert {doc.metadata["chunk_id"] for doc, _ in loaded.search("python", k=5)} == {"b:0", "c:0"}
+        assert lock_free == [True]
+    
+    def test_segment_updates_and_compaction(self, chunked_documents, tmp_path):
+        """Test adds, deletes and compaction on top of a segment"""
+        filepath = tmp_path / "bm25_index.seg"
+        base = BM25Retriever(scoring_mode="sparse")
+        base.build_index(chunked_documents[:3])
+        base.save_segment(str(filepath))
+        
+        loaded = BM25Retriever.load_segment(str(filepath), scoring_mode="sparse")
+        loaded.add_documents(chunked_documents[3:])
+        loaded.delete_document("a")
+        
+        fresh = BM25Retriever(scoring_mode="sparse")
+        fresh.build_index(chunked_documents[2:])
+        
+        def ranked(index):
+            return [(doc.metadata["chunk_id"], score) for doc, score in index.search("brown python", k=5)]
+        
+        assert loaded.N == 2
+        assert [chunk for chunk, _ in ranked(loaded)] == [chunk for chunk, _ in ranked(fresh)]
+        assert [score for _, score in ranked(loaded)] == pytest.approx([score for _, score in ranked(fresh)])
+        
+        assert loaded.compact() == 2
+        assert loaded.get_stats()["segment_documents"] == 2
+        assert [score for _, score in ranked(loaded)] == pytest.approx([score for _, score in ranked(fresh)])
+    
+    def test_segment_compaction_after_deleting_everything(self, chunked_documents, tmp_path):
+        """Test that deleting every document, compacting and saving writes an empty segment"""
+        filepath = tmp_path / "bm25_index.seg"
+        retriever = BM25Retriever()
+        retriever.build_index(chunked_documents)
+        retriever.save_segment(str(filepath), reopen=True)
+        for document_id in {doc.metadata["document_id"] for doc in chunked_documents}:
+            retriever.delete_document(document_id)
+        
+        assert retriever.compact() == len(chunked_documents)
+        assert retriever.N == 0
+        retriever.save_segment(str(filepath), reopen=True)
+        
+        assert retriever.get_stats()["segment_documents"] == 0
+        assert retriever.search("brown python", k=5) == []
+        
+        retriever.add_documents(chunked_documents[:1])
+        retriever.save_segment(str(filepath), reopen=True)
+        
+        assert BM25Retriever.load_segment(str(filepath)).N == 1
+    
+    def test_load_invalid_segment(self, tmp_path):
+        """Test that a file that is not a segment yields an empty index"""
+        filepath = tmp_path / "bm25_index.seg"
+        filepath.write_bytes(b"not a segment")
+        
+        loaded = BM25Retriever.load_segment(str(filepath))
+        
+        assert not loaded.is_built()
+    
+    def test_search_by_partition_matches_filtered_global(self, chunked_documents, tmp_path):
+        """Test that partition-restricted scores equal global scores filtered afterwards"""
+        owners = {"a": "u1", "b": "u2", "c": "u1"}
+        for doc in chunked_documents:
+            doc.metadata["user_id"] = owners[doc.metadata["document_id"]]
+        
+        memory = BM25Retriever()
+        memory.build_index(chunked_documents)
+        filepath = tmp_path / "bm25_index.seg"
+        memory.save_segment(str(filepath))
+        # Segment base plus an in-memory delta
+        segment = BM25Retriever.load_segment(str(filepath))
+        segment.add_documents([Document(
+            page_content="Brown python fox", metadata={"chunk_id": "d:0", "document_id": "d", "user_id": "u2"}
+        )])
+        
+        for index in (memory, segment):
+            everything = index.search("brown python fox", k=10)
+            for document_ids, user_id in [(["a", "c"], None), (["b", "d"], None), (None, "u1"),
+                                          (None, "u2"), (["a", "b"], "u2"), (["missing"], None)]:
+                expected = [
+                    (doc.metadata["chunk_id"], score) for doc, score in everything
+                    if (document_ids is None or doc.metadata["document_id"] in document_ids)
+                    and (user_id is None or doc.metadata["user_id"] == user_id)
+                ]
+                actual = [(doc.metadata["chunk_id"], score)
+                          for doc, score in index.search("brown python fox", k=10, document_ids=document_ids, user_id=user_id)]
+                assert [chunk for chunk, _ in actual] == [chunk for chunk, _ in expected]
+                assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+    
+    def test_segment_groups_partitions(self, chunked_documents, tmp_path):
+        """Test that a segment stores each document's chunks as one contiguous row range"""
+        retriever = BM25Retriever()
+        retriever.build_index([chunked_documents[0], chunked_documents[2], chunked_documents[1]])
+        filepath = tmp_path / "bm25_index.seg"
+        retriever.save_segment(str(filepath))
+        
+        loaded = BM25Retriever.load_segment(str(filepath))
+        
+        assert loaded._segment.columns["document_id"].rows("a").tolist() == [0, 1]
+        assert [doc.metadata["chunk_id"] for doc, _ in loaded.search("brown fox", k=5, document_ids=["a"])] == ["a:0", "a:1"]
+    
+    def test_build_index_paged(self, sample_documents):
+        """Test that a paged build matches a one-shot build and reports progress"""
+        retriever = BM25Retriever()
+        requested = []
+        
+        def page_loader(offset, limit):
+            requested.append((offset, limit))
+            return sample_documents[offset:offset + limit]
+        
+        retriever.build_index_paged(page_loader, page_size=2, total=len(sample_documents))
+        
+        expected = BM25Retriever()
+        expected.build_index(sample_documents)
+        status = retriever.get_build_status()
+        
+        assert requested == [(0, 2), (2, 2), (4, 2)]
+        assert retriever.is_built()
+        assert status["state"] == "ready"
+        assert status["documents_indexed"] == len(sample_documents)
+        assert status["progress"] == 1.0
+        assert retriever.search("brown fox", k=5) == expected.search("brown fox", k=5)
+    
+    def test_build_index_paged_not_ready_until_done(self, sample_documents):
+        """Test that the index reports not built while pages are still loading"""
+        retriever = BM25Retriever()
+        observed = []
+        
+        def page_loader(offset, limit):
+            observed.append((retriever.is_built(), retriever.get_build_status()["state"]))
+            return sample_documents[offset:offset + limit]
+        
+        retriever.build_index_paged(page_loader, page_size=3)
+        
+        assert observed == [(False, "building"), (False, "building")]
+        assert retriever.is_built()
+    
+    def test_build_index_paged_failure(self, sample_documents):
+        """Test that a failing page source is reported in the build status"""
+        retriever = BM25Retriever()
+        
+        def page_loader(offset, limit):
+            raise ConnectionError("store unavailable")
+        
+        with pytest.raises(ConnectionError):
+            retriever.build_index_paged(page_loader)
+        
+        status = retriever.get_build_status()
+        assert not retriever.is_built()
+        assert status["state"] == "failed"
+        assert "store unavailable" in status["error"]
@@ -0,0 +1,124 @@
+"""
+Unit tests for the content-addressed chunk embedding cache
+"""
+
+import os
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+from app.services.chatbot.vector_db.chunk_embedding_cache import ChunkEmbeddingCache
+from app.services.chatbot.vector_db.indexing import LangChainDocumentIndexer
+
+
+class TestChunkEmbeddingCache:
+    """Test suite for ChunkEmbeddingCache and its use by the indexer"""
+    
+    @pytest.fixture
+    def cache(self, tmp_path):
+        """Create an empty cache"""
+        return ChunkEmbeddingCache.for_directory(str(tmp_path), "all-MiniLM-L6-v2")
+    
+    def test_put_and_get(self, cache):
+        """Test that stored vectors are returned for the same text only"""
+        assert cache.put_many(["alpha", "beta", "alpha"], [[1.0, 2.0], [3.0, 4.0], [1.0, 2.0]]) == 2
+        
+        assert cache.get_many(["beta", "gamma", "alpha"]) == [[3.0, 4.0], None, [1.0, 2.0]]
+        assert cache.put_many(["alpha"], [[9.0, 9.0]]) == 0
+        stats = cache.get_stats()
+        assert (stats["entries"], stats["dim"], stats["hits"], stats["misses"]) == (2, 2, 2, 1)
+    
+    def test_persists_and_sees_other_writers(self, cache, tmp_path):
+        """Test that entries survive reopening and appear in an already open cache"""
+        other = ChunkEmbeddingCache(cache.directory, cache.model_name)
+        cache.put_many(["alpha"], [[1.0, 2.0]])
+        other.put_many(["beta"], [[3.0, 4.0]])
+        
+        reopened = ChunkEmbeddingCache(cache.directory, cache.model_name)
+        
+        assert cache.get_many(["beta"]) == [[3.0, 4.0]]
+        assert reopened.get_many(["alpha", "beta"]) == [[1.0, 2.0], [3.0, 4.0]]
+    
+    def test_key_includes_model(self, cache, tmp_path):
+        """Test that vectors of another model are not returned"""
+        cache.put_many(["alpha"], [[1.0, 2.0]])
+        
+        other_model = ChunkEmbeddingCache.for_directory(str(tmp_path), "paraphrase-MiniLM-L3-v2")
+        
+        assert other_model.get_many(["alpha"]) == [None]
+    
+    def test_trims_vectors_of_interrupted_write(self, cache):
+        """Test that vector bytes without a digest are overwritten by the next write"""
+        cache.put_many(["alpha"], [[1.0, 2.0]])
+        with open(cache._vectors_path, "ab") as f:
+            f.write(b"\0" * 8)
+        
+        cache.put_many(["beta"], [[3.0, 4.0]])
+        
+        assert ChunkEmbeddingCache(cache.directory, cache.model_name).get_many(["alpha", "beta"]) == [[1.0, 2.0], [3.0, 4.0]]
+    
+    def test_shared_per_directory(self, cache, tmp_path):
+        """Test that every caller of the same directory and model gets one instance"""
+        assert ChunkEmbeddingCache.for_directory(str(tmp_path), "all-MiniLM-L6-v2") is cache
+        assert ChunkEmbeddingCache.for_directory(str(tmp_path), "paraphrase-MiniLM-L3-v2") is not cache
+    
+    def test_evicts_least_recently_used(self, cache):
+        """Test that going over max_entries keeps the most recently used entries"""
+        cache.max_entries = 4
+        cache.put_many(["a", "b", "c", "d"], [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0], [4.0, 0.0]])
+        cache.get_many(["a"])
+        
+        cache.put_many(["e"], [[5.0, 0.0]])
+        
+        # Keeps 90% of the bound: "e" and "a" were used last, then the newest
+        assert cache.get_many(["a", "b", "c", "d", "e"]) == [[1.0, 0.0], None, None, [4.0, 0.0], [5.0, 0.0]]
+        stats = cache.get_stats()
+        assert (stats["entries"], stats["evictions"]) == (3, 2)
+    
+    def test_other_processes_see_compaction(self, cache):
+        """Test that an open cache reloads its digests after another process compacted"""
+        other = ChunkEmbeddingCache(cache.directory, cache.model_name, max_entries=2)
+        cache.put_many(["a", "b"], [[1.0, 0.0], [2.0, 0.0]])
+        assert cache.get_many(["a"]) == [[1.0, 0.0]]
+        
+        other.put_many(["c"], [[3.0, 0.0]])
+        
+        assert cache.get_many(["a", "b", "c"]) == [None, None, [3.0, 0.0]]
+        cache.put_many(["d"], [[4.0, 0.0]])
+        assert ChunkEmbeddingCache(cache.directory, cache.model_name).get_many(["c", "d"]) == [[3.0, 0.0], [4.0, 0.0]]
+    
+    def test_compaction_to_same_size_is_seen(self, cache):
+        """Test that a compaction leaving the digest file at the size another instance read is reloaded"""
+        # The rewritten digest file may get the inode of the file it replaces
+        fstat = os.fstat
+        with patch("os.fstat", lambda fd: SimpleNamespace(st_ino=1, st_size=fstat(fd).st_size)):
+            other = ChunkEmbeddingCache(cache.directory, cache.model_name, max_entries=3)
+            cache.put_many(["a", "b"], [[1.0, 0.0], [2.0, 0.0]])
+            assert cache.get_many(["a", "b"]) == [[1.0, 0.0], [2.0, 0.0]]
+            
+            # Four rows over a bound of three: other keeps two, "c" and "d"
+            other.put_many(["c", "d"], [[3.0, 0.0], [4.0, 0.0]])
+            
+            assert cache.get_many(["a", "b", "c", "d"]) == [None, None, [3.0, 0.0], [4.0, 0.0]]
+            cache.put_many(["e"], [[5.0, 0.0]])
+        
+        reopened = ChunkEmbeddingCache(cache.directory, cache.model_name)
+        assert reopened.get_many(["c", "d", "e"]) == [[3.0, 0.0], [4.0, 0.0], [5.0, 0.0]]
+    
+    def test_indexer_encodes_only_new_chunks(self, cache):
+        """Test that the indexer reuses cached vectors and encodes the rest"""
+        chunker = Mock()
+        chunker.chunk_by_sentences.side_effect = lambda text, metadata: [
+            {"text": sentence, "metadata": dict(metadata)} for sentence in text.split(". ")
+        ]
+        vectorstore = Mock()
+        vectorstore.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.0] for text in texts]
+        vectorstore.add_documents.side_effect = lambda documents, ids=None, embeddings=None: ids
+        vectorstore.get_chunk_ids.return_value = []
+        indexer = LangChainDocumentIndexer(vectorstore, chunker, embedding_cache=cache)
+        
+        indexer.index_document({"id": "a", "text": "Revenue grew. Costs fell"})
+        indexer.index_document({"id": "b", "text": "Revenue grew. Margins rose"})
+        
+        assert vectorstore.embed_documents.call_args_list[1].args == (["Margins rose"],)
+        _, kwargs = vectorstore.add_documents.call_args
+        assert kwargs["embeddings"] == [[12.0, 0.0], [12.0, 0.0]]
@@ -0,0 +1,91 @@
+"""
+Unit tests for per-user collection sharding and the shard migration
+"""
+
+import pytest
+from unittest.mock import patch
+from langchain.schema import Document
+from app.services.chatbot.vector_db import langchain_chroma
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client
+from app.services.chatbot.vector_db.collection_sharding import (
+    shard_collection_name, user_id_from_filter, migrate_to_shards
+)
+
+
+class TestCollectionSharding:
+    """Test suite for shard routing helpers and migrate_to_shards"""
+    
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        """Create a base collection with chunks of two users and one unowned chunk"""
+        client = _open_persistent_client(str(tmp_path))
+        collection = client.get_or_create_collection("documents")
+        owners = ["alice", "bob", "alice", "bob", ""]
+        collection.add(
+            ids=[f"c{i}" for i in range(5)],
+            embeddings=[[float(i), 1.0, 0.0] for i in range(5)],
+            documents=[f"chunk {i}" for i in range(5)],
+            metadatas=[{"document_id": f"d{i}", "user_id": owner} for i, owner in enumerate(owners)]
+        )
+        return str(tmp_path)
+    
+    def test_shard_names(self):
+        """Test that users map to stable, valid collection names and unowned chunks stay in the base"""
+        user_shard = shard_collection_name("documents", "alice", "user")
+        
+        assert user_shard == shard_collection_name("documents", "alice", "user")
+        assert user_shard != shard_collection_name("documents", "bob", "user")
+        assert user_shard.startswith("documents_u_") and len(user_shard) <= 63
+        assert shard_collection_name("documents", "alice", "hash", buckets=8).startswith("documents_h_000")
+        assert shard_collection_name("documents", "", "user") == "documents"
+        assert shard_collection_name("documents", "alice", "none") == "documents"
+    
+    def test_user_id_from_filter(self):
+        """Test that only filters pinning a single user select a shard"""
+        assert user_id_from_filter({"user_id": "alice"}) == "alice"
+        assert user_id_from_filter({"user_id": {"$eq": "alice"}}) == "alice"
+        assert user_id_from_filter({"$and": [{"document_id": {"$in": ["d1"]}}, {"user_id": "alice"}]}) == "alice"
+        assert user_id_from_filter({"user_id": {"$in": ["alice", "bob"]}}) is None
+        assert user_id_from_filter({"document_id": "d1"}) is None
+        assert user_id_from_filter(None) is None
+    
+    def test_migration_moves_owned_chunks(self, db_path):
+        """Test that owned chunks move to their shard with their vectors and a rerun is a no-op"""
+        assert migrate_to_shards(db_path, sharding="user", dry_run=True)["chunks_moved"] == 4
+        
+        result = migrate_to_shards(db_path, sharding="user", batch_size=2)
+        
+        client = _open_persistent_client(db_path)
+        alice = client.get_collection(shard_collection_name("documents", "alice", "user"))
+        moved = alice.get(ids=["c2"], include=["embeddings", "metadatas"])
+        assert result["chunks_moved"] == 4 and result["chunks_left_in_base"] == 1
+        assert client.get_collection("documents").get()["ids"] == ["c4"]
+        assert alice.count() == 2
+        assert list(moved["embeddings"][0]) == [2.0, 1.0, 0.0]
+        assert migrate_to_shards(db_path, sharding="user")["chunks_moved"] == 0
+    
+    def test_reads_and_deletes_by_owner_touch_one_shard(self, tmp_path):
+        """Test that chunk reads and deletes with a known owner skip listing and opening other shards"""
+        embeddings = type("Embeddings", (), {
+            "embed_documents": lambda self, texts: [[float(len(text)), 1.0, 0.0] for text in texts],
+            "embed_query": lambda self, text: [float(len(text)), 1.0, 0.0]
+        })()
+        with patch.object(langchain_chroma.model_registry, "acquire_embeddings", return_value=embeddings), \
+                patch.object(langchain_chroma.model_registry, "model_id", return_value="test"):
+            store = langchain_chroma.LangChainChromaStore(str(tmp_path), sharding="user", coarse_documents=0)
+        chunks = [
+            Document(page_content=f"chunk {owner} {i}", metadata={"document_id": f"{owner}-doc", "user_id": owner})
+            for owner in ("alice", "bob", "carol") for i in range(2)
+        ]
+        store.add_documents(chunks, ids=[f"{doc.metadata['user_id']}:{i % 2}" for i, doc in enumerate(chunks)])
+        store._collections.clear()
+        
+        with patch.object(store.client, "list_collections", wraps=store.client.list_collections) as listed:
+            found = store.get_documents_by_ids(["alice:0", "bob:1", "missing"], ["alice", "bob", "alice"])
+            store.delete_documents(["alice:0"], user_id="alice")
+        
+        assert [doc.page_content if doc else None for doc in found] == ["chunk alice 0", "chunk bob 1", None]
+        assert not listed.called
+        assert shard_collection_name("documents", "carol", "user") not in store._collections
+        remaining = store.get_documents_by_ids(["alice:0", "alice:1"])
+        assert remaining[0] is None and remaining[1].page_content == "chunk alice 1"
@@ -0,0 +1,70 @@
+"""
+Unit tests for document-level vectors used by coarse-to-fine retrieval
+"""
+
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client
+from app.services.chatbot.vector_db.document_vectors import DocumentVectorIndex, document_centroid
+
+
+class TestDocumentVectors:
+    """Test suite for document_centroid and DocumentVectorIndex"""
+
+    @pytest.fixture
+    def index(self, tmp_path):
+        """Create a chunk collection with three documents of two users and an index next to it"""
+        client = _open_persistent_client(str(tmp_path))
+        chunks = client.get_or_create_collection("documents")
+        vectors = {"d1": [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]], "d2": [[0.8, 0.2, 0.0]], "d3": [[0.0, 0.0, 1.0]]}
+        owners = {"d1": "alice", "d2": "alice", "d3": "bob"}
+        for document_id, document_vectors in vectors.items():
+            chunks.add(
+                ids=[f"{document_id}:{i}" for i in range(len(document_vectors))],
+                embeddings=document_vectors,
+                documents=[f"{document_id} chunk {i}" for i in range(len(document_vectors))],
+                metadatas=[{"document_id": document_id, "user_id": owners[document_id]} for _ in document_vectors]
+            )
+        store = SimpleNamespace(
+            collection_name="documents",
+            client=client,
+            vectorstore=SimpleNamespace(_collection=chunks),
+            _shard_names=lambda: ["documents"],
+            _collection=lambda name: SimpleNamespace(_collection=chunks)
+        )
+        return DocumentVectorIndex(store)
+
+    def test_centroid_is_normalized_mean(self):
+        """Test that the document vector is the unit-length mean of its chunk vectors"""
+        centroid = document_centroid([[2.0, 0.0], [0.0, 2.0]])
+
+        assert np.allclose(centroid, [np.sqrt(0.5), np.sqrt(0.5)])
+        assert document_centroid([[0.0, 0.0]]) == [0.0, 0.0]
+
+    def test_backfill_and_shortlist(self, index):
+        """Test that backfill writes one vector per document and shortlists respect the user"""
+        assert index.backfill(page_size=2) == 3
+        assert index.count() == 3
+        assert index.collection.get(ids=["d1"])["metadatas"][0]["chunks"] == 2
+
+        assert index.shortlist([1.0, 0.0, 0.0], 2, user_id="alice") == ["d1", "d2"]
+        assert index.shortlist([0.0, 0.0, 1.0], 1, user_id="alice") == ["d2"]
+        assert index.shortlist([0.0, 0.0, 1.0], 1) == ["d3"]
+
+    def test_related_upsert_and_delete(self, index):
+        """Test that related documents exclude the document itself and follow upserts and deletes"""
+        index.backfill()
+
+        related = index.related("d1", "alice", k=5)
+        assert [doc["document_id"] for doc in related] == ["d2"]
+        assert related[0]["user_id"] == "alice" and related[0]["distance"] > 0
+        assert index.related("d1", "bob", k=5) == []
+        assert index.related("d3", "bob", k=5) == []
+
+        index.upsert("d3", [[1.0, 0.0, 0.0]], {"user_id": "alice"})
+        assert index.related("d1", "alice", k=1)[0]["document_id"] == "d3"
+
+        index.delete("d3")
+        assert index.related("d3", "alice") == []
+        assert index.count() == 2
@@ -0,0 +1,65 @@
+"""
+Unit tests for the embedding micro-batcher
+"""
+
+import threading
+import pytest
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.embedding_batcher import EmbeddingBatcher
+
+
+class TestEmbeddingBatcher:
+    """Test suite for EmbeddingBatcher"""
+    
+    @pytest.fixture
+    def embed_fn(self):
+        """Create a fake encoder recording its batch sizes"""
+        return Mock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+    
+    def test_results_align_with_each_request(self, embed_fn):
+        """Test that every caller gets the vectors of its own texts"""
+        batcher = EmbeddingBatcher(embed_fn, batch_size=4, max_wait_ms=50)
+        
+        first = batcher.submit(["a", "bb"])
+        second = batcher.submit(["ccc", "dddd", "eeeee"])
+        
+        assert first.result(timeout=5) == [[1.0], [2.0]]
+        assert second.result(timeout=5) == [[3.0], [4.0], [5.0]]
+        batcher.stop()
+    
+    def test_concurrent_requests_are_coalesced(self, embed_fn):
+        """Test that chunks of concurrent callers are encoded in shared fixed-size batches"""
+        batcher = EmbeddingBatcher(embed_fn, batch_size=8, max_wait_ms=200)
+        results = {}
+        
+        def worker(i):
+            results[i] = batcher.embed([f"doc{i}-{j}" for j in range(2)])
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        
+        stats = batcher.get_stats()
+        assert all(results[i] == [[6.0], [6.0]] for i in range(4))
+        assert embed_fn.call_count == 1
+        assert stats["batches"] == 1 and stats["texts"] == 8 and stats["avg_batch_size"] == 8.0
+        batcher.stop()
+    
+    def test_large_request_is_split_into_batches(self, embed_fn):
+        """Test that no encode call exceeds the batch size"""
+        batcher = EmbeddingBatcher(embed_fn, batch_size=3, max_wait_ms=1)
+        
+        assert batcher.embed(["x"] * 7) == [[1.0]] * 7
+        assert [len(call.args[0]) for call in embed_fn.call_args_list] == [3, 3, 1]
+        batcher.stop()
+    
+    def test_failure_propagates_to_callers(self):
+        """Test that an encoder error is raised from every affected future"""
+        batcher = EmbeddingBatcher(Mock(side_effect=RuntimeError("model unavailable")), max_wait_ms=1)
+        
+        with pytest.raises(RuntimeError):
+            batcher.embed(["a"])
+        assert batcher.get_stats()["failed_requests"] == 1
+        batcher.stop()
@@ -0,0 +1,67 @@
+"""
+Unit tests for the embedding server and its registry client
+"""
+
+import threading
+import time
+import numpy as np
+import pytest
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.model_registry import ModelRegistry, SharedEmbeddings
+from app.services.chatbot.vector_db.embedding_server import EmbeddingServer, RemoteSentenceTransformer
+
+
+class TestEmbeddingServer:
+    """Test suite for EmbeddingServer and RemoteSentenceTransformer"""
+
+    @pytest.fixture
+    def server(self, tmp_path):
+        """Run a server with fake models (vector = [text length, normalized flag])"""
+        def load(model_name):
+            model = Mock(schedules_lanes=False)
+            model.encode.side_effect = lambda texts, **kwargs: np.array(
+                [[float(len(text)), float(kwargs.get("normalize_embeddings", False))] for text in texts]
+            )
+            return model
+        registry = ModelRegistry(model_loader=Mock(side_effect=load), client_factory=lambda path: object())
+        server = EmbeddingServer(str(tmp_path / "embeddings.sock"), registry=registry, batch_size=4, max_wait_ms=5)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if (tmp_path / "embeddings.sock").exists():
+                break
+            time.sleep(0.01)
+        yield server
+        server.shutdown()
+        thread.join(timeout=5)
+
+    def test_encodes_in_both_lanes(self, server):
+        """Test that interactive and bulk encodes return the model's vectors in order"""
+        client = RemoteSentenceTransformer("all-MiniLM-L6-v2", server.socket_path)
+
+        assert client.encode(["ab", "abcd"]).tolist() == [[2.0, 0.0], [4.0, 0.0]]
+        assert client.encode("abc").tolist() == [3.0, 0.0]
+        bulk = client.encode([f"{'x' * i}" for i in range(1, 10)], lane="bulk", normalize_embeddings=True)
+        assert bulk[:, 0].tolist() == [float(i) for i in range(1, 10)]
+        assert bulk[:, 1].tolist() == [1.0] * 9
+
+    def test_registry_uses_server_as_drop_in_model(self, server):
+        """Test that one model in the server serves several client registries"""
+        registries = [
+            ModelRegistry(model_loader=lambda name: RemoteSentenceTransformer(name, server.socket_path),
+                          client_factory=lambda path: object())
+            for _ in range(2)
+        ]
+        embeddings = [SharedEmbeddings(registry.acquire_model("all-MiniLM-L6-v2")) for registry in registries]
+
+        assert embeddings[0].embed_documents(["a\nb", "abcd"]) == [[3.0, 0.0], [4.0, 0.0]]
+        assert embeddings[1].embed_query("abc") == [3.0, 0.0]
+        assert list(server.info()["models"]) == ["all-MiniLM-L6-v2"]
+
+    def test_errors_are_reported_to_the_client(self, server):
+        """Test that a failing encode raises in the client"""
+        client = RemoteSentenceTransformer("broken", server.socket_path)
+        server.registry._model_loader.side_effect = RuntimeError("no such model")
+
+        with pytest.raises(RuntimeError, match="no such model"):
+            client.encode(["abc"])
@@ -0,0 +1,36 @@
+"""
+Unit tests for HNSW collection parameters
+"""
+
+import pytest
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client
+from app.services.chatbot.vector_db.hnsw_params import hnsw_metadata, creation_metadata, index_params
+
+
+class TestHNSWParams:
+    """Test suite for hnsw_metadata and index_params"""
+    
+    def test_metadata_only_has_set_params(self):
+        """Test that unset parameters are left to Chroma and invalid ones are rejected"""
+        assert hnsw_metadata() is None
+        assert hnsw_metadata(space="cosine", search_ef=64) == {"hnsw:space": "cosine", "hnsw:search_ef": 64}
+        
+        with pytest.raises(ValueError):
+            hnsw_metadata(space="manhattan")
+        with pytest.raises(ValueError):
+            hnsw_metadata(m=0)
+    
+    def test_params_apply_on_creation(self, tmp_path):
+        """Test that a new collection gets the parameters and an existing one keeps its own"""
+        client = _open_persistent_client(str(tmp_path))
+        collection = client.get_or_create_collection(
+            "documents", metadata=hnsw_metadata(space="ip", m=32, construction_ef=200, search_ef=50)
+        )
+        
+        assert index_params(collection.metadata) == {"space": "ip", "M": 32, "construction_ef": 200, "search_ef": 50}
+        reopened = client.get_or_create_collection(
+            "documents", metadata=creation_metadata(client, "documents", hnsw_metadata(space="l2", m=8))
+        )
+        assert index_params(reopened.metadata)["M"] == 32
+        assert index_params(client.get_collection("documents").metadata)["space"] == "ip"
+        assert index_params(None) == {"space": "l2", "M": None, "construction_ef": None, "search_ef": None}
@@ -2,10 +2,13 @@
 Unit tests for Hybrid Retriever
 """
 
+import asyncio
+import time
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import AsyncMock, Mock, MagicMock, patch
 from langchain.schema import Document
-from app.services.chatbot.search.hybrid_retriever import HybridRetriever
+from app.services.chatbot.rag.chat_engine import LangChainChatEngine
+from app.services.chatbot.search.hybrid_retriever import HybridRetriever, HybridSearchRetriever
 from app.services.chatbot.search.bm25_retriever import BM25Retriever
 
 
@@ -273,3 +276,211 @@ class TestHybridRetriever:
         # Should complete in less than 1 second for small dataset
         assert (end_time - start_time) < 1.0
         assert isinstance(results, list)
+    
+    def test_search_batch(self, hybrid_retriever, sample_documents):
+        """Test batched hybrid search returns one result list per query"""
+        hybrid_retriever.vectorstore.similarity_search_with_score.return_value = [
+            (sample_documents[2], 0.9)
+        ]
+        
+        batches = hybrid_retriever.search_batch(["machine learning", "neural networks"], k=2)
+        
+        assert len(batches) == 2
+        assert all(len(results) <= 2 for results in batches)
+        assert hybrid_retriever.vectorstore.similarity_search_with_score.call_count == 2
+    
+    def test_search_batch_runs_legs_concurrently(self, hybrid_retriever, sample_documents):
+        """Test that the semantic queries of a batch overlap each other and the BM25 leg"""
+        def slow_semantic(query, k, filter=None):
+            time.sleep(0.2)
+            return [(sample_documents[0], 0.9)]
+        
+        bm25_search_batch = hybrid_retriever.bm25_retriever.search_batch
+        
+        def slow_bm25(queries, **kwargs):
+            time.sleep(0.2)
+            return bm25_search_batch(queries, **kwargs)
+        
+        hybrid_retriever.vectorstore.similarity_search_with_score.side_effect = slow_semantic
+        with patch.object(hybrid_retriever.bm25_retriever, "search_batch", side_effect=slow_bm25):
+            started = time.perf_counter()
+            batches = hybrid_retriever.search_batch(["machine learning", "neural networks", "vision"], k=2)
+            elapsed = time.perf_counter() - started
+        
+        assert len(batches) == 3
+        assert batches[0][0] == sample_documents[0]
+        assert elapsed < 0.5
+    
+    def test_rrf_matches_chunks_without_chunk_id(self, hybrid_retriever):
+        """Test that a chunk indexed without chunk_id is fused with its BM25 hit by Chroma ID"""
+        bm25_hit = Document(page_content="quarterly revenue grew", metadata={"chunk_id": "d1:0"})
+        legacy = Document(page_content="quarterly revenue grew", metadata={"document_id": "d1"}, id="d1:0")
+        other = Document(page_content="costs were flat", metadata={"chunk_id": "d1:1"})
+        
+        merged = hybrid_retriever._reciprocal_rank_fusion(
+            [(bm25_hit, 3.0)], [(legacy, 0.1), (other, 0.2)], k=5
+        )
+        
+        assert merged == [legacy, other]
+    
+    def test_search_batch_with_document_ids(self, hybrid_retriever, sample_documents):
+        """Test batched hybrid search restricts both legs to the selected documents"""
+        hybrid_retriever.vectorstore.similarity_search_with_score.return_value = []
+        
+        batches = hybrid_retriever.search_batch(["learning"], k=5, document_ids=["missing"])
+        
+        assert batches == [[]]
+        _, kwargs = hybrid_retriever.vectorstore.similarity_search_with_score.call_args
+        assert kwargs["filter"] == {"document_id": {"$in": ["missing"]}}
+    
+    def test_search_by_documents_filters_bm25_before_scoring(self, mock_vectorstore, sample_documents):
+        """Test that BM25 only scores the selected documents and the owner filter reaches both legs"""
+        for doc in sample_documents:
+            doc.metadata["document_id"] = doc.metadata["doc_id"]
+            doc.metadata["user_id"] = "u1"
+        bm25 = BM25Retriever()
+        bm25.build_index(sample_documents)
+        hybrid = HybridRetriever(vectorstore=mock_vectorstore, bm25_retriever=bm25)
+        mock_vectorstore.similarity_search_with_score.return_value = []
+        
+        with patch.object(bm25, "search", wraps=bm25.search) as bm25_search:
+            results = hybrid.search_by_documents("learning", document_ids=["2"], k=5, user_id="u1")
+        
+        assert results == [sample_documents[1]]
+        assert bm25_search.call_args.kwargs == {"k": 20, "document_ids": ["2"], "user_id": "u1"}
+        assert mock_vectorstore.similarity_search_with_score.call_args.kwargs["filter"] == {
+            "$and": [{"document_id": {"$in": ["2"]}}, {"user_id": "u1"}]
+        }
+    
+    def test_search_while_bm25_building(self, mock_vectorstore, sample_documents):
+        """Test that searches are semantic-only until the BM25 index is ready"""
+        bm25 = BM25Retriever()
+        hybrid = HybridRetriever(vectorstore=mock_vectorstore, bm25_retriever=bm25)
+        mock_vectorstore.similarity_search_with_score.return_value = [
+            (sample_documents[2], 0.9),
+            (sample_documents[0], 0.8)
+        ]
+        
+        results_during_build = []
+        
+        def page_loader(offset, limit):
+            results_during_build.append(hybrid.search("machine learning", k=2))
+            return sample_documents[offset:offset + limit]
+        
+        bm25.build_index_paged(page_loader, page_size=10)
+        results = hybrid.search("machine learning", k=2)
+        
+        assert results_during_build == [[sample_documents[2], sample_documents[0]]]
+        assert results[0] == sample_documents[0]
+    
+    @pytest.mark.asyncio
+    async def test_asearch_matches_search(self, hybrid_retriever, sample_documents):
+        """Test that concurrent search fuses the same results as serial search"""
+        hybrid_retriever.vectorstore.similarity_search_with_score.return_value = [
+            (sample_documents[2], 0.9),
+            (sample_documents[1], 0.8)
+        ]
+        
+        results = await hybrid_retriever.asearch("machine learning", k=3)
+        
+        assert results == hybrid_retriever.search("machine learning", k=3)
+    
+    @pytest.mark.asyncio
+    async def test_asearch_runs_legs_concurrently(self, hybrid_retriever, sample_documents):
+        """Test that hybrid latency is bounded by the slower leg and reported per leg"""
+        def slow_semantic(query, k, filter=None):
+            time.sleep(0.2)
+            return [(sample_documents[0], 0.9)]
+        
+        bm25_search = hybrid_retriever.bm25_retriever.search
+        
+        def slow_bm25(query, **kwargs):
+            time.sleep(0.2)
+            return bm25_search(query, **kwargs)
+        
+        hybrid_retriever.vectorstore.similarity_search_with_score.side_effect = slow_semantic
+        with patch.object(hybrid_retriever.bm25_retriever, "search", side_effect=slow_bm25):
+            started = time.perf_counter()
+            results = await asyncio.wait_for(hybrid_retriever.asearch("machine learning", k=2), timeout=5)
+            elapsed = time.perf_counter() - started
+        
+        stats = hybrid_retriever.get_latency_stats()
+        assert results[0] == sample_documents[0]
+        assert elapsed < 0.35
+        assert stats["bm25"]["count"] == stats["semantic"]["count"] == stats["hybrid"]["count"] == 1
+        assert stats["bm25"]["last_ms"] >= 200 and stats["semantic"]["last_ms"] >= 200
+        assert stats["hybrid"]["last_ms"] < stats["bm25"]["last_ms"] + stats["semantic"]["last_ms"]
+
+
+class TestHybridSearchInChatEngine:
+    """Test that the chat engine searches through the user-bound hybrid retriever"""
+    
+    @pytest.fixture
+    def user_documents(self):
+        """Create chunks of two users"""
+        return [
+            Document(
+                page_content=f"Machine learning notes {i}",
+                metadata={"chunk_id": f"{owner}:{i}", "document_id": f"{owner}-doc{i % 2}", "user_id": owner}
+            )
+            for owner in ("u1", "u2") for i in range(4)
+        ]
+    
+    @pytest.fixture
+    def chat_engine(self, user_documents):
+        """Create a chat engine over a hybrid retriever bound to user u1"""
+        bm25 = BM25Retriever()
+        bm25.build_index(user_documents)
+        vectorstore = Mock()
+        vectorstore.similarity_search_with_score.return_value = []
+        hybrid = HybridRetriever(vectorstore=vectorstore, bm25_retriever=bm25)
+        engine = LangChainChatEngine(Mock(), HybridSearchRetriever(hybrid=hybrid, user_id="u1"), "window")
+        engine.chain.arun_with_documents = AsyncMock(
+            return_value={"answer": "ok", "sources": [], "source_documents": [], "chat_history": []}
+        )
+        return engine, hybrid
+    
+    def test_process_query_searches_user_partition(self, chat_engine):
+        """Test that Knowledge Base queries reach both legs with the user and document filter"""
+        engine, hybrid = chat_engine
+        
+        with patch.object(hybrid.bm25_retriever, "search", wraps=hybrid.bm25_retriever.search) as bm25_search:
+            asyncio.run(engine.process_query("machine learning", user_id="u1", selected_document_ids=["u1-doc0"]))
+        
+        documents = engine.chain.arun_with_documents.call_args.args[1]
+        assert documents and {doc.metadata["document_id"] for doc in documents} == {"u1-doc0"}
+        assert bm25_search.call_args.kwargs["user_id"] == "u1"
+        assert bm25_search.call_args.kwargs["document_ids"] == ["u1-doc0"]
+        assert hybrid.vectorstore.similarity_search_with_score.call_args.kwargs["filter"] == {
+            "$and": [{"document_id": {"$in": ["u1-doc0"]}}, {"user_id": "u1"}]
+        }
+    
+    def test_process_query_runs_legs_off_event_loop(self, chat_engine):
+        """Test that standard and rephrase queries use the concurrent legs of asearch"""
+        engine, hybrid = chat_engine
+        engine.chain.llm.ainvoke = AsyncMock(return_value=Mock(content='{"answer": "Notes", "citations": []}'))
+        engine.enhanced_search.query_rephraser.rephrase_query = AsyncMock(return_value="machine learning notes")
+        
+        with patch.object(hybrid, "asearch", wraps=hybrid.asearch) as asearch, \
+                patch.object(hybrid, "search", wraps=hybrid.search) as search:
+            result = asyncio.run(engine.process_query("machine learning", user_id="u1"))
+            asyncio.run(engine.process_query("machine learning", user_id="u1", search_mode="rephrase"))
+        
+        assert result["response"] == "Notes"
+        assert asearch.call_count == 2 and not search.called
+        assert all(call.kwargs["user_id"] == "u1" for call in asearch.call_args_list)
+    
+    def test_process_query_batches_multiple_queries(self, chat_engine):
+        """Test that multiple-query mode scores all sub-queries in one batched BM25 call"""
+        engine, hybrid = chat_engine
+        engine.enhanced_search.multiple_queries_generator.generate_multiple_queries = AsyncMock(
+            return_value=["machine learning", "learning notes", "notes"]
+        )
+        
+        with patch.object(hybrid.bm25_retriever, "search_batch", wraps=hybrid.bm25_retriever.search_batch) as batch:
+            asyncio.run(engine.process_query("machine learning", user_id="u1", search_mode="multiple_queries"))
+        
+        documents = engine.chain.arun_with_documents.call_args.args[1]
+        assert batch.call_count == 1
+        assert batch.call_args.kwargs["user_id"] == "u1"
+        assert documents and {doc.metadata["user_id"] for doc in documents} == {"u1"}
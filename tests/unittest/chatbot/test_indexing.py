@@ -0,0 +1,56 @@
+"""
+Unit tests for chunk IDs and re-indexing in the document indexer
+"""
+
+import pytest
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.indexing import LangChainDocumentIndexer
+
+
+class TestLangChainDocumentIndexer:
+    """Test suite for deterministic chunk IDs and idempotent re-indexing"""
+    
+    @pytest.fixture
+    def vectorstore(self):
+        """Create a store mock that keeps the IDs of stored chunks"""
+        stored = {}
+        vectorstore = Mock()
+        vectorstore.stored = stored
+        
+        def add_documents(documents, ids=None, embeddings=None):
+            stored.update(zip(ids, documents))
+            return ids
+        
+        vectorstore.add_documents.side_effect = add_documents
+        vectorstore.get_chunk_ids.side_effect = lambda where: list(stored)
+        vectorstore.delete_documents.side_effect = lambda ids, user_id=None: [stored.pop(chunk_id) for chunk_id in ids]
+        return vectorstore
+    
+    @pytest.fixture
+    def indexer(self, vectorstore):
+        """Create an indexer that splits text on sentence boundaries"""
+        chunker = Mock()
+        chunker.chunk_by_sentences.side_effect = lambda text, metadata: [
+            {"text": sentence, "metadata": dict(metadata)} for sentence in text.split(". ")
+        ]
+        return LangChainDocumentIndexer(vectorstore, chunker, change_log=Mock())
+    
+    def test_chunk_ids_are_deterministic(self, indexer, vectorstore):
+        """Test that chunks are stored as {document_id}:{chunk_index} with the ID in metadata"""
+        ids = indexer.index_document({"id": "doc1", "user_id": "u1", "text": "Revenue grew. Costs fell"})
+        
+        assert ids == ["doc1:0", "doc1:1"]
+        assert vectorstore.stored["doc1:1"].metadata["chunk_id"] == "doc1:1"
+        assert vectorstore.stored["doc1:1"].metadata["chunk_index"] == 1
+    
+    def test_reindex_replaces_chunks(self, indexer, vectorstore):
+        """Test that re-indexing a shorter version upserts and removes the leftover chunks"""
+        vectorstore.stored["legacy-uuid"] = Mock()
+        indexer.index_document({"id": "doc1", "user_id": "u1", "text": "Revenue grew. Costs fell. Margins rose"})
+        indexer.index_document({"id": "doc1", "user_id": "u1", "text": "Revenue grew strongly"})
+        
+        where = vectorstore.get_chunk_ids.call_args.args[0]
+        assert sorted(vectorstore.stored) == ["doc1:0"]
+        assert where == {"$and": [{"document_id": "doc1"}, {"user_id": "u1"}]}
+        assert vectorstore.delete_documents.call_args.kwargs == {"user_id": "u1"}
+        indexer.change_log.record_deleted.assert_called_with(chunk_ids=["doc1:1", "doc1:2"])
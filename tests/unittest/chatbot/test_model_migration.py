@@ -0,0 +1,70 @@
+"""
+Unit tests for collection aliases and embedding model migration state
+"""
+
+import pytest
+from app.services.chatbot.vector_db.model_migration import (
+    CollectionAliases, EmbeddingModelMigration, shadow_collection_name, start_shadow, update_shadow,
+    switch_to_shadow, rollback_switch, SHADOW_READY
+)
+
+
+class TestModelMigration:
+    """Test suite for CollectionAliases and the migration state transitions"""
+
+    @pytest.fixture
+    def aliases(self, tmp_path):
+        """Create aliases in an empty vector database directory"""
+        return CollectionAliases.for_directory(str(tmp_path))
+
+    def test_unmigrated_alias_resolves_to_configuration(self, aliases):
+        """Test that an alias without entry uses the configured collection and model"""
+        assert aliases.resolve("documents", "all-MiniLM-L6-v2") == ("documents", "all-MiniLM-L6-v2")
+        assert aliases.mirror_targets("documents", "documents") == []
+
+    def test_shadow_is_mirrored_and_resumable(self, aliases):
+        """Test that a started shadow receives writes and a restart keeps its progress"""
+        start_shadow(aliases, "documents", "all-MiniLM-L6-v2", "bge-small")
+        update_shadow(aliases, "documents", offset=500)
+        entry = start_shadow(aliases, "documents", "all-MiniLM-L6-v2", "bge-small")
+
+        shadow_name = shadow_collection_name("documents", "bge-small")
+        assert entry["shadow"]["offset"] == 500
+        assert aliases.resolve("documents", "all-MiniLM-L6-v2") == ("documents", "all-MiniLM-L6-v2")
+        assert aliases.mirror_targets("documents", "documents") == [{"collection": shadow_name, "model": "bge-small"}]
+        assert aliases.mirror_targets("documents", shadow_name) == [{"collection": "documents", "model": "all-MiniLM-L6-v2"}]
+        with pytest.raises(ValueError):
+            start_shadow(aliases, "documents", "all-MiniLM-L6-v2", "other-model")
+
+    def test_switch_requires_ready_shadow_with_recall(self, aliases):
+        """Test that the switch checks the build and recall, then swaps and can be rolled back"""
+        start_shadow(aliases, "documents", "all-MiniLM-L6-v2", "bge-small")
+        with pytest.raises(ValueError):
+            switch_to_shadow(aliases, "documents")
+
+        update_shadow(aliases, "documents", state=SHADOW_READY,
+                      recall={"k": 5, "active_recall": 0.9, "shadow_recall": 0.7})
+        with pytest.raises(ValueError):
+            switch_to_shadow(aliases, "documents", max_recall_drop=0.05)
+
+        update_shadow(aliases, "documents", recall={"k": 5, "active_recall": 0.9, "shadow_recall": 0.88})
+        switch_to_shadow(aliases, "documents", max_recall_drop=0.05)
+        shadow_name = shadow_collection_name("documents", "bge-small")
+        assert aliases.resolve("documents", "all-MiniLM-L6-v2") == (shadow_name, "bge-small")
+        assert aliases.mirror_targets("documents", shadow_name) == [{"collection": "documents", "model": "all-MiniLM-L6-v2"}]
+
+        rollback_switch(aliases, "documents")
+        assert aliases.resolve("documents", "all-MiniLM-L6-v2") == ("documents", "all-MiniLM-L6-v2")
+        assert aliases.get("documents")["previous"]["collection"] == shadow_name
+
+    def test_build_refuses_persistent_mode_while_api_may_run(self, tmp_path):
+        """Test that a persistent-mode build needs the API stopped, checked before any store is opened"""
+        migration = EmbeddingModelMigration(str(tmp_path), client_mode="persistent")
+
+        with pytest.raises(ValueError, match="CHROMA_CLIENT_MODE=http"):
+            migration.build()
+        # Past the guard: fails only because no shadow was started
+        with pytest.raises(ValueError, match="run start first"):
+            migration.build(api_stopped=True)
+        with pytest.raises(ValueError, match="run start first"):
+            EmbeddingModelMigration(str(tmp_path), client_mode="http").build()
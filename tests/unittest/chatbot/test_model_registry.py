@@ -0,0 +1,144 @@
+"""
+Unit tests for the shared model and client registry
+"""
+
+import importlib.util
+import threading
+import time
+import numpy as np
+import pytest
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.model_registry import ModelRegistry, SharedEmbeddings
+
+
+class TestModelRegistry:
+    """Test suite for ModelRegistry"""
+    
+    @pytest.fixture
+    def model_loader(self):
+        """Create a loader returning a fake model per call"""
+        def load(model_name):
+            model = Mock(schedules_lanes=False)
+            model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(text))] for text in texts])
+            return model
+        return Mock(side_effect=load)
+    
+    @pytest.fixture
+    def registry(self, model_loader):
+        """Create a registry with fake models and clients"""
+        return ModelRegistry(model_loader=model_loader, client_factory=lambda path: object())
+    
+    def test_model_is_loaded_once_and_shared(self, registry, model_loader):
+        """Test that every user gets the same model and it is unloaded after the last release"""
+        first = registry.acquire_model("all-MiniLM-L6-v2")
+        embeddings = registry.acquire_embeddings("all-MiniLM-L6-v2")
+        
+        assert embeddings.model is first
+        assert model_loader.call_count == 1
+        assert registry.memory_report()["models"]["all-MiniLM-L6-v2"]["refs"] == 2
+        
+        registry.release_model("all-MiniLM-L6-v2")
+        registry.release_model("all-MiniLM-L6-v2")
+        
+        assert registry.memory_report()["models"] == {}
+        registry.acquire_model("all-MiniLM-L6-v2")
+        assert model_loader.call_count == 2
+    
+    def test_client_is_shared_per_path(self, registry, tmp_path):
+        """Test that equivalent paths share a client and different paths do not"""
+        client = registry.acquire_client(str(tmp_path))
+        
+        assert registry.acquire_client(str(tmp_path / ".." / tmp_path.name)) is client
+        assert registry.acquire_client(str(tmp_path / "other")) is not client
+        assert registry.memory_report()["clients"][str(tmp_path)]["refs"] == 2
+    
+    def test_server_client_is_shared_per_url(self, model_loader, tmp_path):
+        """Test that http mode opens one client per server URL instead of the directory"""
+        http_client_factory = Mock(side_effect=lambda url: object())
+        registry = ModelRegistry(model_loader=model_loader, client_factory=Mock(),
+                                 http_client_factory=http_client_factory)
+        
+        client = registry.acquire_client(str(tmp_path), "http://localhost:8001")
+        assert registry.acquire_client(str(tmp_path / "other"), "http://localhost:8001") is client
+        http_client_factory.assert_called_once_with("http://localhost:8001")
+        registry._client_factory.assert_not_called()
+        
+        registry.release_client(str(tmp_path), "http://localhost:8001")
+        registry.release_client(str(tmp_path / "other"), "http://localhost:8001")
+        assert registry.memory_report()["clients"] == {}
+    
+    def test_shared_embeddings_match_langchain_behavior(self, registry):
+        """Test that shared embeddings replace newlines like SentenceTransformerEmbeddings"""
+        embeddings = SharedEmbeddings(registry.acquire_model("all-MiniLM-L6-v2"))
+        
+        assert embeddings.embed_documents(["a\nb", "abc"]) == [[3.0], [3.0]]
+        assert embeddings.embed_query("abcd") == [4.0]
+        _, kwargs = embeddings.model.model.encode.call_args
+        assert kwargs == {"show_progress_bar": False}
+    
+    def test_concurrent_acquire_loads_once(self, registry, model_loader):
+        """Test that concurrent first use loads the model a single time"""
+        threads = [threading.Thread(target=registry.acquire_model, args=("all-MiniLM-L6-v2",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert model_loader.call_count == 1
+        assert registry.memory_report()["models"]["all-MiniLM-L6-v2"]["refs"] == 8
+    
+    def test_bulk_encode_yields_to_interactive(self):
+        """Test that a query waiting behind bulk work runs at the next slice boundary"""
+        order = []
+        first_slice_started = threading.Event()
+        release_first_slice = threading.Event()
+        
+        def encode(texts, **kwargs):
+            order.append(tuple(texts))
+            if texts[0] == "chunk0":
+                first_slice_started.set()
+                release_first_slice.wait(timeout=5)
+            return np.zeros((len(texts), 1))
+        
+        model = Mock(schedules_lanes=False)
+        model.encode.side_effect = encode
+        registry = ModelRegistry(model_loader=lambda name: model, client_factory=lambda path: object(), bulk_slice_size=2)
+        shared = registry.acquire_model("all-MiniLM-L6-v2")
+        embeddings = SharedEmbeddings(shared)
+        
+        bulk = threading.Thread(target=embeddings.embed_documents, args=([f"chunk{i}" for i in range(6)],))
+        bulk.start()
+        first_slice_started.wait(timeout=5)
+        query = threading.Thread(target=embeddings.embed_query, args=("revenue?",))
+        query.start()
+        # Let the query register as waiting before the first slice finishes
+        while shared.scheduler.get_stats()["interactive"]["waiting"] == 0:
+            time.sleep(0.001)
+        release_first_slice.set()
+        bulk.join(timeout=5)
+        query.join(timeout=5)
+        
+        assert order == [("chunk0", "chunk1"), ("revenue?",), ("chunk2", "chunk3"), ("chunk4", "chunk5")]
+        lanes = registry.memory_report()["models"]["all-MiniLM-L6-v2"]["lanes"]
+        assert lanes["bulk"]["encodes"] == 3 and lanes["interactive"]["encodes"] == 1
+        assert lanes["interactive"]["max_wait_ms"] > 0
+    
+    def test_backend_is_part_of_model_id(self, model_loader):
+        """Test that cache keys separate vectors of different backends and unknown backends are rejected"""
+        torch_registry = ModelRegistry(model_loader=model_loader, client_factory=lambda path: object())
+        int8_registry = ModelRegistry(model_loader=model_loader, client_factory=lambda path: object(), backend="onnx-int8")
+        
+        assert torch_registry.model_id("all-MiniLM-L6-v2") == "all-MiniLM-L6-v2"
+        assert int8_registry.model_id("all-MiniLM-L6-v2") == "all-MiniLM-L6-v2@onnx-int8"
+        assert int8_registry.memory_report()["backend"] == "onnx-int8"
+        with pytest.raises(ValueError):
+            ModelRegistry(model_loader=model_loader, backend="tensorrt")
+    
+    def test_onnx_backend_requires_optimum(self, monkeypatch):
+        """Test that a local ONNX registry fails at construction when optimum is not installed"""
+        monkeypatch.setattr(importlib.util, "find_spec", lambda name: None if name == "optimum" else object())
+        
+        with pytest.raises(ImportError, match="optimum"):
+            ModelRegistry(client_factory=lambda path: object(), backend="onnx")
+        ModelRegistry(client_factory=lambda path: object(), backend="torch")
+        ModelRegistry(model_loader=Mock(), client_factory=lambda path: object(), backend="onnx")
@@ -0,0 +1,133 @@
+"""
+Unit tests for the quantized vector index
+"""
+
+import time
+import numpy as np
+import pytest
+from unittest.mock import patch
+from langchain.schema import Document
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client
+from app.services.chatbot.vector_db.change_log import ChunkChangeLog
+from app.services.chatbot.vector_db.quantized_index import QuantizedVectorIndex
+
+
+class TestQuantizedVectorIndex:
+    """Test suite for QuantizedVectorIndex"""
+    
+    @pytest.fixture
+    def vectors(self):
+        """Create clustered unit vectors, like chunk embeddings of a few topics"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(50, 384))
+        vectors = centers[rng.integers(0, 50, 3000)] + rng.normal(size=(3000, 384))
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    
+    @pytest.fixture
+    def queries(self, vectors):
+        """Create queries near stored vectors"""
+        rng = np.random.default_rng(1)
+        queries = vectors[:20] + rng.normal(size=(20, 384)) * 0.3
+        return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    
+    def _recall(self, index, vectors, queries, k, candidates):
+        """Fraction of the exact top k found among the index candidates"""
+        found = []
+        for query in queries:
+            exact = {f"c{i}" for i in np.argsort(np.sum((vectors - query) ** 2, axis=1))[:k]}
+            found.append(len(exact & {chunk_id for chunk_id, _ in index.search(query, candidates)}) / k)
+        return np.mean(found)
+    
+    @pytest.mark.parametrize("mode,factor,min_recall,min_ratio", [
+        ("int8", 4, 0.99, 3.5),
+        ("binary", 20, 0.9, 20)
+    ])
+    def test_candidate_recall_and_code_size(self, vectors, queries, mode, factor, min_recall, min_ratio):
+        """Test that the exact top 10 is among the candidates and the codes are compact"""
+        index = QuantizedVectorIndex(mode)
+        index.add([f"c{i}" for i in range(len(vectors))], vectors)
+        index.trim()
+        
+        assert self._recall(index, vectors, queries, 10, 10 * factor) >= min_recall
+        stats = index.get_stats()
+        assert stats["float32_mb"] >= min_ratio * stats["memory_mb"]
+    
+    def test_filters(self, vectors):
+        """Test document_id and user_id filters, and that other filters are reported as unsupported"""
+        index = QuantizedVectorIndex("int8")
+        metadatas = [{"document_id": f"d{i % 3}", "user_id": f"u{i % 2}"} for i in range(30)]
+        index.add([f"c{i}" for i in range(30)], vectors[:30], metadatas)
+        
+        where = {"$and": [{"document_id": {"$in": ["d1", "d2"]}}, {"user_id": "u0"}]}
+        ids = [chunk_id for chunk_id, _ in index.search(vectors[0], 30, where=where)]
+        
+        assert sorted(ids) == sorted(f"c{i}" for i in range(30) if i % 3 in (1, 2) and i % 2 == 0)
+        assert index.search(vectors[0], 5, where={"document_id": "missing"}) == []
+        assert not index.supports_filter({"filename": "report.pdf"})
+        with pytest.raises(ValueError):
+            index.search(vectors[0], 5, where={"page": {"$gt": 1}})
+    
+    def test_replace_and_remove(self, vectors):
+        """Test that re-added IDs replace their vector and removed IDs are not returned"""
+        index = QuantizedVectorIndex("binary")
+        index.add(["a", "b", "c"], vectors[:3])
+        index.add(["a"], vectors[3:4])
+        
+        assert len(index) == 3
+        assert index.search(vectors[3], 1)[0][0] == "a"
+        
+        assert index.remove(["a", "b", "unknown"]) == 2
+        assert [chunk_id for chunk_id, _ in index.search(vectors[3], 3)] == ["c"]
+    
+    def test_sync_follows_collection_changes(self, vectors, tmp_path):
+        """Test that logged deletes, adds and rewrites reach the index without comparing IDs"""
+        collection = _open_persistent_client(str(tmp_path)).create_collection("documents")
+        collection.add(ids=["a", "b"], embeddings=vectors[:2].tolist(), metadatas=[{"document_id": "d1"}] * 2)
+        change_log = ChunkChangeLog.for_directory(str(tmp_path))
+        change_log.record_added(["a", "b"], [Document(page_content=text, metadata={"document_id": "d1"}) for text in "ab"])
+        index = QuantizedVectorIndex("int8")
+        
+        assert index.start_sync()
+        assert not index.start_sync()
+        assert index.sync(collection, change_log) == {"read": 2, "removed": 0}
+        assert index.ready and not index.start_sync(interval=60)
+        
+        # Same count as before, different chunks
+        collection.delete(ids=["b"])
+        change_log.record_deleted(chunk_ids=["b"])
+        collection.add(ids=["c"], embeddings=vectors[2:3].tolist(), metadatas=[{"document_id": "d2"}])
+        change_log.record_added(["c"], [Document(page_content="c", metadata={"document_id": "d2"})])
+        # Written again under its ID by another process
+        collection.upsert(ids=["a"], embeddings=vectors[3:4].tolist(), metadatas=[{"document_id": "d1"}])
+        change_log.record_added(["a"], [Document(page_content="rewritten", metadata={"document_id": "d1"})])
+        
+        assert index.start_sync(interval=0)
+        with patch.object(type(collection), "get", autospec=True, side_effect=type(collection).get) as get:
+            assert index.sync(collection, change_log) == {"read": 2, "removed": 1}
+        assert get.call_args_list and all(call.kwargs.get("ids") for call in get.call_args_list)
+        assert index.ids() == {"a", "c"}
+        assert index.search(vectors[3], 1)[0][0] == "a"
+        assert index.search(vectors[2], 1, where={"document_id": "d2"})[0][0] == "c"
+        
+        collection.delete(where={"document_id": "d1"})
+        change_log.record_deleted(document_id="d1")
+        
+        assert index.sync(collection, change_log) == {"read": 0, "removed": 1}
+        assert index.ids() == {"c"}
+    
+    def test_sync_compares_ids_after_log_truncation(self, vectors, tmp_path):
+        """Test that a replaced change log makes the next sync compare chunk IDs"""
+        collection = _open_persistent_client(str(tmp_path)).create_collection("documents")
+        collection.add(ids=["a"], embeddings=vectors[:1].tolist())
+        change_log = ChunkChangeLog.for_directory(str(tmp_path))
+        change_log.record_added(["a"], [Document(page_content="a")])
+        index = QuantizedVectorIndex("binary")
+        index.sync(collection, change_log)
+        
+        # Added while the log was replaced, so the event is lost
+        collection.add(ids=["b"], embeddings=vectors[1:2].tolist())
+        change_log.truncate(time.time_ns())
+        change_log.record_deleted(chunk_ids=["unrelated"])
+        
+        assert index.sync(collection, change_log) == {"read": 1, "removed": 0}
+        assert index.ids() == {"a", "b"}
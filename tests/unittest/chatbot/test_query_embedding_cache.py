@@ -0,0 +1,59 @@
+"""
+Unit tests for the query embedding cache
+"""
+
+import pytest
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.query_embedding_cache import QueryEmbeddingCache, CachedQueryEmbeddings
+
+
+class TestQueryEmbeddingCache:
+    """Test suite for QueryEmbeddingCache and CachedQueryEmbeddings"""
+    
+    @pytest.fixture
+    def base_embeddings(self):
+        """Create a fake embedding function"""
+        embeddings = Mock()
+        embeddings.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+        embeddings.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.0] for text in texts]
+        return embeddings
+    
+    def test_repeated_query_is_encoded_once(self, base_embeddings):
+        """Test that equal queries up to whitespace hit the cache"""
+        cache = QueryEmbeddingCache(max_size=10)
+        embeddings = CachedQueryEmbeddings(base_embeddings, "all-MiniLM-L6-v2", cache)
+        
+        first = embeddings.embed_query("What is  the revenue?")
+        second = embeddings.embed_query("  What is the\nrevenue? ")
+        
+        assert first == second
+        assert base_embeddings.embed_query.call_count == 1
+        assert cache.get_stats() == {"size": 1, "max_size": 10, "hits": 1, "misses": 1, "hit_rate": 0.5}
+    
+    def test_key_includes_model(self, base_embeddings):
+        """Test that different models do not share cached vectors"""
+        cache = QueryEmbeddingCache(max_size=10)
+        CachedQueryEmbeddings(base_embeddings, "model-a", cache).embed_query("revenue")
+        CachedQueryEmbeddings(base_embeddings, "model-b", cache).embed_query("revenue")
+        
+        assert base_embeddings.embed_query.call_count == 2
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = QueryEmbeddingCache(max_size=2)
+        cache.put("m", "a", [1.0])
+        cache.put("m", "b", [2.0])
+        cache.get("m", "a")
+        cache.put("m", "c", [3.0])
+        
+        assert cache.get("m", "b") is None
+        assert cache.get("m", "a") == [1.0]
+        assert cache.get("m", "c") == [3.0]
+    
+    def test_documents_are_not_cached(self, base_embeddings):
+        """Test that document embeddings bypass the cache"""
+        cache = QueryEmbeddingCache(max_size=10)
+        embeddings = CachedQueryEmbeddings(base_embeddings, "all-MiniLM-L6-v2", cache)
+        
+        assert embeddings.embed_documents(["ab", "abc"]) == [[2.0, 0.0], [3.0, 0.0]]
+        assert cache.get_stats()["size"] == 0
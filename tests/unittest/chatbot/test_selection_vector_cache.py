@@ -0,0 +1,56 @@
+"""
+Unit tests for exact in-memory search over document selections
+"""
+
+import numpy as np
+from app.services.chatbot.vector_db.selection_vector_cache import (
+    SelectedVectors, SelectionVectorCache, is_selection_filter, selection_key
+)
+
+
+class TestSelectionVectorCache:
+    """Test suite for SelectedVectors and SelectionVectorCache"""
+    
+    def _selection(self, count, generation=0, seed=0):
+        """Create a selection of random chunk vectors"""
+        vectors = np.random.default_rng(seed).normal(size=(count, 16)).astype(np.float32)
+        documents = [f"chunk {i}" for i in range(count)]
+        metadatas = [{"document_id": f"d{i % 3}"} for i in range(count)]
+        return SelectedVectors(vectors, documents, metadatas, generation)
+    
+    def test_exact_top_k(self):
+        """Test that search returns the exact nearest chunks with squared L2 distances"""
+        selection = self._selection(200)
+        query = np.random.default_rng(1).normal(size=16).astype(np.float32)
+        
+        results = selection.search(query, k=5)
+        
+        distances = np.sum((selection.vectors - query) ** 2, axis=1)
+        expected = np.argsort(distances)[:5]
+        assert [doc.page_content for doc, _ in results] == [f"chunk {i}" for i in expected]
+        assert np.allclose([score for _, score in results], distances[expected], rtol=1e-4)
+        assert len(selection.search(query, k=500)) == 200
+    
+    def test_selection_filters(self):
+        """Test which filters are served from memory and that keys ignore $in order"""
+        assert is_selection_filter({"document_id": {"$in": ["a", "b"]}})
+        assert is_selection_filter({"$and": [{"document_id": {"$in": ["a"]}}, {"user_id": "u1"}]})
+        assert not is_selection_filter({"user_id": "u1"})
+        assert not is_selection_filter({"$and": [{"document_id": "a"}, {"page": {"$gt": 2}}]})
+        assert selection_key({"document_id": {"$in": ["b", "a"]}}) == selection_key({"document_id": {"$in": ["a", "b"]}})
+    
+    def test_lru_eviction_and_invalidation(self):
+        """Test that the vector budget evicts the least recently used selection and writes invalidate"""
+        cache = SelectionVectorCache(max_vectors=250, max_selection_vectors=200)
+        cache.put("ns", "a", self._selection(100))
+        cache.put("ns", "b", self._selection(100))
+        cache.get("ns", "a")
+        cache.put("ns", "c", self._selection(100))
+        
+        assert cache.get("ns", "b") is None
+        assert cache.get("ns", "a") is not None
+        
+        cache.invalidate("ns")
+        assert cache.get("ns", "a") is None
+        cache.put("ns", "big", self._selection(201, generation=cache.generation("ns")))
+        assert cache.get("ns", "big") is None
@@ -0,0 +1,141 @@
+"""
+Unit tests for the vector store orphan sweep, compaction and integrity report
+"""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client
+from app.services.chatbot.vector_db.change_log import ChunkChangeLog
+from app.services.chatbot.vector_db.vector_maintenance import (
+    VectorStoreMaintenance, find_duplicates, embedding_drift, finish_rebuilds,
+    rebuild_collection_name, REBUILD_OF_KEY
+)
+
+
+class TestVectorMaintenance:
+    """Test suite for find_duplicates, embedding_drift and VectorStoreMaintenance"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a store with a live document, a deleted document and a re-indexed legacy chunk"""
+        client = _open_persistent_client(str(tmp_path))
+        chunks = client.get_or_create_collection("documents", metadata={"hnsw:space": "cosine"})
+        rows = [
+            ("d1:0", "d1", "alice", 0), ("d1:1", "d1", "alice", 1),
+            ("legacy-uuid", "d1", "alice", 0),
+            ("gone:0", "gone", "bob", 0)
+        ]
+        chunks.add(
+            ids=[row[0] for row in rows],
+            embeddings=[[float(i), 1.0, 0.0] for i in range(len(rows))],
+            documents=[f"chunk {row[0]}" for row in rows],
+            metadatas=[{"document_id": row[1], "user_id": row[2], "chunk_index": row[3]} for row in rows]
+        )
+        document_vectors = client.get_or_create_collection("documents_docvectors")
+        document_vectors.add(ids=["d1", "gone"], embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+        def collection(name):
+            try:
+                return SimpleNamespace(_collection=client.get_collection(name))
+            except Exception:
+                return None
+
+        return SimpleNamespace(
+            collection_name="documents",
+            client=client,
+            persist_directory=str(tmp_path),
+            _collection=collection,
+            _index=lambda name: None,
+            selection_cache=Mock(),
+            _selection_namespace=(str(tmp_path), "documents"),
+            document_vectors=SimpleNamespace(collection=document_vectors, collection_name="documents_docvectors")
+        )
+
+    @pytest.fixture
+    def maintenance(self, store, tmp_path):
+        """Create the job with d1 as the only document in Postgres"""
+        return VectorStoreMaintenance(
+            store,
+            change_log=ChunkChangeLog.for_directory(str(tmp_path)),
+            load_documents=lambda: {"d1": "alice"},
+            load_embedding_rows=lambda: {"d1": ["d1:0"], "d9": ["d9:0"]}
+        )
+
+    def test_find_duplicates(self):
+        """Test that random IDs of re-indexed documents, cross-shard copies and repeated indexes are duplicates"""
+        chunks = [
+            ("documents", "d1:0", {"document_id": "d1", "chunk_index": 0}),
+            ("documents", "old", {"document_id": "d1", "chunk_index": 0}),
+            ("documents", "d2:0", {"document_id": "d2", "chunk_index": 0}),
+            ("documents_u_x", "d2:0", {"document_id": "d2", "chunk_index": 0}),
+            ("documents", "r1", {"document_id": "d3", "chunk_index": 0}),
+            ("documents", "r2", {"document_id": "d3", "chunk_index": 0}),
+            ("documents", "r3", {"document_id": "d3", "chunk_index": 1})
+        ]
+
+        assert find_duplicates(chunks, "documents") == [("documents", "old"), ("documents", "d2:0"), ("documents", "r2")]
+
+    def test_embedding_drift(self):
+        """Test that rows without vectors, vectors without rows and count mismatches are reported"""
+        drift = embedding_drift(
+            {"d1": {"d1:0", "d1:1"}, "d2": {"d2:0"}, "d3": {"d3:0"}},
+            {"d1": ["d1:0"], "d3": ["d3:0"], "d4": [None]}
+        )
+
+        assert drift["missing_vectors"] == {"documents": 1, "sample": ["d4"]}
+        assert drift["missing_rows"] == {"documents": 1, "sample": ["d2"]}
+        assert drift["count_mismatch"]["sample"] == [{"document_id": "d1", "rows": 1, "vectors": 2}]
+        assert drift["dangling_embedding_ids"] == 0
+        assert not drift["in_sync"]
+        assert embedding_drift({"d1": {"d1:0"}}, {"d1": ["d1:0"]})["in_sync"]
+
+    def test_report_and_sweep(self, maintenance, store, tmp_path):
+        """Test that the report counts orphans, a dry run changes nothing and the sweep removes and logs them"""
+        report = maintenance.report()
+        assert report["chunks"] == 4
+        assert report["chunks_per_user"] == {"alice": 3, "bob": 1}
+        assert report["orphans"] == {"chunks": 1, "documents": 1, "sample": ["gone"]}
+        assert report["duplicates"]["sample"] == ["legacy-uuid"]
+        assert report["orphan_document_vectors"] == 1
+        assert report["drift"]["missing_vectors"]["sample"] == ["d9"]
+        assert "documents" in report["disk"]["collections"]
+
+        assert maintenance.sweep(dry_run=True)["removed_chunks"] == 0
+        assert store.client.get_collection("documents").count() == 4
+
+        result = maintenance.sweep(dry_run=False)
+        assert result["removed_chunks"] == 2
+        assert sorted(store.client.get_collection("documents").get()["ids"]) == ["d1:0", "d1:1"]
+        assert store.document_vectors.collection.get()["ids"] == ["d1"]
+        events, _ = ChunkChangeLog.for_directory(str(tmp_path)).read()
+        assert sorted(event["chunk_id"] for event in events) == ["gone:0", "legacy-uuid"]
+
+    def test_sweep_refuses_when_most_chunks_look_orphaned(self, store):
+        """Test that an empty documents table does not wipe the store without force"""
+        maintenance = VectorStoreMaintenance(store, load_documents=lambda: {}, load_embedding_rows=lambda: {})
+
+        with pytest.raises(ValueError):
+            maintenance.sweep(dry_run=False)
+        assert store.client.get_collection("documents").count() == 4
+
+    def test_compact_rebuilds_and_finishes_interrupted_rebuilds(self, maintenance, store):
+        """Test that a rebuild keeps vectors and metadata, and an interrupted rebuild is completed"""
+        result = maintenance.compact(force=True)
+
+        rebuilt = store.client.get_collection("documents")
+        assert result["rebuilt"]["documents"]["vectors"] == 4
+        assert rebuilt.count() == 4 and rebuilt.metadata == {"hnsw:space": "cosine"}
+        assert rebuilt.get(ids=["d1:1"], include=["embeddings"])["embeddings"] == [[1.0, 1.0, 0.0]]
+
+        # Interrupted after the original was deleted: the complete copy takes its place
+        copy = store.client.create_collection(
+            rebuild_collection_name("documents_docvectors"),
+            metadata={REBUILD_OF_KEY: "documents_docvectors"}
+        )
+        copy.add(ids=["d1", "gone"], embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        store.client.delete_collection("documents_docvectors")
+
+        assert finish_rebuilds(store.client) == ["documents_docvectors"]
+        assert store.client.get_collection("documents_docvectors").count() == 2
+        assert all(not collection.name.startswith("rebuild_") for collection in store.client.list_collections())
@@ -0,0 +1,175 @@
+"""
+Unit tests for vector store snapshot export, import and catch-up
+"""
+
+import io
+import json
+import tarfile
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock
+from app.services.chatbot.vector_db.model_registry import _open_persistent_client, model_registry
+from app.services.chatbot.vector_db.model_migration import CollectionAliases
+from app.services.chatbot.search.bm25_retriever import BM25Retriever
+from app.services.chatbot.search.bm25_change_feed import APPLIED_TS_KEY
+from app.services.chatbot.vector_db.vector_snapshot import (
+    export_snapshot, verify_snapshot, import_snapshot, catch_up_snapshot, catch_up_pending,
+    read_snapshot_state, MANIFEST_NAME, SNAPSHOT_TS_KEY
+)
+
+
+class TestVectorSnapshot:
+    """Test suite for export_snapshot, verify_snapshot, import_snapshot and catch_up_snapshot"""
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        """Create a migrated collection with a shard and document vectors"""
+        directory = tmp_path / "source"
+        client = _open_persistent_client(str(directory))
+        CollectionAliases.for_directory(str(directory)).update(
+            "documents", lambda entry: {"collection": "documents_m_abc", "model": "all-MiniLM-L6-v2"}
+        )
+        chunks = client.create_collection("documents_m_abc", metadata={"hnsw:space": "cosine", "hnsw:M": 32})
+        chunks.add(
+            ids=["d1:0", "d1:1", "d2:0"],
+            embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+            documents=["quarterly revenue grew", "operating costs were flat", "contract renewal in march"],
+            metadatas=[{"document_id": "d1", "user_id": "alice"}, {"document_id": "d1", "user_id": "alice"},
+                       {"document_id": "d2", "user_id": "bob"}]
+        )
+        shard = client.create_collection("documents_m_abc_u_bob")
+        shard.add(ids=["d3:0"], embeddings=[[0.5, 0.5, 0.0]], documents=["invoice overdue"],
+                  metadatas=[{"document_id": "d3", "user_id": "bob"}])
+        client.create_collection("documents_m_abc_docvectors").add(ids=["d1", "d2"], embeddings=[[1.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        # Not part of the active collection
+        client.create_collection("documents").add(ids=["old:0"], embeddings=[[1.0, 0.0, 0.0]])
+        return SimpleNamespace(client=client, directory=str(directory))
+
+    @pytest.fixture
+    def archive(self, source, tmp_path):
+        """Export the source into a compressed archive"""
+        path = str(tmp_path / "snapshot.tar.gz")
+        export_snapshot(source.client, path, "documents", "all-MiniLM-L6-v2", persist_directory=source.directory, page_size=2)
+        return path
+
+    def test_export_import_round_trip(self, archive, tmp_path):
+        """Test that vectors, metadata, the alias and a searchable BM25 segment arrive on the new node"""
+        manifest = verify_snapshot(archive)
+        assert manifest["collection"] == "documents_m_abc"
+        assert [entry["name"] for entry in manifest["collections"]] == [
+            "documents_m_abc", "documents_m_abc_u_bob", "documents_m_abc_docvectors"
+        ]
+        assert manifest["model_id"] == model_registry.model_id("all-MiniLM-L6-v2")
+        assert manifest["bm25"]["chunks"] == 4
+
+        directory = str(tmp_path / "target")
+        client = _open_persistent_client(directory)
+        result = import_snapshot(client, archive, directory, "documents")
+
+        assert result["vectors"] == {"documents_m_abc": 3, "documents_m_abc_u_bob": 1, "documents_m_abc_docvectors": 2}
+        chunks = client.get_collection("documents_m_abc")
+        assert chunks.metadata == {"hnsw:space": "cosine", "hnsw:M": 32}
+        stored = chunks.get(ids=["d1:1"], include=["embeddings", "documents", "metadatas"])
+        assert stored["embeddings"] == [[0.0, 1.0, 0.0]]
+        assert stored["documents"] == ["operating costs were flat"]
+        assert stored["metadatas"] == [{"document_id": "d1", "user_id": "alice"}]
+        assert "documents" not in [collection.name for collection in client.list_collections()]
+        assert CollectionAliases.for_directory(directory).resolve("documents", "other-model") == ("documents_m_abc", "all-MiniLM-L6-v2")
+
+        retriever = BM25Retriever.load_segment(f"{directory}/bm25_index.seg")
+        assert retriever.get_segment_meta()[APPLIED_TS_KEY] == 0
+        assert retriever.get_segment_meta()[SNAPSHOT_TS_KEY] == manifest["snapshot_ts"]
+        assert retriever.search("invoice overdue", k=1)[0][0].metadata["chunk_id"] == "d3:0"
+
+        assert read_snapshot_state(directory)[SNAPSHOT_TS_KEY] == manifest["snapshot_ts"]
+        assert catch_up_pending(directory)
+
+    def test_import_refuses_corrupted_or_foreign_archives(self, archive, tmp_path, monkeypatch):
+        """Test that tampered members, newer versions and another embedding backend are rejected"""
+        directory = str(tmp_path / "target")
+        client = _open_persistent_client(directory)
+
+        with tarfile.open(archive, "r:gz") as tar:
+            members = {member.name: tar.extractfile(member).read() for member in tar if member.isfile()}
+
+        def rewrite(name, change):
+            path = str(tmp_path / name)
+            with tarfile.open(path, "w") as tar:
+                for member, data in change(dict(members)).items():
+                    info = tarfile.TarInfo(member)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+            return path
+
+        part = "collections/documents_m_abc/part-00000.jsonl"
+        tampered = rewrite("tampered.tar", lambda files: {**files, part: files[part].replace(b"revenue", b"REVENUE")})
+        with pytest.raises(ValueError, match="Checksum"):
+            import_snapshot(client, tampered, directory, "documents")
+
+        def newer(files):
+            manifest = json.loads(files[MANIFEST_NAME])
+            return {**files, MANIFEST_NAME: json.dumps({**manifest, "version": 99}).encode("utf-8")}
+        with pytest.raises(ValueError, match="version"):
+            import_snapshot(client, rewrite("newer.tar", newer), directory, "documents")
+
+        monkeypatch.setattr(model_registry, "backend", "onnx")
+        with pytest.raises(ValueError, match="EMBEDDING_BACKEND"):
+            import_snapshot(client, archive, directory, "documents")
+        assert client.list_collections() == []
+        assert read_snapshot_state(directory) is None
+
+    def test_import_requires_replace_for_filled_collections(self, archive, tmp_path):
+        """Test that existing vectors are only overwritten with replace"""
+        directory = str(tmp_path / "target")
+        client = _open_persistent_client(directory)
+        client.create_collection("documents_m_abc").add(ids=["x:0"], embeddings=[[1.0, 0.0, 0.0]])
+
+        with pytest.raises(ValueError, match="replace"):
+            import_snapshot(client, archive, directory, "documents")
+
+        import_snapshot(client, archive, directory, "documents", replace=True)
+        assert sorted(client.get_collection("documents_m_abc").get()["ids"]) == ["d1:0", "d1:1", "d2:0"]
+
+    def test_catch_up(self, archive, tmp_path):
+        """Test that changed and missing documents are re-embedded, deleted ones swept, and it runs once"""
+        directory = str(tmp_path / "target")
+        client = _open_persistent_client(directory)
+        import_snapshot(client, archive, directory, "documents")
+
+        def collection(name):
+            try:
+                return SimpleNamespace(_collection=client.get_collection(name))
+            except Exception:
+                return None
+
+        docvectors = client.get_collection("documents_m_abc_docvectors")
+        store = SimpleNamespace(
+            collection_name="documents_m_abc",
+            client=client,
+            persist_directory=directory,
+            _collection=collection,
+            _index=lambda name: None,
+            selection_cache=Mock(),
+            _selection_namespace=(directory, "documents_m_abc"),
+            document_vectors=SimpleNamespace(collection=docvectors, collection_name="documents_m_abc_docvectors")
+        )
+        embed = Mock(side_effect=lambda document_id: {"success": document_id != "d5"})
+        changed_since = []
+
+        def load_changed(since):
+            changed_since.append(since)
+            return ["d1"]
+
+        # d2 was deleted after the snapshot; d4 and d5 were uploaded
+        documents = {"d1": "alice", "d3": "bob", "d4": "alice", "d5": "bob"}
+        result = catch_up_snapshot(directory, store, embed, load_changed_documents=load_changed,
+                                   load_documents=lambda: documents, margin=60)
+
+        assert sorted(call.args[0] for call in embed.call_args_list) == ["d1", "d4", "d5"]
+        assert changed_since == [read_snapshot_state(directory)[SNAPSHOT_TS_KEY] / 1e9 - 60]
+        assert result["embedded"] == 2 and result["failed_sample"] == ["d5"]
+        assert result["removed_chunks"] == 1
+        assert client.get_collection("documents_m_abc").get(ids=["d2:0"])["ids"] == []
+        assert not catch_up_pending(directory)
+        assert "skipped" in catch_up_snapshot(directory, store, embed, load_changed_documents=load_changed,
+                                              load_documents=lambda: documents)